@@ -0,0 +1,831 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+An asyncio version of the Kafka client. This module requires Python 3.5 or later, and is not imported by anything else
+in the package so that the rest of it still works on older versions.
+"""
+
+import asyncio
+import functools
+import six
+import time
+from random import shuffle
+
+from kafka.tools import log
+from kafka.tools.client import BaseClient
+from kafka.tools.exceptions import ConnectionError, GroupError, TopicError
+from kafka.tools.models.broker import Broker
+from kafka.tools.models.cluster import Cluster
+from kafka.tools.protocol.errors import error_invalidates_metadata
+from kafka.tools.protocol.requests.describe_groups_v0 import DescribeGroupsV0Request
+from kafka.tools.protocol.requests.group_coordinator_v0 import GroupCoordinatorV0Request
+from kafka.tools.protocol.requests.list_groups_v0 import ListGroupsV0Request
+from kafka.tools.protocol.requests.list_offset_v1 import ListOffsetV1Request
+from kafka.tools.protocol.requests.offset_fetch_v1 import OffsetFetchV1Request
+from kafka.tools.protocol.requests.topic_metadata_v2 import TopicMetadataV2Request
+from kafka.tools.protocol.types.bufferpool import BufferPool
+from kafka.tools.protocol.types.bytebuffer import ByteBuffer
+from kafka.tools.snapshot import write_snapshot
+from kafka.tools.utilities import raise_if_error
+
+
+class AsyncBroker(Broker):
+    """
+    A broker that communicates using asyncio streams. Requests are pipelined on the connection (up to the max_in_flight
+    configuration), and a reader task matches the responses to the requests by correlation ID
+    """
+    def __init__(self, hostname, id=0, port=9092, configuration=None):
+        super(AsyncBroker, self).__init__(hostname, id=id, port=port, configuration=configuration)
+
+        # The transport can hold on to written data until it is sent, so request bodies are never reused
+        self._send_pool = BufferPool(0)
+
+        self._stream_reader = None
+        self._stream_writer = None
+        self._read_task = None
+        self._pending = {}
+
+        # These are created when first used, as they must belong to the event loop the broker is used in
+        self._connect_lock = None
+        self._slots = None
+
+    @classmethod
+    def from_broker(cls, broker, configuration=None):
+        """Create an AsyncBroker with the same identity and endpoints as the provided broker"""
+        newbroker = cls(broker.hostname, id=broker.id, port=broker.port, configuration=configuration)
+        for attr in ['jmx_port', 'rack', 'version', 'endpoints', 'timestamp']:
+            setattr(newbroker, attr, getattr(broker, attr))
+        return newbroker
+
+    async def connect(self):
+        """
+        Open a connection to the broker if there is not one already, and start the task that reads responses from it
+
+        Raises:
+            ConnectionError: If the connection to the broker cannot be opened
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self._stream_writer is not None:
+                return
+
+            ssl_context = self._configuration.ssl_context
+            protocol = 'SSL' if ssl_context is not None else 'PLAINTEXT'
+            endpoint = self.get_endpoint(protocol)
+            kwargs = {}
+            if ssl_context is not None:
+                kwargs = {'ssl': ssl_context, 'server_hostname': self.hostname}
+
+            log.info("Connecting to {0} on port {1} using {2}".format(self.hostname, self.port, protocol))
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(endpoint.hostname, endpoint.port, **kwargs),
+                                                        self._configuration.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                log.error("Cannot connect to broker {0}:{1}: {2}".format(endpoint.hostname, endpoint.port, e))
+                raise ConnectionError("Cannot connect to broker {0}:{1}: {2}".format(endpoint.hostname, endpoint.port, e))
+
+            self._stream_reader = reader
+            self._stream_writer = writer
+            self._read_task = asyncio.ensure_future(self._read_responses(reader))
+
+    def close(self):
+        """Close the connection to the broker, failing all requests that are waiting for a response"""
+        self._fail_pending(ConnectionError("Connection to broker {0} was closed".format(self.id)))
+        if self._stream_writer is None:
+            return
+        log.info("Disconnecting from {0}".format(self.hostname))
+
+        self._stream_writer.close()
+        self._stream_writer = None
+        self._stream_reader = None
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+
+    async def send(self, request):
+        """
+        Send a request to the broker and wait for the response. Failures to communicate with the broker are retried,
+        reconnecting each time, up to the num_retries configuration
+
+        Args:
+            request (BaseRequest): the request to send
+
+        Returns:
+            int: the correlation ID of the request
+            BaseResponse: the response to the request
+
+        Raises:
+            ConnectionError: If the request still fails when the retries are exhausted
+        """
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                await self.connect()
+                return await self._send_pipelined(request)
+            except ConnectionError as e:
+                if attempts >= self._configuration.num_retries:
+                    log.error("Failed communicating with Kafka broker {0}. retries remaining = 0: {1}".format(self.id, e))
+                    raise
+                log.warn("Failed communicating with Kafka broker {0}. retries remaining = {1}: {2}".format(self.id,
+                                                                                                           self._configuration.num_retries - attempts,
+                                                                                                           e))
+
+            # Sleep for the backoff period before retrying the request, and force a reconnect
+            self.close()
+            await asyncio.sleep(self._configuration.retry_backoff)
+
+    async def _send_pipelined(self, request):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._configuration.max_in_flight)
+
+        async with self._slots:
+            writer = self._stream_writer
+            if writer is None:
+                raise ConnectionError("Connection to broker {0} was closed".format(self.id))
+
+            correlation_id, header, body_buf, body_size = self._encode_request(request)
+            future = asyncio.get_event_loop().create_future()
+            self._pending[correlation_id] = (request, future)
+            try:
+                writer.write(header)
+                writer.write(memoryview(body_buf)[:body_size])
+                await writer.drain()
+            except OSError as e:
+                # A partial write leaves the connection unusable, so everything in flight on it fails
+                if self._stream_writer is writer:
+                    self.close()
+                raise ConnectionError("Failed communicating with Kafka: {0}".format(e))
+            return await future
+
+    async def _read_responses(self, reader):
+        """Read responses from the stream and resolve the futures for the requests they belong to"""
+        try:
+            while True:
+                size, correlation_id = self._response_header_struct.unpack(await reader.readexactly(self._response_header_struct.size))
+                if size < 4:
+                    raise ConnectionError("Invalid response size {0} from Kafka".format(size))
+                body = await reader.readexactly(size - 4)
+
+                request, future = self._pending.pop(correlation_id)
+                if future.done():
+                    continue
+                try:
+                    future.set_result((correlation_id, request.response.from_bytebuffer(correlation_id, ByteBuffer(body, zero_copy=True))))
+                except Exception as e:
+                    future.set_exception(e)
+        except (ConnectionError, KeyError, OSError, asyncio.IncompleteReadError) as e:
+            if self._stream_reader is reader:
+                log.warn("Failed reading responses from Kafka broker {0}: {1}".format(self.id, e))
+                self.close()
+
+    def _fail_pending(self, error):
+        pending = self._pending
+        self._pending = {}
+        for request, future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+class AsyncClient(BaseClient):
+    def __init__(self, **kwargs):
+        """
+        Create a new asyncio Kafka client. This takes the same arguments as Client, and provides the same interfaces
+        as coroutines. The client must be used from a single event loop.
+
+        Args:
+            configuration (ClientConfiguration): a ClientConfiguration object to specify client settings
+            kwargs: keyword arguments that are passed to create a new ClientConfiguration object
+
+        Returns:
+            AsyncClient: the client object, ready for a connect call
+        """
+        super(AsyncClient, self).__init__(**kwargs)
+
+        # The task that refreshes the metadata in the background, if background_refresh_interval is set, and the one that
+        # replaces the metadata loaded from a snapshot
+        self._refresher = None
+        self._revalidation = None
+
+    async def connect(self):
+        """
+        Connect to all the cluster brokers and populate topic and partition information. This works the same as
+        Client.connect, except that bootstrapping from Zookeeper is done in the default executor of the event loop, and
+        the background metadata refresh and the revalidation of a metadata snapshot run as tasks on the event loop
+        instead of in threads
+
+        Raises:
+            ConnectionError: If the cluster information cannot be fetched from any of the bootstrap brokers
+        """
+        from_snapshot = False
+        if self.configuration.zkconnect is not None:
+            loop = asyncio.get_event_loop()
+            cluster = await loop.run_in_executor(None, functools.partial(Cluster.create_from_zookeeper,
+                                                                         zkconnect=self.configuration.zkconnect,
+                                                                         fetch_topics=False))
+            for broker_id in list(cluster.brokers.keys()):
+                cluster.add_broker(AsyncBroker.from_broker(cluster.brokers[broker_id], configuration=self.configuration))
+            self.cluster = cluster
+            self._connected = True
+        else:
+            from_snapshot = self._maybe_load_snapshot()
+
+            # Connect to bootstrap brokers until we succeed or exhaust the list
+            try_brokers = list(self.configuration.broker_list)
+            self._connected = from_snapshot
+            while (len(try_brokers) > 0) and not self._connected:
+                self._connected = await self._maybe_bootstrap_cluster(try_brokers.pop())
+
+            if not self._connected:
+                raise ConnectionError("Unable to bootstrap cluster information")
+
+        # Connect to all brokers, unless they are to be connected to when first used. Failures are ignored here, as
+        # sends will attempt to reconnect
+        if not self.configuration.lazy_connect:
+            await asyncio.gather(*[broker.connect() for broker in self.cluster.brokers.values() if broker.hostname is not None],
+                                 return_exceptions=True)
+
+        if from_snapshot:
+            self._revalidation = asyncio.ensure_future(self._revalidate_snapshot())
+        elif self.configuration.zkconnect is None:
+            await self._save_snapshot()
+
+        self._stop_refresher()
+        if self.configuration.background_refresh_interval is not None:
+            self._refresher = asyncio.ensure_future(self._refresh_loop(self.configuration.background_refresh_interval))
+
+    async def close(self):
+        """
+        Close connections to all brokers. The configuration information is retained, so calling connect() again will
+        reconnect to all brokers.
+        """
+        self._stop_refresher()
+        await self._stop_revalidation()
+        if self._connected:
+            await self._save_snapshot()
+        for broker_id in self.cluster.brokers:
+            self.cluster.brokers[broker_id].close()
+        self._connected = False
+
+    async def list_topics(self, cache=True):
+        """
+        Get a list of all topics in the cluster
+
+        Args:
+            cache (boolean): If False, ignore cached metadata and always fetch from the cluster
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        """
+        self._raise_if_not_connected()
+        await self._maybe_update_full_metadata(cache)
+        return list(self.cluster.topics.keys())
+
+    async def get_topic(self, topic_name, cache=True):
+        """
+        Get information on a topic in the cluster. See Client.get_topic
+
+        Args:
+            topic_name (string): The name of the topic to return
+            cache (boolean): If False, ignore cached metadata and always fetch from the cluster
+
+        Returns:
+            Topic: The Topic object holding the detail for the topic
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+            TopicError: If the topic does not exist, or there is a problem getting metadata for it
+        """
+        self._raise_if_not_connected()
+        if self._topic_needs_update(topic_name, cache):
+            metadata = await self._send_any_broker(TopicMetadataV2Request({'topics': [topic_name]}))
+            raise_if_error(TopicError, metadata['topics'][0]['error'])
+            self._update_from_metadata(metadata)
+
+        return self.cluster.topics[topic_name]
+
+    async def list_groups(self, cache=True):
+        """
+        Get a list of all groups in the cluster. The ListGroups requests to all brokers are sent concurrently
+
+        Args:
+            cache (boolean): If False, ignore cached groups and always fetch from the cluster
+
+        Returns:
+            list (string): a list of valid group names in the cluster
+            int: the number of brokers that failed to response
+        """
+        self._raise_if_not_connected()
+        error_counter = await self._maybe_update_groups_list(cache)
+        return list(self.cluster.groups.keys()), error_counter
+
+    async def get_group(self, group_name, cache=True):
+        """
+        Get information on a group in the cluster. See Client.get_group
+
+        Args:
+            group_name (string): The name of the group to return
+            cache (boolean): If False, ignore cached information and always fetch from the cluster
+
+        Returns:
+            Group: The Group object holding the detail for the group
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+            GroupError: If the group does not exist or there is a problem fetching information for it
+        """
+        self._raise_if_not_connected()
+        if self._group_needs_update(group_name, cache):
+            group_info = await self._send_group_aware_request(group_name, DescribeGroupsV0Request({'group_ids': [group_name]}))
+            raise_if_error(GroupError, group_info['groups'][0]['error'])
+            self._update_groups_from_describe(group_info)
+
+        return self.cluster.groups[group_name]
+
+    async def describe_groups(self, group_names, cache=True):
+        """
+        Get information on many groups in the cluster at once, with one DescribeGroups request to each coordinator. See
+        Client.describe_groups
+
+        Returns:
+            dict (string -> Group): a mapping of group names to the Group object holding the detail for each group
+            dict (string -> int): a mapping of group names to the error code for each group that could not be described
+
+        Raises:
+            ConnectionError: If there is a failure to send the coordinator lookups to all brokers in the cluster
+        """
+        self._raise_if_not_connected()
+        groups = {}
+        errors = {}
+        pending = []
+        for group_name in group_names:
+            if self._group_needs_update(group_name, cache):
+                pending.append(group_name)
+            else:
+                groups[group_name] = self.cluster.groups[group_name]
+
+        for attempt in range(2):
+            if len(pending) == 0:
+                break
+            buckets, lookup = self._bucket_groups_by_coordinator(pending)
+            if len(lookup) > 0:
+                lookups = await asyncio.gather(*[self._send_any_broker(GroupCoordinatorV0Request({'group_id': group_name}))
+                                                 for group_name in lookup])
+                self._add_coordinator_lookups(buckets, lookup, lookups, errors)
+
+            responses = await self._send_some_brokers(dict((broker_id, DescribeGroupsV0Request({'group_ids': bucket}))
+                                                           for broker_id, bucket in buckets.items()))
+            pending = self._apply_describe_responses(buckets, responses, groups, errors)
+        return groups, errors
+
+    async def describe_all_groups(self, cache=True):
+        """
+        Get information on all the groups in the cluster. See Client.describe_all_groups
+
+        Returns:
+            dict (string -> Group): a mapping of group names to the Group object holding the detail for each group
+            dict (string -> int): a mapping of group names to the error code for each group that could not be described
+            int: the number of brokers that failed to respond to the ListGroups request
+        """
+        group_names, error_counter = await self.list_groups(cache)
+        groups, errors = await self.describe_groups(group_names, cache)
+        return groups, errors, error_counter
+
+    async def get_offsets_for_topic(self, topic_name, timestamp=BaseClient.OFFSET_LATEST):
+        """
+        Get the offsets for all the partitions in the specified topic. See Client.get_offsets_for_topic
+
+        Return:
+            TopicOffsets: A TopicOffsets instance that contain offsets for all the partitions in the topic.
+        """
+        offsets = await self.get_offsets_for_topics([topic_name], timestamp)
+        return offsets[topic_name]
+
+    async def get_offsets_for_topics(self, topic_list, timestamp=BaseClient.OFFSET_LATEST):
+        """
+        Get the offsets for all the partitions in the specified topics. The ListOffsets requests to the leader brokers
+        are sent concurrently. See Client.get_offsets_for_topics
+
+        Return:
+            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
+                offsets for all the partitions in the topic.
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to a broker
+            TopicError: If a topic does not exist or there is a problem getting information for it
+            OffsetError: If there is a failure retrieving offsets for the specified topic or timestamp
+            TypeError: If the timestamp is not an integer
+        """
+        self._raise_if_not_connected()
+        if not isinstance(timestamp, six.integer_types):
+            raise TypeError("timestamp must be a valid integer")
+
+        await self._maybe_update_metadata_for_topics(topic_list)
+        request_values = self._list_offsets_values(topic_list, timestamp)
+        requests = dict((broker_id, ListOffsetV1Request(request_values[broker_id])) for broker_id in request_values)
+        return self._parse_list_offsets_responses(await self._send_some_brokers(requests, ignore_errors=False))
+
+    async def get_offsets_for_group(self, group_name, topic_list=None):
+        """
+        Get the latest offsets committed by the specified group. See Client.get_offsets_for_group
+
+        Return:
+            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
+                offsets for all the partitions in the topic
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            TopicError: If the topic does not exist or there is a problem getting information for it
+            GroupError: If there is a failure to get information for the specified group
+            OffsetError: If there is a failure retrieving offsets for the topic(s)
+        """
+        offsets = await self.get_offsets_for_groups([group_name], topic_list)
+        return offsets[group_name]
+
+    async def get_offsets_for_groups(self, group_names, topic_list=None):
+        """
+        Get the latest offsets committed by each of the specified groups. The requests for all the groups are sent
+        concurrently. See Client.get_offsets_for_groups
+
+        Return:
+            dict (string -> dict): A dictionary mapping group names to a dictionary of topic names to TopicOffsets
+                instances
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            TopicError: If a topic does not exist or there is a problem getting information for it
+            GroupError: If there is a failure to get information for any of the specified groups
+            OffsetError: If there is a failure retrieving offsets for the topic(s)
+        """
+        self._raise_if_not_connected()
+
+        groups = await asyncio.gather(*[self.get_group(group_name) for group_name in group_names])
+        fetch_topics = dict((group.name, self._get_topics_for_group(group, topic_list)) for group in groups)
+        await self._maybe_update_metadata_for_topics(list(set(topic for topics in fetch_topics.values() for topic in topics)))
+
+        responses = await asyncio.gather(*[self._send_group_aware_request(group_name,
+                                                                          OffsetFetchV1Request(self._offset_fetch_values(group_name,
+                                                                                                                         fetch_topics[group_name])))
+                                           for group_name in group_names])
+        return dict((group_name, self._parse_offset_fetch_response(response)) for group_name, response in zip(group_names, responses))
+
+    async def get_lag(self, groups=None, topics=None):
+        """
+        Get the consumer lag for many groups at once. See Client.get_lag
+
+        Returns:
+            dict (string -> GroupLag): a mapping of group names to GroupLag instances
+            dict (string -> int): a mapping of group names to the error code for each group that lag could not be
+                computed for
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+        """
+        self._raise_if_not_connected()
+        if groups is None:
+            groups = (await self.list_groups())[0]
+
+        errors = {}
+        described = {}
+        if topics is None:
+            described, errors = await self.describe_groups(groups)
+            wanted = set(topic for group in described.values() for topic in group.subscribed_topics())
+        else:
+            wanted = set(topics)
+
+        await self._maybe_update_metadata_for_topics(list(wanted))
+        fetch_topics = self._lag_topics(groups, topics, described)
+        if len(fetch_topics) == 0:
+            return {}, errors
+
+        end_offsets = await self.get_offsets_for_topics(list(set(topic for group_topics in fetch_topics.values() for topic in group_topics)))
+        responses = await self._send_group_aware_requests(dict((group_name, OffsetFetchV1Request(self._offset_fetch_values(group_name, group_topics)))
+                                                               for group_name, group_topics in fetch_topics.items()),
+                                                          errors, self._described_coordinators(described))
+        return self._lags_from_offset_fetches(responses, end_offsets, errors), errors
+
+    async def set_offsets_for_group(self, group_name, topic_offsets):
+        """
+        Given a group name and a list of topics and offsets, write the offsets as the latest for the group. See
+        Client.set_offsets_for_group
+
+        Returns:
+            dict (string -> list): a map of topic names to a list of error code responses for each partition. Error code
+                0 indicates no error.
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            TypeError: if the topic_offsets argument is not properly formatted
+            GroupError: If the group is not in the "Empty" state (if it is a new consumer), or if the group coordinator
+                is unavailable
+        """
+        self._raise_if_not_connected()
+        self._raise_if_not_offsets_list(topic_offsets)
+        self._raise_if_group_active(await self.get_group(group_name))
+
+        await self._maybe_update_metadata_for_topics([offsets.topic.name for offsets in topic_offsets])
+        response = await self._send_group_aware_request(group_name, self._set_offset_request(group_name, topic_offsets))
+        return self._parse_set_offset_response(response)
+
+    async def set_offsets_for_groups(self, group_offsets, topics=None):
+        """
+        Set the offsets for many groups at once. See Client.set_offsets_for_groups
+
+        Returns:
+            dict (string -> dict): a mapping of group names to a map of topic names to a list of error code responses
+                for each partition, for the groups that offsets were committed for
+            dict (string -> int): a mapping of group names to the error code for each group that offsets were not
+                committed for
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            TypeError: If the offsets for any group are not properly formatted, or if targets are used without topics
+            TopicError: If a topic does not exist or there is a problem getting information for it
+        """
+        self._raise_if_not_connected()
+        targets = self._raise_if_not_group_offsets(group_offsets, topics)
+        described, errors = await self.describe_groups(list(group_offsets.keys()), cache=False)
+
+        fetch_topics = set(topics or [])
+        for offsets in group_offsets.values():
+            if not isinstance(offsets, six.integer_types):
+                fetch_topics.update(topic_offsets.topic.name for topic_offsets in offsets)
+        await self._maybe_update_metadata_for_topics(list(fetch_topics))
+
+        target_list = list(targets)
+        target_offsets = dict(zip(target_list, await asyncio.gather(*[self.get_offsets_for_topics(topics, target) for target in target_list])))
+        if self._offsets_past_end(target_offsets):
+            latest = target_offsets.get(self.OFFSET_LATEST) or await self.get_offsets_for_topics(topics)
+            self._set_past_end_offsets(target_offsets, latest)
+
+        commits = self._group_offsets_to_set(group_offsets, topics, described, target_offsets, errors)
+        responses = await self._send_group_aware_requests(dict((group_name, self._set_offset_request(group_name, offsets))
+                                                               for group_name, offsets in commits.items()),
+                                                          errors, self._described_coordinators(described))
+        return dict((group_name, self._parse_set_offset_response(response)) for group_name, response in responses.items()), errors
+
+    async def send_to_leaders(self, items, build_request, parse_response):
+        """
+        Send work that is addressed to partitions to the leader of each partition, and collect the results. See
+        Client.send_to_leaders
+
+        Returns:
+            dict (tuple -> object): a mapping of items to the result for each item that succeeded
+            dict (tuple -> int): a mapping of items to the error code for each item that failed
+
+        Raises:
+            ConnectionError: If there is a failure to send the metadata request to all brokers in the cluster
+        """
+        self._raise_if_not_connected()
+        if not isinstance(items, dict):
+            items = dict((item, None) for item in items)
+
+        await self._maybe_update_metadata_for_topics(list(set(topic_name for topic_name, partition in items)))
+        results = {}
+        errors = {}
+        pending = items
+        for attempt in range(self.configuration.num_retries + 1):
+            if attempt > 0:
+                stale_topics = set(topic_name for topic_name, partition in pending if error_invalidates_metadata(errors[(topic_name, partition)]))
+                if len(stale_topics) > 0:
+                    self._invalidate_topics(stale_topics)
+                    await self._maybe_update_metadata_for_topics(list(stale_topics))
+                else:
+                    await asyncio.sleep(self.configuration.retry_backoff)
+
+            routed = self._route_to_leaders(pending, errors)
+            requests = dict((broker_id, build_request(broker_items)) for broker_id, broker_items in routed.items())
+            responses = await self._send_some_brokers(requests) if len(requests) > 0 else {}
+            self._gather_leader_responses(routed, responses, parse_response, results, errors)
+
+            pending = self._retriable_items(pending, errors)
+            if len(pending) == 0:
+                break
+        return results, errors
+
+    ##########################################################################
+    # PRIVATE HELPER METHODS
+    ##########################################################################
+
+    def _new_broker(self, hostname, **kwargs):
+        return AsyncBroker(hostname, configuration=self.configuration, **kwargs)
+
+    async def _maybe_bootstrap_cluster(self, broker_port):
+        """Attempt to bootstrap the cluster information using the given broker"""
+        broker = self._new_broker(broker_port[0], port=broker_port[1])
+
+        try:
+            await broker.connect()
+            correlation_id, metadata = await broker.send(TopicMetadataV2Request({'topics': None}))
+        except ConnectionError:
+            # Just skip to the next bootstrap broker
+            return False
+        finally:
+            broker.close()
+
+        self._controller_id = metadata['controller_id']
+        self._update_from_metadata(metadata)
+        self._last_full_metadata = time.time()
+        return True
+
+    async def _send_to_broker(self, broker_id, request):
+        correlation_id, response = await self.cluster.brokers[broker_id].send(request)
+        return response
+
+    async def _send_any_broker(self, request):
+        """
+        Sends a request to any broker, trying each broker in a random order until one succeeds
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        """
+        broker_ids = [broker_id for broker_id in self.cluster.brokers if self.cluster.brokers[broker_id].hostname is not None]
+        shuffle(broker_ids)
+        for broker_id in broker_ids:
+            try:
+                return await self._send_to_broker(broker_id, request)
+            except ConnectionError:
+                # We're going to ignore failures unless we exhaust brokers
+                pass
+
+        raise ConnectionError("Failed to send request to any broker")
+
+    async def _send_some_brokers(self, requests, ignore_errors=True):
+        """
+        Sends requests to one or more brokers concurrently. The responses are returned mapped to the broker that they
+        were retrieved from
+
+        Args:
+            requests (int -> BaseRequest): A dictionary, where keys are integer broker IDs and the values are valid
+                request objects that inherit from BaseRequest.
+            ignore_errors (boolean): If False, raise the first ConnectionError instead of returning None for it
+
+        Returns:
+            dict (int -> BaseResponse): A map of broker IDs to response instances. Failed requests are represented with
+                a value of None
+        """
+        broker_ids = list(requests.keys())
+        results = await asyncio.gather(*[self._send_to_broker(broker_id, requests[broker_id]) for broker_id in broker_ids],
+                                       return_exceptions=True)
+
+        responses = {}
+        for broker_id, result in zip(broker_ids, results):
+            if isinstance(result, ConnectionError) and ignore_errors:
+                # Individual broker failures are OK, as we'll represent them with a None value
+                result = None
+            elif isinstance(result, Exception):
+                raise result
+            responses[broker_id] = result
+        return responses
+
+    async def _send_all_brokers(self, request):
+        return await self._send_some_brokers(dict((broker_id, request) for broker_id in self.cluster.brokers
+                                                  if self.cluster.brokers[broker_id].hostname is not None))
+
+    async def _send_group_aware_request(self, group_name, request, coordinator=None, errors=None):
+        """
+        Sends a request to the broker currently serving as the group coordinator for the specified group name, setting
+        the group coordinator as a side effect. Cached coordinators are used the same as in Client. See
+        Client._send_group_aware_request
+
+        Args:
+            group_name (string): The name of the group to send the request for
+            request (BaseRequest): The request to send to the coordinator
+            coordinator (Broker): A coordinator that was just found for the group, to send to without looking it up
+            errors (dict): If provided, and the coordinator lookup returns an error, the error code is added to this
+                mapping of group names to error codes, and None is returned instead of raising an error
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to the coordinator broker, or a failure to
+                retrieve the coordinator information
+            GroupError: If an error is returned when fetching coordinator information, and errors is not provided
+        """
+        coordinator = coordinator or self._cached_coordinator(group_name)
+        if coordinator is not None:
+            try:
+                response = await self._send_to_broker(coordinator.id, request)
+                if not self._coordinator_moved(group_name, response, cached=True):
+                    return response
+            except ConnectionError:
+                self._invalidate_coordinator(group_name)
+
+        response = await self._send_any_broker(GroupCoordinatorV0Request({'group_id': group_name}))
+        if (errors is not None) and (response['error'] != 0):
+            errors[group_name] = response['error']
+            return None
+        coordinator = self._set_group_coordinator(group_name, response)
+        try:
+            response = await self._send_to_broker(coordinator.id, request)
+        except ConnectionError:
+            self._invalidate_coordinator(group_name)
+            raise
+        self._coordinator_moved(group_name, response)
+        return response
+
+    async def _send_group_aware_requests(self, group_requests, errors, coordinators=None):
+        """
+        Sends requests for many groups at once, each to the coordinator for its group. Groups whose coordinator cannot
+        be found, or whose request fails even after looking up the coordinator, are added to errors (with an error code
+        of -1 for a failed request) instead of failing all the groups. See Client._send_group_aware_requests
+
+        Returns:
+            dict (string -> BaseResponse): a mapping of group names to the response for the request for that group
+        """
+        coordinators = coordinators or {}
+        group_names = list(group_requests.keys())
+        results = await asyncio.gather(*[self._send_group_aware_request(group_name, group_requests[group_name],
+                                                                        coordinators.get(group_name), errors)
+                                         for group_name in group_names], return_exceptions=True)
+
+        responses = {}
+        for group_name, result in zip(group_names, results):
+            if isinstance(result, ConnectionError):
+                errors[group_name] = -1
+            elif isinstance(result, Exception):
+                raise result
+            elif result is not None:
+                responses[group_name] = result
+        return responses
+
+    def _stop_refresher(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def _stop_revalidation(self):
+        if self._revalidation is not None:
+            self._revalidation.cancel()
+            await asyncio.gather(self._revalidation, return_exceptions=True)
+            self._revalidation = None
+
+    async def _save_snapshot(self):
+        """
+        If a metadata snapshot is configured, save the cluster information to it. The cluster is encoded on the event
+        loop, and the file is written in the default executor so that disk I/O does not block the loop. Failures are
+        only logged
+        """
+        if self.configuration.metadata_snapshot is None:
+            return
+        data = self._encode_snapshot()
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, write_snapshot, self.configuration.metadata_snapshot, data)
+        except (IOError, OSError) as e:
+            log.warn("Failed to save metadata snapshot: {0}".format(e))
+
+    async def _refresh_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._refresh_metadata()
+            except Exception as e:
+                # Callers will fetch the metadata themselves if it expires before the next refresh succeeds
+                log.warn("Background metadata refresh failed: {0}".format(e))
+
+    async def _revalidate_snapshot(self):
+        try:
+            await self._refresh_metadata()
+        except Exception as e:
+            log.warn("Failed to fetch metadata to replace the snapshot: {0}".format(e))
+
+    async def _refresh_metadata(self):
+        # Both requests are sent before either response is applied, so the cluster is updated without yielding to other
+        # tasks in between
+        metadata, group_lists = await asyncio.gather(self._send_any_broker(TopicMetadataV2Request({'topics': None})),
+                                                     self._send_all_brokers(ListGroupsV0Request({})))
+        self._update_from_metadata(metadata, delete=True)
+        self._update_groups_from_lists(group_lists)
+        self._last_full_metadata = self._last_group_list = time.time()
+        await self._save_snapshot()
+
+    async def _maybe_update_metadata_for_topics(self, topics, cache=True):
+        if any(self._topic_needs_update(topic, cache) for topic in topics):
+            self._update_from_metadata(await self._send_any_broker(TopicMetadataV2Request({'topics': topics})), delete=False)
+
+    async def _maybe_update_full_metadata(self, cache=True):
+        if self._full_metadata_expired(cache):
+            self._update_from_metadata(await self._send_any_broker(TopicMetadataV2Request({'topics': None})), delete=True)
+            self._last_full_metadata = time.time()
+
+    async def _maybe_update_groups_list(self, cache=True):
+        if self._groups_list_expired(cache):
+            error_counter = self._update_groups_from_lists(await self._send_all_brokers(ListGroupsV0Request({})))
+            self._last_group_list = time.time()
+            return error_counter
+        return 0
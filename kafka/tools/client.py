@@ -15,53 +15,57 @@
 # specific language governing permissions and limitations
 # under the License.
 
-from multiprocessing.pool import ThreadPool
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
 from random import shuffle
-from threading import RLock
-import collections
+import json
+from threading import Condition, Event, Lock, RLock, Thread
 import six
 import time
 
+from kafka.tools import log
 from kafka.tools.configuration import ClientConfiguration
-from kafka.tools.exceptions import ConnectionError, GroupError, TopicError, ConfigurationError
+from kafka.tools.exceptions import ConnectionError, GroupError, OffsetError, TopicError, ConfigurationError
+from kafka.tools.executor import BoundedExecutor
+from kafka.tools.multiplexer import BrokerMultiplexer
+from kafka.tools.protocol.errors import error_invalidates_coordinator, error_invalidates_metadata, error_retriable
 from kafka.tools.protocol.requests.describe_groups_v0 import DescribeGroupsV0Request
 from kafka.tools.protocol.requests.group_coordinator_v0 import GroupCoordinatorV0Request
 from kafka.tools.protocol.requests.list_groups_v0 import ListGroupsV0Request
 from kafka.tools.protocol.requests.list_offset_v1 import ListOffsetV1Request
 from kafka.tools.protocol.requests.offset_commit_v2 import OffsetCommitV2Request
 from kafka.tools.protocol.requests.offset_fetch_v1 import OffsetFetchV1Request
+from kafka.tools.protocol.requests.offset_fetch_v2 import OffsetFetchV2Request
 from kafka.tools.protocol.requests.topic_metadata_v2 import TopicMetadataV2Request
 from kafka.tools.models.broker import Broker
 from kafka.tools.models.cluster import Cluster
-from kafka.tools.models.group import Group
+from kafka.tools.models.group import Group, GroupLag
+from kafka.tools.models.partition import PartitionDelta
 from kafka.tools.models.topic import Topic, TopicOffsets
-from kafka.tools.utilities import synchronized, raise_if_error
+from kafka.tools.snapshot import encode_snapshot, load_snapshot, write_snapshot
+from kafka.tools.utilities import json_loads, synchronized, raise_if_error
 
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
 
-class Client:
+
+class BaseClient(object):
+    """
+    The parts of the Kafka client that do not perform network I/O: configuration, cluster state, and the building
+    and parsing of requests. Client and AsyncClient add the transport on top of this
+    """
     # Special timestamps for offset requests
     OFFSET_EARLIEST = -2
     OFFSET_LATEST = -1
 
     def __init__(self, **kwargs):
         """
-        Create a new Kafka client. There are two ways to instantiate the client:
-            1) Provide a ClientConfiguration object with configuration=obj. This specifies all the configuration options
-               for the client, or uses the defaults in ClientConfiguration. If the configuration keyword argument is
-               present, all other arguments are ignored
-
-            2) Provide keyword arguments that will be passed to create a new ClientConfiguration object. If the
-               configuration keyword argument is not provided, this is the option that is chosen.
+        Set up the client configuration and an empty cluster. The arguments are the same as for Client
 
-        The client will not be connected, either using the broker_list or the zkconnect option, until the connect()
-        method is called
-
-        Args:
-            configuration (ClientConfiguration): a ClientConfiguration object to specify client settings
-            kwargs: keyword arguments that are passed to create a new ClientConfiguration object
-
-        Returns:
-            Client: the Client object, ready for a connect call
+        Raises:
+            ConfigurationError: If the configuration argument is not a ClientConfiguration object
         """
         if 'configuration' in kwargs:
             if not isinstance(kwargs['configuration'], ClientConfiguration):
@@ -75,534 +79,508 @@ class Client:
         self._last_group_list = 0.0
         self.cluster = Cluster()
         self._connected = False
-        self._lock = RLock()
-
-    @synchronized
-    def connect(self):
-        """
-        Connect to the all cluster brokers and populate topic and partition information. If the client was created with
-        a zkconnect string, first we connect to Zookeeper to bootstrap the broker and topic information from there,
-        and then the client connects to all brokers in the cluster. Otherwise, connect to the bootstrap broker
-        specified and fetch the broker and topic metadata for the cluster.
+        self._metadata_listeners = []
 
-        Todo:
-            * Currently assumes everything works. Need to check for failure to connect to
-              ZK or bootstrap.
+    def add_metadata_listener(self, callback):
         """
-        if self.configuration.zkconnect is not None:
-            self.cluster = Cluster.create_from_zookeeper(zkconnect=self.configuration.zkconnect, fetch_topics=False)
-            self._connected = True
-        else:
-            # Connect to bootstrap brokers until we succeed or exhaust the list
-            try_brokers = list(self.configuration.broker_list)
-            self._connected = False
-            while (len(try_brokers) > 0) and not self._connected:
-                self._connected = self._maybe_bootstrap_cluster(try_brokers.pop())
-
-            if not self._connected:
-                raise ConnectionError("Unable to bootstrap cluster information")
+        Register a function to be told about changes to the cluster metadata. After each metadata response is applied,
+        the function is called with a list of PartitionDelta objects for the partitions that were added, removed, or
+        had their leader, replicas, or in-sync replicas change. It is not called if nothing changed.
 
-        # Connect to all brokers
-        self._connect_all_brokers()
+        The function is called on the thread that applied the metadata (with the client lock held, for Client), so it
+        should return quickly and not send requests. Exceptions from it are logged and otherwise ignored.
 
-    @synchronized
-    def close(self):
-        """
-        Close connections to all brokers. The configuration information is retained, so calling connect() again will
-        reconnect to all brokers.
+        Args:
+            callback (function): the function to call with the list of changes
         """
-        for broker_id in self.cluster.brokers:
-            self.cluster.brokers[broker_id].close()
-        self._connected = False
+        self._metadata_listeners.append(callback)
 
-    @synchronized
-    def list_topics(self, cache=True):
-        """
-        Get a list of all topics in the cluster
+    ##########################################################################
+    # PRIVATE HELPER METHODS
+    #
+    # Everything below this point is methods that are not exposed, and are helpers for the
+    # actual exposed interfaces.
+    ##########################################################################
 
-        Args:
-            cache (boolean): If False, ignore cached metadata and always fetch from the cluster
+    def _raise_if_not_connected(self):
+        if not self._connected:
+            raise ConnectionError("The client is not yet connected")
 
-        Raises:
-            ConnectionError: If there is a failure to send the request to all brokers in the cluster
-        """
-        self._raise_if_not_connected()
-        self._maybe_update_full_metadata(cache)
-        return list(self.cluster.topics.keys())
+    def _new_broker(self, hostname, **kwargs):
+        """Create a broker object that uses the client configuration. Subclasses override this to use other transports"""
+        return Broker(hostname, configuration=self.configuration, **kwargs)
 
-    @synchronized
-    def get_topic(self, topic_name, cache=True):
+    def _make_broker(self, broker_dict):
+        return self._new_broker(broker_dict['host'], id=broker_dict['node_id'], port=broker_dict['port'])
+
+    def _set_group_coordinator(self, group_name, response):
         """
-        Get information on a topic in the cluster. If cache is True, used cached topic metadata
-        if it has not expired. Otherwise, perform a metadata request to refresh information on
-        the topic first.
+        Given a GroupCoordinator response, set the coordinator for the group, creating the group and the coordinator
+        broker in the cluster if needed
 
         Args:
-            topic_name (string): The name of the topic to return
-            cache (boolean): If False, ignore cached metadata and always fetch from the cluster
+            group_name (string): The name of the group the coordinator was fetched for
+            response (GroupCoordinatorV0Response): The response to the coordinator request for the group
 
         Returns:
-            Topic: The Topic object holding the detail for the topic
+            Broker: the coordinator broker for the group
 
         Raises:
-            ConnectionError: If there is a failure to send the request to all brokers in the cluster
-            TopicError: If the topic does not exist, or there is a problem getting metadata for it
+            GroupError: If an error is returned in the coordinator response
         """
-        self._raise_if_not_connected()
+        raise_if_error(GroupError, response['error'])
+
+        if group_name not in self.cluster.groups:
+            self.cluster.add_group(Group(group_name))
         try:
-            topic = self.cluster.topics[topic_name]
-            force_update = (not cache) or (not topic.updated_since(time.time() - self.configuration.metadata_refresh))
+            self.cluster.groups[group_name].coordinator = self.cluster.brokers[response['node_id']]
         except KeyError:
-            force_update = True
-
-        if force_update:
-            # It doesn't matter what broker we fetch topic metadata from
-            metadata = self._send_any_broker(TopicMetadataV2Request({'topics': [topic_name]}))
-            raise_if_error(TopicError, metadata['topics'][0]['error'])
+            broker = self._make_broker(response)
+            self.cluster.add_broker(broker)
+            self.cluster.groups[group_name].coordinator = broker
+        self.cluster.groups[group_name]._coordinator_updated = time.time()
+        return self.cluster.groups[group_name].coordinator
 
-            self._update_from_metadata(metadata)
+    def _cached_coordinator(self, group_name, max_age=None):
+        """
+        Get the coordinator for a group without looking it up, if the coordinator_cache_ttl configuration is set and the
+        coordinator was found within that many seconds
 
-        return self.cluster.topics[topic_name]
+        Args:
+            group_name (string): The name of the group to get the coordinator for
+            max_age (int): If provided, use this many seconds instead of the coordinator_cache_ttl configuration
 
-    @synchronized
-    def list_groups(self, cache=True):
+        Returns:
+            Broker: the coordinator broker for the group, or None if it needs to be looked up
         """
-        Get a list of all topics in the cluster. This is done by sending a ListGroups request to
-        every broker in the cluster and collating the responses.
+        max_age = self.configuration.coordinator_cache_ttl if max_age is None else max_age
+        if max_age is None:
+            return None
+        group = self.cluster.groups.get(group_name)
+        if (group is None) or (not group.coordinator_updated_since(time.time() - max_age)):
+            return None
+        return group.coordinator
+
+    def _bucket_groups_by_coordinator(self, group_names):
+        """
+        Sort groups by their known coordinators, for sending one request per coordinator. Coordinators from ListGroups
+        responses or earlier lookups are used if they are not older than the coordinator_cache_ttl configuration, or
+        metadata_refresh if that is not set
 
         Args:
-            cache (boolean): If False, ignore cached groups and always fetch from the cluster
+            group_names (list): a list of the group name strings to sort
 
         Returns:
-            list (string): a list of valid group names in the cluster
-            int: the number of brokers that failed to response
+            dict (int -> list): a mapping of coordinator broker IDs to the names of the groups they coordinate
+            list (string): the names of the groups whose coordinators need to be looked up
         """
-        self._raise_if_not_connected()
-        error_counter = self._maybe_update_groups_list(cache)
-        return list(self.cluster.groups.keys()), error_counter
+        max_age = self.configuration.coordinator_cache_ttl or self.configuration.metadata_refresh
+        buckets = {}
+        lookup = []
+        for group_name in group_names:
+            coordinator = self._cached_coordinator(group_name, max_age=max_age)
+            if coordinator is None:
+                lookup.append(group_name)
+            else:
+                buckets.setdefault(coordinator.id, []).append(group_name)
+        return buckets, lookup
+
+    def _add_coordinator_lookups(self, buckets, group_names, responses, errors):
+        """
+        Set the coordinators for groups from GroupCoordinator responses, adding each group to the bucket for its
+        coordinator. Groups that the coordinator could not be found for are added to the errors instead
 
-    @synchronized
-    def get_group(self, group_name, cache=True):
+        Args:
+            buckets (dict): a mapping of coordinator broker IDs to lists of group names, as from _bucket_groups_by_coordinator
+            group_names (list): the names of the groups that were looked up
+            responses (list): the GroupCoordinator responses for the groups, in the same order
+            errors (dict): a mapping of group names to error codes, to add failed lookups to
         """
-        Get information on a group in the cluster. If cache is True, used cached group information
-        if it has not expired. Otherwise, send a request to refresh information on the group first.
+        for group_name, response in zip(group_names, responses):
+            if response['error'] != 0:
+                errors[group_name] = response['error']
+                continue
+            coordinator = self._set_group_coordinator(group_name, response)
+            buckets.setdefault(coordinator.id, []).append(group_name)
+
+    def _apply_describe_responses(self, buckets, responses, groups, errors):
+        """
+        Update the cluster with the groups from DescribeGroups responses from the coordinators. All the groups are
+        updated in a single call to _update_groups_from_describe
 
         Args:
-            group_name (string): The name of the group to return
-            cache (boolean): If False, ignore cached information and always fetch from the cluster
+            buckets (dict): a mapping of coordinator broker IDs to the names of the groups that were sent to them
+            responses (dict): a mapping of coordinator broker IDs to the DescribeGroups response, or None if the
+                coordinator failed
+            groups (dict): a mapping of group names to Group objects, to add the described groups to
+            errors (dict): a mapping of group names to error codes, to add groups that were not described to. Groups
+                that were sent to a coordinator that failed have an error code of -1 (UNKNOWN)
 
         Returns:
-            Group: The Group object holding the detail for the group
+            list (string): the names of the groups that were sent to a broker that is not their coordinator. The
+                coordinators for these groups are invalidated, so they will be looked up if they are sent again
+        """
+        described = []
+        moved = []
+        for broker_id, group_names in buckets.items():
+            if responses.get(broker_id) is None:
+                for group_name in group_names:
+                    self._invalidate_coordinator(group_name)
+                    errors[group_name] = -1
+                continue
 
-        Raises:
-            ConnectionError: If there is a failure to send the request to all brokers in the cluster
-            GroupError: If the group does not exist or there is a problem fetching information for it
+            for group_info in responses[broker_id]['groups']:
+                group_name = group_info['group_id']
+                if group_info['error'] == 0:
+                    described.append(group_info)
+                    errors.pop(group_name, None)
+                    continue
+
+                errors[group_name] = group_info['error']
+                if error_invalidates_coordinator(group_info['error']):
+                    self._invalidate_coordinator(group_name)
+                    moved.append(group_name)
+
+        self._update_groups_from_describe({'groups': described})
+        for group_info in described:
+            groups[group_info['group_id']] = self.cluster.groups[group_info['group_id']]
+        return moved
+
+    def _invalidate_coordinator(self, group_name):
+        """Mark the coordinator for a group as unknown, so that it is looked up before the next request for the group"""
+        if group_name in self.cluster.groups:
+            self.cluster.groups[group_name]._coordinator_updated = 0.0
+
+    def _coordinator_moved(self, group_name, response, cached=False):
         """
-        self._raise_if_not_connected()
-        try:
-            group = self.cluster.groups[group_name]
-            force_update = (not cache) or (not group.updated_since(time.time() - self.configuration.metadata_refresh))
-        except KeyError:
-            force_update = True
+        Check a response from a group coordinator for errors that mean it is not the coordinator for the group. If there
+        are any, the cached coordinator is invalidated. This is only checked when coordinators are cached, or when
+        cached is True
 
-        if force_update:
-            # Group detail must come from the coordinator broker
-            group_info = self._send_group_aware_request(group_name, DescribeGroupsV0Request({'group_ids': [group_name]}))
-            raise_if_error(GroupError, group_info['groups'][0]['error'])
+        Args:
+            group_name (string): The name of the group the request was for
+            response (BaseResponse): The response from the coordinator
+            cached (boolean): If True, the request was sent to a coordinator that was known from an earlier request, even
+                if the coordinator_cache_ttl configuration is not set
 
-            self._update_groups_from_describe(group_info)
+        Returns:
+            boolean: True if the request must be sent again after looking up the coordinator
+        """
+        if (self.configuration.coordinator_cache_ttl is None) and (not cached):
+            return False
+        if any(error_invalidates_coordinator(err_num) for err_num in response.error_codes()):
+            self._invalidate_coordinator(group_name)
+            return True
+        return False
 
-        return self.cluster.groups[group_name]
+    def _offset_fetch_values(self, group_name, topic_list):
+        """Build the values for an OffsetFetch request for all partitions of the listed topics"""
+        return {'group_id': group_name,
+                'topics': [{'topic': topic, 'partitions': list(range(len(self.cluster.topics[topic].partitions)))} for topic in topic_list]}
 
-    @synchronized
-    def get_offsets_for_topic(self, topic_name, timestamp=OFFSET_LATEST):
+    def _parse_offset_fetch_response(self, response, topic_list=None):
         """
-        Get the offsets for all the partitions in the specified topic. The offsets are requested at the specified
-        timestamp, which defaults to the latest offsets available (defined as the offset of the next message to be
-        produced).
+        Given an OffsetFetch response, return a mapping of topic names to TopicOffsets instances
 
         Args:
-            topic_name (string or list): The name of the topic to fetch offsets for. For multiple topics, a list of
-                topics can be provided
-            timestamp (int): The timestamp (in millis) to fetch offsets at. If not specified, the default is the special
-                timestamp OFFSET_LATEST, which requests the current end of the partitions (tail). You can also specify
-                the special offset OFFSET_EARLIEST, which requests the oldest offset for each partition (head)
-
-        Return:
-            TopicOffsets: A TopicOffsets instance that contain offsets for all the partitions in the topic.
+            response (OffsetFetchV1Response): the response to parse
+            topic_list (list): if not None, only the topics in this list are parsed from the response
 
         Raises:
-            ConnectionError: If there is a failure to send the request to a broker
-            TopicError: If the topic does not exist or there is a problem getting information for it
-            OffsetError: If there is a failure retrieving offsets for the specified topic or timestamp
-            TypeError: If the timestamp is not an integer
+            OffsetError: If there is an error for the request or for any partition in the response
         """
-        return self.get_offsets_for_topics([topic_name], timestamp)[topic_name]
+        # Newer versions of the response (from API version negotiation) have an error for the entire request
+        if 'error' in response:
+            raise_if_error(OffsetError, response['error'])
 
-    @synchronized
-    def get_offsets_for_topics(self, topic_list, timestamp=OFFSET_LATEST):
+        rv = {}
+        for topic in response['responses']:
+            topic_name = topic['topic']
+            if (topic_list is not None) and (topic_name not in topic_list):
+                continue
+            rv[topic_name] = TopicOffsets(self.cluster.topics[topic_name])
+            rv[topic_name].set_offsets_from_fetch(topic['partition_responses'])
+        return rv
+
+    def _lag_topics(self, group_names, topics, described):
         """
-        Get the offsets for all the partitions in the specified topics. The offsets are requested at the specified
-        timestamp, which defaults to the latest offsets available (defined as the offset of the next message to be
-        produced).
+        Get the topics to compute lag for each group. These are either the topics provided, or the topics that the
+        members of each group are subscribed to. Topics that are not in the cluster are skipped
 
         Args:
-            topic_list (list): a list of topic name strings to fetch offsets for.
-            timestamp (int): The timestamp (in millis) to fetch offsets at. If not specified, the default is the special
-                timestamp OFFSET_LATEST, which requests the current end of the partitions (tail). You can also specify
-                the special offset OFFSET_EARLIEST, which requests the oldest offset for each partition (head)
-
-        Return:
-            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
-                offsets for all the partitions in the topic.
+            group_names (list): the names of the groups to compute lag for
+            topics (list): a list of topic names, or None to use the topics each group is subscribed to
+            described (dict): a mapping of group names to Group objects with current member information. Only used if
+                topics is None
 
-        Raises:
-            ConnectionError: If there is a failure to send the request to a broker
-            TopicError: If a topic does not exist or there is a problem getting information for it
-            OffsetError: If there is a failure retrieving offsets for the specified topic or timestamp
-            TypeError: If the timestamp is not an integer
+        Returns:
+            dict (string -> list): a mapping of group names to the topics for the group. Groups with no topics are not
+                included
         """
-        self._raise_if_not_connected()
-        if not isinstance(timestamp, six.integer_types):
-            raise TypeError("timestamp must be a valid integer")
+        rv = {}
+        for group_name in group_names:
+            if topics is not None:
+                group_topics = list(topics)
+            elif group_name in described:
+                group_topics = described[group_name].subscribed_topics()
+            else:
+                continue
 
-        # Get the topic information, making sure all the leadership info is current
-        self._maybe_update_metadata_for_topics(topic_list)
+            group_topics = [topic for topic in group_topics if (topic in self.cluster.topics) and (len(self.cluster.topics[topic].partitions) > 0)]
+            if len(group_topics) > 0:
+                rv[group_name] = group_topics
+        return rv
 
-        # Get a broker to topic-partition mapping
-        broker_to_tp = self._map_topic_partitions_to_brokers(topic_list)
+    def _described_coordinators(self, described):
+        """Get the coordinators for groups from describe_groups, to send further requests to without looking them up"""
+        return dict((group_name, group.coordinator) for group_name, group in described.items() if group.coordinator is not None)
 
-        request_values = {}
-        for broker_id in broker_to_tp:
-            request_values[broker_id] = {'replica_id': -1, 'topics': []}
-            for topic_name in broker_to_tp[broker_id]:
-                request_values[broker_id]['topics'].append({'topic': topic_name,
-                                                            'partitions': [{'partition': i,
-                                                                            'timestamp': timestamp} for i in broker_to_tp[broker_id][topic_name]]})
+    def _lags_from_offset_fetches(self, responses, end_offsets, errors):
+        """
+        Compute the lag for groups from their OffsetFetch responses and the log end offsets for the topics
 
-        return self._send_list_offsets_to_brokers(request_values)
+        Args:
+            responses (dict): a mapping of group names to the OffsetFetch response with the committed offsets
+            end_offsets (dict): a mapping of topic names to TopicOffsets instances with the log end offsets
+            errors (dict): a mapping of group names to error codes, to add groups with an error for the entire request to
 
-    @synchronized
-    def get_offsets_for_group(self, group_name, topic_list=None):
+        Returns:
+            dict (string -> GroupLag): a mapping of group names to the lag for each group
         """
-        Get the latest offsets committed by the specified group. If a topic_name is specified, only the offsets for that
-        topic are returned. Otherwise, offsets for all topics that the group is subscribed to are returned.
+        lags = {}
+        for group_name, response in responses.items():
+            if ('error' in response) and (response['error'] != 0):
+                errors[group_name] = response['error']
+                continue
+
+            lag = GroupLag(group_name)
+            for topic in response['responses']:
+                # The response may have partitions that the end offsets do not, if the topic grew since they were fetched
+                topic_name = topic['topic']
+                end = list(end_offsets[topic_name].partitions) if topic_name in end_offsets else []
+                size = max([len(end)] + [partition['partition'] + 1 for partition in topic['partition_responses']])
+                committed = [-1] * size
+                for partition in topic['partition_responses']:
+                    if partition['error'] == 0:
+                        committed[partition['partition']] = partition['offset']
+                lag.add_topic(topic_name, committed, end + [-1] * (size - len(end)))
+            lags[group_name] = lag
+        return lags
+
+    def _set_offset_request(self, group_name, topic_offsets):
+        """
+        Build an OffsetCommit request to set the offsets for a group
 
         Args:
-            group_name (string): The name of the group to fetch offsets for
-            topic_list (list): A list of string topic names to fetch offsets for. Defaults to None, which specifies all
-                topics that are subscribed to by the group.
+            group_name (string): the name of the consumer group to set offsets for
+            topic_offsets (list): a list of TopicOffsets objects which describe the topics and offsets to set
 
-        Return:
-            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
-                offsets for all the partitions in the topic. The dictionary will contain a single key if the topic_name
-                provided is not None.
+        Returns:
+            OffsetCommitV2Request: the request to send to the group coordinator
 
         Raises:
-            ConnectionError: If there is a failure to send requests to brokers
-            TopicError: If the topic does not exist or there is a problem getting information for it
-            GroupError: If there is a failure to get information for the specified group
-            OffsetError: If there is a failure retrieving offsets for the topic(s)
+            TypeError: if any of the TopicOffsets objects are not properly formed
         """
-        self._raise_if_not_connected()
+        request = {'group_id': group_name,
+                   'group_generation_id': -1,
+                   'member_id': '',
+                   'retention_time': -1,
+                   'topics': []}
+        for offset in topic_offsets:
+            if not (isinstance(offset, TopicOffsets) and isinstance(offset.topic, Topic)):
+                raise TypeError("TopicOffsets objects are not properly formed")
 
-        # Get the group we're fetching offsets for (potentially updating the group information)
-        group = self.get_group(group_name)
-        fetch_topics = self._get_topics_for_group(group, topic_list)
+            request['topics'].append({'topic': offset.topic.name,
+                                      'partitions': [{'partition': p_num,
+                                                      'offset': p_offset,
+                                                      'metadata': None} for p_num, p_offset in enumerate(offset.partitions)]})
 
-        # Get the topic information, making sure all the leadership info is current
-        self._maybe_update_metadata_for_topics(fetch_topics)
+        return OffsetCommitV2Request(request)
+
+    def _raise_if_not_offsets_list(self, topic_offsets):
+        if isinstance(topic_offsets, six.string_types) or (not isinstance(topic_offsets, Sequence)):
+            raise TypeError("topic_offsets argument is not a list")
 
-        request_values = {'group_id': group_name,
-                          'topics': [{'topic': topic, 'partitions': list(range(len(self.cluster.topics[topic].partitions)))} for topic in fetch_topics]}
-        response = self._send_group_aware_request(group_name, OffsetFetchV1Request(request_values))
+    def _raise_if_group_active(self, group):
+        if group.state not in (None, 'Empty', 'Dead'):
+            raise GroupError("The consumer group must be in the 'Empty' or 'Dead' state to set offsets, not '{0}'".format(group.state))
 
+    def _parse_set_offset_response(self, response):
         rv = {}
         for topic in response['responses']:
             topic_name = topic['topic']
-            rv[topic_name] = TopicOffsets(self.cluster.topics[topic_name])
-            rv[topic_name].set_offsets_from_fetch(topic['partition_responses'])
+            # Not every partition is committed when offsets are imported, so size the list by the highest partition
+            rv[topic_name] = [-1] * (max([partition['partition'] for partition in topic['partition_responses']] or [-1]) + 1)
+            for partition in topic['partition_responses']:
+                rv[topic_name][partition['partition']] = partition['error']
 
         return rv
 
-    @synchronized
-    def set_offsets_for_group(self, group_name, topic_offsets):
+    def _raise_if_not_group_offsets(self, group_offsets, topics):
         """
-        Given a group name and a list of topics and offsets, write the offsets as the latest for the group. This can only
-        be done if the consumer is an old consumer (committing to Kafka), or if it is a new consumer in the "Empty"
-        state (i.e. not running)
+        Check the offsets given for a bulk reset of group offsets, and find the targets that need to be resolved
 
         Args:
-            group_name (string): the name of the consumer group to set offsets for
-            topic_offsets (list): a list of TopicOffsets objects which describe the topics and offsets to set
+            group_offsets (dict): a mapping of group names to either a list of TopicOffsets objects, or a target
+            topics (list): a list of topic names to reset to the target offsets
 
         Returns:
-            dict (string -> list): a map of topic names to a list of error code responses for each partition. Error code
-                0 indicates no error.
+            set: the targets (OFFSET_EARLIEST, OFFSET_LATEST, or a timestamp in millis) used by any of the groups
 
         Raises:
-            ConnectionError: If there is a failure to send requests to brokers
-            TypeError: if the topic_offsets argument is not properly formatted
-            GroupError: If the group is not in the "Empty" state (if it is a new consumer), or if the group coordinator
-                is unavailable
+            TypeError: If the offsets for a group are neither a list nor an integer target, or if targets are used
+                without a list of topics
         """
-        self._raise_if_not_connected()
-        if isinstance(topic_offsets, six.string_types) or (not isinstance(topic_offsets, collections.Sequence)):
-            raise TypeError("topic_offsets argument is not a list")
-
-        # Get the group we're setting offsets for (potentially updating the group information)
-        group = self.get_group(group_name)
-        if group.state not in (None, 'Empty', 'Dead'):
-            raise GroupError("The consumer group must be in the 'Empty' or 'Dead' state to set offsets, not '{0}'".format(group.state))
-
-        # Get the topic information, making sure all the leadership info is current
-        fetch_topics = [offsets.topic.name for offsets in topic_offsets]
-        self._maybe_update_metadata_for_topics(fetch_topics)
-
-        response = self._send_set_offset_request(group_name, topic_offsets)
-        return self._parse_set_offset_response(response)
-
-    # The following interfaces are for future implementation. The names are set, but the interfaces
-    # are not yet
-    #
-    # def create_topic(self):
-    #     raise NotImplementedError
-    #
-    # def delete_topic(self):
-    #     raise NotImplementedError
-
-    ##########################################################################
-    # PRIVATE HELPER METHODS
-    #
-    # Everything below this point is methods that are not exposed, and are helpers for the
-    # actual exposed interfaces.
-    ##########################################################################
-
-    def _raise_if_not_connected(self):
-        if not self._connected:
-            raise ConnectionError("The client is not yet connected")
-
-    def _maybe_bootstrap_cluster(self, broker_port):
-        """Attempt to bootstrap the cluster information using the given broker"""
-        broker = Broker(broker_port[0], port=broker_port[1], configuration=self.configuration)
-
-        try:
-            broker.connect()
-        except ConnectionError:
-            # Just skip to the next bootstrap broker
-            return False
-
-        # Fetch topic metadata for all topics/brokers
-        req = TopicMetadataV2Request({'topics': None})
-        correlation_id, metadata = broker.send(req)
-        broker.close()
-
-        # Add brokers and topics to cluster
-        self._controller_id = metadata['controller_id']
-        self._update_from_metadata(metadata)
-        self._last_full_metadata = time.time()
-        return True
-
-    def _connect_all_brokers(self):
-        pool = ThreadPool(processes=self.configuration.broker_threads)
-        for broker_id in self.cluster.brokers:
-            pool.apply_async(self.cluster.brokers[broker_id].connect)
-        pool.close()
-        pool.join()
+        targets = set()
+        for offsets in group_offsets.values():
+            if isinstance(offsets, six.integer_types):
+                targets.add(offsets)
+            else:
+                self._raise_if_not_offsets_list(offsets)
+
+        if (len(targets) > 0) and ((topics is None) or isinstance(topics, six.string_types) or (len(topics) == 0)):
+            raise TypeError("A list of topics is required to set offsets for groups to a target")
+        return targets
+
+    def _offsets_past_end(self, target_offsets):
+        """Return True if a timestamp target has any partitions with no messages after the timestamp"""
+        for target, offsets in target_offsets.items():
+            if target < 0:
+                continue
+            for topic_offsets in offsets.values():
+                if any((offset < 0) and (p_num not in topic_offsets.errors) for p_num, offset in enumerate(topic_offsets.partitions)):
+                    return True
+        return False
 
-    def _send_to_broker(self, broker_id, request):
+    def _set_past_end_offsets(self, target_offsets, latest):
         """
-        Given a broker ID and a request, send the request to that broker and return the response
-
-        Args:
-            broker_id (int): The ID of a broker in the cluster
-            request (BaseRequest): A valid request object that inherits from BaseRequest
-
-        Returns:
-            BaseResponse: An instance of the response class associated with the request
-
-        Raises:
-            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        Partitions that have no messages after a timestamp target are set to the latest offset, so that a group reset
+        to that time does not consume anything older
         """
-        correlation_id, response = self.cluster.brokers[broker_id].send(request)
-        return response
-
-    def _send_any_broker(self, request):
+        for target, offsets in target_offsets.items():
+            if target < 0:
+                continue
+            for topic_name, topic_offsets in offsets.items():
+                for p_num, offset in enumerate(topic_offsets.partitions):
+                    if (offset < 0) and (p_num not in topic_offsets.errors):
+                        if p_num in latest[topic_name].errors:
+                            topic_offsets.errors[p_num] = latest[topic_name].errors[p_num]
+                        else:
+                            topic_offsets.partitions[p_num] = latest[topic_name].partitions[p_num]
+
+    def _group_can_set_offsets(self, group_name, described, errors):
         """
-        Sends a request to any broker. This can be used for requests that do not require a
-        specific broker to answer, such as metadata requests
+        Check whether offsets can be set for a group, given its current state. Groups that could not be described or
+        that are active are added to the errors
 
         Args:
-            request (BaseRequest): A valid request object that inherits from BaseRequest
+            group_name (string): the name of the group
+            described (dict): a mapping of group names to Group objects with the current state of each group
+            errors (dict): a mapping of group names to error codes
 
         Returns:
-            BaseResponse: An instance of the response class associated with the request
-
-        Raises:
-            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+            boolean: True if the group is in the "Empty" or "Dead" state
         """
-        broker_ids = list(self.cluster.brokers.keys())
-        shuffle(broker_ids)
-        while len(broker_ids) > 0:
-            broker_id = broker_ids.pop()
-            try:
-                if self.cluster.brokers[broker_id].hostname is not None:
-                    return self._send_to_broker(broker_id, request)
-            except ConnectionError:
-                # We're going to ignore failures unless we exhaust brokers
-                pass
-
-        # If we exhausted all the brokers, we have a serious problem
-        raise ConnectionError("Failed to send request to any broker")
+        if group_name not in described:
+            errors.setdefault(group_name, -1)
+            return False
+        if described[group_name].state not in (None, 'Empty', 'Dead'):
+            # This is the error the coordinator returns for a commit from outside an active group
+            errors[group_name] = 25
+            return False
+        return True
 
-    def _send_some_brokers(self, requests, ignore_errors=True):
+    def _offset_export_lines(self, group_name, response):
         """
-        Sends a request to one or more brokers. The responses are returned mapped to the broker that
-        they were retrieved from. This method uses a thread pool to parallelize sends.
+        Format the offsets committed by a group as lines for an offsets export. Each line is a JSON object with the
+        group, the topic, and a list of the committed offset for each partition (-1 if there is none)
 
         Args:
-            requests (int -> BaseRequest): A dictionary, where keys are integer broker IDs and the values are valid
-                request objects that inherit from BaseRequest.
+            group_name (string): the name of the group
+            response (OffsetFetchV2Response): the response to an OffsetFetch request for all the topics for the group
 
         Returns:
-            dict (int -> BaseResponse): A map of broker IDs to response instances (inherited from
-                BaseResponse). Failed requests are represented with a value of None
+            list (string): a line for each topic in the response
         """
-        results = {}
-        pool = ThreadPool(processes=self.configuration.broker_threads)
-        for broker_id in requests:
-            results[broker_id] = pool.apply_async(self._send_to_broker, (broker_id, requests[broker_id]))
-        pool.close()
-        pool.join()
-
-        responses = {}
-        for broker_id in results:
-            try:
-                responses[broker_id] = results[broker_id].get()
-            except ConnectionError:
-                if ignore_errors:
-                    # Individual broker failures are OK, as we'll represent them with a None value
-                    responses[broker_id] = None
-                else:
-                    raise
-        return responses
-
-    def _send_all_brokers(self, request):
+        lines = []
+        for topic in response['responses']:
+            offsets = [-1] * (max([partition['partition'] for partition in topic['partition_responses']] or [-1]) + 1)
+            for partition in topic['partition_responses']:
+                if partition['error'] == 0:
+                    offsets[partition['partition']] = partition['offset']
+            if any(offset >= 0 for offset in offsets):
+                lines.append(json.dumps({'group': group_name, 'topic': topic['topic'], 'offsets': offsets},
+                                        separators=(',', ':'), sort_keys=True) + '\n')
+        return lines
+
+    def _parse_offset_import_line(self, line, line_number):
         """
-        Sends a request to all brokers. The responses are returned mapped to the broker that
-        they were retrieved from
-
-        Args:
-            request (BaseRequest): A valid request object that inherits from BaseRequest
+        Parse a line from an offsets export
 
         Returns:
-            dict (int -> BaseResponse): A map of broker IDs to response instances (inherited from
-                BaseResponse). Failed requests are represented with a value of None
-        """
-        requests = {}
-        for broker_id in self.cluster.brokers:
-            if self.cluster.brokers[broker_id].hostname is not None:
-                requests[broker_id] = request
-        return self._send_some_brokers(requests)
+            tuple: the group name, topic name, and list of offsets from the line
 
-    def _make_broker(self, broker_dict):
-        return Broker(broker_dict['host'], id=broker_dict['node_id'], port=broker_dict['port'], configuration=self.configuration)
-
-    def _send_group_aware_request(self, group_name, request):
+        Raises:
+            ValueError: If the line is not a valid offsets record
         """
-        Sends a request to the broker currently serving as the group coordinator for the specified
-        group name. The request is not introspected for whether or not this is the correct broker,
-        and the response is not checked as to whether or not there was an error.
-
-        As a side effect of this call, the group object is created if it exists, and the coordinator
-        attribute is set to the broker that is currently the coordinator for that group.
+        try:
+            record = json_loads(line)
+            group_name, topic_name, offsets = record['group'], record['topic'], record['offsets']
+            if not all(isinstance(offset, six.integer_types) for offset in offsets):
+                raise TypeError("offsets must be integers")
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError("Line {0} is not a valid offsets record: {1}".format(line_number, e))
+        return group_name, topic_name, offsets
+
+    def _offset_import_request(self, group_name, topics):
+        """
+        Build an OffsetCommit request for offsets read from an export. Partitions with no committed offset are skipped
 
         Args:
-            group_name (string): The name of the group to find the coordinator for
-            request (BaseRequest): A request instance, inherited from BaseRequest, to send to the
-                coordinator broker
+            group_name (string): the name of the consumer group to set offsets for
+            topics (dict): a mapping of topic names to a list of the offset for each partition
 
         Returns:
-            BaseResponse: The response instance, appropriate for the request, that is returned from
-                the broker
-
-        Raises:
-            ConnectionError: If there is a failure to send the request to the coordinator broker,
-                or a failure to retrieve the coordinator information
-            GroupError: If an error is returned when fetching coordinator information
+            OffsetCommitV2Request: the request to send to the group coordinator
         """
-        response = self._send_any_broker(GroupCoordinatorV0Request({'group_id': group_name}))
-        raise_if_error(GroupError, response['error'])
-
-        if group_name not in self.cluster.groups:
-            self.cluster.add_group(Group(group_name))
-        try:
-            self.cluster.groups[group_name].coordinator = self.cluster.brokers[response['node_id']]
-        except KeyError:
-            broker = self._make_broker(response)
-            self.cluster.add_broker(broker)
-            self.cluster.groups[group_name].coordinator = broker
-
-        response = self._send_to_broker(self.cluster.groups[group_name].coordinator.id, request)
-        return response
-
-    def _send_list_offsets_to_brokers(self, request_values):
+        return OffsetCommitV2Request({'group_id': group_name,
+                                      'group_generation_id': -1,
+                                      'member_id': '',
+                                      'retention_time': -1,
+                                      'topics': [{'topic': topic_name,
+                                                  'partitions': [{'partition': p_num,
+                                                                  'offset': p_offset,
+                                                                  'metadata': None} for p_num, p_offset in enumerate(offsets) if p_offset >= 0]}
+                                                 for topic_name, offsets in topics.items() if any(offset >= 0 for offset in offsets)]})
+
+    def _group_offsets_to_set(self, group_offsets, topics, described, target_offsets, errors):
         """
-        Given a mapping of broker IDs to values for ListOffset requests, send the requests to all the brokers and
-        collate the responses into a mapping of topic names to TopicOffsets instances
+        Work out the offsets to commit for each group in a bulk reset. Groups that could not be described, that are
+        not in the "Empty" or "Dead" state, or whose target offsets could not be resolved for every partition are
+        skipped and added to the errors
 
         Args:
-            request_values (dict): a mapping of broker ID (int) to value dictionaries for ListOffsets requests
+            group_offsets (dict): a mapping of group names to either a list of TopicOffsets objects, or a target
+            topics (list): a list of topic names to reset to the target offsets
+            described (dict): a mapping of group names to Group objects with the current state of each group
+            target_offsets (dict): a mapping of each target to a mapping of topic names to TopicOffsets for the target
+            errors (dict): a mapping of group names to error codes, which groups that are skipped are added to
 
         Returns:
-            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
-                offsets for all the partitions requested.
-
-        Raises:
-            ConnectionError: If there is a failure to send the request to a broker
-            OffsetError: If there is a failure retrieving offsets
+            dict (string -> list): a mapping of group names to the list of TopicOffsets objects to commit
         """
-        requests = {}
-        for broker_id in request_values:
-            requests[broker_id] = ListOffsetV1Request(request_values[broker_id])
-        responses = self._send_some_brokers(requests, ignore_errors=False)
-
-        rv = {}
-        for broker_id in responses:
-            response = responses[broker_id]
-            for topic in response['responses']:
-                topic_name = topic['topic']
-                if topic_name not in rv:
-                    rv[topic_name] = TopicOffsets(self.cluster.topics[topic_name])
-                rv[topic_name].set_offsets_from_list(topic['partition_responses'])
-
-        return rv
-
-    def _send_set_offset_request(self, group_name, topic_offsets):
-        request = {'group_id': group_name,
-                   'group_generation_id': -1,
-                   'member_id': '',
-                   'retention_time': -1,
-                   'topics': []}
-        for offset in topic_offsets:
-            if not (isinstance(offset, TopicOffsets) and isinstance(offset.topic, Topic)):
-                raise TypeError("TopicOffsets objects are not properly formed")
-
-            request['topics'].append({'topic': offset.topic.name,
-                                      'partitions': [{'partition': p_num,
-                                                      'offset': p_offset,
-                                                      'metadata': None} for p_num, p_offset in enumerate(offset.partitions)]})
-
-        return self._send_group_aware_request(group_name, OffsetCommitV2Request(request))
-
-    def _parse_set_offset_response(self, response):
         rv = {}
-        for topic in response['responses']:
-            topic_name = topic['topic']
-            rv[topic_name] = [-1] * len(topic['partition_responses'])
-            for partition in topic['partition_responses']:
-                rv[topic_name][partition['partition']] = partition['error']
+        for group_name, offsets in group_offsets.items():
+            if not self._group_can_set_offsets(group_name, described, errors):
+                continue
 
+            if isinstance(offsets, six.integer_types):
+                offsets = [target_offsets[offsets][topic_name] for topic_name in topics]
+                unresolved = [topic_offsets.errors for topic_offsets in offsets if len(topic_offsets.errors) > 0]
+                if len(unresolved) > 0:
+                    errors[group_name] = list(unresolved[0].values())[0]
+                    continue
+            rv[group_name] = offsets
         return rv
 
     def _update_brokers_from_metadata(self, metadata):
@@ -639,104 +617,107 @@ class Client:
             delete (boolean): If False, no action is taken
         """
         if not delete:
-            return
+            return []
 
+        deltas = []
         topic_list = metadata.topic_names()
         topics_for_deletion = []
         for topic_name in self.cluster.topics:
             if topic_name in topic_list:
                 continue
 
-            self.cluster.topics[topic_name].assure_has_partitions(0)
+            topic = self.cluster.topics[topic_name]
+            deltas.extend(PartitionDelta(topic_name, partition.num, partition.metadata_state(), None) for partition in topic.partitions)
+            topic.assure_has_partitions(0)
             topics_for_deletion.append(topic_name)
 
         for topic_name in topics_for_deletion:
-            del self.cluster.topics[topic_name]
+            self.cluster.remove_topic(topic_name)
+        return deltas
 
     def _update_or_add_partition(self, partition_metadata, partition):
-        partition.leader = self.cluster.brokers[partition_metadata['leader']]
+        # A leader of -1 means that the partition has no leader right now
+        partition.leader = None if partition_metadata['leader'] < 0 else self.cluster.brokers[partition_metadata['leader']]
         for i, replica in enumerate(partition_metadata['replicas']):
             if replica not in self.cluster.brokers:
                 # We have a replica ID that is not a known broker. This can happen if a broker is offline, or
                 # if the partition is otherwise assigned to a non-existent broker ID. In this case, we need to
                 # create a broker object for this with no endpoint information as a placeholder.
-                self.cluster.add_broker(Broker(hostname=None, id=replica))
+                self.cluster.add_broker(self._new_broker(None, id=replica))
             partition.add_or_update_replica(i, self.cluster.brokers[replica])
         partition.delete_replicas(len(partition_metadata['replicas']))
+        partition.isr = [self.cluster.brokers[replica] for replica in partition_metadata['isrs'] if replica in self.cluster.brokers]
 
-    def _update_topics_from_metadata(self, metadata, delete=False):
+    def _update_topics_from_metadata(self, metadata, delete=False, exclude=()):
         """
         Given a Metadata response (either V0 or V1 will work), update the topic information
         for this cluster.
 
+        The state of each partition in the response is compared, as a compact (leader, replicas, ISR) tuple, with the
+        state that was last applied, and only the partitions that changed are updated. On a large cluster, most
+        partitions are unchanged on each refresh, so this avoids walking the replica lists of every partition.
+
         Args:
             metadata (MetadataV1Response): A metadata response to create or update topics for
             delete (boolean): If True, delete topics from the cluster that are not present in the
                 metadata response
+            exclude (collection): names of topics in the metadata response that should not be created or updated
+
+        Returns:
+            list (PartitionDelta): the partitions that were added, removed, or changed
 
         Raises:
             IndexError: If the brokers in the metadata object are not defined in the cluster
         """
+        deltas = []
         for t in metadata['topics']:
+            if t['name'] in exclude:
+                continue
             if t['name'] not in self.cluster.topics:
                 self.cluster.add_topic(Topic(t['name'], len(t['partitions'])))
+                known_partitions = 0
+            else:
+                known_partitions = len(self.cluster.topics[t['name']].partitions)
             topic = self.cluster.topics[t['name']]
             topic._last_updated = time.time()
 
+            deltas.extend(PartitionDelta(topic.name, partition.num, partition.metadata_state(), None)
+                          for partition in topic.partitions[len(t['partitions']):])
             topic.assure_has_partitions(len(t['partitions']))
             for p in t['partitions']:
-                self._update_or_add_partition(p, topic.partitions[p['id']])
-
-        self._maybe_delete_topics_not_in_metadata(metadata, delete)
-
-    def _update_from_metadata(self, metadata, delete=False):
+                partition = topic.partitions[p['id']]
+                state = (p['leader'] if p['leader'] >= 0 else -1, tuple(p['replicas']), tuple(p['isrs']))
+                old_state = partition.metadata_state() if p['id'] < known_partitions else None
+                if state != old_state:
+                    self._update_or_add_partition(p, partition)
+                    deltas.append(PartitionDelta(topic.name, p['id'], old_state, state))
+                partition._metadata_state = state
+
+        deltas.extend(self._maybe_delete_topics_not_in_metadata(metadata, delete))
+        return deltas
+
+    def _update_from_metadata(self, metadata, delete=False, exclude=()):
         """
         Given a metadata response, update both the brokers and topics from it. If specified, delete the topics
-        that are not present in the provided metadata
+        that are not present in the provided metadata. The metadata listeners are called with the changes, if any
 
         Args:
             metadata (MetadataV1Response): A metadata response to create or update brokers and topics for
             delete (boolean): If True, delete topics from the cluster that are not present in the metadata response
-        """
-        self._update_brokers_from_metadata(metadata)
-        self._update_topics_from_metadata(metadata, delete=delete)
-
-    def _maybe_update_metadata_for_topics(self, topics, cache=True):
-        """
-        Fetch metadata for the topics specified from the cluster if cache is False or if the cached metadata has expired.
-        The cluster brokers and topics are updated with the metadata information.
-
-        Args:
-            cache (boolean): Ignore the metadata expiration and fetch from the cluster anyway
-
-        Raises:
-            ConnectionError: If there is a failure to send the request to all brokers in the cluster
-        """
-        force_update = not cache
-        for topic in topics:
-            try:
-                if not self.cluster.topics[topic].updated_since(time.time() - self.configuration.metadata_refresh):
-                    force_update = True
-            except KeyError:
-                force_update = True
-
-        if force_update:
-            self._update_from_metadata(self._send_any_broker(TopicMetadataV2Request({'topics': topics})), delete=False)
-
-    def _maybe_update_full_metadata(self, cache=True):
-        """
-        Fetch all topic metadata from the cluster if cache is False or if the cached metadata has expired. The cluster
-        brokers and topics are updated with the metadata information, potentially deleting ones that no longer exist
-
-        Args:
-            cache (boolean): Ignore the metadata expiration and fetch from the cluster anyway
+            exclude (collection): names of topics in the metadata response that should not be created or updated
 
-        Raises:
-            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        Returns:
+            list (PartitionDelta): the partitions that were added, removed, or changed
         """
-        if (not cache) or (self._last_full_metadata < (time.time() - self.configuration.metadata_refresh)):
-            self._update_from_metadata(self._send_any_broker(TopicMetadataV2Request({'topics': None})), delete=True)
-            self._last_full_metadata = time.time()
+        self._update_brokers_from_metadata(metadata)
+        deltas = self._update_topics_from_metadata(metadata, delete=delete, exclude=exclude)
+        if len(deltas) > 0:
+            for callback in self._metadata_listeners:
+                try:
+                    callback(deltas)
+                except Exception as e:
+                    log.warn("Metadata listener failed: {0}".format(e))
+        return deltas
 
     def _add_or_update_group(self, group_info, coordinator):
         """
@@ -753,6 +734,7 @@ class Client:
             group = Group(group_name)
             self.cluster.add_group(group)
         group.coordinator = self.cluster.brokers[coordinator]
+        group._coordinator_updated = time.time()
         group.protocol_type = group_info['protocol_type']
 
     def _update_groups_from_lists(self, responses):
@@ -776,23 +758,7 @@ class Client:
 
         return error_counter
 
-    def _maybe_update_groups_list(self, cache=True):
-        """
-        Fetch lists of groups from all brokers if cache is False or if the cached group list has expired.
-
-        Args:
-            cache (boolean): Ignore the metadata expiration and fetch from the cluster anyway
-
-        Returns:
-            int: a count of the number of brokers that returned no response or error responses
-        """
-        if (not cache) or (self._last_group_list < (time.time() - self.configuration.metadata_refresh)):
-            error_counter = self._update_groups_from_lists(self._send_all_brokers(ListGroupsV0Request({})))
-            self._last_group_list = time.time()
-            return error_counter
-        return 0
-
-    def _update_groups_from_describe(self, response):
+    def _update_groups_from_describe(self, response):
         """
         Given a DescribeGroupsV0 response, update the group information for all groups in the response
         in this cluster. This does not delete any groups not in the response, as we do not fetch all
@@ -817,6 +783,153 @@ class Client:
                                  assignment=m['member_assignment'])
             group._last_updated = time.time()
 
+    def _topic_needs_update(self, topic_name, cache=True):
+        """Return True if the metadata for the topic is not cached, has expired, or cache is False"""
+        try:
+            return (not cache) or (not self.cluster.topics[topic_name].updated_since(time.time() - self.configuration.metadata_refresh))
+        except KeyError:
+            return True
+
+    def _group_needs_update(self, group_name, cache=True):
+        """Return True if the information for the group is not cached, has expired, or cache is False"""
+        try:
+            return (not cache) or (not self.cluster.groups[group_name].updated_since(time.time() - self.configuration.metadata_refresh))
+        except KeyError:
+            return True
+
+    def _full_metadata_expired(self, cache=True):
+        return (not cache) or (self._last_full_metadata < (time.time() - self.configuration.metadata_refresh))
+
+    def _groups_list_expired(self, cache=True):
+        return (not cache) or (self._last_group_list < (time.time() - self.configuration.metadata_refresh))
+
+    def _list_offsets_values(self, topic_list, timestamp):
+        """
+        Build the values for the ListOffsets requests to fetch offsets for all partitions of the listed topics, one
+        request for each leader broker
+
+        Args:
+            topic_list (list): a list of topic name strings to fetch offsets for
+            timestamp (int): The timestamp (in millis) to fetch offsets at
+
+        Returns:
+            dict: a mapping of broker ID (int) to value dictionaries for ListOffsets requests
+
+        Raises:
+            TopicError: if any of the topics do not exist in the cluster
+        """
+        # Get a broker to topic-partition mapping
+        broker_to_tp = self._map_topic_partitions_to_brokers(topic_list)
+
+        request_values = {}
+        for broker_id in broker_to_tp:
+            request_values[broker_id] = {'replica_id': -1, 'topics': []}
+            for topic_name in broker_to_tp[broker_id]:
+                request_values[broker_id]['topics'].append({'topic': topic_name,
+                                                            'partitions': [{'partition': i,
+                                                                            'timestamp': timestamp} for i in broker_to_tp[broker_id][topic_name]]})
+        return request_values
+
+    def _parse_list_offsets_responses(self, responses, topic_list=None):
+        """
+        Collate ListOffsets responses from brokers into a mapping of topic names to TopicOffsets instances
+
+        Args:
+            responses (dict): a mapping of broker ID to ListOffsetV1Response
+            topic_list (list): if not None, only the topics in this list are parsed from the responses
+
+        Returns:
+            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
+                offsets for all the partitions in the responses. Partitions that have errors are in the errors of the
+                TopicOffsets
+        """
+        rv = {}
+        for broker_id in responses:
+            response = responses[broker_id]
+            for topic in response['responses']:
+                topic_name = topic['topic']
+                if (topic_list is not None) and (topic_name not in topic_list):
+                    continue
+                if topic_name not in rv:
+                    rv[topic_name] = TopicOffsets(self.cluster.topics[topic_name])
+                rv[topic_name].set_offsets_from_list(topic['partition_responses'], raise_errors=False)
+        return rv
+
+    def _invalidate_topics(self, topic_names):
+        """Mark the cached metadata for the topics as expired, so that it is fetched again before it is next used"""
+        for topic_name in topic_names:
+            if topic_name in self.cluster.topics:
+                self.cluster.topics[topic_name]._last_updated = 0
+
+    def _warm_up_order(self):
+        """
+        Get the order in which to connect to brokers ahead of time. Group coordinators are first, followed by the
+        partition leaders (those leading the most partitions first), and then all other brokers
+
+        Returns:
+            list (int): the IDs of all the brokers that have an endpoint
+        """
+        leaders = dict((broker_id, self.cluster.count_led_by(broker_id)) for broker_id in self.cluster.brokers)
+        coordinators = set(group.coordinator.id for group in self.cluster.groups.values() if group.coordinator is not None)
+
+        broker_ids = [broker_id for broker_id in self.cluster.brokers if self.cluster.brokers[broker_id].hostname is not None]
+        return sorted(broker_ids, key=lambda broker_id: (broker_id not in coordinators, -leaders.get(broker_id, 0), broker_id))
+
+    def _snapshot_bootstrap(self):
+        # Snapshots are only used by clients configured with the same bootstrap brokers as the one that saved it
+        return ','.join('{0}:{1}'.format(host, port) for host, port in self.configuration.broker_list)
+
+    def _maybe_load_snapshot(self):
+        """
+        If a metadata snapshot is configured, load the cluster information from it. The topics and groups from the
+        snapshot expire based on when it was saved, not when it was loaded
+
+        Returns:
+            boolean: True if the cluster was loaded from the snapshot, or False if there is no usable snapshot
+        """
+        if self.configuration.metadata_snapshot is None:
+            return False
+        snapshot = load_snapshot(self.configuration.metadata_snapshot,
+                                 bootstrap=self._snapshot_bootstrap(),
+                                 max_age=self.configuration.metadata_snapshot_max_age)
+        if snapshot is None:
+            return False
+
+        try:
+            self._update_from_metadata(snapshot['metadata'], delete=True)
+            for group_info in snapshot['groups']:
+                if group_info['coordinator'] != -1:
+                    self._add_or_update_group(group_info, group_info['coordinator'])
+        except (KeyError, IndexError) as e:
+            log.warn("Ignoring metadata snapshot that is not consistent: {0}".format(e))
+            self.cluster = Cluster()
+            return False
+
+        for topic in self.cluster.topics.values():
+            topic._last_updated = snapshot['created']
+        for group in self.cluster.groups.values():
+            group._coordinator_updated = snapshot['created']
+        self._controller_id = snapshot['metadata']['controller_id']
+        self._last_full_metadata = snapshot['created']
+        self._last_group_list = snapshot['groups_listed']
+        return True
+
+    def _encode_snapshot(self):
+        return encode_snapshot(self.cluster,
+                               controller_id=-1 if self._controller_id is None else self._controller_id,
+                               bootstrap=self._snapshot_bootstrap(),
+                               created=self._last_full_metadata,
+                               groups_listed=self._last_group_list)
+
+    def _save_snapshot(self):
+        """If a metadata snapshot is configured, save the cluster information to it. Failures are only logged"""
+        if self.configuration.metadata_snapshot is None:
+            return
+        try:
+            write_snapshot(self.configuration.metadata_snapshot, self._encode_snapshot())
+        except (IOError, OSError) as e:
+            log.warn("Failed to save metadata snapshot: {0}".format(e))
+
     def _map_topic_partitions_to_brokers(self, topic_list):
         """
         Given a list of topics, map the topic-partitions to the leader brokers
@@ -829,7 +942,7 @@ class Client:
                 keys are topic names and the values are an array of partition IDs
 
         Raises:
-            TopicError: if any of the topics do not exist in the cluster
+            TopicError: if any of the topics do not exist in the cluster, or if a partition has no leader
         """
         broker_to_tp = {}
         for topic_name in topic_list:
@@ -838,11 +951,70 @@ class Client:
             except KeyError:
                 raise TopicError("Topic {0} does not exist in the cluster".format(topic_name))
 
-            for i, partition in enumerate(topic.partitions):
-                broker_to_tp.setdefault(partition.leader.id, {}).setdefault(topic_name, []).append(i)
+            for i in range(len(topic.partitions)):
+                leader = self.cluster.leader_for(topic_name, i)
+                if leader is None:
+                    raise TopicError("Partition {0} of topic {1} has no leader".format(i, topic_name))
+                broker_to_tp.setdefault(leader.id, {}).setdefault(topic_name, []).append(i)
 
         return broker_to_tp
 
+    def _route_to_leaders(self, items, errors):
+        """
+        Group partition work items by the current leader of each partition
+
+        Args:
+            items (dict): a mapping of (topic name, partition number) tuples to the value for each item
+            errors (dict): a mapping of items to error codes. Items that cannot be routed are added with an error of 3
+                (UNKNOWN_TOPIC_OR_PARTITION) if the partition does not exist, or 5 (LEADER_NOT_AVAILABLE)
+
+        Returns:
+            dict (int -> dict): a mapping of broker IDs to the items that broker is the leader for
+        """
+        rv = {}
+        for item, value in items.items():
+            topic_name, partition = item
+            leader = self.cluster.leader_for(topic_name, partition)
+            if (leader is None) and ((topic_name not in self.cluster.topics) or
+                                     (not 0 <= partition < len(self.cluster.topics[topic_name].partitions))):
+                errors[item] = 3
+                continue
+            if leader is None:
+                errors[item] = 5
+                continue
+            rv.setdefault(leader.id, {})[item] = value
+        return rv
+
+    def _gather_leader_responses(self, routed, responses, parse_response, results, errors):
+        """
+        Collect the results for partition work items from the responses of the leaders they were sent to
+
+        Args:
+            routed (dict): a mapping of broker IDs to the items sent to that broker, as from _route_to_leaders
+            responses (dict): a mapping of broker IDs to the response from that broker, or None if it failed
+            parse_response (function): called with a response, returns a mapping of items to (result, error) tuples
+            results (dict): a mapping of items to results, which items that succeed are added to
+            errors (dict): a mapping of items to error codes, which items that fail are added to. Items sent to a broker
+                that failed have an error of 13 (NETWORK_EXCEPTION), and items missing from a response have -1 (UNKNOWN)
+        """
+        for broker_id, broker_items in routed.items():
+            response = responses.get(broker_id)
+            parsed = {} if response is None else parse_response(response)
+            for item in broker_items:
+                if response is None:
+                    errors[item] = 13
+                    continue
+                result, error = parsed.get(item, (None, -1))
+                if error == 0:
+                    results[item] = result
+                    errors.pop(item, None)
+                else:
+                    errors[item] = error
+
+    def _retriable_items(self, items, errors):
+        """Return the items that failed with an error that is worth retrying, with their values"""
+        return dict((item, value) for item, value in items.items() if (item in errors) and error_retriable(errors[item]))
+
     def _get_topics_for_group(self, group, topic_list):
         """
         Given a group and a topic_list, return a list of topics that is either the topic list provided or the list of
@@ -868,3 +1040,1537 @@ class Client:
         if len(fetch_topics) == 0:
             raise GroupError("No topic specified is consumed by the group")
         return fetch_topics
+
+
+class _Batch(object):
+    """Work that concurrent callers need done, which is collected for a short time and then done all at once"""
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self._item_set = set()
+
+    def add(self, items):
+        for item in items:
+            if item not in self._item_set:
+                self._item_set.add(item)
+                self.items.append(item)
+
+
+class Client(BaseClient):
+    def __init__(self, **kwargs):
+        """
+        Create a new Kafka client. There are two ways to instantiate the client:
+            1) Provide a ClientConfiguration object with configuration=obj. This specifies all the configuration options
+               for the client, or uses the defaults in ClientConfiguration. If the configuration keyword argument is
+               present, all other arguments are ignored
+
+            2) Provide keyword arguments that will be passed to create a new ClientConfiguration object. If the
+               configuration keyword argument is not provided, this is the option that is chosen.
+
+        The client will not be connected, either using the broker_list or the zkconnect option, until the connect()
+        method is called
+
+        Args:
+            configuration (ClientConfiguration): a ClientConfiguration object to specify client settings
+            kwargs: keyword arguments that are passed to create a new ClientConfiguration object
+
+        Returns:
+            Client: the Client object, ready for a connect call
+        """
+        super(Client, self).__init__(**kwargs)
+
+        # The client can be used from many threads. Cached cluster information is read without locking, and changes to
+        # it are serialized with this lock, which is also held for connect and close. Requests to brokers are sent
+        # without holding it, and each broker serializes the requests on its own connection
+        self._lock = RLock()
+
+        # The thread pool for sending to multiple brokers is created when it is first needed, and lives until close()
+        self._executor = None
+
+        # Requests from concurrent callers that are batched together, by the kind of request. See _batched
+        self._batches = {}
+        self._batch_lock = Lock()
+        self._batch_ready = Condition(self._batch_lock)
+
+        # The event that stops the background metadata refresh thread, if one is running. See _start_refresher
+        self._refresh_stop = None
+
+    @synchronized
+    def connect(self):
+        """
+        Connect to the all cluster brokers and populate topic and partition information. If the client was created with
+        a zkconnect string, first we connect to Zookeeper to bootstrap the broker and topic information from there,
+        and then the client connects to all brokers in the cluster. Otherwise, connect to the bootstrap broker
+        specified and fetch the broker and topic metadata for the cluster.
+
+        If the lazy_connect configuration is set, the connections to the brokers are not opened here. Each broker is
+        connected to when the first request is sent to it, and if warm_up_connections is also set, the connections are
+        opened in the background.
+
+        If the metadata_snapshot configuration is set and the snapshot file is recent enough, the cluster information is
+        loaded from it instead of the bootstrap brokers, and the current metadata is fetched in the background.
+
+        If the background_refresh_interval configuration is set, a thread is started that refreshes the topic metadata
+        and the group lists at that interval until close() is called.
+
+        Todo:
+            * Currently assumes everything works. Need to check for failure to connect to
+              ZK or bootstrap.
+        """
+        from_snapshot = False
+        if self.configuration.zkconnect is not None:
+            self.cluster = Cluster.create_from_zookeeper(zkconnect=self.configuration.zkconnect, fetch_topics=False)
+            self._connected = True
+        else:
+            from_snapshot = self._maybe_load_snapshot()
+
+            # Connect to bootstrap brokers until we succeed or exhaust the list
+            try_brokers = list(self.configuration.broker_list)
+            self._connected = from_snapshot
+            while (len(try_brokers) > 0) and not self._connected:
+                self._connected = self._maybe_bootstrap_cluster(try_brokers.pop())
+
+            if not self._connected:
+                raise ConnectionError("Unable to bootstrap cluster information")
+
+        if not self.configuration.lazy_connect:
+            self._connect_all_brokers()
+        elif self.configuration.warm_up_connections:
+            self._start_warm_up()
+
+        if from_snapshot:
+            self._start_revalidation()
+        elif self.configuration.zkconnect is None:
+            self._save_snapshot()
+
+        self._stop_refresher()
+        if self.configuration.background_refresh_interval is not None:
+            self._start_refresher()
+
+    @synchronized
+    def close(self):
+        """
+        Close connections to all brokers. The configuration information is retained, so calling connect() again will
+        reconnect to all brokers.
+        """
+        self._stop_refresher()
+        if self._connected:
+            self._save_snapshot()
+        for broker_id in self.cluster.brokers:
+            self.cluster.brokers[broker_id].close()
+        self._connected = False
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def list_topics(self, cache=True):
+        """
+        Get a list of all topics in the cluster
+
+        Args:
+            cache (boolean): If False, ignore cached metadata and always fetch from the cluster
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        """
+        self._raise_if_not_connected()
+        self._maybe_update_full_metadata(cache)
+        return list(self.cluster.topics.keys())
+
+    def get_topic(self, topic_name, cache=True):
+        """
+        Get information on a topic in the cluster. If cache is True, used cached topic metadata
+        if it has not expired. Otherwise, perform a metadata request to refresh information on
+        the topic first.
+
+        Args:
+            topic_name (string): The name of the topic to return
+            cache (boolean): If False, ignore cached metadata and always fetch from the cluster
+
+        Returns:
+            Topic: The Topic object holding the detail for the topic
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+            TopicError: If the topic does not exist, or there is a problem getting metadata for it
+        """
+        self._raise_if_not_connected()
+        if self._topic_needs_update(topic_name, cache):
+            metadata = self._fetch_topic_metadata([topic_name], check_errors=True)
+            for topic in metadata['topics']:
+                if topic['name'] == topic_name:
+                    raise_if_error(TopicError, topic['error'])
+
+        return self.cluster.topics[topic_name]
+
+    def list_groups(self, cache=True):
+        """
+        Get a list of all topics in the cluster. This is done by sending a ListGroups request to
+        every broker in the cluster and collating the responses.
+
+        Args:
+            cache (boolean): If False, ignore cached groups and always fetch from the cluster
+
+        Returns:
+            list (string): a list of valid group names in the cluster
+            int: the number of brokers that failed to response
+        """
+        self._raise_if_not_connected()
+        error_counter = self._maybe_update_groups_list(cache)
+        return list(self.cluster.groups.keys()), error_counter
+
+    def get_group(self, group_name, cache=True):
+        """
+        Get information on a group in the cluster. If cache is True, used cached group information
+        if it has not expired. Otherwise, send a request to refresh information on the group first.
+
+        Args:
+            group_name (string): The name of the group to return
+            cache (boolean): If False, ignore cached information and always fetch from the cluster
+
+        Returns:
+            Group: The Group object holding the detail for the group
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+            GroupError: If the group does not exist or there is a problem fetching information for it
+        """
+        self._raise_if_not_connected()
+        if self._group_needs_update(group_name, cache):
+            # Group detail must come from the coordinator broker
+            group_info = self._send_group_aware_request(group_name, DescribeGroupsV0Request({'group_ids': [group_name]}))
+            raise_if_error(GroupError, group_info['groups'][0]['error'])
+
+            self._update_groups_from_describe(group_info)
+
+        return self.cluster.groups[group_name]
+
+    def describe_groups(self, group_names, cache=True):
+        """
+        Get information on many groups in the cluster at once. The groups are sorted by their coordinators, and one
+        DescribeGroups request for all of the groups that each coordinator has is sent to the coordinators in parallel.
+        Coordinators that are already known (from ListGroups responses or earlier requests) are not looked up again,
+        and the ones that are needed are looked up together. Groups that are sent to a broker that is no longer their
+        coordinator are looked up and sent once more.
+
+        Args:
+            group_names (list): a list of the group name strings to describe
+            cache (boolean): If False, ignore cached information and always fetch from the cluster
+
+        Returns:
+            dict (string -> Group): a mapping of group names to the Group object holding the detail for each group
+            dict (string -> int): a mapping of group names to the error code for each group that could not be described.
+                Groups whose coordinator failed to respond have an error code of -1 (UNKNOWN)
+
+        Raises:
+            ConnectionError: If there is a failure to send the coordinator lookups to all brokers in the cluster
+        """
+        self._raise_if_not_connected()
+        groups = {}
+        errors = {}
+        pending = []
+        for group_name in group_names:
+            if self._group_needs_update(group_name, cache):
+                pending.append(group_name)
+            else:
+                groups[group_name] = self.cluster.groups[group_name]
+
+        for attempt in range(2):
+            if len(pending) == 0:
+                break
+            buckets, lookup = self._bucket_groups_by_coordinator(pending)
+            if len(lookup) > 0:
+                lookups = self._send_any_broker_pipelined([GroupCoordinatorV0Request({'group_id': group_name}) for group_name in lookup])
+                self._add_coordinator_lookups(buckets, lookup, lookups, errors)
+
+            responses = self._send_some_brokers(dict((broker_id, DescribeGroupsV0Request({'group_ids': bucket}))
+                                                     for broker_id, bucket in buckets.items()))
+            pending = self._apply_describe_responses(buckets, responses, groups, errors)
+        return groups, errors
+
+    def describe_all_groups(self, cache=True):
+        """
+        Get information on all the groups in the cluster. The list of groups is fetched as for list_groups, and then the
+        groups are described as for describe_groups, using the coordinators from the ListGroups responses
+
+        Args:
+            cache (boolean): If False, ignore the cached group list and group information and always fetch from the
+                cluster
+
+        Returns:
+            dict (string -> Group): a mapping of group names to the Group object holding the detail for each group
+            dict (string -> int): a mapping of group names to the error code for each group that could not be described
+            int: the number of brokers that failed to respond to the ListGroups request
+
+        Raises:
+            ConnectionError: If there is a failure to send the coordinator lookups to all brokers in the cluster
+        """
+        group_names, error_counter = self.list_groups(cache)
+        groups, errors = self.describe_groups(group_names, cache)
+        return groups, errors, error_counter
+
+    def prefetch_coordinators(self, group_names):
+        """
+        Look up the coordinators for many groups at once, so that later requests for the groups can be sent to the
+        coordinators without looking them up first. The lookups are pipelined, and spread across all the brokers in the
+        cluster. Groups with coordinators that are already cached are skipped. This is only useful if the
+        coordinator_cache_ttl configuration is set.
+
+        Args:
+            group_names (list): a list of the group name strings to find coordinators for
+
+        Returns:
+            dict (string -> Broker): a mapping of group names to their coordinator brokers. Groups that a coordinator
+                could not be found for are not included
+
+        Raises:
+            ConnectionError: If there is a failure to send the lookups to all brokers in the cluster
+        """
+        self._raise_if_not_connected()
+        rv = {}
+        lookup = []
+        for group_name in group_names:
+            coordinator = self._cached_coordinator(group_name)
+            if coordinator is None:
+                lookup.append(group_name)
+            else:
+                rv[group_name] = coordinator
+        if len(lookup) == 0:
+            return rv
+
+        lookups = self._send_any_broker_pipelined([GroupCoordinatorV0Request({'group_id': group_name}) for group_name in lookup])
+        for group_name, response in zip(lookup, lookups):
+            try:
+                rv[group_name] = self._set_group_coordinator(group_name, response)
+            except GroupError as e:
+                log.warn("Failed to find the coordinator for group {0}: {1}".format(group_name, e))
+        return rv
+
+    def get_offsets_for_topic(self, topic_name, timestamp=BaseClient.OFFSET_LATEST):
+        """
+        Get the offsets for all the partitions in the specified topic. The offsets are requested at the specified
+        timestamp, which defaults to the latest offsets available (defined as the offset of the next message to be
+        produced).
+
+        Args:
+            topic_name (string or list): The name of the topic to fetch offsets for. For multiple topics, a list of
+                topics can be provided
+            timestamp (int): The timestamp (in millis) to fetch offsets at. If not specified, the default is the special
+                timestamp OFFSET_LATEST, which requests the current end of the partitions (tail). You can also specify
+                the special offset OFFSET_EARLIEST, which requests the oldest offset for each partition (head)
+
+        Return:
+            TopicOffsets: A TopicOffsets instance that contain offsets for all the partitions in the topic. Partitions
+                that offsets could not be retrieved for are in its errors attribute, mapped to the error code
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to a broker
+            TopicError: If the topic does not exist or there is a problem getting information for it
+            TypeError: If the timestamp is not an integer
+        """
+        return self.get_offsets_for_topics([topic_name], timestamp)[topic_name]
+
+    def get_offsets_for_topics(self, topic_list, timestamp=BaseClient.OFFSET_LATEST):
+        """
+        Get the offsets for all the partitions in the specified topics. The offsets are requested at the specified
+        timestamp, which defaults to the latest offsets available (defined as the offset of the next message to be
+        produced).
+
+        Args:
+            topic_list (list): a list of topic name strings to fetch offsets for.
+            timestamp (int): The timestamp (in millis) to fetch offsets at. If not specified, the default is the special
+                timestamp OFFSET_LATEST, which requests the current end of the partitions (tail). You can also specify
+                the special offset OFFSET_EARLIEST, which requests the oldest offset for each partition (head)
+
+        Partitions that fail with a retriable error (such as when leadership has moved) are requested again, up to the
+        num_retries configuration. If the error means the leadership information is out of date, the metadata for just
+        those topics is refreshed first, and only the failed partitions are sent to their new leaders.
+
+        Return:
+            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
+                offsets for all the partitions in the topic. Partitions that offsets could not be retrieved for are in
+                the errors attribute of the TopicOffsets, mapped to the error code
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to a broker
+            TopicError: If a topic does not exist or there is a problem getting information for it
+            TypeError: If the timestamp is not an integer
+        """
+        self._raise_if_not_connected()
+        if not isinstance(timestamp, six.integer_types):
+            raise TypeError("timestamp must be a valid integer")
+
+        # Get the topic information, making sure all the leadership info is current
+        self._maybe_update_metadata_for_topics(topic_list)
+        if self.configuration.offset_batch_window is None:
+            return self._send_list_offsets_to_brokers(self._list_offsets_values(topic_list, timestamp))
+
+        # Check the topics before joining a batch, so that a missing topic only fails this call
+        self._map_topic_partitions_to_brokers(topic_list)
+        responses = self._batched(('list_offsets', timestamp), topic_list, self.configuration.offset_batch_window,
+                                  partial(self._send_list_offsets_batch, timestamp))
+        return self._retry_list_offsets(self._parse_list_offsets_responses(responses, topic_list), lambda topic_name, partition: timestamp)
+
+    def get_offsets_for_group(self, group_name, topic_list=None):
+        """
+        Get the latest offsets committed by the specified group. If a topic_name is specified, only the offsets for that
+        topic are returned. Otherwise, offsets for all topics that the group is subscribed to are returned.
+
+        Args:
+            group_name (string): The name of the group to fetch offsets for
+            topic_list (list): A list of string topic names to fetch offsets for. Defaults to None, which specifies all
+                topics that are subscribed to by the group.
+
+        Return:
+            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
+                offsets for all the partitions in the topic. The dictionary will contain a single key if the topic_name
+                provided is not None.
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            TopicError: If the topic does not exist or there is a problem getting information for it
+            GroupError: If there is a failure to get information for the specified group
+            OffsetError: If there is a failure retrieving offsets for the topic(s)
+        """
+        self._raise_if_not_connected()
+
+        # Get the group we're fetching offsets for (potentially updating the group information)
+        group = self.get_group(group_name)
+        fetch_topics = self._get_topics_for_group(group, topic_list)
+
+        # Get the topic information, making sure all the leadership info is current
+        self._maybe_update_metadata_for_topics(fetch_topics)
+
+        if self.configuration.offset_batch_window is None:
+            response = self._send_group_aware_request(group_name, OffsetFetchV1Request(self._offset_fetch_values(group_name, fetch_topics)))
+        else:
+            responses, errors = self._batched('offset_fetch', [(group_name, topic) for topic in fetch_topics],
+                                              self.configuration.offset_batch_window, self._send_offset_fetch_batch)
+            raise_if_error(GroupError, errors.get(group_name, 0))
+            response = responses[group_name]
+        return self._parse_offset_fetch_response(response, fetch_topics)
+
+    def get_offsets_for_groups(self, group_names, topic_list=None):
+        """
+        Get the latest offsets committed by each of the specified groups. This works like get_offsets_for_group, except
+        that the requests for all the groups are sent at once. The requests that go to the same coordinator are
+        pipelined on the connection to it (up to the max_in_flight configuration), so that fetching offsets for many
+        groups does not take a round trip for each one.
+
+        Args:
+            group_names (list): a list of the string names of the groups to fetch offsets for
+            topic_list (list): A list of string topic names to fetch offsets for. Defaults to None, which specifies all
+                topics that are subscribed to by each group.
+
+        Return:
+            dict (string -> dict): A dictionary mapping group names to a dictionary of topic names to TopicOffsets
+                instances, as returned by get_offsets_for_group
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            TopicError: If a topic does not exist or there is a problem getting information for it
+            GroupError: If there is a failure to get information for any of the specified groups
+            OffsetError: If there is a failure retrieving offsets for the topic(s)
+        """
+        self._raise_if_not_connected()
+
+        # Get the groups we're fetching offsets for, refreshing the information for any that are out of date
+        groups = self._get_groups(group_names)
+        fetch_topics = dict((group_name, self._get_topics_for_group(groups[group_name], topic_list)) for group_name in group_names)
+
+        # Get the topic information, making sure all the leadership info is current
+        self._maybe_update_metadata_for_topics(list(set(topic for topics in fetch_topics.values() for topic in topics)))
+
+        requests = dict((group_name, OffsetFetchV1Request(self._offset_fetch_values(group_name, fetch_topics[group_name])))
+                        for group_name in group_names)
+        responses = self._send_group_aware_requests(requests)
+        return dict((group_name, self._parse_offset_fetch_response(responses[group_name])) for group_name in group_names)
+
+    def get_lag(self, groups=None, topics=None):
+        """
+        Get the consumer lag for many groups at once. The log end offsets for all the topics that are needed are
+        fetched once, with one request to each leader, and the committed offsets for all the groups are fetched in
+        parallel, pipelined to each coordinator.
+
+        If topics is not provided, the groups are described (with describe_groups) to find the topics that their members
+        are subscribed to. Groups with no members are skipped in this case, as there is no way to know which topics they
+        have committed offsets for.
+
+        Args:
+            groups (list): a list of group names. Defaults to None, which specifies all groups in the cluster
+            topics (list): a list of topic names to get the lag for. Defaults to None, which specifies the topics that
+                each group is subscribed to
+
+        Returns:
+            dict (string -> GroupLag): a mapping of group names to GroupLag instances, which have the lag for each
+                partition, each topic, and the entire group. Partitions that the group has not committed offsets for,
+                or that offsets could not be fetched for, have a lag of None
+            dict (string -> int): a mapping of group names to the error code for each group that lag could not be
+                computed for, including groups whose coordinator could not be found
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+        """
+        self._raise_if_not_connected()
+        if groups is None:
+            groups = self.list_groups()[0]
+
+        errors = {}
+        described = {}
+        if topics is None:
+            described, errors = self.describe_groups(groups)
+            wanted = set(topic for group in described.values() for topic in group.subscribed_topics())
+        else:
+            wanted = set(topics)
+
+        # Make sure the topics are known and the leadership info is current before choosing the topics for each group
+        self._maybe_update_metadata_for_topics(list(wanted))
+        fetch_topics = self._lag_topics(groups, topics, described)
+        if len(fetch_topics) == 0:
+            return {}, errors
+
+        end_offsets = self.get_offsets_for_topics(list(set(topic for group_topics in fetch_topics.values() for topic in group_topics)))
+
+        # The coordinators that describe_groups just found are used, rather than looking them up again
+        responses = self._send_group_aware_requests(dict((group_name, OffsetFetchV1Request(self._offset_fetch_values(group_name, group_topics)))
+                                                         for group_name, group_topics in fetch_topics.items()),
+                                                    errors, self._described_coordinators(described))
+
+        return self._lags_from_offset_fetches(responses, end_offsets, errors), errors
+
+    def set_offsets_for_group(self, group_name, topic_offsets):
+        """
+        Given a group name and a list of topics and offsets, write the offsets as the latest for the group. This can only
+        be done if the consumer is an old consumer (committing to Kafka), or if it is a new consumer in the "Empty"
+        state (i.e. not running)
+
+        Args:
+            group_name (string): the name of the consumer group to set offsets for
+            topic_offsets (list): a list of TopicOffsets objects which describe the topics and offsets to set
+
+        Returns:
+            dict (string -> list): a map of topic names to a list of error code responses for each partition. Error code
+                0 indicates no error.
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            TypeError: if the topic_offsets argument is not properly formatted
+            GroupError: If the group is not in the "Empty" state (if it is a new consumer), or if the group coordinator
+                is unavailable
+        """
+        self._raise_if_not_connected()
+        self._raise_if_not_offsets_list(topic_offsets)
+
+        # Get the group we're setting offsets for (potentially updating the group information)
+        self._raise_if_group_active(self.get_group(group_name))
+
+        # Get the topic information, making sure all the leadership info is current
+        fetch_topics = [offsets.topic.name for offsets in topic_offsets]
+        self._maybe_update_metadata_for_topics(fetch_topics)
+
+        response = self._send_set_offset_request(group_name, topic_offsets)
+        return self._parse_set_offset_response(response)
+
+    def set_offsets_for_groups(self, group_offsets, topics=None):
+        """
+        Set the offsets for many groups at once, such as when resetting consumers after an incident. The groups are
+        described together, with one DescribeGroups request to each coordinator, and only groups that are in the
+        "Empty" or "Dead" state are changed. Targets are resolved to offsets with one set of ListOffsets requests for
+        each distinct target, and the commits for all the groups are then sent in parallel, pipelined to each
+        coordinator.
+
+        Args:
+            group_offsets (dict): a mapping of group names to the offsets to set for each group. This is either a list
+                of TopicOffsets objects, as for set_offsets_for_group, or a target for the topics in the topics
+                argument. The target is OFFSET_EARLIEST, OFFSET_LATEST, or a timestamp in millis. Partitions with no
+                messages after a timestamp are set to the latest offset
+            topics (list): a list of topic names to set offsets for in groups that have a target. Not used for groups
+                with a list of TopicOffsets
+
+        Returns:
+            dict (string -> dict): a mapping of group names to a map of topic names to a list of error code responses
+                for each partition, as returned by set_offsets_for_group, for the groups that offsets were committed for
+            dict (string -> int): a mapping of group names to the error code for each group that offsets were not
+                committed for. Groups that are active have an error code of 25 (UNKNOWN_MEMBER_ID), groups whose
+                coordinator failed to respond have an error code of -1 (UNKNOWN), and groups whose coordinator could not
+                be found have the error from the lookup
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            TypeError: If the offsets for any group are not properly formatted, or if targets are used without topics
+            TopicError: If a topic does not exist or there is a problem getting information for it
+        """
+        self._raise_if_not_connected()
+        targets = self._raise_if_not_group_offsets(group_offsets, topics)
+
+        # The group states must be current, as committing offsets for a running consumer would be overwritten
+        described, errors = self.describe_groups(list(group_offsets.keys()), cache=False)
+
+        fetch_topics = set(topics or [])
+        for offsets in group_offsets.values():
+            if not isinstance(offsets, six.integer_types):
+                fetch_topics.update(topic_offsets.topic.name for topic_offsets in offsets)
+        self._maybe_update_metadata_for_topics(list(fetch_topics))
+
+        target_offsets = dict((target, self.get_offsets_for_topics(topics, target)) for target in targets)
+        if self._offsets_past_end(target_offsets):
+            latest = target_offsets.get(self.OFFSET_LATEST) or self.get_offsets_for_topics(topics)
+            self._set_past_end_offsets(target_offsets, latest)
+
+        commits = self._group_offsets_to_set(group_offsets, topics, described, target_offsets, errors)
+        if len(commits) == 0:
+            return {}, errors
+
+        # The commits go to the coordinators that describe_groups just found, rather than looking them up again
+        responses = self._send_group_aware_requests(dict((group_name, self._set_offset_request(group_name, offsets))
+                                                         for group_name, offsets in commits.items()),
+                                                    errors, self._described_coordinators(described))
+        return dict((group_name, self._parse_set_offset_response(response)) for group_name, response in responses.items()), errors
+
+    def export_offsets(self, fileobj, groups=None, batch_size=100):
+        """
+        Write the offsets committed by groups to a file, to be restored later with import_offsets. The file has one line
+        for each group and topic, with a JSON object that has the group name, the topic name, and a list of the
+        committed offset for each partition (-1 for partitions with no committed offset).
+
+        The groups are fetched batch_size at a time, with the OffsetFetch requests for each batch pipelined to the
+        coordinators, and each batch is written out before the next is fetched. This keeps the memory used bounded no
+        matter how many groups there are. All the topics each group has committed offsets for are exported, which
+        requires brokers that support OffsetFetch version 2 or later.
+
+        Args:
+            fileobj (file): a file object opened for writing in text mode
+            groups (list): a list of group names to export. Defaults to None, which specifies all groups in the cluster
+            batch_size (int): the number of groups to fetch at once
+
+        Returns:
+            int: the number of groups that offsets were exported for
+            dict (string -> int): a mapping of group names to the error code for each group that could not be exported,
+                including groups whose coordinator could not be found
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+        """
+        self._raise_if_not_connected()
+        if groups is None:
+            groups = self.list_groups()[0]
+
+        exported = 0
+        errors = {}
+        for start in range(0, len(groups), batch_size):
+            batch = groups[start:start + batch_size]
+            responses = self._send_group_aware_requests(dict((group_name, OffsetFetchV2Request({'group_id': group_name, 'topics': None}))
+                                                             for group_name in batch), errors)
+            for group_name in batch:
+                if group_name not in responses:
+                    continue
+                response = responses[group_name]
+                if ('error' in response) and (response['error'] != 0):
+                    errors[group_name] = response['error']
+                    continue
+                for line in self._offset_export_lines(group_name, response):
+                    fileobj.write(line)
+                exported += 1
+        return exported, errors
+
+    def import_offsets(self, fileobj, groups=None, batch_size=100):
+        """
+        Restore the offsets for groups from a file written by export_offsets. The file is read batch_size groups at a
+        time, and for each batch the groups are described together to make sure they are not active, and then one
+        OffsetCommit request for each group is sent, pipelined to the coordinators. Only the partitions that have a
+        committed offset in the file are set.
+
+        Batches that were read before an invalid line in the file have already been committed when the error is raised.
+
+        Args:
+            fileobj (file): a file object opened for reading in text mode
+            groups (list): a list of group names to import. Defaults to None, which imports all groups in the file
+            batch_size (int): the number of groups to commit offsets for at once
+
+        Returns:
+            dict (string -> dict): a mapping of group names to a map of topic names to a list of error code responses
+                for each partition, for the groups that offsets were committed for
+            dict (string -> int): a mapping of group names to the error code for each group that offsets were not
+                committed for. Groups that are active have an error code of 25 (UNKNOWN_MEMBER_ID), and groups whose
+                coordinator could not be found have the error from the lookup
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            ValueError: If a line in the file is not a valid offsets record
+        """
+        self._raise_if_not_connected()
+        results = {}
+        errors = {}
+        batch = {}
+        for line_number, line in enumerate(fileobj, 1):
+            if line.strip() == '':
+                continue
+            group_name, topic_name, offsets = self._parse_offset_import_line(line, line_number)
+            if (groups is not None) and (group_name not in groups):
+                continue
+
+            if (group_name not in batch) and (len(batch) >= batch_size):
+                self._import_offsets_batch(batch, results, errors)
+                batch = {}
+            batch.setdefault(group_name, {})[topic_name] = offsets
+
+        if len(batch) > 0:
+            self._import_offsets_batch(batch, results, errors)
+        return results, errors
+
+    def send_to_leaders(self, items, build_request, parse_response):
+        """
+        Send work that is addressed to partitions to the leader of each partition, and collect the results. The items
+        are grouped by their current leader, one request is built for each leader with all of its items, and the
+        requests are sent to the leaders in parallel. Items that fail with a retriable error are sent again, up to the
+        num_retries configuration. If the error means that the leadership information is out of date, the metadata for
+        those topics is refreshed first, so the items go to the new leaders. Otherwise, the retry_backoff is waited
+        before retrying.
+
+        This is a building block for operations that are sent to partition leaders, such as ListOffsets, DeleteRecords,
+        or OffsetsForLeaderEpoch. The caller only needs to say how to build a request for a set of items, and how to
+        get the result and error for each item from a response.
+
+        Args:
+            items (list or dict): a list of (topic name, partition number) tuples, or a mapping of those tuples to a
+                value for each item (such as a timestamp or an offset) to pass to build_request
+            build_request (function): called with a mapping of items to values for a single leader, returns the
+                request to send to that leader
+            parse_response (function): called with a response from a leader, returns a mapping of items to
+                (result, error code) tuples
+
+        Returns:
+            dict (tuple -> object): a mapping of items to the result for each item that succeeded
+            dict (tuple -> int): a mapping of items to the error code for each item that failed. Items for partitions
+                that do not exist have an error of 3 (UNKNOWN_TOPIC_OR_PARTITION), and items whose leader failed to
+                respond have an error of 13 (NETWORK_EXCEPTION)
+
+        Raises:
+            ConnectionError: If there is a failure to send the metadata request to all brokers in the cluster
+        """
+        self._raise_if_not_connected()
+        if not isinstance(items, dict):
+            items = dict((item, None) for item in items)
+
+        self._maybe_update_metadata_for_topics(list(set(topic_name for topic_name, partition in items)))
+        results = {}
+        errors = {}
+        pending = items
+        for attempt in range(self.configuration.num_retries + 1):
+            if attempt > 0:
+                stale_topics = set(topic_name for topic_name, partition in pending if error_invalidates_metadata(errors[(topic_name, partition)]))
+                if len(stale_topics) > 0:
+                    self._invalidate_topics(stale_topics)
+                    self._maybe_update_metadata_for_topics(list(stale_topics))
+                else:
+                    time.sleep(self.configuration.retry_backoff)
+
+            routed = self._route_to_leaders(pending, errors)
+            requests = dict((broker_id, build_request(broker_items)) for broker_id, broker_items in routed.items())
+            responses = self._send_some_brokers(requests) if len(requests) > 0 else {}
+            self._gather_leader_responses(routed, responses, parse_response, results, errors)
+
+            pending = self._retriable_items(pending, errors)
+            if len(pending) == 0:
+                break
+        return results, errors
+
+    # The following interfaces are for future implementation. The names are set, but the interfaces
+    # are not yet
+    #
+    # def create_topic(self):
+    #     raise NotImplementedError
+    #
+    # def delete_topic(self):
+    #     raise NotImplementedError
+
+    ##########################################################################
+    # PRIVATE HELPER METHODS
+    #
+    # Everything below this point is methods that are not exposed, and are helpers for the
+    # actual exposed interfaces.
+    ##########################################################################
+
+    def _maybe_bootstrap_cluster(self, broker_port):
+        """Attempt to bootstrap the cluster information using the given broker"""
+        broker = self._new_broker(broker_port[0], port=broker_port[1])
+
+        try:
+            broker.connect()
+        except ConnectionError:
+            # Just skip to the next bootstrap broker
+            return False
+
+        # Fetch topic metadata for all topics/brokers
+        req = TopicMetadataV2Request({'topics': None})
+        correlation_id, metadata = broker.send(req)
+        broker.close()
+
+        # Add brokers and topics to cluster
+        self._controller_id = metadata['controller_id']
+        self._update_from_metadata(metadata)
+        self._last_full_metadata = time.time()
+        return True
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = BoundedExecutor(self.configuration.broker_threads, self.configuration.broker_queue_size)
+            return self._executor
+
+    def _connect_all_brokers(self):
+        # Failures are ignored here, as sends will attempt to reconnect
+        executor = self._get_executor()
+        executor.results(dict((broker_id, executor.submit(self.cluster.brokers[broker_id].connect)) for broker_id in self.cluster.brokers))
+
+    # The BaseClient methods that change the cluster information are serialized with the client lock, so that concurrent
+    # updates do not interleave. Readers see each topic, broker, and group either before or after it changes
+
+    def _update_from_metadata(self, metadata, delete=False, exclude=()):
+        with self._lock:
+            return super(Client, self)._update_from_metadata(metadata, delete=delete, exclude=exclude)
+
+    def _set_group_coordinator(self, group_name, response):
+        with self._lock:
+            return super(Client, self)._set_group_coordinator(group_name, response)
+
+    def _update_groups_from_lists(self, responses):
+        with self._lock:
+            return super(Client, self)._update_groups_from_lists(responses)
+
+    def _update_groups_from_describe(self, response):
+        with self._lock:
+            super(Client, self)._update_groups_from_describe(response)
+
+    def _save_snapshot(self):
+        with self._lock:
+            super(Client, self)._save_snapshot()
+
+    def _start_warm_up(self):
+        # Submitting the connections is done in its own thread, as it blocks if the executor queue fills up
+        thread = Thread(target=self._warm_up_connections, args=(self._get_executor(), self._warm_up_order()))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _warm_up_connections(self, executor, broker_ids):
+        for broker_id in broker_ids:
+            try:
+                executor.submit(self._warm_up_broker, self.cluster.brokers[broker_id])
+            except RuntimeError:
+                # The executor was shut down because the client was closed
+                return
+
+    def _warm_up_broker(self, broker):
+        if not self._connected:
+            return
+        try:
+            broker.connect_if_needed()
+        except ConnectionError:
+            # This is only an optimization. A send to the broker will try to connect again
+            pass
+
+    def _start_refresher(self):
+        # Each refresher has its own stop event, so one that is still finishing a refresh after close() exits afterwards
+        self._refresh_stop = Event()
+        thread = Thread(target=self._refresh_loop, args=(self._refresh_stop, self.configuration.background_refresh_interval))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _stop_refresher(self):
+        if self._refresh_stop is not None:
+            self._refresh_stop.set()
+            self._refresh_stop = None
+
+    def _refresh_loop(self, stop, interval):
+        while not stop.wait(interval):
+            try:
+                self._refresh_metadata()
+            except Exception as e:
+                # Callers will fetch the metadata themselves if it expires before the next refresh succeeds
+                log.warn("Background metadata refresh failed: {0}".format(e))
+
+    def _start_revalidation(self):
+        # After loading a snapshot, the current metadata is fetched once in the background to replace it
+        thread = Thread(target=self._revalidate_snapshot)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _revalidate_snapshot(self):
+        try:
+            self._refresh_metadata()
+        except Exception as e:
+            log.warn("Failed to fetch metadata to replace the snapshot: {0}".format(e))
+
+    def _refresh_metadata(self):
+        """
+        Fetch the full topic metadata and the group lists, and replace the cached information with them. Both are
+        fetched before either is applied, and they are applied together under the client lock, so the lock is only
+        held for as long as it takes to update the cluster. The metadata snapshot is saved afterwards, if configured
+
+        Raises:
+            ConnectionError: If there is a failure to send the metadata request to all brokers in the cluster
+        """
+        metadata = self._send_any_broker(TopicMetadataV2Request({'topics': None}))
+        group_lists = self._send_all_brokers(ListGroupsV0Request({}))
+        with self._lock:
+            self._update_from_metadata(metadata, delete=True)
+            self._update_groups_from_lists(group_lists)
+            self._last_full_metadata = self._last_group_list = time.time()
+        self._save_snapshot()
+
+    def _send_to_broker(self, broker_id, request):
+        """
+        Given a broker ID and a request, send the request to that broker and return the response
+
+        Args:
+            broker_id (int): The ID of a broker in the cluster
+            request (BaseRequest): A valid request object that inherits from BaseRequest
+
+        Returns:
+            BaseResponse: An instance of the response class associated with the request
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        """
+        correlation_id, response = self.cluster.brokers[broker_id].send(request)
+        return response
+
+    def _send_any_broker(self, request):
+        """
+        Sends a request to any broker. This can be used for requests that do not require a
+        specific broker to answer, such as metadata requests
+
+        Args:
+            request (BaseRequest): A valid request object that inherits from BaseRequest
+
+        Returns:
+            BaseResponse: An instance of the response class associated with the request
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        """
+        broker_ids = list(self.cluster.brokers.keys())
+        shuffle(broker_ids)
+        while len(broker_ids) > 0:
+            broker_id = broker_ids.pop()
+            try:
+                if self.cluster.brokers[broker_id].hostname is not None:
+                    return self._send_to_broker(broker_id, request)
+            except ConnectionError:
+                # We're going to ignore failures unless we exhaust brokers
+                pass
+
+        # If we exhausted all the brokers, we have a serious problem
+        raise ConnectionError("Failed to send request to any broker")
+
+    def _send_any_broker_pipelined(self, requests):
+        """
+        Sends a list of requests to any brokers. The requests are spread across the brokers, and the ones for each broker
+        are pipelined on its connection. Requests that fail are resent using _send_any_broker, which will try other
+        brokers
+
+        Args:
+            requests (list): A list of valid request objects that inherit from BaseRequest
+
+        Returns:
+            list (BaseResponse): The responses, in the same order as the requests
+
+        Raises:
+            ConnectionError: If there is a failure to send a request to all brokers in the cluster
+        """
+        if len(requests) == 1:
+            return [self._send_any_broker(requests[0])]
+
+        broker_ids = [broker_id for broker_id, broker in list(self.cluster.brokers.items()) if broker.hostname is not None]
+        if len(broker_ids) == 0:
+            raise ConnectionError("Failed to send request to any broker")
+        shuffle(broker_ids)
+        return self._send_pipelined([(broker_ids[i % len(broker_ids)], request) for i, request in enumerate(requests)],
+                                    retry=lambda broker_id, request: self._send_any_broker(request))
+
+    def _send_pipelined(self, requests, retry=None):
+        """
+        Sends a list of requests, each to a specified broker, without waiting for each response before sending the next
+        request. Requests to the same broker are pipelined on the connection (up to the max_in_flight configuration), and
+        requests to different brokers are in flight at the same time. Each broker's requests are sent from their own
+        queue, so a broker that already has max_in_flight requests outstanding does not hold up the sends to other
+        brokers. A request that fails with a connection error is sent again on its own, which will use the normal broker
+        retry behavior
+
+        Args:
+            requests (list): a list of (broker ID, request) tuples
+            retry (function): the function to call with the broker ID and request to resend a failed request. Defaults
+                to _send_to_broker
+
+        Returns:
+            list (BaseResponse): The responses, in the same order as the requests
+
+        Raises:
+            ConnectionError: If a request still fails after it is retried
+        """
+        retry = retry or self._send_to_broker
+        if len(requests) == 1:
+            return [retry(requests[0][0], requests[0][1])]
+
+        queues = {}
+        for i, (broker_id, request) in enumerate(requests):
+            queues.setdefault(broker_id, []).append(i)
+
+        if len(queues) == 1:
+            futures = self._send_queue(requests[0][0], [request for broker_id, request in requests])
+        else:
+            futures = [None] * len(requests)
+            executor = self._get_executor()
+            results = executor.results(dict((broker_id, executor.submit(self._send_queue, broker_id, [requests[i][1] for i in indices]))
+                                            for broker_id, indices in queues.items()))
+            for broker_id, indices in queues.items():
+                broker_futures, error = results[broker_id]
+                if error is not None:
+                    raise error
+                for i, future in zip(indices, broker_futures):
+                    futures[i] = future
+
+        responses = []
+        for (broker_id, request), future in zip(requests, futures):
+            try:
+                responses.append(future.result()[1])
+            except ConnectionError:
+                responses.append(retry(broker_id, request))
+        return responses
+
+    def _send_queue(self, broker_id, requests):
+        """
+        Sends a list of requests to a single broker in order, without waiting for the responses. This blocks while the
+        broker has max_in_flight requests outstanding
+
+        Args:
+            broker_id (int): The ID of a broker in the cluster
+            requests (list): A list of valid request objects that inherit from BaseRequest
+
+        Returns:
+            list (concurrent.futures.Future): the futures for the responses, in the same order as the requests
+        """
+        broker = self.cluster.brokers[broker_id]
+        return [broker.send_async(request) for request in requests]
+
+    def _send_some_brokers(self, requests, ignore_errors=True, timeout=None):
+        """
+        Sends a request to one or more brokers. The responses are returned mapped to the broker that
+        they were retrieved from. This method uses the client thread pool to parallelize sends, or a single thread
+        with non-blocking sockets if the multiplex_broker_io configuration is set. When multiplexing, brokers that are
+        not connected yet are sent to using the thread pool, so that connecting to them does not hold up the others.
+
+        Args:
+            requests (int -> BaseRequest): A dictionary, where keys are integer broker IDs and the values are valid
+                request objects that inherit from BaseRequest.
+            ignore_errors (boolean): If False, raise an error for the first broker that fails instead of returning None
+            timeout (float): The number of seconds to wait for all the responses. Defaults to the request_timeout
+                configuration. Brokers that do not respond in time are treated as failures
+
+        Returns:
+            dict (int -> BaseResponse): A map of broker IDs to response instances (inherited from
+                BaseResponse). Failed requests are represented with a value of None
+
+        Raises:
+            ConnectionError: If ignore_errors is False and a request fails or times out
+        """
+        timeout = self.configuration.request_timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.time() + timeout
+
+        results = {}
+        retry = list(requests.keys())
+        if self.configuration.multiplex_broker_io:
+            results = BrokerMultiplexer().send(dict((broker_id, (self.cluster.brokers[broker_id], requests[broker_id])) for broker_id in requests),
+                                               timeout=timeout)
+
+            # Brokers that failed, or were not connected yet, are sent to again the normal way, which connects and
+            # retries with backoff
+            retry = [broker_id for broker_id in results if isinstance(results[broker_id][1], ConnectionError)]
+
+        if len(retry) > 0:
+            executor = self._get_executor()
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            results.update(executor.results(dict((broker_id, executor.submit(self._send_to_broker, broker_id, requests[broker_id]))
+                                                 for broker_id in retry), timeout=remaining))
+
+        responses = {}
+        for broker_id in results:
+            response, error = results[broker_id]
+            if error is None:
+                responses[broker_id] = response
+            elif isinstance(error, FutureTimeoutError):
+                if not ignore_errors:
+                    raise ConnectionError("Timed out waiting for a response from broker {0}".format(broker_id))
+                responses[broker_id] = None
+            elif isinstance(error, ConnectionError) and ignore_errors:
+                # Individual broker failures are OK, as we'll represent them with a None value
+                responses[broker_id] = None
+            else:
+                raise error
+        return responses
+
+    def _send_all_brokers(self, request):
+        """
+        Sends a request to all brokers. The responses are returned mapped to the broker that
+        they were retrieved from
+
+        Args:
+            request (BaseRequest): A valid request object that inherits from BaseRequest
+
+        Returns:
+            dict (int -> BaseResponse): A map of broker IDs to response instances (inherited from
+                BaseResponse). Failed requests are represented with a value of None
+        """
+        requests = {}
+        for broker_id, broker in list(self.cluster.brokers.items()):
+            if broker.hostname is not None:
+                requests[broker_id] = request
+        return self._send_some_brokers(requests)
+
+    def _send_group_aware_request(self, group_name, request):
+        """
+        Sends a request to the broker currently serving as the group coordinator for the specified
+        group name. The request is not introspected for whether or not this is the correct broker,
+        and the response is not checked as to whether or not there was an error.
+
+        As a side effect of this call, the group object is created if it exists, and the coordinator
+        attribute is set to the broker that is currently the coordinator for that group.
+
+        If the coordinator_cache_ttl configuration is set and the coordinator is cached, the request is sent to it
+        without looking it up. If that broker fails, or responds that it is not the coordinator, the coordinator is
+        looked up and the request is sent again.
+
+        Args:
+            group_name (string): The name of the group to find the coordinator for
+            request (BaseRequest): A request instance, inherited from BaseRequest, to send to the
+                coordinator broker
+
+        Returns:
+            BaseResponse: The response instance, appropriate for the request, that is returned from
+                the broker
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to the coordinator broker,
+                or a failure to retrieve the coordinator information
+            GroupError: If an error is returned when fetching coordinator information
+        """
+        coordinator = self._cached_coordinator(group_name)
+        if coordinator is not None:
+            try:
+                response = self._send_to_broker(coordinator.id, request)
+                if not self._coordinator_moved(group_name, response):
+                    return response
+            except ConnectionError:
+                self._invalidate_coordinator(group_name)
+
+        response = self._send_any_broker(GroupCoordinatorV0Request({'group_id': group_name}))
+        coordinator = self._set_group_coordinator(group_name, response)
+        try:
+            response = self._send_to_broker(coordinator.id, request)
+        except ConnectionError:
+            self._invalidate_coordinator(group_name)
+            raise
+        self._coordinator_moved(group_name, response)
+        return response
+
+    def _send_group_aware_requests(self, group_requests, errors=None, coordinators=None):
+        """
+        Sends requests for many groups, each to the broker currently serving as the coordinator for its group. This is
+        the same as _send_group_aware_request, except that the coordinator lookups are pipelined, spread across the
+        brokers, and then the requests are pipelined to the coordinators. Groups with cached coordinators are not looked
+        up, unless the request for the group has to be sent again. If a coordinator fails, only the groups whose
+        requests failed are looked up and sent again, and the responses that were already received are kept.
+
+        Args:
+            group_requests (dict): a mapping of group names to the request instance to send to the coordinator of that
+                group
+            errors (dict): If provided, groups whose coordinator cannot be found are added to this mapping of group names
+                to error codes, and are left out of the responses, instead of raising an error for all the groups. Groups
+                whose request fails even after looking up the coordinator have an error code of -1 (UNKNOWN)
+            coordinators (dict): a mapping of group names to coordinator brokers that were just found, such as by
+                describe_groups. These are used for the first send to each group instead of looking them up
+
+        Returns:
+            dict (string -> BaseResponse): a mapping of group names to the response for the request for that group
+
+        Raises:
+            ConnectionError: If there is a failure to send a request to a coordinator broker that was just looked up,
+                and errors is not provided, or a failure to retrieve the coordinator information
+            GroupError: If an error is returned when fetching coordinator information for any group, and errors is not
+                provided
+        """
+        known = dict(coordinators or {})
+        responses = {}
+        pending = list(group_requests.keys())
+        while len(pending) > 0:
+            targets = dict((group_name, known.pop(group_name, None) or self._cached_coordinator(group_name)) for group_name in pending)
+            lookup = [group_name for group_name in pending if targets[group_name] is None]
+            targets.update(self._lookup_coordinators(lookup, errors))
+            pending = [group_name for group_name in pending if targets[group_name] is not None]
+
+            requests = [(targets[group_name].id, group_requests[group_name]) for group_name in pending]
+            retry = []
+            for group_name, response in zip(pending, self._send_pipelined(requests, retry=self._try_send_to_broker)):
+                if response is None:
+                    # The coordinator failed, so it is looked up again before resending, unless it was just looked up
+                    self._invalidate_coordinator(group_name)
+                    if group_name not in lookup:
+                        retry.append(group_name)
+                    elif errors is None:
+                        raise ConnectionError("Failed to send request to the coordinator for group {0}".format(group_name))
+                    else:
+                        errors[group_name] = -1
+                    continue
+
+                # Requests that went to a cached coordinator that is no longer the coordinator are sent again. Checking
+                # the responses also invalidates coordinators that were just looked up and have already moved
+                responses[group_name] = response
+                if group_name in lookup:
+                    self._coordinator_moved(group_name, response)
+                elif self._coordinator_moved(group_name, response, cached=True):
+                    retry.append(group_name)
+            pending = retry
+        return responses
+
+    def _try_send_to_broker(self, broker_id, request):
+        """Send a request to a broker the same way as _send_to_broker, but return None if it fails instead of raising"""
+        try:
+            return self._send_to_broker(broker_id, request)
+        except ConnectionError:
+            return None
+
+    def _lookup_coordinators(self, group_names, errors=None):
+        """
+        Look up the coordinators for a list of groups, pipelining the requests and spreading them across the brokers
+
+        Args:
+            group_names (list): the names of the groups to look up
+            errors (dict): If provided, groups whose lookup returns an error are added to this mapping of group names to
+                error codes, and are left out of the result, instead of raising an error
+
+        Returns:
+            dict (string -> Broker): a mapping of group names to the coordinator broker for each group
+
+        Raises:
+            ConnectionError: If there is a failure to send a lookup to all brokers in the cluster
+            GroupError: If an error is returned when fetching coordinator information for any group, and errors is not
+                provided
+        """
+        if len(group_names) == 0:
+            return {}
+        lookups = self._send_any_broker_pipelined([GroupCoordinatorV0Request({'group_id': group_name}) for group_name in group_names])
+
+        coordinators = {}
+        for group_name, response in zip(group_names, lookups):
+            if (errors is not None) and (response['error'] != 0):
+                errors[group_name] = response['error']
+                continue
+            coordinators[group_name] = self._set_group_coordinator(group_name, response)
+        return coordinators
+
+    def _send_list_offsets_to_brokers(self, request_values):
+        """
+        Given a mapping of broker IDs to values for ListOffset requests, send the requests to all the brokers and
+        collate the responses into a mapping of topic names to TopicOffsets instances
+
+        Args:
+            request_values (dict): a mapping of broker ID (int) to value dictionaries for ListOffsets requests
+
+        Returns:
+            dict (string -> TopicOffsets): A dictionary mapping topic names to TopicOffsets instances that contain
+                offsets for all the partitions requested. Partitions that still have errors after retrying are in the
+                errors of the TopicOffsets
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to a broker
+        """
+        requests = {}
+        timestamps = {}
+        for broker_id in request_values:
+            requests[broker_id] = ListOffsetV1Request(request_values[broker_id])
+            for topic in request_values[broker_id]['topics']:
+                for partition in topic['partitions']:
+                    timestamps[(topic['topic'], partition['partition'])] = partition['timestamp']
+
+        offsets = self._parse_list_offsets_responses(self._send_some_brokers(requests, ignore_errors=False))
+        return self._retry_list_offsets(offsets, lambda topic_name, partition: timestamps[(topic_name, partition)])
+
+    def _retry_list_offsets(self, offsets, timestamp_for):
+        """
+        Request the offsets again for the partitions that failed with a retriable error, up to num_retries times. When
+        the error means that the leadership information is out of date, the metadata for those topics is refreshed
+        first. Otherwise, the retry_backoff is waited before retrying
+
+        Args:
+            offsets (dict): a mapping of topic names to TopicOffsets instances, as from _parse_list_offsets_responses.
+                These are updated with the offsets from the retries
+            timestamp_for (function): called with a topic name and partition number, returns the timestamp to request
+
+        Returns:
+            dict (string -> TopicOffsets): the offsets that were passed in
+        """
+        for attempt in range(self.configuration.num_retries):
+            failed = [(topic_name, partition, error) for topic_name in offsets
+                      for partition, error in offsets[topic_name].errors.items() if error_retriable(error)]
+            if len(failed) == 0:
+                break
+
+            stale_topics = set(topic_name for topic_name, partition, error in failed if error_invalidates_metadata(error))
+            if len(stale_topics) > 0:
+                self._invalidate_topics(stale_topics)
+                self._maybe_update_metadata_for_topics(list(stale_topics))
+            else:
+                time.sleep(self.configuration.retry_backoff)
+
+            # Send only the failed partitions, each to its (possibly new) leader. Partitions that went away or have no
+            # leader are not sent, and the error is left for them
+            routed = self._route_to_leaders(dict(((topic_name, partition), timestamp_for(topic_name, partition))
+                                                 for topic_name, partition, error in failed), {})
+            requests = {}
+            for broker_id, broker_items in routed.items():
+                topics = {}
+                for (topic_name, partition), timestamp in broker_items.items():
+                    topics.setdefault(topic_name, []).append({'partition': partition, 'timestamp': timestamp})
+                requests[broker_id] = ListOffsetV1Request({'replica_id': -1,
+                                                           'topics': [{'topic': topic_name, 'partitions': partitions}
+                                                                      for topic_name, partitions in topics.items()]})
+
+            # Brokers that fail leave the errors for their partitions in place
+            responses = self._send_some_brokers(requests)
+            for broker_id, response in responses.items():
+                if response is None:
+                    continue
+                for topic in response['responses']:
+                    offsets[topic['topic']].set_offsets_from_list(topic['partition_responses'], raise_errors=False)
+        return offsets
+
+    def _send_list_offsets_batch(self, timestamp, topic_list):
+        """
+        Send the ListOffsets requests for a batch of topics (see _batched), one to each leader broker
+
+        Returns:
+            dict: a mapping of broker ID to the ListOffsetV1Response from that broker
+        """
+        request_values = self._list_offsets_values(topic_list, timestamp)
+        requests = dict((broker_id, ListOffsetV1Request(request_values[broker_id])) for broker_id in request_values)
+        return self._send_some_brokers(requests, ignore_errors=False)
+
+    def _send_offset_fetch_batch(self, items):
+        """
+        Send the OffsetFetch requests for a batch of (group name, topic name) items (see _batched). An OffsetFetch request
+        only holds a single group, so there is one request for each group with all of its topics, and the requests that
+        go to the same coordinator are pipelined. A group whose coordinator cannot be found does not fail the batch, as
+        the other callers in it did not ask for that group
+
+        Returns:
+            dict (string -> BaseResponse): a mapping of group names to the OffsetFetch response for the group
+            dict (string -> int): a mapping of group names to the error code for groups whose coordinator lookup failed
+        """
+        group_topics = {}
+        for group_name, topic_name in items:
+            group_topics.setdefault(group_name, []).append(topic_name)
+
+        errors = {}
+        responses = self._send_group_aware_requests(dict((group_name, OffsetFetchV1Request(self._offset_fetch_values(group_name, topics)))
+                                                         for group_name, topics in group_topics.items()), errors)
+        return responses, errors
+
+    def _get_groups(self, group_names):
+        """
+        Get the Group objects for the listed groups, refreshing the information for any that are not cached or have
+        expired. The DescribeGroups requests for the groups that need refreshing are sent together
+
+        Args:
+            group_names (list): a list of string group names
+
+        Returns:
+            dict (string -> Group): a mapping of the group names to Group objects
+
+        Raises:
+            ConnectionError: If there is a failure to send requests to brokers
+            GroupError: If a group does not exist or there is a problem fetching information for it
+        """
+        requests = {}
+        for group_name in group_names:
+            if self._group_needs_update(group_name):
+                requests[group_name] = DescribeGroupsV0Request({'group_ids': [group_name]})
+
+        if len(requests) > 0:
+            responses = self._send_group_aware_requests(requests)
+            for group_name in requests:
+                raise_if_error(GroupError, responses[group_name]['groups'][0]['error'])
+                self._update_groups_from_describe(responses[group_name])
+
+        return dict((group_name, self.cluster.groups[group_name]) for group_name in group_names)
+
+    def _import_offsets_batch(self, batch, results, errors):
+        """
+        Commit the offsets for a batch of groups read by import_offsets, adding the results and errors for each group
+
+        Args:
+            batch (dict): a mapping of group names to a mapping of topic names to a list of offsets for each partition
+            results (dict): a mapping of group names to the parsed OffsetCommit responses, to add to
+            errors (dict): a mapping of group names to error codes, to add to
+        """
+        described, describe_errors = self.describe_groups(list(batch.keys()), cache=False)
+        errors.update(describe_errors)
+
+        requests = dict((group_name, self._offset_import_request(group_name, topics)) for group_name, topics in batch.items()
+                        if self._group_can_set_offsets(group_name, described, errors))
+        if len(requests) == 0:
+            return
+        responses = self._send_group_aware_requests(requests, errors, self._described_coordinators(described))
+        for group_name, response in responses.items():
+            results.setdefault(group_name, {}).update(self._parse_set_offset_response(response))
+
+    def _send_set_offset_request(self, group_name, topic_offsets):
+        return self._send_group_aware_request(group_name, self._set_offset_request(group_name, topic_offsets))
+
+    def _maybe_update_metadata_for_topics(self, topics, cache=True):
+        """
+        Fetch metadata for the topics specified from the cluster if cache is False or if the cached metadata has expired.
+        The cluster brokers and topics are updated with the metadata information.
+
+        Args:
+            cache (boolean): Ignore the metadata expiration and fetch from the cluster anyway
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        """
+        if any(self._topic_needs_update(topic, cache) for topic in topics):
+            self._fetch_topic_metadata(topics)
+
+    def _fetch_topic_metadata(self, topics, check_errors=False):
+        """
+        Fetch metadata for the topics specified and update the cluster from it. Callers that need topic metadata within
+        the metadata_batch_window of each other share a single request for all their topics (see _batched), and the
+        cluster is updated from it once.
+
+        Args:
+            topics (list): the names of the topics to fetch metadata for
+            check_errors (boolean): If True, the caller checks the errors for its topics, and topics that have errors
+                are not added to the cluster
+
+        Returns:
+            MetadataV2Response: the metadata response, which includes (at least) the topics specified
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        """
+        return self._batched('metadata', [(topic, check_errors) for topic in topics],
+                             self.configuration.metadata_batch_window, self._send_metadata_batch)
+
+    def _send_metadata_batch(self, items):
+        topics = []
+        checked_topics = set()
+        for topic, check_errors in items:
+            if topic not in topics:
+                topics.append(topic)
+            if check_errors:
+                checked_topics.add(topic)
+
+        # It doesn't matter what broker we fetch topic metadata from
+        response = self._send_any_broker(TopicMetadataV2Request({'topics': topics}))
+        exclude = set()
+        if len(checked_topics) > 0:
+            exclude = set(topic['name'] for topic in response['topics'] if (topic['error'] != 0) and (topic['name'] in checked_topics))
+        self._update_from_metadata(response, delete=False, exclude=exclude)
+        return response
+
+    def _batched(self, key, items, window, run):
+        """
+        Collect work from concurrent callers into a batch, and do it all at once. The first caller for a key starts a
+        batch and waits for the window, so that other callers can add their items to it. It then calls run with all the
+        items, and every caller in the batch gets the same result (or exception).
+
+        Args:
+            key (hashable): the kind of work. Only calls with the same key are batched together
+            items (list): the (hashable) items of work that this caller needs done
+            window (float): the number of seconds to wait for other callers, or None to do the work right away
+            run (function): called with the list of all the items in the batch, and returns the result for the batch
+
+        Returns:
+            the return value of run for the batch that included the items
+
+        Raises:
+            Any exception that run raises for the batch
+        """
+        with self._batch_lock:
+            batch = self._batches.get(key)
+            if batch is not None:
+                # Another caller is collecting this kind of work, so join it and wait for the result
+                batch.add(items)
+                while not batch.done:
+                    self._batch_ready.wait()
+                if batch.error is not None:
+                    raise batch.error
+                return batch.result
+
+            batch = self._batches[key] = _Batch()
+            batch.add(items)
+            self._wait_for_batch_window(window)
+            del self._batches[key]
+
+        # The work is done without holding the batch lock, so that other batches can start and finish meanwhile
+        try:
+            result = run(batch.items)
+        except Exception as e:
+            self._finish_batch(batch, None, e)
+            raise
+        self._finish_batch(batch, result, None)
+        return result
+
+    def _finish_batch(self, batch, result, error):
+        with self._batch_lock:
+            batch.result = result
+            batch.error = error
+            batch.done = True
+            self._batch_ready.notify_all()
+
+    def _wait_for_batch_window(self, window):
+        """Wait for the number of seconds specified (if not None), releasing the batch lock while waiting"""
+        if window is None:
+            return
+
+        deadline = time.time() + window
+        remaining = window
+        while remaining > 0:
+            self._batch_ready.wait(remaining)
+            remaining = deadline - time.time()
+
+    def _maybe_update_full_metadata(self, cache=True):
+        """
+        Fetch all topic metadata from the cluster if cache is False or if the cached metadata has expired. The cluster
+        brokers and topics are updated with the metadata information, potentially deleting ones that no longer exist
+
+        Args:
+            cache (boolean): Ignore the metadata expiration and fetch from the cluster anyway
+
+        Raises:
+            ConnectionError: If there is a failure to send the request to all brokers in the cluster
+        """
+        if self._full_metadata_expired(cache):
+            self._update_from_metadata(self._send_any_broker(TopicMetadataV2Request({'topics': None})), delete=True)
+            self._last_full_metadata = time.time()
+
+    def _maybe_update_groups_list(self, cache=True):
+        """
+        Fetch lists of groups from all brokers if cache is False or if the cached group list has expired.
+
+        Args:
+            cache (boolean): Ignore the metadata expiration and fetch from the cluster anyway
+
+        Returns:
+            int: a count of the number of brokers that returned no response or error responses
+        """
+        if self._groups_list_expired(cache):
+            error_counter = self._update_groups_from_lists(self._send_all_brokers(ListGroupsV0Request({})))
+            self._last_group_list = time.time()
+            return error_counter
+        return 0
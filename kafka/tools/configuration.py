@@ -20,6 +20,8 @@ import six
 import ssl
 
 from kafka.tools.exceptions import ConfigurationError
+from kafka.tools.protocol.types.bufferpool import BufferPool
+from kafka.tools.sessioncache import TLSSessionCache
 
 
 def eval_boolean(value):
@@ -191,7 +193,7 @@ class ClientConfiguration(object):
 
     @property
     def max_request_size(self):
-        """The largest size for outgoing Kafka requests. Used to allocate the request buffer"""
+        """The largest size for outgoing Kafka requests. Larger requests are rejected before they are sent"""
         return getattr(self, '_max_request_size', 200000)
 
     @max_request_size.setter
@@ -199,6 +201,51 @@ class ClientConfiguration(object):
         raise_if_not_positive_integer("max_request_size", value)
         self._max_request_size = value
 
+    @property
+    def send_buffer_pool_size(self):
+        """The maximum number of bytes of request buffers to keep for reuse, for each broker
+
+        Request buffers are sized to fit each request, so this does not limit the size of requests. Buffers are not kept
+        for reuse once the pool holds this many bytes.
+        """
+        return getattr(self, '_send_buffer_pool_size', 200000)
+
+    @send_buffer_pool_size.setter
+    def send_buffer_pool_size(self, value):
+        raise_if_not_positive_integer("send_buffer_pool_size", value)
+        self._send_buffer_pool_size = value
+
+    @property
+    def receive_buffer_pool_size(self):
+        """The maximum number of bytes of response buffers to keep for reuse
+
+        The pool is shared by all the brokers that use this configuration. Buffers are allocated in power of two sizes,
+        and the default leaves room to keep the buffer for a full metadata response from a large cluster (up to 32 MB)
+        along with the buffers for smaller responses.
+        """
+        return getattr(self, '_receive_buffer_pool_size', 67108864)
+
+    @receive_buffer_pool_size.setter
+    def receive_buffer_pool_size(self, value):
+        raise_if_not_positive_integer("receive_buffer_pool_size", value)
+        self._receive_buffer_pool_size = value
+        if hasattr(self, 'receive_pool'):
+            self.receive_pool.max_bytes = value
+
+    @property
+    def max_in_flight(self):
+        """The maximum number of requests that can be pipelined on each broker connection at once
+
+        When this is more than 1, all requests to a broker are sent through the pipeline, and responses are read by a
+        background thread for each broker that has requests outstanding.
+        """
+        return getattr(self, '_max_in_flight', 1)
+
+    @max_in_flight.setter
+    def max_in_flight(self, value):
+        raise_if_not_positive_integer("max_in_flight", value)
+        self._max_in_flight = value
+
     @property
     def num_retries(self):
         """The number of times to retry a request when there is a failure"""
@@ -229,6 +276,175 @@ class ClientConfiguration(object):
         raise_if_not_positive_integer("broker_threads", value)
         self._broker_threads = value
 
+    @property
+    def lazy_connect(self):
+        """Connect to each broker the first time a request is sent to it, instead of to all brokers in connect()"""
+        return getattr(self, '_lazy_connect', False)
+
+    @lazy_connect.setter
+    def lazy_connect(self, value):
+        self._lazy_connect = eval_boolean(value)
+
+    @property
+    def warm_up_connections(self):
+        """When lazy_connect is set, connect to the brokers in the background after connect() returns
+
+        Brokers that lead partitions or coordinate groups are connected to first, as they are the most likely to be
+        needed.
+        """
+        return getattr(self, '_warm_up_connections', False)
+
+    @warm_up_connections.setter
+    def warm_up_connections(self, value):
+        self._warm_up_connections = eval_boolean(value)
+
+    @property
+    def connect_timeout(self):
+        """The number of seconds (float) to wait when connecting to a broker, or None for no limit"""
+        return getattr(self, '_connect_timeout', None)
+
+    @connect_timeout.setter
+    def connect_timeout(self, value):
+        if value is not None:
+            raise_if_not_positive_float("connect_timeout", value)
+        self._connect_timeout = value
+
+    @property
+    def api_version_negotiation(self):
+        """Ask each broker which API versions it supports when connecting, and send the newest version both support
+
+        Brokers older than 0.10 do not support the ApiVersions request and close the connection. When that happens, the
+        client reconnects and uses the default request versions for that broker.
+        """
+        return getattr(self, '_api_version_negotiation', False)
+
+    @api_version_negotiation.setter
+    def api_version_negotiation(self, value):
+        self._api_version_negotiation = eval_boolean(value)
+
+    @property
+    def multiplex_broker_io(self):
+        """Send requests that go to many brokers at once from a single thread, using non-blocking sockets
+
+        When this is False, a thread from the broker thread pool is used for each broker.
+        """
+        return getattr(self, '_multiplex_broker_io', False)
+
+    @multiplex_broker_io.setter
+    def multiplex_broker_io(self, value):
+        self._multiplex_broker_io = eval_boolean(value)
+
+    @property
+    def broker_queue_size(self):
+        """How many broker tasks can wait for a thread in the pool. Callers block when this many are waiting"""
+        return getattr(self, '_broker_queue_size', 1000)
+
+    @broker_queue_size.setter
+    def broker_queue_size(self, value):
+        raise_if_not_positive_integer("broker_queue_size", value)
+        self._broker_queue_size = value
+
+    @property
+    def request_timeout(self):
+        """The number of seconds (float) to wait for responses when sending to multiple brokers, or None for no limit
+
+        Brokers that do not respond in time are treated the same as brokers that fail to respond.
+        """
+        return getattr(self, '_request_timeout', None)
+
+    @request_timeout.setter
+    def request_timeout(self, value):
+        if value is not None:
+            raise_if_not_positive_float("request_timeout", value)
+        self._request_timeout = value
+
+    @property
+    def metadata_batch_window(self):
+        """The number of seconds (float) to wait for other callers that need topic metadata, so that their topics are
+        fetched in a single request. None sends each request right away
+        """
+        return getattr(self, '_metadata_batch_window', None)
+
+    @metadata_batch_window.setter
+    def metadata_batch_window(self, value):
+        if value is not None:
+            raise_if_not_positive_float("metadata_batch_window", value)
+        self._metadata_batch_window = value
+
+    @property
+    def offset_batch_window(self):
+        """The number of seconds (float) to collect get_offsets_for_topic(s) and get_offsets_for_group calls from other
+        threads, so that they are sent to each broker together. None sends the requests for each call right away
+        """
+        return getattr(self, '_offset_batch_window', None)
+
+    @offset_batch_window.setter
+    def offset_batch_window(self, value):
+        if value is not None:
+            raise_if_not_positive_float("offset_batch_window", value)
+        self._offset_batch_window = value
+
+    @property
+    def background_refresh_interval(self):
+        """The number of seconds (float) between refreshes of the full topic metadata and the group lists in the
+        background, or None to only fetch them when a caller finds that they have expired
+
+        This should be shorter than metadata_refresh, so that the cached information is replaced before it expires and
+        callers do not have to wait for it to be fetched.
+        """
+        return getattr(self, '_background_refresh_interval', None)
+
+    @background_refresh_interval.setter
+    def background_refresh_interval(self, value):
+        if value is not None:
+            raise_if_not_positive_float("background_refresh_interval", value)
+        self._background_refresh_interval = value
+
+    @property
+    def coordinator_cache_ttl(self):
+        """How long (in seconds) to send group requests to the known coordinator of a group without looking it up again
+
+        The coordinator is looked up again sooner if it returns an error saying it is not the coordinator for the group,
+        or if sending to it fails. None looks up the coordinator before every group request.
+        """
+        return getattr(self, '_coordinator_cache_ttl', None)
+
+    @coordinator_cache_ttl.setter
+    def coordinator_cache_ttl(self, value):
+        if value is not None:
+            raise_if_not_positive_integer("coordinator_cache_ttl", value)
+        self._coordinator_cache_ttl = value
+
+    @property
+    def metadata_snapshot(self):
+        """The path of a file to save the cluster metadata to, so that later clients can start from it, or None
+
+        When this is set, connect() loads the brokers, topics, and group coordinators from the file instead of fetching
+        them from the bootstrap brokers, and then fetches the current metadata in the background. The file is written
+        after the metadata is fetched, and when the client is closed.
+        """
+        return getattr(self, '_metadata_snapshot', None)
+
+    @metadata_snapshot.setter
+    def metadata_snapshot(self, value):
+        if value is not None:
+            raise_if_not_string("metadata_snapshot", value)
+        self._metadata_snapshot = value
+
+    @property
+    def metadata_snapshot_max_age(self):
+        """How old (in seconds) a metadata snapshot can be and still be used when connecting
+
+        Cached information loaded from a snapshot expires the same as any other, based on metadata_refresh and the time
+        that the snapshot was saved.
+        """
+        return getattr(self, '_metadata_snapshot_max_age', 3600)
+
+    @metadata_snapshot_max_age.setter
+    def metadata_snapshot_max_age(self, value):
+        raise_if_not_positive_integer("metadata_snapshot_max_age", value)
+        self._metadata_snapshot_max_age = value
+
     def _set_attributes(self, **kwargs):
         for key in kwargs:
             if not hasattr(self, key):
@@ -248,8 +464,13 @@ class ClientConfiguration(object):
             raise ConfigurationError("Only one of zkconnect and broker_list may be provided")
         self._set_attributes(**kwargs)
 
-        # Create the SSL context if we are going to enable TLS
+        # Create the SSL context if we are going to enable TLS. The context, and the cache of TLS sessions for resuming
+        # connections, are shared by all brokers that use this configuration
         self.ssl_context = self._create_ssl_context() if self.enable_tls else None
+        self.tls_sessions = TLSSessionCache()
+
+        # Response buffers are shared by all brokers, as large responses (like metadata) can come from any broker
+        self.receive_pool = BufferPool(self.receive_buffer_pool_size)
 
     def _verify_ssl_configuration(self):
         if self.tls_verify_hostnames and (not self.tls_verify_certificates):
@@ -77,6 +77,10 @@ class ConnectionError(ClientError):
     errstr = "There was an error connecting to a Kafka broker"
 
 
+class RequestTooLargeError(ClientError):
+    errstr = "The request is larger than the maximum request size"
+
+
 class GroupError(ClientError):
     errstr = "There was an error getting information about a group"
 
@@ -0,0 +1,82 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+
+class BoundedExecutor(object):
+    def __init__(self, max_workers, max_queued):
+        """
+        Create a thread pool that limits how many tasks can be waiting for a thread. Once max_queued tasks are waiting,
+        submit blocks until a task finishes, so a burst of calls cannot queue an unbounded amount of work.
+
+        Args:
+            max_workers (int): the number of threads in the pool
+            max_queued (int): the number of tasks that can be waiting for a thread, in addition to the running ones
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = BoundedSemaphore(max_workers + max_queued)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule a function to run on the pool, blocking first if the queue is full
+
+        Args:
+            fn (function): the function to call
+            args: the positional arguments to call the function with
+            kwargs: the keyword arguments to call the function with
+
+        Returns:
+            concurrent.futures.Future: resolves to the return value of the function, or raises its exception
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def results(self, futures, timeout=None):
+        """
+        Wait for a set of futures, sharing a single timeout between all of them
+
+        Args:
+            futures (dict): a mapping of keys to futures returned by submit
+            timeout (float): the number of seconds to wait for all the futures. None waits without a limit
+
+        Returns:
+            dict: a mapping of the same keys to a tuple of the result and the exception for each future. Futures that
+                do not finish in time have a TimeoutError as the exception. The tasks for them keep running, and are not
+                waited for.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        rv = {}
+        for key, future in futures.items():
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                rv[key] = (future.result(remaining), None)
+            except Exception as e:
+                rv[key] = (None, e)
+        return rv
+
+    def shutdown(self, wait=True):
+        """Stop the pool threads once the tasks already submitted are finished"""
+        self._executor.shutdown(wait=wait)
@@ -19,14 +19,21 @@ from __future__ import division
 
 import re
 import socket
+import ssl
 import struct
 import time
+from concurrent.futures import Future
+from threading import BoundedSemaphore, Lock, Thread, current_thread
 
 from kafka.tools import log
 from kafka.tools.configuration import ClientConfiguration
 from kafka.tools.models import BaseModel
-from kafka.tools.exceptions import ConfigurationException, ConnectionError
+from kafka.tools.exceptions import ConfigurationException, ConnectionError, RequestTooLargeError
+from kafka.tools.protocol.requests.api_versions_v0 import ApiVersionsV0Request
+from kafka.tools.protocol.schema import references_buffer_for
+from kafka.tools.protocol.types.bufferpool import BufferPool
 from kafka.tools.protocol.types.bytebuffer import ByteBuffer
+from kafka.tools.protocol.versions import upgrade_request
 from kafka.tools.utilities import json_loads
 
 
@@ -41,6 +48,11 @@ class Endpoint(BaseModel):
 
 class Broker(BaseModel):
     equality_attrs = ['hostname', 'id']
+    # size and correlation_id at the start of every response
+    _response_header_struct = struct.Struct('>ii')
+
+    # size, api_key, api_version, correlation_id, and the length of the client_id string
+    _header_struct = struct.Struct('>ihhih')
 
     @property
     def hostname(self):
@@ -71,8 +83,28 @@ class Broker(BaseModel):
         self.endpoints = []
         self._sock = sock
 
+        # The API versions the broker supports, as a mapping of API key to (min, max). None until the broker is asked,
+        # and empty if the broker does not support the ApiVersions request
+        self.api_versions = None
+
         self._correlation_id = 1
         self._configuration = configuration or ClientConfiguration()
+        self._session_endpoint = None
+
+        # Buffers used for reading responses. The size and correlation ID are always read into the same small buffer,
+        # and the pool for the response bodies is shared by all brokers using the same configuration
+        self._response_header_buf = bytearray(self._response_header_struct.size)
+        self._response_header_view = memoryview(self._response_header_buf)
+        self._receive_pool = self._configuration.receive_pool
+        self._send_pool = BufferPool(self._configuration.send_buffer_pool_size)
+
+        # State for pipelined requests. In-flight requests are tracked by correlation ID, and a reader thread runs
+        # whenever there are requests outstanding. Writes to the socket are serialized separately from reads
+        self._in_flight = {}
+        self._in_flight_lock = Lock()
+        self._in_flight_slots = BoundedSemaphore(self._configuration.max_in_flight)
+        self._send_lock = Lock()
+        self._reader = None
 
     @classmethod
     def create_from_json(cls, broker_id, jsondata):
@@ -113,6 +145,7 @@ class Broker(BaseModel):
         newbroker.endpoints = self.endpoints
         newbroker.timestamp = self.timestamp
         newbroker.cluster = self.cluster
+        newbroker.api_versions = self.api_versions
         return newbroker
 
     def num_leaders(self):
@@ -141,10 +174,14 @@ class Broker(BaseModel):
                 return endpoint
         return self.endpoint
 
-    def _get_socket(self, sslcontext):
+    def _get_socket(self, sslcontext, session=None):
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         if sslcontext is not None:
-            sock = sslcontext.wrap_socket(sock, server_hostname=self.hostname)
+            if session is not None:
+                # Resume the TLS session from an earlier connection to the same endpoint
+                sock = sslcontext.wrap_socket(sock, server_hostname=self.hostname, session=session)
+            else:
+                sock = sslcontext.wrap_socket(sock, server_hostname=self.hostname)
         return sock
 
     def connect(self):
@@ -152,16 +189,76 @@ class Broker(BaseModel):
         endpoint = self.get_endpoint(protocol)
 
         log.info("Connecting to {0} on port {1} using {2}".format(self.hostname, self.port, protocol))
+        tls_sessions = self._configuration.tls_sessions
+        sock = self._sock or self._get_socket(self._configuration.ssl_context, tls_sessions.get(endpoint.hostname, endpoint.port))
         try:
-            self._sock = self._sock or self._get_socket(self._configuration.ssl_context)
-            self._sock.connect((endpoint.hostname, endpoint.port))
+            # The timeout only applies to connecting (and the TLS handshake). Requests block until they complete
+            sock.settimeout(self._configuration.connect_timeout)
+            sock.connect((endpoint.hostname, endpoint.port))
+            sock.settimeout(None)
         except socket.error as e:
+            if sock is not self._sock:
+                sock.close()
             log.error("Cannot connect to broker {0}:{1}: {2}".format(endpoint.hostname, endpoint.port, e))
             raise ConnectionError("Cannot connect to broker {0}:{1}: {2}".format(endpoint.hostname, endpoint.port, e))
 
+        if isinstance(sock, ssl.SSLSocket):
+            tls_sessions.record_connect(endpoint.hostname, endpoint.port, sock)
+            self._session_endpoint = (endpoint.hostname, endpoint.port)
+
+        # The socket is only made visible once it is connected, so other threads never send on a socket that isn't
+        self._sock = sock
+
+        if self._configuration.api_version_negotiation and (self.api_versions is None):
+            self._negotiate_api_versions()
+
+    def _negotiate_api_versions(self):
+        """
+        Ask the broker which versions of each API it supports. This is done once, on the first connection, and the
+        versions are kept for the life of the Broker. Brokers that do not support ApiVersions close the connection, so
+        in that case the connection is reopened and the default request versions are used
+
+        Raises:
+            ConnectionError: If the connection to the broker cannot be reopened
+        """
+        try:
+            correlation_id, response = self._single_send(ApiVersionsV0Request({}))
+        except ConnectionError as e:
+            log.info("Broker {0} does not support ApiVersions, using default request versions: {1}".format(self.id, e))
+            self.api_versions = {}
+            self.close()
+            self.connect()
+            return
+
+        if response['error'] != 0:
+            self.api_versions = {}
+        else:
+            self.api_versions = dict((item['api_key'], (item['min_version'], item['max_version']))
+                                     for item in response['api_versions'])
+
+    def connect_if_needed(self):
+        """
+        Connect to the broker unless there is already a connection. This is safe to call from multiple threads, and only
+        one of them will connect
+
+        Raises:
+            ConnectionError: If the connection to the broker cannot be opened
+        """
+        with self._send_lock:
+            if self._sock is None:
+                self.connect()
+
     def close(self):
+        self._fail_in_flight(ConnectionError("Connection to broker {0} was closed".format(self.id)))
+        if self._sock is None:
+            return
         log.info("Disconnecting from {0}".format(self.hostname))
 
+        # With TLS 1.3 the session ticket arrives after the handshake, so the session is cached again before closing
+        if isinstance(self._sock, ssl.SSLSocket) and (self._session_endpoint is not None):
+            self._configuration.tls_sessions.put(self._session_endpoint[0], self._session_endpoint[1],
+                                                 getattr(self._sock, 'session', None))
+
         # Shutdown throws an error if the socket is not connected, but that's OK
         try:
             self._sock.shutdown(socket.SHUT_RDWR)
@@ -176,11 +273,16 @@ class Broker(BaseModel):
         while attempts < self._configuration.num_retries:
             attempts += 1
             try:
-                # Connect to the broker if not currently connected
-                if self._sock is None:
-                    self.connect()
-
-                return self._single_send(request)
+                # Once requests are pipelined, responses must go through the reader so they are matched correctly
+                if self._configuration.max_in_flight == 1:
+                    # The send lock is held for the request and response, so other threads wait their turn on this
+                    # broker. The reader can only be started by a thread holding the lock
+                    with self._send_lock:
+                        if self._sock is None:
+                            self.connect()
+                        if self._reader is None:
+                            return self._single_send(request)
+                return self.send_async(request).result()
             except ConnectionError as e:
                 if attempts >= self._configuration.num_retries:
                     log.error("Failed communicating with Kafka broker {0}. retries remaining = 0: {1}".format(self.id, e))
@@ -194,64 +296,279 @@ class Broker(BaseModel):
             self.close()
             time.sleep(self._configuration.retry_backoff)
 
-    def _single_send(self, request):
-        # Build the payload based on the request passed in. We'll fill in the size at the end
-        buf = ByteBuffer(self._configuration.max_request_size)
-        buf.putInt32(0)
-        buf.putInt16(request.api_key)
-        buf.putInt16(request.api_version)
-        buf.putInt32(self._correlation_id)
-        buf.putInt16(len(self._configuration.client_id))
-        buf.put(struct.pack('{0}s'.format(len(self._configuration.client_id)), self._configuration.client_id.encode("utf-8")))
-        request.encode(buf)
-
-        # Close the payload and write the size (payload size without the size field itself)
-        buf.limit = buf.position - 1
-        payload_len = buf.capacity - 4
-        buf.rewind()
-        buf.putInt32(payload_len)
-        buf.rewind()
+    def _encode_request(self, request):
+        """
+        Encode a request for sending to the broker. The header and the body are encoded separately, so that they can be
+        sent without being joined. The body is encoded into a buffer of exactly the right size from the send pool, and
+        this buffer must be released back to the pool once it has been sent.
+
+        Args:
+            request (BaseRequest): the request to encode
+
+        Returns:
+            int: the correlation ID used for the request
+            bytes: the request header, including the size of the entire request
+            bytearray: the buffer from the send pool that holds the body
+            int: the size of the body in the buffer
+
+        Raises:
+            RequestTooLargeError: If the encoded request is larger than the max_request_size configuration
+        """
+        client_id = self._configuration.client_id.encode("utf-8")
+        body_size = request.encoded_size()
+        if self._header_struct.size + len(client_id) + body_size > self._configuration.max_request_size:
+            raise RequestTooLargeError("Request of {0} bytes is larger than max_request_size ({1})".format(
+                self._header_struct.size + len(client_id) + body_size, self._configuration.max_request_size))
+        body_buf = self._send_pool.acquire(body_size)
+        try:
+            request.encode(ByteBuffer(memoryview(body_buf)[:body_size]))
+        except Exception:
+            self._send_pool.release(body_buf)
+            raise
+
+        # The size in the header is the payload size without the size field itself
+        correlation_id = self._correlation_id
+        header = self._header_struct.pack(self._header_struct.size - 4 + len(client_id) + body_size,
+                                          request.api_key,
+                                          request.api_version,
+                                          correlation_id,
+                                          len(client_id)) + client_id
 
         # Increment the correlation ID for the next request
         self._correlation_id += 1
-
+        return correlation_id, header, body_buf, body_size
+
+    def _send_segments(self, segments, sock=None):
+        """
+        Send a list of buffers to the broker without concatenating them. sendmsg is used when the socket supports it
+        (it is not available on SSL sockets or on all platforms), and partial sends are resumed where they left off.
+
+        Args:
+            segments (list): a list of bytes-like objects to send, in order
+            sock (socket): the socket to send on. Defaults to the broker's current socket
+
+        Raises:
+            socket.error: If there is a failure sending the data
+        """
+        sock = sock or self._sock
+        if isinstance(sock, ssl.SSLSocket) or (not hasattr(sock, 'sendmsg')):
+            for segment in segments:
+                sock.sendall(segment)
+            return
+
+        segments = [memoryview(segment) for segment in segments if len(segment) > 0]
+        while len(segments) > 0:
+            sent = sock.sendmsg(segments)
+            while (sent > 0) and (len(segments) > 0):
+                if sent >= len(segments[0]):
+                    sent -= len(segments[0])
+                    segments.pop(0)
+                else:
+                    segments[0] = segments[0][sent:]
+                    sent = 0
+
+    def send_async(self, request):
+        """
+        Send a request to the broker without waiting for the response. Up to max_in_flight requests can be outstanding on
+        the connection at once, and this call blocks when that many are already in flight. Responses are read by a
+        background thread that matches them to requests by correlation ID, and it exits when nothing is in flight.
+
+        Unlike send, there are no retries. If the connection fails, all requests that are in flight fail with it.
+
+        Args:
+            request (BaseRequest): the request to send
+
+        Returns:
+            concurrent.futures.Future: resolves to a tuple of the correlation ID and the response, or raises
+                ConnectionError if there was a failure communicating with the broker
+        """
+        future = Future()
+        sock = None
+        registered = False
+        self._in_flight_slots.acquire()
+        try:
+            with self._send_lock:
+                if self._sock is None:
+                    self.connect()
+                sock = self._sock
+                request = upgrade_request(request, self.api_versions)
+                correlation_id, header, body_buf, body_size = self._encode_request(request)
+
+                try:
+                    # Register the request before sending it, as the response can arrive before the send returns
+                    with self._in_flight_lock:
+                        self._in_flight[correlation_id] = (request, future)
+                        registered = True
+                        if self._reader is None:
+                            self._reader = Thread(target=self._read_responses, args=(sock, ))
+                            self._reader.daemon = True
+                            self._reader.start()
+
+                    self._send_segments([header, memoryview(body_buf)[:body_size]], sock)
+                finally:
+                    self._send_pool.release(body_buf)
+        except Exception as e:
+            if not registered:
+                # The request never made it into the pipeline, so only this future fails
+                self._in_flight_slots.release()
+                if isinstance(e, socket.error):
+                    e = ConnectionError("Failed communicating with Kafka: {0}".format(e))
+                future.set_exception(e)
+            elif self._sock is sock:
+                # A partial write leaves the connection unusable. Closing it fails everything in flight, including this
+                self.close()
+        return future
+
+    def _read_responses(self, sock):
+        """
+        Read responses from the socket and resolve the futures for the requests they belong to. This runs in its own
+        thread, and exits when there are no requests left in flight or when the connection fails or is replaced.
+        """
+        me = current_thread()
         try:
-            # Send the payload bytes to the broker
-            self._sock.sendall(buf.get(buf.capacity))
+            while True:
+                with self._in_flight_lock:
+                    if (len(self._in_flight) == 0) or (self._reader is not me):
+                        if self._reader is me:
+                            self._reader = None
+                        return
+
+                correlation_id, size = self._read_response_header(sock)
+                with self._in_flight_lock:
+                    request, future = self._in_flight.pop(correlation_id)
+
+                try:
+                    response, response_buf = self._read_response_body(sock, request.response, size)
+                except socket.error as e:
+                    self._in_flight_slots.release()
+                    future.set_exception(ConnectionError("Failed communicating with Kafka: {0}".format(e)))
+                    raise
+
+                try:
+                    future.set_result((correlation_id, self._decode_response(request, correlation_id, response, response_buf)))
+                except Exception as e:
+                    future.set_exception(e)
+                finally:
+                    self._in_flight_slots.release()
+        except (ConnectionError, KeyError, socket.error) as e:
+            # Closing the connection fails everything in flight on it. If the connection has already been closed or
+            # replaced, those requests were failed at that time
+            if self._sock is sock:
+                log.warn("Failed reading responses from Kafka broker {0}: {1}".format(self.id, e))
+                self.close()
+
+    def _fail_in_flight(self, error):
+        """Fail every request that is in flight on the connection with the provided error"""
+        with self._in_flight_lock:
+            pending = self._in_flight
+            self._in_flight = {}
+            self._reader = None
+
+        for request, future in pending.values():
+            future.set_exception(error)
+            self._in_flight_slots.release()
 
-            # Read the first 4 bytes so we know the size
-            size = ByteBuffer(self._sock.recv(4)).getInt32()
+    def _single_send(self, request):
+        request = upgrade_request(request, self.api_versions)
+        correlation_id, header, body_buf, body_size = self._encode_request(request)
 
-            # Read the response that we're expecting
-            response_data = self._read_bytes(size)
-            response = ByteBuffer(response_data)
+        try:
+            # Send the header and body to the broker, and then the body buffer can be reused
+            try:
+                self._send_segments([header, memoryview(body_buf)[:body_size]])
+            finally:
+                self._send_pool.release(body_buf)
 
-            # Parse off the correlation ID for the response
-            correlation_id = response.getInt32()
-        except EOFError:
-            raise ConnectionError("Failed to read enough data from Kafka")
+            correlation_id, size = self._read_response_header(self._sock)
+            response, response_buf = self._read_response_body(self._sock, request.response, size)
         except socket.error as e:
             raise ConnectionError("Failed communicating with Kafka: {0}".format(e))
 
+        return correlation_id, self._decode_response(request, correlation_id, response, response_buf)
+
+    def _read_response_header(self, sock):
+        """
+        Read the size and the correlation ID of the next response from the socket
+
+        Args:
+            sock (socket): the socket to read from
+
+        Returns:
+            int: the correlation ID of the response
+            int: the size of the response body that follows
+
+        Raises:
+            socket.error: If there is a failure reading from the socket
+            ConnectionError: If the size is too small to be a valid response
+        """
+        self._read_into(self._response_header_view, sock)
+        size, correlation_id = self._response_header_struct.unpack_from(self._response_header_buf)
+        if size < 4:
+            raise ConnectionError("Invalid response size from Kafka: {0}".format(size))
+        return correlation_id, size - 4
+
+    def _read_response_body(self, sock, response_class, size):
+        """
+        Read the body of a response from the socket. Responses that keep references into their buffer (because they have
+        bytes fields) get a buffer of exactly the right size, which belongs to the response. Otherwise a buffer from the
+        receive pool is used, and it is released back to the pool when the response is decoded
+
+        Args:
+            sock (socket): the socket to read from
+            response_class (class): the class of the response being read
+            size (int): the size of the response body
+
+        Returns:
+            ByteBuffer: the response body
+            bytearray: the buffer that holds the response body
+
+        Raises:
+            socket.error: If there is a failure reading from the socket
+        """
+        response_buf = self._response_buffer(response_class, size)
+        self._read_into(memoryview(response_buf)[:size], sock)
+        return ByteBuffer(memoryview(response_buf)[:size]), response_buf
+
+    def _response_buffer(self, response_class, size):
+        """Get a buffer to read a response body of the given size into. See _read_response_body"""
+        if references_buffer_for(response_class):
+            return bytearray(size)
+        return self._receive_pool.acquire(size)
+
+    def _decode_response(self, request, correlation_id, response, response_buf):
         # Get the proper response class and parse the response
-        return correlation_id, request.response.from_bytebuffer(correlation_id, response.slice())
-
-    def _read_bytes(self, size):
-        bytes_left = size
-        responses = []
-
-        while bytes_left:
+        rv = request.response.from_bytebuffer(correlation_id, response.slice())
+
+        # If the response can't hold views into the buffer (it has no bytes fields), it can be reused for the next
+        # response. Otherwise, the buffer was allocated for this response and now belongs to the response object
+        if not references_buffer_for(request.response):
+            self._receive_pool.release(response_buf)
+        return rv
+
+    def _read_into(self, view, sock=None):
+        """
+        Fill the provided memoryview with data from the socket, handling partial reads
+
+        Args:
+            view (memoryview): the (writable) memory to read into. The entire view is filled
+            sock (socket): the socket to read from. Defaults to the broker's current socket
+
+        Raises:
+            socket.error: If the socket fails, or is closed before enough data is read
+        """
+        sock = sock or self._sock
+        bytes_read = 0
+        bytes_total = len(view)
+
+        while bytes_read < bytes_total:
             try:
-                data = self._sock.recv(min(bytes_left, 4096))
+                count = sock.recv_into(view[bytes_read:], bytes_total - bytes_read)
             except socket.error:
                 raise socket.error("Unable to receive data from Kafka")
 
-            if data == b'':
+            if count == 0:
                 raise socket.error("Not enough data to read message -- did server kill socket?")
-
-            bytes_left -= len(data)
-            responses.append(data)
-        return b''.join(responses)
+            bytes_read += count
 
     def to_dict(self):
         return {
@@ -65,6 +65,12 @@ class Cluster(BaseModel):
         self.groups = {}
         self.retention = retention
 
+        # Indexes of the partitions (as (topic name, partition number) tuples) that each broker ID leads or has a
+        # replica of, and of the leader for each partition. These are kept up to date by the Partition objects
+        self._leaders = {}
+        self._replicas = {}
+        self._partition_leaders = {}
+
     @classmethod
     def create_from_zookeeper(cls, zkconnect, default_retention=1, fetch_topics=True):
         log.info("Connecting to zookeeper {0}".format(zkconnect))
@@ -123,10 +129,28 @@ class Cluster(BaseModel):
         self.brokers[broker.id] = broker
 
     def add_topic(self, topic):
+        if topic.name in self.topics:
+            self._unindex_topic(self.topics[topic.name])
         topic.cluster = self
         topic.retention = self.retention
         self.topics[topic.name] = topic
 
+        for partition in topic.partitions:
+            if partition.leader is not None:
+                self._index_leader(partition, None, partition.leader)
+            for broker in partition.replicas:
+                self._index_replica(partition, broker, True)
+
+    def remove_topic(self, topic_name):
+        """
+        Remove a topic from the cluster, along with its partitions in the leader and replica indexes
+
+        Args:
+            topic_name (string): the name of the topic to remove
+        """
+        self._unindex_topic(self.topics[topic_name])
+        del self.topics[topic_name]
+
     def add_group(self, group):
         group.cluster = self
         self.groups[group.name] = group
@@ -142,6 +166,79 @@ class Cluster(BaseModel):
             for partition in self.topics[topic].partitions:
                 yield partition
 
+    def partitions_led_by(self, broker_id):
+        """
+        Get the partitions that a broker is the leader for, without scanning all the partitions in the cluster
+
+        Args:
+            broker_id (int): the ID of the broker
+
+        Returns:
+            set: the (topic name, partition number) tuples for the partitions the broker leads
+        """
+        return set(self._leaders.get(broker_id, ()))
+
+    def count_led_by(self, broker_id):
+        """
+        Get the number of partitions that a broker is the leader for, without copying the set of partitions
+
+        Args:
+            broker_id (int): the ID of the broker
+
+        Returns:
+            int: the number of partitions the broker leads
+        """
+        return len(self._leaders.get(broker_id, ()))
+
+    def partitions_replicated_on(self, broker_id):
+        """
+        Get the partitions that a broker has a replica of, without scanning all the partitions in the cluster
+
+        Args:
+            broker_id (int): the ID of the broker
+
+        Returns:
+            set: the (topic name, partition number) tuples for the partitions the broker is a replica for
+        """
+        return set(self._replicas.get(broker_id, ()))
+
+    def leader_for(self, topic_name, partition_num):
+        """
+        Get the current leader of a partition
+
+        Args:
+            topic_name (string): the name of the topic
+            partition_num (int): the partition number
+
+        Returns:
+            Broker: the leader of the partition, or None if the partition is not known or has no leader
+        """
+        return self._partition_leaders.get((topic_name, partition_num))
+
+    def _index_leader(self, partition, old_broker, new_broker):
+        key = (partition.topic.name, partition.num)
+        if old_broker is not None:
+            self._leaders.get(old_broker.id, set()).discard(key)
+        if new_broker is None:
+            self._partition_leaders.pop(key, None)
+        else:
+            self._leaders.setdefault(new_broker.id, set()).add(key)
+            self._partition_leaders[key] = new_broker
+
+    def _index_replica(self, partition, broker, add):
+        key = (partition.topic.name, partition.num)
+        if add:
+            self._replicas.setdefault(broker.id, set()).add(key)
+        else:
+            self._replicas.get(broker.id, set()).discard(key)
+
+    def _unindex_topic(self, topic):
+        for partition in topic.partitions:
+            if partition.leader is not None:
+                self._index_leader(partition, partition.leader, None)
+            for broker in partition.replicas:
+                self._index_replica(partition, broker, False)
+
     def num_brokers(self):
         return len(self.brokers)
 
@@ -32,10 +32,14 @@ class Group(BaseModel):
         self.state = None
         self.members = []
         self._last_updated = 0.0
+        self._coordinator_updated = 0.0
 
     def updated_since(self, check_time):
         return check_time <= self._last_updated
 
+    def coordinator_updated_since(self, check_time):
+        return (self.coordinator is not None) and (check_time <= self._coordinator_updated)
+
     def clear_members(self):
         self.members = []
 
@@ -78,3 +82,40 @@ class GroupMember(BaseModel):
                 self.topics[tp['topic']] = []
             for partition in tp['partitions']:
                 self.topics[tp['topic']].append(partition)
+
+
+class GroupLag(object):
+    def __init__(self, name):
+        """
+        The consumer lag for a group: how far behind the end of each partition the offsets committed by the group are
+
+        Args:
+            name (string): the name of the group
+        """
+        self.name = name
+
+        # A mapping of topic names to a list of the lag for each partition. The lag is None for partitions that the group
+        # has not committed an offset for, or that the offsets could not be fetched for
+        self.partitions = {}
+
+    def add_topic(self, topic_name, committed, end):
+        """
+        Set the lag for the partitions of a topic from the committed offsets and the log end offsets
+
+        Args:
+            topic_name (string): the name of the topic
+            committed (list): the offset committed by the group for each partition, or -1 if there is none
+            end (list): the log end offset for each partition, or -1 if it is not known
+        """
+        self.partitions[topic_name] = [None if (committed[i] < 0) or (end[i] < 0) else max(end[i] - committed[i], 0)
+                                       for i in range(len(committed))]
+
+    @property
+    def topics(self):
+        """A mapping of topic names to the total lag for the topic, counting only the partitions with a known lag"""
+        return dict((topic_name, sum(lag for lag in lags if lag is not None)) for topic_name, lags in self.partitions.items())
+
+    @property
+    def total(self):
+        """The total lag for the group across all topics"""
+        return sum(self.topics.values())
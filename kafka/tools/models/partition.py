@@ -27,11 +27,48 @@ class Partition(BaseModel):
     def __init__(self, topic, num):
         self.topic = topic
         self.num = num
-        self.leader = None
+        self._leader = None
         self.replicas = []
+        self.isr = []
         self.size = 0
         self.scaled_size = 0
 
+        # The (leader ID, replica IDs, ISR IDs) last applied from a metadata response. This is cleared whenever the
+        # partition is changed in any other way, so that the next metadata update applies the state again
+        self._metadata_state = None
+
+    @property
+    def leader(self):
+        return self._leader
+
+    # Setting the leader keeps the leader indexes of the cluster up to date
+    @leader.setter
+    def leader(self, broker):
+        cluster = self._indexed_cluster()
+        if (cluster is not None) and (broker is not self._leader):
+            cluster._index_leader(self, self._leader, broker)
+        self._leader = broker
+        self._metadata_state = None
+
+    def metadata_state(self):
+        """
+        Get the leadership and replica state of the partition in a compact form that is cheap to compare
+
+        Returns:
+            tuple: the leader broker ID (-1 if there is no leader), a tuple of the replica broker IDs, and a tuple of
+                the in-sync replica broker IDs
+        """
+        if self._metadata_state is not None:
+            return self._metadata_state
+        return (-1 if self._leader is None else self._leader.id, tuple(broker.id for broker in self.replicas), tuple(broker.id for broker in self.isr))
+
+    # Return the cluster that indexes this partition, or None if the topic has not been added to a cluster
+    def _indexed_cluster(self):
+        cluster = getattr(self.topic, 'cluster', None)
+        if (cluster is None) or (getattr(cluster, 'topics', {}).get(self.topic.name) is not self.topic):
+            return None
+        return cluster
+
     # Shallow copy - do not copy replica list (zero length)
     def copy(self):
         newpartition = Partition(self.topic, self.num)
@@ -57,6 +94,11 @@ class Partition(BaseModel):
             position = len(self.replicas)
         self._add_broker_partition(position, broker)
         self.replicas.insert(position, broker)
+        self._metadata_state = None
+
+        cluster = self._indexed_cluster()
+        if cluster is not None:
+            cluster._index_replica(self, broker, True)
 
     # Remove the specified broker from the replica list of this partition
     # If the replica does not exist on this partition, throw an exception
@@ -68,6 +110,11 @@ class Partition(BaseModel):
 
         broker.partitions[position].remove(self)
         self.replicas.remove(broker)
+        self._metadata_state = None
+
+        cluster = self._indexed_cluster()
+        if cluster is not None:
+            cluster._index_replica(self, broker, False)
 
     def delete_replicas(self, target_count):
         """
@@ -130,6 +177,7 @@ class Partition(BaseModel):
         # Last, swap the replica positons on this partition object
         self.replicas[p1] = broker2
         self.replicas[p2] = broker1
+        self._metadata_state = None
 
     # Helper function to add a partition to a broker
     # This should never be called - please use the add_replica method
@@ -150,3 +198,39 @@ class Partition(BaseModel):
             'size': self.size,
             'replicas': [r.id for r in self.replicas]
         }
+
+
+class PartitionDelta(object):
+    def __init__(self, topic_name, partition_num, old_state, new_state):
+        """
+        A change to a partition that was found when applying metadata to the cluster
+
+        Args:
+            topic_name (string): the name of the topic
+            partition_num (int): the partition number
+            old_state (tuple): the (leader ID, replica IDs, ISR IDs) state before the change, or None if the partition
+                was added
+            new_state (tuple): the state after the change, or None if the partition was removed
+        """
+        self.topic = topic_name
+        self.partition = partition_num
+        self.old_state = old_state
+        self.new_state = new_state
+
+    def _changed(self, index):
+        return (self.old_state is None) or (self.new_state is None) or (self.old_state[index] != self.new_state[index])
+
+    @property
+    def leader_changed(self):
+        return self._changed(0)
+
+    @property
+    def replicas_changed(self):
+        return self._changed(1)
+
+    @property
+    def isr_changed(self):
+        return self._changed(2)
+
+    def __repr__(self):
+        return "PartitionDelta({0}, {1}, {2} -> {3})".format(self.topic, self.partition, self.old_state, self.new_state)
@@ -44,6 +44,8 @@ class Topic(BaseModel):
         return newtopic
 
     def add_partition(self, partition):
+        # Partitions copied from another topic (as when cloning a cluster) belong to this one now
+        partition.topic = self
         self.partitions.append(partition)
 
     def to_dict(self):
@@ -70,8 +72,10 @@ class Topic(BaseModel):
         # to be deleted and recreated with a smaller partition count before we see that it's been
         # deleted. This would look like partition deletion, so we should support it.
         while len(self.partitions) > target_count:
-            partition = self.partitions.pop()
+            partition = self.partitions[-1]
+            partition.leader = None
             partition.delete_replicas(0)
+            self.partitions.pop()
 
 
 class TopicOffsets:
@@ -79,19 +83,30 @@ class TopicOffsets:
         self.topic = topic
         self.partitions = [-1 for i in range(len(topic.partitions))]
 
-    def set_offsets_from_list(self, partitions):
+        # Partitions that offsets could not be retrieved for, as a mapping of partition number to error code
+        self.errors = {}
+
+    def set_offsets_from_list(self, partitions, raise_errors=True):
         """
         Given a partition_responses object from a ListOffsets response, update the offsets
         with the values in the response
 
         Args:
             partitions (Array): the partition_response object from a ListOffsets response
+            raise_errors (boolean): If False, partitions with errors are recorded in the errors attribute instead, and
+                their offsets are not changed
 
         Raises:
-            OffsetError: If there was a failure retrieving any of the offsets
+            OffsetError: If raise_errors is True and there was a failure retrieving any of the offsets
         """
         for partition in partitions:
-            raise_if_error(OffsetError, partition['error'])
+            if partition['error'] != 0:
+                if raise_errors:
+                    raise_if_error(OffsetError, partition['error'])
+                self.errors[partition['partition']] = partition['error']
+                continue
+
+            self.errors.pop(partition['partition'], None)
             self.partitions[partition['partition']] = partition['offset']
 
     def set_offsets_from_fetch(self, partitions):
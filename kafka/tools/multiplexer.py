@@ -0,0 +1,227 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+import errno
+import socket
+import ssl
+import time
+from concurrent.futures import TimeoutError
+
+from kafka.tools import log
+from kafka.tools.exceptions import ConnectionError
+from kafka.tools.protocol.types.bytebuffer import ByteBuffer
+from kafka.tools.protocol.versions import upgrade_request
+
+try:
+    import selectors
+except ImportError:
+    import selectors34 as selectors
+
+
+def _would_block(e):
+    """Return True if the socket error is a non-blocking socket (or SSL) operation that needs to be tried again later"""
+    if isinstance(e, (ssl.SSLWantReadError, ssl.SSLWantWriteError)):
+        return True
+    return getattr(e, 'errno', None) in (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+class _Exchange(object):
+    """The state of one request and its response on a broker connection that is being driven by the multiplexer"""
+    def __init__(self, broker, request):
+        self.broker = broker
+        self.request = upgrade_request(request, broker.api_versions)
+        self.sock = broker._sock
+        self.timeout = self.sock.gettimeout()
+
+        self.correlation_id, header, self.body_buf, body_size = broker._encode_request(self.request)
+        self.segments = [memoryview(header), memoryview(self.body_buf)[:body_size]]
+
+        self.header_view = memoryview(bytearray(broker._response_header_struct.size))
+        self.header_read = 0
+        self.response_buf = None
+        self.response_size = 0
+        self.response_read = 0
+
+    def release_body(self):
+        if self.body_buf is not None:
+            self.broker._send_pool.release(self.body_buf)
+            self.body_buf = None
+
+    def write(self):
+        """Send as much of the request as the socket will take. Returns True once the entire request is sent"""
+        while len(self.segments) > 0:
+            try:
+                sent = self.sock.send(self.segments[0])
+            except (socket.error, ssl.SSLError) as e:
+                if _would_block(e):
+                    return False
+                raise
+            if sent >= len(self.segments[0]):
+                self.segments.pop(0)
+            else:
+                self.segments[0] = self.segments[0][sent:]
+
+        # Once the request is sent, the body buffer can be reused
+        self.release_body()
+        return True
+
+    def _recv_into(self, view):
+        count = self.sock.recv_into(view, len(view))
+        if count == 0:
+            raise socket.error("Not enough data to read message -- did server kill socket?")
+        return count
+
+    def read(self):
+        """
+        Read as much of the response as is available. Reading continues until the socket would block, so that data
+        buffered inside an SSL socket is not left waiting for a readiness event that will not come.
+
+        Returns:
+            bool: True once the entire response has been read
+
+        Raises:
+            socket.error: If the socket fails or is closed
+            ConnectionError: If the response is not valid, or is not the response to the request
+        """
+        try:
+            while self.header_read < len(self.header_view):
+                self.header_read += self._recv_into(self.header_view[self.header_read:])
+                if self.header_read == len(self.header_view):
+                    size, correlation_id = self.broker._response_header_struct.unpack(self.header_view.tobytes())
+                    if size < 4:
+                        raise ConnectionError("Invalid response size from Kafka: {0}".format(size))
+                    if correlation_id != self.correlation_id:
+                        raise ConnectionError("Response correlation ID {0} does not match request {1}".format(
+                            correlation_id, self.correlation_id))
+                    self.response_size = size - 4
+                    self.response_buf = self.broker._response_buffer(self.request.response, self.response_size)
+
+            view = memoryview(self.response_buf)[:self.response_size]
+            while self.response_read < self.response_size:
+                self.response_read += self._recv_into(view[self.response_read:])
+        except (socket.error, ssl.SSLError) as e:
+            if _would_block(e):
+                return False
+            raise
+        return True
+
+    def decode(self):
+        return self.broker._decode_response(self.request, self.correlation_id,
+                                            ByteBuffer(memoryview(self.response_buf)[:self.response_size]), self.response_buf)
+
+
+class BrokerMultiplexer(object):
+    """
+    Sends requests to many brokers from a single thread. The broker sockets are switched to non-blocking mode, and a
+    selector is used to write each request and read each response as the sockets become ready. This lets a request go
+    to every broker in the cluster in about one round trip, without a thread per broker.
+
+    There are no retries. A broker that fails is closed and reported with a ConnectionError, and the caller can resend
+    to it with Broker.send to get the usual retry behavior. Brokers that are not connected are not connected to here, as
+    connecting (and negotiating TLS and API versions) blocks. They are reported with a ConnectionError without being
+    closed, so the caller can send to them the same way.
+    """
+    def send(self, broker_requests, timeout=None):
+        """
+        Send one request to each of a set of brokers and wait for the responses
+
+        Args:
+            broker_requests (dict): a mapping of keys (usually broker IDs) to (Broker, BaseRequest) tuples. Each broker
+                may only be used once
+            timeout (float): the number of seconds to wait for all the responses. None waits without a limit
+
+        Returns:
+            dict: a mapping of the same keys to a tuple of the response and the exception for each request. Requests
+                that fail, or that are for a broker that is not connected, have a ConnectionError (or the error from
+                decoding the response), and requests that do not finish in time have a TimeoutError. Brokers that fail
+                or time out are closed, as the connection is left in an unknown state
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        results = {}
+        locked = []
+        exchanges = {}
+        selector = selectors.DefaultSelector()
+
+        try:
+            for key, (broker, request) in broker_requests.items():
+                # The broker can't be shared with a send that is already in progress, or with pipelined requests
+                if not broker._send_lock.acquire(False):
+                    results[key] = (None, ConnectionError("Broker {0} is busy".format(broker.id)))
+                    continue
+                locked.append(broker)
+                if broker._reader is not None:
+                    results[key] = (None, ConnectionError("Broker {0} has requests in flight".format(broker.id)))
+                    continue
+                if broker._sock is None:
+                    results[key] = (None, ConnectionError("Broker {0} is not connected".format(broker.id)))
+                    continue
+
+                try:
+                    exchange = _Exchange(broker, request)
+                except Exception as e:
+                    results[key] = (None, e)
+                    continue
+
+                exchange.sock.setblocking(False)
+                exchanges[key] = exchange
+                selector.register(exchange.sock, selectors.EVENT_WRITE, key)
+
+            while len(selector.get_map()) > 0:
+                remaining = None if deadline is None else deadline - time.time()
+                if (remaining is not None) and (remaining <= 0):
+                    break
+
+                for selector_key, events in selector.select(remaining):
+                    key = selector_key.data
+                    exchange = exchanges[key]
+                    try:
+                        if events & selectors.EVENT_WRITE:
+                            if exchange.write():
+                                selector.modify(exchange.sock, selectors.EVENT_READ, key)
+                        elif exchange.read():
+                            selector.unregister(exchange.sock)
+                            self._finish(exchange, results, key)
+                    except (socket.error, ssl.SSLError, ConnectionError) as e:
+                        selector.unregister(exchange.sock)
+                        self._fail(exchange, results, key, ConnectionError("Failed communicating with Kafka: {0}".format(e)))
+
+            # Anything left did not finish in time
+            for selector_key in list(selector.get_map().values()):
+                key = selector_key.data
+                self._fail(exchanges[key], results, key, TimeoutError("Timed out waiting for broker {0}".format(exchanges[key].broker.id)))
+        finally:
+            selector.close()
+            for exchange in exchanges.values():
+                exchange.release_body()
+                if exchange.broker._sock is exchange.sock:
+                    exchange.sock.settimeout(exchange.timeout)
+            for broker in locked:
+                broker._send_lock.release()
+
+        return results
+
+    def _finish(self, exchange, results, key):
+        try:
+            results[key] = (exchange.decode(), None)
+        except Exception as e:
+            results[key] = (None, e)
+
+    def _fail(self, exchange, results, key, error):
+        log.warn("Failed communicating with Kafka broker {0}: {1}".format(exchange.broker.id, error))
+        exchange.release_body()
+        exchange.broker.close()
+        results[key] = (None, error)
@@ -154,6 +154,16 @@ errors = {
          'long': "A partition reassignment is in progress"},
 }
 
+# Errors that can go away if the request is sent again, such as those caused by leadership changes or timeouts
+retriable_errors = set([2, 3, 5, 6, 7, 9, 13, 14, 15, 16, 19, 20, 51, 56])
+
+# Retriable errors that mean the client's metadata (such as the leader for a partition) is out of date, and it needs to
+# be refreshed before the request is sent again
+metadata_errors = set([3, 5, 6, 56])
+
+# Errors that mean the broker a group request was sent to is no longer (or not yet) the coordinator for the group
+coordinator_errors = set([15, 16])
+
 
 def error_short(err_num):
     if err_num in errors:
@@ -167,3 +177,15 @@ def error_long(err_num):
         return errors[err_num]['long']
     else:
         return "This is an unknown error code"
+
+
+def error_retriable(err_num):
+    return err_num in retriable_errors
+
+
+def error_invalidates_metadata(err_num):
+    return err_num in metadata_errors
+
+
+def error_invalidates_coordinator(err_num):
+    return err_num in coordinator_errors
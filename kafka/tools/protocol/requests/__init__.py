@@ -16,9 +16,14 @@
 # under the License.
 
 import abc
-import collections
 import six
-import struct
+
+from kafka.tools.protocol.schema import encoder_for, sizer_for
+
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
 
 
 class ArgumentError(Exception):
@@ -35,7 +40,7 @@ def _evaluate_plain_value(value, value_type):
         if (value is not None) and (not isinstance(value, six.string_types)):
             raise TypeError("Expected a string, got {0} instead".format(type(value)))
     elif value_type == 'bytes':
-        if (value is not None) and (not isinstance(value, six.binary_type)):
+        if (value is not None) and (not isinstance(value, (six.binary_type, bytearray, memoryview))):
             raise TypeError("Expected a binary string, got {0} instead".format(type(value)))
     elif value_type == 'boolean':
         # Everything evaluates as boolean
@@ -50,7 +55,7 @@ def _evaluate_sequence(value, schema):
             raise KeyError('Value is missing an entry with key "{0}"'.format(entry['name']))
         entry_schema = entry['type']
         if isinstance(entry_schema, six.string_types) and entry_schema.lower() == 'array':
-            if isinstance(value[entry['name']], collections.Sequence):
+            if isinstance(value[entry['name']], Sequence):
                 for item in value[entry['name']]:
                     _evaluate_plain_value(item, entry['item_type'])
             elif value[entry['name']] is None:
@@ -61,49 +66,6 @@ def _evaluate_sequence(value, schema):
             _evaluate_plain_value(value[entry['name']], entry_schema)
 
 
-def _encode_plain_value(value, value_type, buf):
-    if value_type == 'int8':
-        buf.putInt8(value)
-    elif value_type == 'int16':
-        buf.putInt16(value)
-    elif value_type == 'int32':
-        buf.putInt32(value)
-    elif value_type == 'int64':
-        buf.putInt64(value)
-    elif value_type == 'string':
-        if value is None:
-            buf.putInt16(-1)
-        else:
-            buf.putInt16(len(value))
-            buf.put(struct.pack('{0}s'.format(len(value)), value.encode("utf-8")))
-    elif value_type == 'bytes':
-        if value is None:
-            buf.putInt32(-1)
-        else:
-            buf.putInt32(len(value))
-            buf.put(value)
-    elif value_type == 'boolean':
-        buf.putInt8(1 if value else 0)
-    elif isinstance(value_type, collections.Sequence):
-        _encode_sequence(value, value_type, buf)
-    else:
-        raise NotImplementedError("Reference to non-implemented type in schema: {0}".format(value_type))
-
-
-def _encode_sequence(value, schema, buf):
-    for entry in schema:
-        entry_schema = entry['type']
-        if isinstance(entry_schema, six.string_types) and entry_schema.lower() == 'array':
-            if value[entry['name']] is None:
-                buf.putInt32(-1)
-            else:
-                buf.putInt32(len(value[entry['name']]))
-                for item in value[entry['name']]:
-                    _encode_plain_value(item, entry['item_type'], buf)
-        else:
-            _encode_plain_value(value[entry['name']], entry_schema, buf)
-
-
 @six.add_metaclass(abc.ABCMeta)
 class BaseRequest():  # pragma: no cover
     @abc.abstractproperty
@@ -138,7 +100,11 @@ class BaseRequest():  # pragma: no cover
         self._request = value
 
     def encode(self, buf):
-        _encode_sequence(self._request, self.schema, buf)
+        encoder_for(self.__class__)(self._request, buf)
+
+    def encoded_size(self):
+        """Return the number of bytes that encode() will write for this request"""
+        return sizer_for(self.__class__)(self._request)
 
     # This is not an abstract method because requests that are not supported in the CLI will not override it
     @classmethod
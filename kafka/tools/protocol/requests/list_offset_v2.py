@@ -33,6 +33,7 @@ class ListOffsetV2Request(ListOffsetV1Request):
 
     schema = [
         {'name': 'replica_id', 'type': 'int32'},
+        {'name': 'isolation_level', 'type': 'int8'},
         {'name': 'topics',
          'type': 'array',
          'item_type': [
@@ -2,47 +2,31 @@ import abc
 import pprint
 import six
 
+from kafka.tools.protocol.schema import decoder_for
 
-def _decode_plain_type(value_type, buf):
-    if value_type == 'int8':
-        return buf.getInt8()
-    elif value_type == 'int16':
-        return buf.getInt16()
-    elif value_type == 'int32':
-        return buf.getInt32()
-    elif value_type == 'int64':
-        return buf.getInt64()
-    elif value_type == 'string':
-        val_len = buf.getInt16()
-        return None if val_len == -1 else buf.get(val_len).decode("utf-8")
-    elif value_type == 'bytes':
-        val_len = buf.getInt32()
-        return None if val_len == -1 else buf.get(val_len)
-    elif value_type == 'boolean':
-        return buf.getInt8() == 1
-    else:
-        raise NotImplementedError("Reference to non-implemented type in schema: {0}".format(value_type))
-
-
-def _decode_array(array_schema, buf):
-    array_len = buf.getInt32()
-    if array_len == -1:
-        return None
-
-    if isinstance(array_schema, six.string_types):
-        return [_decode_plain_type(array_schema, buf) for i in range(array_len)]
-    else:
-        return [_decode_sequence(array_schema, buf) for i in range(array_len)]
-
-
-def _decode_sequence(sequence_schema, buf):
-    val = {}
-    for entry in sequence_schema:
-        if entry['type'].lower() == 'array':
-            val[entry['name']] = _decode_array(entry['item_type'], buf)
-        else:
-            val[entry['name']] = _decode_plain_type(entry['type'].lower(), buf)
-    return val
+
+def _printable(value):
+    """Convert any memoryviews in a decoded value to binary strings, so that they can be pretty-printed"""
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    elif isinstance(value, dict):
+        return dict((k, _printable(v)) for k, v in value.items())
+    elif isinstance(value, list):
+        return [_printable(v) for v in value]
+    return value
+
+
+def _error_codes(value, codes):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in ('error', 'error_code'):
+                codes.add(item)
+            elif isinstance(item, (dict, list)):
+                _error_codes(item, codes)
+    elif isinstance(value, list):
+        for item in value:
+            _error_codes(item, codes)
+    return codes
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -53,7 +37,7 @@ class BaseResponse():  # pragma: no cover
 
     @classmethod
     def from_bytebuffer(cls, correlation_id, buf):
-        seq_obj = _decode_sequence(cls.schema, buf)
+        seq_obj = decoder_for(cls)(buf)
         rv = cls(seq_obj)
         rv.correlation_id = correlation_id
         return rv
@@ -61,12 +45,16 @@ class BaseResponse():  # pragma: no cover
     def __init__(self, sequence_obj):
         self._response = sequence_obj
 
+    def error_codes(self):
+        """Return the set of error codes anywhere in the response, at the top level or for any item. 0 is not removed"""
+        return _error_codes(self._response, set())
+
     def __hash__(self):
         return id(self)
 
     def __str__(self):
         pp = pprint.PrettyPrinter(indent=4)
-        return pp.pformat(self._response)
+        return pp.pformat(_printable(self._response))
 
     def __len__(self):
         return len(self._response)
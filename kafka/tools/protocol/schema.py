@@ -0,0 +1,514 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Compile request and response schemas into specialized encoder and decoder functions.
+
+The schemas used by requests and responses are lists of dicts. Walking them for every message means re-checking the
+type of every field, so instead each schema is turned into a list of closures once. Adjacent fixed-width fields are
+grouped together into a single precompiled struct.Struct, so a run of integer fields is packed or unpacked with one call.
+The values that are encoded and decoded are still plain dicts (and lists), exactly as with the interpreted functions.
+"""
+
+import codecs
+import six
+import struct
+from threading import Lock
+
+
+# struct format characters for the fixed-width types. Booleans are packed with '?' (which accepts any value and writes
+# 0 or 1), but are unpacked as a signed byte so that only a value of 1 is considered True
+_pack_formats = {'int8': 'b', 'int16': 'h', 'int32': 'i', 'int64': 'q', 'boolean': '?'}
+_unpack_formats = {'int8': 'b', 'int16': 'h', 'int32': 'i', 'int64': 'q', 'boolean': 'b'}
+
+_compile_lock = Lock()
+_encoders = {}
+_sizers = {}
+_decoders = {}
+_references = {}
+
+
+def _entry_type(entry):
+    entry_type = entry['type']
+    return entry_type.lower() if isinstance(entry_type, six.string_types) else entry_type
+
+
+def _group_entries(schema):
+    """
+    Split a schema into a list of steps. Each step is either a tuple of (names, types) for a run of adjacent
+    fixed-width entries, or a single schema entry for everything else
+    """
+    steps = []
+    names = []
+    types = []
+    for entry in schema:
+        entry_type = _entry_type(entry)
+        if isinstance(entry_type, six.string_types) and (entry_type in _pack_formats):
+            names.append(entry['name'])
+            types.append(entry_type)
+            continue
+
+        if len(names) > 0:
+            steps.append((names, types))
+            names = []
+            types = []
+        steps.append(entry)
+
+    if len(names) > 0:
+        steps.append((names, types))
+    return steps
+
+
+def _array_struct(formats, value_type, count):
+    return struct.Struct('>{0}{1}'.format(count, formats[value_type]))
+
+
+#######################
+# ENCODER
+#
+
+def _make_fixed_encoder(names, types):
+    packer = struct.Struct('>' + ''.join(_pack_formats[t] for t in types))
+
+    def encode_fixed(value, buf):
+        buf.putStruct(packer, [value[name] for name in names])
+    return encode_fixed
+
+
+def _encode_string(value, buf):
+    if value is None:
+        buf.putInt16(-1)
+    else:
+        data = value.encode("utf-8")
+        buf.putInt16(len(data))
+        buf.put(data)
+
+
+def _encode_bytes(value, buf):
+    if value is None:
+        buf.putInt32(-1)
+    else:
+        buf.putInt32(len(value))
+        buf.put(value)
+
+
+def _make_item_encoder(value_type):
+    """Return a function that encodes a single value of the given type (either a type name or a nested schema)"""
+    if not isinstance(value_type, six.string_types):
+        return compile_encoder(value_type)
+    elif value_type in _pack_formats:
+        packer = struct.Struct('>' + _pack_formats[value_type])
+
+        def encode_plain(value, buf):
+            buf.putStruct(packer, (value,))
+        return encode_plain
+    elif value_type == 'string':
+        return _encode_string
+    elif value_type == 'bytes':
+        return _encode_bytes
+    raise NotImplementedError("Reference to non-implemented type in schema: {0}".format(value_type))
+
+
+def _make_array_encoder(name, item_type):
+    if isinstance(item_type, six.string_types):
+        item_type = item_type.lower()
+
+    if isinstance(item_type, six.string_types) and (item_type in _pack_formats):
+        # Arrays of fixed-width items are written with a single pack after the length. As with decoding, the structs
+        # are kept per length
+        structs = {}
+
+        def encode_fixed_array(value, buf):
+            items = value[name]
+            if items is None:
+                buf.putInt32(-1)
+                return
+
+            try:
+                packer = structs[len(items)]
+            except KeyError:
+                packer = structs.setdefault(len(items), _array_struct(_pack_formats, item_type, len(items)))
+            buf.putInt32(len(items))
+            buf.putStruct(packer, items)
+        return encode_fixed_array
+
+    encode_item = _make_item_encoder(item_type)
+
+    def encode_array(value, buf):
+        items = value[name]
+        if items is None:
+            buf.putInt32(-1)
+        else:
+            buf.putInt32(len(items))
+            for item in items:
+                encode_item(item, buf)
+    return encode_array
+
+
+def _make_entry_encoder(entry):
+    name = entry['name']
+    entry_type = _entry_type(entry)
+    if entry_type == 'array':
+        return _make_array_encoder(name, entry['item_type'])
+
+    encode_item = _make_item_encoder(entry_type)
+
+    def encode_entry(value, buf):
+        encode_item(value[name], buf)
+    return encode_entry
+
+
+def compile_encoder(schema):
+    """
+    Compile a schema into a function that encodes a value (a dict that matches the schema) into a ByteBuffer
+
+    Args:
+        schema (list): a request schema, as used by BaseRequest
+
+    Returns:
+        function: a function that takes (value, buf) and writes the value into the buffer
+    """
+    steps = []
+    for step in _group_entries(schema):
+        if isinstance(step, tuple):
+            steps.append(_make_fixed_encoder(*step))
+        else:
+            steps.append(_make_entry_encoder(step))
+
+    def encode(value, buf):
+        for step in steps:
+            step(value, buf)
+    return encode
+
+
+#######################
+# SIZER
+#
+# Sizers compute the exact number of bytes that an encoder will write for a value, so that a buffer of the right size
+# can be allocated before encoding
+
+def _string_size(value):
+    return 2 if value is None else 2 + len(value.encode("utf-8"))
+
+
+def _bytes_size(value):
+    return 4 if value is None else 4 + len(value)
+
+
+def _make_item_sizer(value_type):
+    """Return a function that computes the encoded size of a single value of the given type"""
+    if not isinstance(value_type, six.string_types):
+        return compile_sizer(value_type)
+    elif value_type in _pack_formats:
+        size = struct.calcsize('>' + _pack_formats[value_type])
+        return lambda value: size
+    elif value_type == 'string':
+        return _string_size
+    elif value_type == 'bytes':
+        return _bytes_size
+    raise NotImplementedError("Reference to non-implemented type in schema: {0}".format(value_type))
+
+
+def _make_array_sizer(name, item_type):
+    if isinstance(item_type, six.string_types):
+        item_type = item_type.lower()
+
+    if isinstance(item_type, six.string_types) and (item_type in _pack_formats):
+        item_size = struct.calcsize('>' + _pack_formats[item_type])
+
+        def size_fixed_array(value):
+            items = value[name]
+            return 4 if items is None else 4 + (len(items) * item_size)
+        return size_fixed_array
+
+    size_item = _make_item_sizer(item_type)
+
+    def size_array(value):
+        items = value[name]
+        return 4 if items is None else 4 + sum(size_item(item) for item in items)
+    return size_array
+
+
+def _make_entry_sizer(entry):
+    name = entry['name']
+    entry_type = _entry_type(entry)
+    if entry_type == 'array':
+        return _make_array_sizer(name, entry['item_type'])
+
+    size_item = _make_item_sizer(entry_type)
+    return lambda value: size_item(value[name])
+
+
+def compile_sizer(schema):
+    """
+    Compile a schema into a function that returns the number of bytes needed to encode a value
+
+    Args:
+        schema (list): a request schema, as used by BaseRequest
+
+    Returns:
+        function: a function that takes a value and returns the encoded size in bytes
+    """
+    fixed_size = 0
+    steps = []
+    for step in _group_entries(schema):
+        if isinstance(step, tuple):
+            fixed_size += struct.calcsize('>' + ''.join(_pack_formats[t] for t in step[1]))
+        else:
+            steps.append(_make_entry_sizer(step))
+
+    def size(value):
+        return fixed_size + sum(step(value) for step in steps)
+    return size
+
+
+#######################
+# DECODER
+#
+# Decoders work directly on the underlying buffer of a ByteBuffer. Each step takes the raw data, the current position,
+# and the end of the readable data, and returns the new position. This avoids a ByteBuffer method call for every field
+
+_length16 = struct.Struct('>h')
+_length32 = struct.Struct('>i')
+
+
+def _check_remaining(pos, num_bytes, end):
+    if pos + num_bytes > end:
+        raise EOFError("not enough data left in buffer")
+
+
+def _read_length(length_struct, data, pos, end):
+    _check_remaining(pos, length_struct.size, end)
+    return length_struct.unpack_from(data, pos)[0], pos + length_struct.size
+
+
+def _make_fixed_decoder(names, types):
+    unpacker = struct.Struct('>' + ''.join(_unpack_formats[t] for t in types))
+    unpack_from = unpacker.unpack_from
+    size = unpacker.size
+    bool_names = [name for name, value_type in zip(names, types) if value_type == 'boolean']
+
+    def decode_fixed(data, pos, end, val):
+        if pos + size > end:
+            raise EOFError("not enough data left in buffer")
+        val.update(zip(names, unpack_from(data, pos)))
+        for name in bool_names:
+            val[name] = val[name] == 1
+        return pos + size
+    return decode_fixed
+
+
+def _decode_string(data, pos, end):
+    val_len, pos = _read_length(_length16, data, pos, end)
+    if val_len == -1:
+        return None, pos
+    _check_remaining(pos, val_len, end)
+    # utf_8_decode works on both bytearrays and memoryviews, so this is correct in either mode of the ByteBuffer
+    return codecs.utf_8_decode(data[pos:pos + val_len])[0], pos + val_len
+
+
+def _decode_bytes(data, pos, end):
+    val_len, pos = _read_length(_length32, data, pos, end)
+    if val_len == -1:
+        return None, pos
+    _check_remaining(pos, val_len, end)
+
+    # If the ByteBuffer is in memoryview mode, this is a view into the buffer and not a copy
+    return data[pos:pos + val_len], pos + val_len
+
+
+def _make_item_decoder(value_type):
+    """
+    Return a function that decodes a single value of the given type (either a type name or a nested schema). The
+    function takes (data, pos, end) and returns a tuple of the value and the new position
+    """
+    if not isinstance(value_type, six.string_types):
+        return _compile_sequence_decoder(value_type)
+    elif value_type in _unpack_formats:
+        unpacker = struct.Struct('>' + _unpack_formats[value_type])
+        is_boolean = value_type == 'boolean'
+
+        def decode_plain(data, pos, end):
+            _check_remaining(pos, unpacker.size, end)
+            value = unpacker.unpack_from(data, pos)[0]
+            return (value == 1) if is_boolean else value, pos + unpacker.size
+        return decode_plain
+    elif value_type == 'string':
+        return _decode_string
+    elif value_type == 'bytes':
+        return _decode_bytes
+    raise NotImplementedError("Reference to non-implemented type in schema: {0}".format(value_type))
+
+
+def _make_array_decoder(name, item_type):
+    if isinstance(item_type, six.string_types):
+        item_type = item_type.lower()
+
+    if isinstance(item_type, six.string_types) and (item_type in _unpack_formats):
+        # Arrays of fixed-width items are read with a single unpack. Most arrays in a response have the same handful of
+        # lengths (such as replica lists), so the structs are kept per length
+        structs = {}
+        unpack_length = _length32.unpack_from
+        is_boolean = item_type == 'boolean'
+
+        def decode_fixed_array(data, pos, end, val):
+            if pos + 4 > end:
+                raise EOFError("not enough data left in buffer")
+            array_len = unpack_length(data, pos)[0]
+            pos += 4
+            if array_len == -1:
+                val[name] = None
+                return pos
+
+            try:
+                unpacker = structs[array_len]
+            except KeyError:
+                unpacker = structs.setdefault(array_len, _array_struct(_unpack_formats, item_type, max(array_len, 0)))
+            if pos + unpacker.size > end:
+                raise EOFError("not enough data left in buffer")
+            items = unpacker.unpack_from(data, pos)
+            val[name] = [item == 1 for item in items] if is_boolean else list(items)
+            return pos + unpacker.size
+        return decode_fixed_array
+
+    decode_item = _make_item_decoder(item_type)
+
+    def decode_array(data, pos, end, val):
+        array_len, pos = _read_length(_length32, data, pos, end)
+        if array_len == -1:
+            val[name] = None
+            return pos
+
+        items = []
+        for i in range(array_len):
+            item, pos = decode_item(data, pos, end)
+            items.append(item)
+        val[name] = items
+        return pos
+    return decode_array
+
+
+def _make_entry_decoder(entry):
+    name = entry['name']
+    entry_type = _entry_type(entry)
+    if entry_type == 'array':
+        return _make_array_decoder(name, entry['item_type'])
+
+    decode_item = _make_item_decoder(entry_type)
+
+    def decode_entry(data, pos, end, val):
+        val[name], pos = decode_item(data, pos, end)
+        return pos
+    return decode_entry
+
+
+def _compile_sequence_decoder(schema):
+    steps = []
+    for step in _group_entries(schema):
+        if isinstance(step, tuple):
+            steps.append(_make_fixed_decoder(*step))
+        else:
+            steps.append(_make_entry_decoder(step))
+
+    def decode_sequence(data, pos, end):
+        val = {}
+        for step in steps:
+            pos = step(data, pos, end, val)
+        return val, pos
+    return decode_sequence
+
+
+def compile_decoder(schema):
+    """
+    Compile a schema into a function that decodes a dict from a ByteBuffer
+
+    Args:
+        schema (list): a response schema, as used by BaseResponse
+
+    Returns:
+        function: a function that takes a buf and returns a dict with the decoded values. The position of the buffer
+            is moved past the decoded data
+    """
+    decode_sequence = _compile_sequence_decoder(schema)
+
+    def decode(buf):
+        data, start, end = buf.raw()
+        val, pos = decode_sequence(data, start, end)
+        buf.skip(pos - start)
+        return val
+    return decode
+
+
+#######################
+# PER-CLASS CACHES
+#
+# Subclasses frequently inherit a schema from their parent class, but may also override it, so compiled codecs are
+# cached per class rather than per schema
+
+def _get_compiled(cache, klass, compile_func):
+    try:
+        return cache[klass]
+    except KeyError:
+        with _compile_lock:
+            if klass not in cache:
+                cache[klass] = compile_func(klass.schema)
+            return cache[klass]
+
+
+def encoder_for(klass):
+    """Return the compiled encoder for a request class, compiling it on first use"""
+    return _get_compiled(_encoders, klass, compile_encoder)
+
+
+def sizer_for(klass):
+    """Return the compiled sizer for a request class, compiling it on first use"""
+    return _get_compiled(_sizers, klass, compile_sizer)
+
+
+def decoder_for(klass):
+    """Return the compiled decoder for a response class, compiling it on first use"""
+    return _get_compiled(_decoders, klass, compile_decoder)
+
+
+def references_buffer(schema):
+    """
+    Check whether a decoded value for the schema can hold references into the buffer it was decoded from. This is the
+    case if the schema has any bytes fields, as those are views into the buffer when it is in memoryview mode
+
+    Args:
+        schema (list): a response schema, as used by BaseResponse
+
+    Returns:
+        boolean: True if there are any bytes fields anywhere in the schema
+    """
+    for entry in schema:
+        entry_type = _entry_type(entry)
+        if entry_type == 'array':
+            entry_type = entry['item_type']
+            entry_type = entry_type.lower() if isinstance(entry_type, six.string_types) else entry_type
+
+        if isinstance(entry_type, six.string_types):
+            if entry_type == 'bytes':
+                return True
+        elif references_buffer(entry_type):
+            return True
+    return False
+
+
+def references_buffer_for(klass):
+    """Return whether decoded responses for the class can hold references into their buffer (cached per class)"""
+    return _get_compiled(_references, klass, references_buffer)
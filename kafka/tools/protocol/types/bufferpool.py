@@ -0,0 +1,80 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+from threading import Lock
+
+
+class BufferPool(object):
+    # Buffers are allocated in power of two sizes, with this as the smallest, so that they can be reused for responses
+    # of similar but not identical sizes
+    min_buffer_size = 4096
+
+    def __init__(self, max_bytes):
+        """
+        Create a pool of reusable bytearrays
+
+        Args:
+            max_bytes (int): The maximum total size of the buffers that are kept in the pool for reuse. Buffers that are
+                released when the pool is full are dropped
+        """
+        self.max_bytes = max_bytes
+        self._free = []
+        self._free_bytes = 0
+        self._lock = Lock()
+
+    @property
+    def free_bytes(self):
+        """The total size of the buffers currently held in the pool"""
+        return self._free_bytes
+
+    def _buffer_size(self, size):
+        buffer_size = self.min_buffer_size
+        while buffer_size < size:
+            buffer_size *= 2
+        return buffer_size
+
+    def acquire(self, size):
+        """
+        Get a buffer that is at least the requested size. The smallest pooled buffer that is large enough is used if
+        there is one, otherwise a new buffer is allocated.
+
+        Args:
+            size (int): the minimum number of bytes the buffer must hold
+
+        Returns:
+            bytearray: a buffer that may be larger than the requested size
+        """
+        with self._lock:
+            # Buffers are compared by index, not by value, as bytearray equality compares the contents
+            candidates = [i for i, buf in enumerate(self._free) if len(buf) >= size]
+            if len(candidates) > 0:
+                buf = self._free.pop(min(candidates, key=lambda i: len(self._free[i])))
+                self._free_bytes -= len(buf)
+                return buf
+        return bytearray(self._buffer_size(size))
+
+    def release(self, buf):
+        """
+        Return a buffer to the pool for reuse. The caller must not hold any references into the buffer after this
+
+        Args:
+            buf (bytearray): a buffer previously returned by acquire
+        """
+        with self._lock:
+            if self._free_bytes + len(buf) <= self.max_bytes:
+                self._free.append(buf)
+                self._free_bytes += len(buf)
@@ -25,13 +25,32 @@ class ByteBuffer(object):
               'i': {'pack': struct.Struct('>i').pack_into, 'unpack': struct.Struct('>i').unpack_from, 'num_bytes': 4},
               'q': {'pack': struct.Struct('>q').pack_into, 'unpack': struct.Struct('>q').unpack_from, 'num_bytes': 8}}
 
-    def __init__(self, value):
-        if isinstance(value, bytearray):
+    def __init__(self, value, zero_copy=False):
+        """
+        Create a new ByteBuffer, either wrapping existing data or allocating a new buffer.
+
+        If zero_copy is True, or if the value provided is a memoryview, the buffer operates in memoryview mode. In this
+        mode, binary strings are wrapped without being copied, and get() returns a memoryview into the underlying data
+        rather than a copy. Buffers created with slice() and duplicate() share the same memory.
+
+        Args:
+            value (bytearray, bytes, memoryview, or int): the data to wrap, or the size of a new buffer to allocate
+            zero_copy (boolean): If True, use memoryview mode
+
+        Raises:
+            TypeError: If the value is not one of the supported types
+        """
+        if isinstance(value, (bytearray, memoryview)):
+            self._buffer = value
+        elif isinstance(value, six.binary_type) and zero_copy:
             self._buffer = value
         elif isinstance(value, six.binary_type) or isinstance(value, six.integer_types):
             self._buffer = bytearray(value)
         else:
-            raise TypeError("initialization of ByteBuffer must be a bytearray, binary string, or integer")
+            raise TypeError("initialization of ByteBuffer must be a bytearray, binary string, memoryview, or integer")
+
+        if zero_copy and (not isinstance(self._buffer, memoryview)):
+            self._buffer = memoryview(self._buffer)
 
         self._position = 0
         self._first = 0
@@ -61,6 +80,11 @@ class ByteBuffer(object):
         self._check_position_value(value, pos_type='limit')
         self._last = value
 
+    @property
+    def zero_copy(self):
+        """True if the buffer is in memoryview mode, and get() returns views instead of copies"""
+        return isinstance(self._buffer, memoryview)
+
     @property
     def capacity(self):
         return self._last - self._first + 1
@@ -115,13 +139,34 @@ class ByteBuffer(object):
         return self._buffer[pos:pos+num_bytes]
 
     def put(self, byte_str, position=None):
-        if not isinstance(byte_str, six.binary_type):
+        if not isinstance(byte_str, (six.binary_type, bytearray, memoryview)):
             raise TypeError("argument must be a binary string")
 
         num_bytes = len(byte_str)
         pos = self._get_and_check_position(position, num_bytes)
         self._buffer[pos:pos+num_bytes] = byte_str
 
+    def getStruct(self, packer, position=None):
+        """Unpack a precompiled struct.Struct from the buffer, returning the tuple of values"""
+        pos = self._get_and_check_position(position, packer.size)
+        return packer.unpack_from(self._buffer, pos)
+
+    def putStruct(self, packer, values, position=None):
+        """Pack a sequence of values into the buffer using a precompiled struct.Struct"""
+        pos = self._get_and_check_position(position, packer.size)
+        packer.pack_into(self._buffer, pos, *values)
+
+    def raw(self):
+        """
+        Return the underlying buffer, the current position, and the end of the readable data (the limit plus one). This
+        is used by the compiled schema decoders, which read directly from the buffer
+        """
+        return self._buffer, self._position, self._last + 1
+
+    def skip(self, num_bytes):
+        """Move the position forward by the specified number of bytes"""
+        self._get_and_check_position(None, num_bytes)
+
     def _read_integer(self, position, struct_char):
         pos = self._get_and_check_position(position, self.struct[struct_char]['num_bytes'])
         return self.struct[struct_char]['unpack'](self._buffer, pos)[0]
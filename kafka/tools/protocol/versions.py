@@ -0,0 +1,90 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+from kafka.tools.protocol.requests.describe_groups_v0 import DescribeGroupsV0Request
+from kafka.tools.protocol.requests.describe_groups_v1 import DescribeGroupsV1Request
+from kafka.tools.protocol.requests.find_coordinator_v1 import FindCoordinatorV1Request
+from kafka.tools.protocol.requests.group_coordinator_v0 import GroupCoordinatorV0Request
+from kafka.tools.protocol.requests.list_groups_v0 import ListGroupsV0Request
+from kafka.tools.protocol.requests.list_groups_v1 import ListGroupsV1Request
+from kafka.tools.protocol.requests.list_offset_v1 import ListOffsetV1Request
+from kafka.tools.protocol.requests.list_offset_v2 import ListOffsetV2Request
+from kafka.tools.protocol.requests.offset_commit_v2 import OffsetCommitV2Request
+from kafka.tools.protocol.requests.offset_commit_v3 import OffsetCommitV3Request
+from kafka.tools.protocol.requests.offset_fetch_v1 import OffsetFetchV1Request
+from kafka.tools.protocol.requests.offset_fetch_v2 import OffsetFetchV2Request
+from kafka.tools.protocol.requests.offset_fetch_v3 import OffsetFetchV3Request
+from kafka.tools.protocol.requests.topic_metadata_v2 import TopicMetadataV2Request
+from kafka.tools.protocol.requests.topic_metadata_v3 import TopicMetadataV3Request
+from kafka.tools.protocol.requests.topic_metadata_v4 import TopicMetadataV4Request
+from kafka.tools.protocol.requests.topic_metadata_v5 import TopicMetadataV5Request
+
+
+def _same_values(values):
+    return values
+
+
+def _no_auto_create(values):
+    return dict(values, allow_auto_topic_creation=False)
+
+
+def _read_uncommitted(values):
+    return dict(values, isolation_level=0)
+
+
+def _find_group_coordinator(values):
+    return {'coordinator_key': values['group_id'], 'coordinator_type': 0}
+
+
+# For each request that the client sends, the newer versions it can be sent as, newest first. Each version has a
+# function that converts the values for the original request into the values for that version. The responses to the
+# newer versions have all the fields of the original response, so they are handled the same way
+REQUEST_UPGRADES = {
+    TopicMetadataV2Request: [(TopicMetadataV5Request, _no_auto_create),
+                             (TopicMetadataV4Request, _no_auto_create),
+                             (TopicMetadataV3Request, _same_values)],
+    ListOffsetV1Request: [(ListOffsetV2Request, _read_uncommitted)],
+    OffsetFetchV1Request: [(OffsetFetchV3Request, _same_values),
+                           (OffsetFetchV2Request, _same_values)],
+    OffsetCommitV2Request: [(OffsetCommitV3Request, _same_values)],
+    DescribeGroupsV0Request: [(DescribeGroupsV1Request, _same_values)],
+    ListGroupsV0Request: [(ListGroupsV1Request, _same_values)],
+    GroupCoordinatorV0Request: [(FindCoordinatorV1Request, _find_group_coordinator)],
+}
+
+
+def upgrade_request(request, api_versions):
+    """
+    Pick the newest version of a request that the broker supports. Only the requests in REQUEST_UPGRADES are changed,
+    and only to versions that the broker has said it supports
+
+    Args:
+        request (BaseRequest): the request to send
+        api_versions (dict): a mapping of API key to a tuple of the minimum and maximum versions the broker supports, as
+            returned by an ApiVersions request. If this is empty or None, the request is not changed
+
+    Returns:
+        BaseRequest: the newest version of the request that the broker supports, or the original request
+    """
+    if (not api_versions) or (request.__class__ not in REQUEST_UPGRADES):
+        return request
+
+    for request_class, convert in REQUEST_UPGRADES[request.__class__]:
+        supported = api_versions.get(request_class.api_key)
+        if (supported is not None) and (supported[0] <= request_class.api_version <= supported[1]):
+            return request_class(convert(request._request))
+    return request
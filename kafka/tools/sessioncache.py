@@ -0,0 +1,66 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+from threading import Lock
+
+
+class TLSSessionCache(object):
+    def __init__(self):
+        """
+        Create a cache of TLS sessions, keyed by broker endpoint, so that reconnecting to a broker can resume the
+        previous session instead of doing a full handshake. This also counts how many connections used a full handshake
+        and how many resumed a session.
+
+        Session resumption requires Python 3.6 or later. On older versions no sessions are cached, and every connection
+        is counted as a full handshake.
+        """
+        self._sessions = {}
+        self._lock = Lock()
+        self.handshakes = 0
+        self.resumptions = 0
+
+    def get(self, hostname, port):
+        """Return the cached session for the endpoint, or None if there is not one"""
+        with self._lock:
+            return self._sessions.get((hostname, port))
+
+    def put(self, hostname, port, session):
+        """Cache the session for the endpoint. A session of None is ignored"""
+        if session is not None:
+            with self._lock:
+                self._sessions[(hostname, port)] = session
+
+    def record_connect(self, hostname, port, sock):
+        """
+        Update the counters for a newly connected socket, and cache its session
+
+        Args:
+            hostname (string): the hostname of the endpoint that was connected to
+            port (int): the port of the endpoint that was connected to
+            sock (ssl.SSLSocket): the connected socket
+        """
+        with self._lock:
+            if getattr(sock, 'session_reused', False):
+                self.resumptions += 1
+            else:
+                self.handshakes += 1
+        self.put(hostname, port, getattr(sock, 'session', None))
+
+    def stats(self):
+        """Return a dictionary with the handshakes and resumptions counters, and the number of cached sessions"""
+        with self._lock:
+            return {'handshakes': self.handshakes, 'resumptions': self.resumptions, 'sessions': len(self._sessions)}
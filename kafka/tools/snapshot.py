@@ -0,0 +1,195 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Save the cluster information that a client has cached to a file, and load it again in a later process, so that a client
+can start without fetching the metadata for the entire cluster first.
+
+Snapshots are encoded with the same compiled schema codecs as the Kafka protocol. The brokers and topics are stored in
+the structure of a Metadata V2 response, so a loaded snapshot is applied to the cluster in the same way as a response.
+"""
+
+import os
+import struct
+import tempfile
+import time
+
+from kafka.tools.protocol.responses.metadata_v2 import MetadataV2Response
+from kafka.tools.protocol.schema import decoder_for, encoder_for, sizer_for
+from kafka.tools.protocol.types.bytebuffer import ByteBuffer
+
+SNAPSHOT_MAGIC = 0x4b54534e
+SNAPSHOT_VERSION = 1
+
+_header = struct.Struct('>ih')
+
+
+class _Snapshot(object):
+    schema = [
+        {'name': 'magic', 'type': 'int32'},
+        {'name': 'version', 'type': 'int16'},
+        {'name': 'created', 'type': 'int64'},
+        {'name': 'groups_listed', 'type': 'int64'},
+        {'name': 'bootstrap', 'type': 'string'},
+        {'name': 'metadata', 'type': MetadataV2Response.schema},
+        {'name': 'groups',
+         'type': 'array',
+         'item_type': [
+             {'name': 'group_id', 'type': 'string'},
+             {'name': 'protocol_type', 'type': 'string'},
+             {'name': 'coordinator', 'type': 'int32'},
+         ]},
+    ]
+
+
+def _to_millis(timestamp):
+    return int(timestamp * 1000)
+
+
+def _snapshot_value(cluster, controller_id, bootstrap, created, groups_listed):
+    metadata = {'brokers': [], 'cluster_id': None, 'controller_id': controller_id, 'topics': []}
+    for broker in cluster.brokers.values():
+        # Brokers without an endpoint are placeholders for replicas, and are created again when the topics are loaded
+        if broker.hostname is not None:
+            metadata['brokers'].append({'node_id': broker.id, 'host': broker.hostname, 'port': broker.port, 'rack': broker.rack})
+
+    for topic in cluster.topics.values():
+        partitions = []
+        for partition in topic.partitions:
+            partitions.append({'error': 0,
+                               'id': partition.num,
+                               'leader': -1 if partition.leader is None else partition.leader.id,
+                               'replicas': [replica.id for replica in partition.replicas],
+                               'isrs': [broker.id for broker in partition.isr]})
+        metadata['topics'].append({'error': 0, 'name': topic.name, 'internal': topic.internal, 'partitions': partitions})
+
+    groups = []
+    for group in cluster.groups.values():
+        groups.append({'group_id': group.name,
+                       'protocol_type': group.protocol_type,
+                       'coordinator': -1 if group.coordinator is None else group.coordinator.id})
+
+    return {'magic': SNAPSHOT_MAGIC,
+            'version': SNAPSHOT_VERSION,
+            'created': _to_millis(created),
+            'groups_listed': _to_millis(groups_listed),
+            'bootstrap': bootstrap,
+            'metadata': metadata,
+            'groups': groups}
+
+
+def save_snapshot(filename, cluster, controller_id=-1, bootstrap=None, created=None, groups_listed=0.0):
+    """
+    Write the brokers, topics, partitions, and group coordinators of a cluster to a snapshot file. This is the same as
+    calling write_snapshot with the result of encode_snapshot
+
+    Args:
+        filename (string): the path of the snapshot file to write
+        cluster (Cluster): the cluster to save
+        controller_id (int): the ID of the controller broker, or -1 if it is not known
+        bootstrap (string): an identifier for the cluster, such as the bootstrap broker list, that is checked on load
+        created (float): the time (in seconds since the epoch) that the cluster information was fetched. Defaults to now
+        groups_listed (float): the time that the group list was fetched, or 0 if it never was
+
+    Raises:
+        IOError: If the snapshot file cannot be written
+    """
+    write_snapshot(filename, encode_snapshot(cluster, controller_id, bootstrap, created, groups_listed))
+
+
+def encode_snapshot(cluster, controller_id=-1, bootstrap=None, created=None, groups_listed=0.0):
+    """
+    Encode the brokers, topics, partitions, and group coordinators of a cluster as the contents of a snapshot file. This
+    reads the cluster, so it must be called where the cluster is not being updated at the same time
+
+    Args:
+        cluster (Cluster): the cluster to save
+        controller_id (int): the ID of the controller broker, or -1 if it is not known
+        bootstrap (string): an identifier for the cluster, such as the bootstrap broker list, that is checked on load
+        created (float): the time (in seconds since the epoch) that the cluster information was fetched. Defaults to now
+        groups_listed (float): the time that the group list was fetched, or 0 if it never was
+
+    Returns:
+        bytearray: the snapshot file contents
+    """
+    value = _snapshot_value(cluster, controller_id, bootstrap, time.time() if created is None else created, groups_listed)
+    buf = ByteBuffer(sizer_for(_Snapshot)(value))
+    encoder_for(_Snapshot)(value, buf)
+    return buf.raw()[0]
+
+
+def write_snapshot(filename, data):
+    """
+    Write encoded snapshot contents to a file. The file is written to a temporary file in the same directory first, and
+    then renamed, so readers never see a partial snapshot
+
+    Args:
+        filename (string): the path of the snapshot file to write
+        data (bytearray): the snapshot contents, as returned by encode_snapshot
+
+    Raises:
+        IOError: If the snapshot file cannot be written
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.snapshot')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmpname, filename)
+    except Exception:
+        os.unlink(tmpname)
+        raise
+
+
+def load_snapshot(filename, bootstrap=None, max_age=None):
+    """
+    Read a snapshot file written by save_snapshot
+
+    Args:
+        filename (string): the path of the snapshot file to read
+        bootstrap (string): the identifier that the snapshot must have been saved with
+        max_age (float): the number of seconds old a snapshot can be, or None for no limit
+
+    Returns:
+        dict: the snapshot, with the metadata as a MetadataV2Response, the group list as dicts with group_id,
+            protocol_type, and coordinator keys, and the created and groups_listed times in seconds. None if the file
+            does not exist, cannot be read, is for a different cluster or snapshot version, or is too old
+    """
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+
+    # Check that this is a snapshot in the current format before trying to decode the rest of it
+    if (len(data) < _header.size) or (_header.unpack_from(data) != (SNAPSHOT_MAGIC, SNAPSHOT_VERSION)):
+        return None
+    try:
+        value = decoder_for(_Snapshot)(ByteBuffer(data))
+    except (EOFError, ValueError):
+        return None
+
+    if value['bootstrap'] != bootstrap:
+        return None
+
+    value['created'] /= 1000.0
+    value['groups_listed'] /= 1000.0
+    if (max_age is not None) and (value['created'] < time.time() - max_age):
+        return None
+
+    value['metadata'] = MetadataV2Response(value['metadata'])
+    return value
@@ -13,6 +13,8 @@ entry_points = {
 }
 
 install_requires = [
+    'futures; python_version < "3"',
+    'selectors34; python_version < "3.4"',
     'JPype1',
     'kazoo',
     'pex',
@@ -141,10 +141,10 @@ def list_offset():
                                                                          'timestamp': 1234}]}]})
 
 
-def list_offset_error():
+def list_offset_error(error=6):
     return ListOffsetV1Response({'responses': [{'topic': 'topic1',
                                                 'partition_responses': [{'partition': 0,
-                                                                         'error': 6,
+                                                                         'error': error,
                                                                          'offset': -1,
                                                                          'timestamp': -1},
                                                                         {'partition': 1,
@@ -0,0 +1,348 @@
+import socket
+import sys
+import unittest
+from threading import Thread
+from mock import MagicMock
+
+from tests.tools.client.fixtures import (describe_groups, group_coordinator, group_coordinator_error, list_groups, list_offset, offset_commit_response,
+                                         offset_fetch, topic_metadata)
+from tests.tools.models.test_broker import api_versions_response, read_request
+
+from kafka.tools.configuration import ClientConfiguration
+from kafka.tools.exceptions import ConnectionError, GroupError
+from kafka.tools.models.broker import Broker
+from kafka.tools.models.group import Group
+from kafka.tools.protocol.requests.api_versions_v0 import ApiVersionsV0Request
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from kafka.tools.async_client import AsyncBroker, AsyncClient
+    from kafka.tools.snapshot import write_snapshot
+
+
+def resolved(loop, value):
+    """Return a stand-in for a coroutine function that returns the provided value, or raises it if it is an exception"""
+    def stub(*args, **kwargs):
+        future = loop.create_future()
+        if isinstance(value, Exception):
+            future.set_exception(value)
+        else:
+            future.set_result(value)
+        return future
+    return MagicMock(side_effect=stub)
+
+
+def serve_once(listener, handler):
+    """Accept one connection on the listening socket and pass it to the handler in a background thread"""
+    def run():
+        conn, addr = listener.accept()
+        try:
+            handler(conn)
+        finally:
+            conn.close()
+    thread = Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+@unittest.skipIf(sys.version_info < (3, 5), "asyncio client requires Python 3.5")
+class AsyncBrokerTests(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.configuration = ClientConfiguration(num_retries=1, retry_backoff=0.01, max_in_flight=4)
+        self.broker = AsyncBroker('127.0.0.1', id=1, port=self.listener.getsockname()[1], configuration=self.configuration)
+
+    def tearDown(self):
+        self.broker.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.listener.close()
+
+    def test_from_broker(self):
+        broker = Broker('host1.example.com', id=3, port=9093)
+        broker.rack = 'rack1'
+        newbroker = AsyncBroker.from_broker(broker, configuration=self.configuration)
+        assert isinstance(newbroker, AsyncBroker)
+        assert newbroker.id == 3
+        assert newbroker.hostname == 'host1.example.com'
+        assert newbroker.port == 9093
+        assert newbroker.rack == 'rack1'
+        assert newbroker._configuration is self.configuration
+
+    def test_send_pipelined_out_of_order(self):
+        def handler(conn):
+            # Read both requests before answering, then answer the second one first
+            correlation_ids = [read_request(conn), read_request(conn)]
+            for correlation_id in reversed(correlation_ids):
+                conn.sendall(api_versions_response(correlation_id))
+        thread = serve_once(self.listener, handler)
+
+        results = self.loop.run_until_complete(asyncio.gather(self.broker.send(ApiVersionsV0Request({})),
+                                                              self.broker.send(ApiVersionsV0Request({}))))
+        thread.join(5)
+        assert [correlation_id for correlation_id, response in results] == [1, 2]
+        assert all(response['error'] == 0 for correlation_id, response in results)
+
+    def test_send_connection_lost(self):
+        serve_once(self.listener, read_request)
+        self.assertRaises(ConnectionError, self.loop.run_until_complete, self.broker.send(ApiVersionsV0Request({})))
+        assert self.broker._pending == {}
+        assert self.broker._stream_writer is None
+
+    def test_connect_error(self):
+        self.listener.close()
+        self.assertRaises(ConnectionError, self.loop.run_until_complete, self.broker.connect())
+
+    def test_close_fails_pending(self):
+        future = self.loop.create_future()
+        self.broker._pending[1] = (ApiVersionsV0Request({}), future)
+        self.broker.close()
+        self.broker.close()
+        assert isinstance(future.exception(), ConnectionError)
+        assert self.broker._pending == {}
+
+
+@unittest.skipIf(sys.version_info < (3, 5), "asyncio client requires Python 3.5")
+class AsyncClientTests(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.client = AsyncClient()
+        self.client._connected = True
+        self.client._update_from_metadata(topic_metadata())
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_coroutine(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_brokers_are_async(self):
+        assert all(isinstance(broker, AsyncBroker) for broker in self.client.cluster.brokers.values())
+
+    def test_list_topics(self):
+        self.client._send_any_broker = resolved(self.loop, topic_metadata())
+        assert self.run_coroutine(self.client.list_topics(cache=False)) == ['topic1']
+        self.client._send_any_broker.assert_called_once()
+
+    def test_get_topic_cached(self):
+        self.client._send_any_broker = resolved(self.loop, topic_metadata())
+        topic = self.run_coroutine(self.client.get_topic('topic1'))
+        assert topic is self.client.cluster.topics['topic1']
+        self.client._send_any_broker.assert_not_called()
+
+    def test_send_some_brokers_concurrent(self):
+        self.client._send_to_broker = resolved(self.loop, 'response')
+        val = self.run_coroutine(self.client._send_some_brokers({1: 'request1', 101: 'request101'}))
+        assert val == {1: 'response', 101: 'response'}
+        assert self.client._send_to_broker.call_count == 2
+
+    def test_send_some_brokers_error(self):
+        self.client._send_to_broker = resolved(self.loop, ConnectionError('broken'))
+        assert self.run_coroutine(self.client._send_some_brokers({1: 'request1'})) == {1: None}
+        self.assertRaises(ConnectionError, self.run_coroutine, self.client._send_some_brokers({1: 'request1'}, ignore_errors=False))
+
+    def test_send_any_broker_exhausted(self):
+        self.client._send_to_broker = resolved(self.loop, ConnectionError('broken'))
+        self.assertRaises(ConnectionError, self.run_coroutine, self.client._send_any_broker('request'))
+        assert self.client._send_to_broker.call_count == 2
+
+    def test_list_groups(self):
+        self.client._send_to_broker = resolved(self.loop, list_groups())
+        groups, errors = self.run_coroutine(self.client.list_groups())
+        assert groups == ['group1']
+        assert errors == 0
+
+    def test_get_group(self):
+        self.client._send_any_broker = resolved(self.loop, group_coordinator())
+        self.client._send_to_broker = resolved(self.loop, describe_groups())
+        group = self.run_coroutine(self.client.get_group('testgroup'))
+        assert group.state == 'Stable'
+        assert group.coordinator is self.client.cluster.brokers[1]
+        self.client._send_to_broker.assert_called_once()
+        assert self.client._send_to_broker.call_args[0][0] == 1
+
+    def test_send_group_aware_request_cached(self):
+        self.client.configuration.coordinator_cache_ttl = 60
+        self.client._send_any_broker = resolved(self.loop, group_coordinator())
+        self.client._send_to_broker = resolved(self.loop, describe_groups())
+        self.run_coroutine(self.client._send_group_aware_request('testgroup', 'request'))
+        self.run_coroutine(self.client._send_group_aware_request('testgroup', 'request'))
+        self.client._send_any_broker.assert_called_once()
+        assert self.client._send_to_broker.call_count == 2
+
+    def test_describe_all_groups(self):
+        response = describe_groups()
+        response['groups'][0]['group_id'] = 'group1'
+        self.client._send_all_brokers = resolved(self.loop, {1: list_groups()})
+        self.client._send_some_brokers = resolved(self.loop, {1: response})
+        self.client._send_any_broker = resolved(self.loop, group_coordinator())
+
+        groups, errors, error_counter = self.run_coroutine(self.client.describe_all_groups())
+        assert error_counter == 0
+        assert errors == {}
+        assert groups['group1'].state == 'Stable'
+
+        # The coordinator is known from the ListGroups response, so it is not looked up
+        self.client._send_any_broker.assert_not_called()
+        requests = self.client._send_some_brokers.call_args[0][0]
+        assert requests[1]['group_ids'] == ['group1']
+
+    def test_get_lag(self):
+        self.client._send_to_broker = resolved(self.loop, list_offset())
+        self.client._send_group_aware_request = resolved(self.loop, offset_fetch())
+        lags, errors = self.run_coroutine(self.client.get_lag(['group1', 'group2'], ['topic1']))
+        assert errors == {}
+        assert lags['group1'].partitions == {'topic1': [0, 0]}
+        assert self.client._send_group_aware_request.call_count == 2
+
+    def test_get_lag_lookup_error(self):
+        self.client._send_to_broker = resolved(self.loop, list_offset())
+        self.client._send_any_broker = resolved(self.loop, group_coordinator_error())
+        lags, errors = self.run_coroutine(self.client.get_lag(['group1', 'group2'], ['topic1']))
+        assert lags == {}
+        assert errors == {'group1': 15, 'group2': 15}
+
+    def test_get_lag_reuses_coordinators(self):
+        group = Group('group1')
+        group.coordinator = self.client.cluster.brokers[1]
+        group.subscribed_topics = MagicMock()
+        group.subscribed_topics.return_value = ['topic1']
+        self.client.describe_groups = resolved(self.loop, ({'group1': group}, {}))
+        self.client._send_to_broker = resolved(self.loop, list_offset())
+        self.client._send_any_broker = resolved(self.loop, group_coordinator())
+
+        lags, errors = self.run_coroutine(self.client.get_lag(['group1']))
+        assert errors == {}
+        assert 'group1' in lags
+        self.client._send_any_broker.assert_not_called()
+
+    def test_get_offsets_for_topic(self):
+        self.client._send_to_broker = resolved(self.loop, list_offset())
+        val = self.run_coroutine(self.client.get_offsets_for_topic('topic1'))
+        assert val.partitions == [4829, 8904]
+        assert self.client._send_to_broker.call_count == 2
+
+    def test_get_offsets_for_group(self):
+        self.client.cluster.add_group(Group('testgroup'))
+        self.client.get_group = resolved(self.loop, self.client.cluster.groups['testgroup'])
+        self.client._send_group_aware_request = resolved(self.loop, offset_fetch())
+        val = self.run_coroutine(self.client.get_offsets_for_group('testgroup', 'topic1'))
+        assert val['topic1'].partitions == [4829, 8904]
+
+    def test_set_offsets_for_group_active(self):
+        group = Group('testgroup')
+        group.state = 'Stable'
+        self.client.get_group = resolved(self.loop, group)
+        self.assertRaises(GroupError, self.run_coroutine, self.client.set_offsets_for_group('testgroup', []))
+
+    def test_set_offsets_for_groups(self):
+        empty = Group('group1')
+        empty.state = 'Empty'
+        active = Group('group2')
+        active.state = 'Stable'
+        self.client.describe_groups = resolved(self.loop, ({'group1': empty, 'group2': active}, {}))
+        self.client._send_to_broker = resolved(self.loop, list_offset())
+        self.client._send_group_aware_request = resolved(self.loop, offset_commit_response())
+
+        results, errors = self.run_coroutine(self.client.set_offsets_for_groups({'group1': AsyncClient.OFFSET_LATEST,
+                                                                                 'group2': AsyncClient.OFFSET_LATEST}, ['topic1']))
+        assert results == {'group1': {'topic1': [0, 16]}}
+        assert errors == {'group2': 25}
+        request = self.client._send_group_aware_request.call_args[0][1]
+        assert [p['offset'] for p in request['topics'][0]['partitions']] == [4829, 8904]
+
+    def test_set_offsets_for_groups_lookup_error(self):
+        empty = Group('group1')
+        empty.state = 'Empty'
+        self.client.describe_groups = resolved(self.loop, ({'group1': empty}, {}))
+        self.client._send_to_broker = resolved(self.loop, list_offset())
+        self.client._send_any_broker = resolved(self.loop, group_coordinator_error())
+
+        results, errors = self.run_coroutine(self.client.set_offsets_for_groups({'group1': AsyncClient.OFFSET_LATEST}, ['topic1']))
+        assert results == {}
+        assert errors == {'group1': 15}
+
+    def test_send_to_leaders(self):
+        self.client._send_some_brokers = resolved(self.loop, {1: 'response1', 101: 'response101'})
+        parsed = {'response1': {('topic1', 0): ('result0', 0)}, 'response101': {('topic1', 1): ('result1', 0)}}
+
+        results, errors = self.run_coroutine(self.client.send_to_leaders([('topic1', 0), ('topic1', 1)], lambda items: list(items),
+                                                                         lambda response: parsed[response]))
+        assert results == {('topic1', 0): 'result0', ('topic1', 1): 'result1'}
+        assert errors == {}
+        assert self.client._send_some_brokers.call_args[0][0] == {1: [('topic1', 0)], 101: [('topic1', 1)]}
+
+    def test_close(self):
+        for broker in self.client.cluster.brokers.values():
+            broker.close = MagicMock()
+        self.run_coroutine(self.client.close())
+        assert not self.client._connected
+        for broker in self.client.cluster.brokers.values():
+            broker.close.assert_called_once_with()
+
+    def test_refresh_metadata(self):
+        self.client._send_any_broker = resolved(self.loop, topic_metadata())
+        self.client._send_all_brokers = resolved(self.loop, {1: list_groups()})
+        self.run_coroutine(self.client._refresh_metadata())
+        assert 'group1' in self.client.cluster.groups
+        assert not self.client._full_metadata_expired()
+        assert not self.client._groups_list_expired()
+
+    def test_refresher_cancelled_on_close(self):
+        self.client.configuration.background_refresh_interval = 0.01
+        self.client._maybe_bootstrap_cluster = resolved(self.loop, True)
+        self.client.configuration.lazy_connect = True
+        self.client._refresh_metadata = resolved(self.loop, None)
+
+        self.run_coroutine(self.client.connect())
+        refresher = self.client._refresher
+        self.run_coroutine(asyncio.sleep(0.05))
+        assert self.client._refresh_metadata.call_count > 0
+
+        self.run_coroutine(self.client.close())
+        self.run_coroutine(asyncio.sleep(0))
+        assert refresher.cancelled()
+        assert self.client._refresher is None
+
+    def test_save_snapshot_in_executor(self):
+        self.client.configuration.broker_list = 'broker1.example.com:9091'
+        self.client.configuration.metadata_snapshot = '/nonexistent/cluster.snapshot'
+        self.loop.run_in_executor = resolved(self.loop, None)
+        self.run_coroutine(self.client._save_snapshot())
+        args = self.loop.run_in_executor.call_args[0]
+        assert args[1] is write_snapshot
+        assert args[2] == '/nonexistent/cluster.snapshot'
+
+    def test_save_snapshot_error(self):
+        self.client.configuration.broker_list = 'broker1.example.com:9091'
+        self.client.configuration.metadata_snapshot = '/nonexistent/cluster.snapshot'
+        self.run_coroutine(self.client._save_snapshot())
+
+    def test_revalidation_cancelled_on_close(self):
+        self.client._maybe_load_snapshot = MagicMock()
+        self.client._maybe_load_snapshot.return_value = True
+        self.client.configuration.lazy_connect = True
+        self.client._refresh_metadata = MagicMock()
+        self.client._refresh_metadata.return_value = self.loop.create_future()
+
+        self.run_coroutine(self.client.connect())
+        revalidation = self.client._revalidation
+        self.run_coroutine(asyncio.sleep(0))
+        self.client._refresh_metadata.assert_called_once_with()
+
+        self.run_coroutine(self.client.close())
+        assert revalidation.cancelled()
+        assert self.client._revalidation is None
+
+    def test_connect_no_bootstrap(self):
+        client = AsyncClient(broker_list='127.0.0.1:1')
+        client._maybe_bootstrap_cluster = resolved(self.loop, False)
+        self.assertRaises(ConnectionError, self.run_coroutine, client.connect())
@@ -5,6 +5,7 @@ from mock import MagicMock, patch, call
 
 from kafka.tools.configuration import ClientConfiguration, eval_boolean, check_file_access
 from kafka.tools.exceptions import ConfigurationError
+from kafka.tools.sessioncache import TLSSessionCache
 
 
 class ConfigurationTests(unittest.TestCase):
@@ -51,6 +52,30 @@ class ConfigurationTests(unittest.TestCase):
         self.assertRaises(TypeError, ClientConfiguration, max_request_size='foo')
         self.assertRaises(TypeError, ClientConfiguration, max_request_size=-1)
 
+    def test_receive_buffer_pool_size(self):
+        config = ClientConfiguration(receive_buffer_pool_size=2345)
+        assert config.receive_buffer_pool_size == 2345
+        self.assertRaises(TypeError, ClientConfiguration, receive_buffer_pool_size='foo')
+        self.assertRaises(TypeError, ClientConfiguration, receive_buffer_pool_size=-1)
+
+    def test_send_buffer_pool_size(self):
+        config = ClientConfiguration(send_buffer_pool_size=2345)
+        assert config.send_buffer_pool_size == 2345
+        self.assertRaises(TypeError, ClientConfiguration, send_buffer_pool_size='foo')
+        self.assertRaises(TypeError, ClientConfiguration, send_buffer_pool_size=-1)
+
+    def test_receive_pool(self):
+        config = ClientConfiguration()
+        assert config.receive_pool.max_bytes == 67108864
+        config.receive_buffer_pool_size = 2345
+        assert config.receive_pool.max_bytes == 2345
+
+    def test_max_in_flight(self):
+        config = ClientConfiguration(max_in_flight=5)
+        assert config.max_in_flight == 5
+        self.assertRaises(TypeError, ClientConfiguration, max_in_flight='foo')
+        self.assertRaises(TypeError, ClientConfiguration, max_in_flight=0)
+
     def test_num_retries(self):
         config = ClientConfiguration(num_retries=5)
         assert config.num_retries == 5
@@ -69,6 +94,79 @@ class ConfigurationTests(unittest.TestCase):
         self.assertRaises(TypeError, ClientConfiguration, broker_threads='foo')
         self.assertRaises(TypeError, ClientConfiguration, broker_threads=-1)
 
+    def test_tls_sessions(self):
+        config = ClientConfiguration()
+        assert isinstance(config.tls_sessions, TLSSessionCache)
+        assert config.tls_sessions is not ClientConfiguration().tls_sessions
+
+    def test_lazy_connect(self):
+        assert not ClientConfiguration().lazy_connect
+        assert ClientConfiguration(lazy_connect=True).lazy_connect
+
+    def test_warm_up_connections(self):
+        assert not ClientConfiguration().warm_up_connections
+        assert ClientConfiguration(warm_up_connections='yes').warm_up_connections
+
+    def test_connect_timeout(self):
+        assert ClientConfiguration().connect_timeout is None
+        assert ClientConfiguration(connect_timeout=1.5).connect_timeout == 1.5
+        self.assertRaises(TypeError, ClientConfiguration, connect_timeout=5)
+        self.assertRaises(TypeError, ClientConfiguration, connect_timeout=-1.0)
+
+    def test_metadata_batch_window(self):
+        assert ClientConfiguration().metadata_batch_window is None
+        assert ClientConfiguration(metadata_batch_window=0.005).metadata_batch_window == 0.005
+        self.assertRaises(TypeError, ClientConfiguration, metadata_batch_window=0)
+
+    def test_offset_batch_window(self):
+        assert ClientConfiguration().offset_batch_window is None
+        assert ClientConfiguration(offset_batch_window=0.002).offset_batch_window == 0.002
+        self.assertRaises(TypeError, ClientConfiguration, offset_batch_window=-1.0)
+
+    def test_background_refresh_interval(self):
+        assert ClientConfiguration().background_refresh_interval is None
+        assert ClientConfiguration(background_refresh_interval=45.0).background_refresh_interval == 45.0
+        self.assertRaises(TypeError, ClientConfiguration, background_refresh_interval=0)
+
+    def test_coordinator_cache_ttl(self):
+        assert ClientConfiguration().coordinator_cache_ttl is None
+        assert ClientConfiguration(coordinator_cache_ttl=300).coordinator_cache_ttl == 300
+        self.assertRaises(TypeError, ClientConfiguration, coordinator_cache_ttl=1.5)
+
+    def test_metadata_snapshot(self):
+        assert ClientConfiguration().metadata_snapshot is None
+        assert ClientConfiguration(metadata_snapshot='/tmp/cluster.snapshot').metadata_snapshot == '/tmp/cluster.snapshot'
+        self.assertRaises(TypeError, ClientConfiguration, metadata_snapshot=1)
+
+    def test_metadata_snapshot_max_age(self):
+        assert ClientConfiguration().metadata_snapshot_max_age == 3600
+        assert ClientConfiguration(metadata_snapshot_max_age=60).metadata_snapshot_max_age == 60
+        self.assertRaises(TypeError, ClientConfiguration, metadata_snapshot_max_age=0)
+
+    def test_api_version_negotiation(self):
+        assert not ClientConfiguration().api_version_negotiation
+        assert ClientConfiguration(api_version_negotiation='true').api_version_negotiation
+
+    def test_multiplex_broker_io(self):
+        assert not ClientConfiguration().multiplex_broker_io
+        config = ClientConfiguration(multiplex_broker_io='true')
+        assert config.multiplex_broker_io
+
+    def test_broker_queue_size(self):
+        config = ClientConfiguration(broker_queue_size=50)
+        assert config.broker_queue_size == 50
+        self.assertRaises(TypeError, ClientConfiguration, broker_queue_size='foo')
+        self.assertRaises(TypeError, ClientConfiguration, broker_queue_size=0)
+
+    def test_request_timeout(self):
+        assert ClientConfiguration().request_timeout is None
+        config = ClientConfiguration(request_timeout=2.5)
+        assert config.request_timeout == 2.5
+        config.request_timeout = None
+        assert config.request_timeout is None
+        self.assertRaises(TypeError, ClientConfiguration, request_timeout='foo')
+        self.assertRaises(TypeError, ClientConfiguration, request_timeout=-1.0)
+
     def test_broker_list(self):
         config = ClientConfiguration(broker_list='broker1.example.com:9091,broker2.example.com:9092')
         assert config.broker_list == [('broker1.example.com', 9091), ('broker2.example.com', 9092)]
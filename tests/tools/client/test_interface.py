@@ -1,13 +1,19 @@
+import os
+import shutil
+import tempfile
+import time
 import unittest
+from threading import Event, Thread
 from mock import MagicMock, patch, call
 
-from tests.tools.client.fixtures import topic_metadata
+from tests.tools.client.fixtures import list_groups, topic_metadata
 
 from kafka.tools.client import Client
 from kafka.tools.configuration import ClientConfiguration
 from kafka.tools.exceptions import ConfigurationError, ConnectionError
 from kafka.tools.models.broker import Broker
 from kafka.tools.models.cluster import Cluster
+from kafka.tools.models.group import Group
 from kafka.tools.protocol.requests.topic_metadata_v1 import TopicMetadataV1Request
 
 
@@ -34,6 +40,15 @@ class GenericInterfaceTests(unittest.TestCase):
         for broker_id in self.client.cluster.brokers:
             self.client.cluster.brokers[broker_id].close.assert_called_once()
 
+    def test_close_shuts_down_executor(self):
+        executor = self.client._get_executor()
+        assert self.client._get_executor() is executor
+        executor.shutdown = MagicMock()
+
+        self.client.close()
+        executor.shutdown.assert_called_once_with(wait=False)
+        assert self.client._executor is None
+
     def test_create(self):
         assert self.client.configuration.broker_list == [('broker1.example.com', 9091), ('broker2.example.com', 9092)]
 
@@ -84,7 +99,221 @@ class GenericInterfaceTests(unittest.TestCase):
         for broker_id in self.client.cluster.brokers:
             self.client.cluster.brokers[broker_id].connect.assert_called_once()
 
+    def test_connect_lazy(self):
+        self.client.configuration.lazy_connect = True
+        self.client._maybe_bootstrap_cluster = MagicMock()
+        self.client._maybe_bootstrap_cluster.return_value = True
+        self.client._connect_all_brokers = MagicMock()
+        self.client._start_warm_up = MagicMock()
+
+        self.client.connect()
+        self.client._connect_all_brokers.assert_not_called()
+        self.client._start_warm_up.assert_not_called()
+
+        self.client.configuration.warm_up_connections = True
+        self.client.connect()
+        self.client._connect_all_brokers.assert_not_called()
+        self.client._start_warm_up.assert_called_once_with()
+
+    def test_warm_up_order(self):
+        self.client._update_from_metadata(self.metadata_response)
+        self.client.cluster.add_broker(Broker('host3.example.com', id=3, port=8033))
+        self.client.cluster.add_broker(Broker(None, id=4))
+        group = Group('testgroup')
+        group.coordinator = self.client.cluster.brokers[101]
+        self.client.cluster.add_group(group)
+
+        # The coordinator, then the leaders, then the rest. Brokers without an endpoint are skipped
+        self.client.cluster.topics['topic1'].partitions[1].leader = self.client.cluster.brokers[1]
+        assert self.client._warm_up_order() == [101, 1, 3]
+
+    def test_warm_up_connections(self):
+        self.client._update_from_metadata(self.metadata_response)
+        for broker in self.client.cluster.brokers.values():
+            broker.connect_if_needed = MagicMock()
+
+        self.client._start_warm_up().join(5)
+        self.client._executor.shutdown()
+        for broker in self.client.cluster.brokers.values():
+            broker.connect_if_needed.assert_called_once_with()
+
+    def test_warm_up_broker_error(self):
+        broker = Broker('host1.example.com', id=1, port=8031)
+        broker.connect_if_needed = MagicMock()
+        broker.connect_if_needed.side_effect = ConnectionError
+        self.client._warm_up_broker(broker)
+
+        self.client._connected = False
+        broker.connect_if_needed.reset_mock()
+        self.client._warm_up_broker(broker)
+        broker.connect_if_needed.assert_not_called()
+
+    def test_warm_up_connections_closed(self):
+        self.client._update_from_metadata(self.metadata_response)
+        executor = MagicMock()
+        executor.submit.side_effect = RuntimeError
+        self.client._warm_up_connections(executor, [1, 101])
+        executor.submit.assert_called_once()
+
+    def test_connect_starts_refresher(self):
+        self.client._maybe_bootstrap_cluster = MagicMock()
+        self.client._maybe_bootstrap_cluster.return_value = True
+        self.client._connect_all_brokers = MagicMock()
+        self.client._start_refresher = MagicMock()
+
+        self.client.connect()
+        self.client._start_refresher.assert_not_called()
+
+        self.client.configuration.background_refresh_interval = 30.0
+        self.client.connect()
+        self.client._start_refresher.assert_called_once_with()
+
+    def test_refresh_metadata(self):
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.metadata_response
+        self.client._send_all_brokers = MagicMock()
+        self.client._send_all_brokers.return_value = {1: list_groups()}
+
+        self.client._refresh_metadata()
+        assert 'topic1' in self.client.cluster.topics
+        assert 'group1' in self.client.cluster.groups
+        assert not self.client._full_metadata_expired()
+        assert not self.client._groups_list_expired()
+
+    def test_refresher_runs_until_closed(self):
+        refreshed = Event()
+        self.client.configuration.background_refresh_interval = 0.01
+        self.client._refresh_metadata = MagicMock(side_effect=lambda: refreshed.set())
+
+        thread = self.client._start_refresher()
+        assert refreshed.wait(5)
+        self.client.close()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert self.client._refresh_stop is None
+
+    def test_refresher_survives_errors(self):
+        stop = Event()
+        calls = []
+
+        def refresh():
+            calls.append(1)
+            if len(calls) == 2:
+                stop.set()
+            raise ConnectionError('broken')
+        self.client._refresh_metadata = MagicMock(side_effect=refresh)
+
+        self.client._refresh_loop(stop, 0.01)
+        assert len(calls) == 2
+
+    def test_connect_from_snapshot(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            self.client.configuration.metadata_snapshot = os.path.join(tmpdir, 'cluster.snapshot')
+            self.client.configuration.lazy_connect = True
+            self.client._update_from_metadata(self.metadata_response)
+            group = Group('group1')
+            group.coordinator = self.client.cluster.brokers[101]
+            self.client.cluster.add_group(group)
+            self.client._last_full_metadata = time.time() - 10
+            self.client._controller_id = 1
+            self.client._save_snapshot()
+
+            client = Client(configuration=self.client.configuration)
+            client._maybe_bootstrap_cluster = MagicMock()
+            client._start_revalidation = MagicMock()
+            client.connect()
+
+            # The bootstrap brokers are not used, and the current metadata is fetched in the background
+            client._maybe_bootstrap_cluster.assert_not_called()
+            client._start_revalidation.assert_called_once_with()
+            assert client._connected
+            assert client.cluster.topics['topic1'].partitions[1].leader.id == 101
+            assert client.cluster.groups['group1'].coordinator is client.cluster.brokers[101]
+            assert client._controller_id == 1
+
+            # Loaded information expires based on when it was saved
+            assert abs(client.cluster.topics['topic1']._last_updated - self.client._last_full_metadata) < 0.01
+            client.configuration.metadata_refresh = 5
+            assert client._topic_needs_update('topic1')
+            assert client._groups_list_expired()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_connect_saves_snapshot(self):
+        self.client.configuration.metadata_snapshot = '/nonexistent/directory/cluster.snapshot'
+        self.client._maybe_bootstrap_cluster = MagicMock()
+        self.client._maybe_bootstrap_cluster.return_value = True
+        self.client._connect_all_brokers = MagicMock()
+        self.client._save_snapshot = MagicMock()
+        self.client._start_revalidation = MagicMock()
+
+        # There is no snapshot file, so the cluster is bootstrapped, and then saved
+        self.client.connect()
+        self.client._maybe_bootstrap_cluster.assert_called_once()
+        self.client._start_revalidation.assert_not_called()
+        self.client._save_snapshot.assert_called_once_with()
+
+        self.client.close()
+        assert self.client._save_snapshot.call_count == 2
+
+    def test_load_inconsistent_snapshot(self):
+        self.client.configuration.metadata_snapshot = '/tmp/cluster.snapshot'
+        metadata = topic_metadata()
+        metadata['topics'][0]['partitions'][0]['leader'] = 5
+        snapshot = {'metadata': metadata, 'groups': [], 'created': time.time(), 'groups_listed': 0.0}
+
+        with patch('kafka.tools.client.load_snapshot', return_value=snapshot):
+            assert not self.client._maybe_load_snapshot()
+        assert self.client.cluster.topics == {}
+
+    def test_save_snapshot_error(self):
+        self.client.configuration.metadata_snapshot = '/nonexistent/directory/cluster.snapshot'
+        self.client._update_from_metadata(self.metadata_response)
+        self.client._save_snapshot()
+
+    def test_revalidate_snapshot_error(self):
+        self.client._refresh_metadata = MagicMock(side_effect=ConnectionError('broken'))
+        self.client._start_revalidation().join(5)
+        self.client._refresh_metadata.assert_called_once_with()
+
     def test_connect_broker_list_exhausted(self):
         self.client._maybe_bootstrap_cluster = MagicMock()
         self.client._maybe_bootstrap_cluster.return_value = False
         self.assertRaises(ConnectionError, self.client.connect)
+
+    def test_cached_read_during_slow_request(self):
+        self.client._update_from_metadata(self.metadata_response)
+        started = Event()
+        release = Event()
+
+        def slow_request(group_name, request):
+            started.set()
+            release.wait(5)
+            raise ConnectionError('slow')
+        self.client._send_group_aware_request = MagicMock(side_effect=slow_request)
+
+        thread = Thread(target=lambda: self.assertRaises(ConnectionError, self.client.get_group, 'testgroup'))
+        thread.daemon = True
+        thread.start()
+        assert started.wait(5)
+
+        # A request in progress on one thread does not block reading cached information on another
+        assert self.client.get_topic('topic1').name == 'topic1'
+        release.set()
+        thread.join(5)
+
+    def test_update_from_metadata_locked(self):
+        done = Event()
+
+        def update():
+            self.client._update_from_metadata(self.metadata_response)
+            done.set()
+
+        with self.client._lock:
+            thread = Thread(target=update)
+            thread.daemon = True
+            thread.start()
+            assert not done.wait(0.1)
+        assert done.wait(5)
+        assert 'topic1' in self.client.cluster.topics
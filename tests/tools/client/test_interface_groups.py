@@ -2,13 +2,14 @@ import time
 import unittest
 from mock import MagicMock
 
-from tests.tools.client.fixtures import describe_groups, describe_groups_error
+from tests.tools.client.fixtures import describe_groups, describe_groups_error, group_coordinator, group_coordinator_error, list_groups
 
 from kafka.tools.client import Client
 from kafka.tools.exceptions import GroupError
 from kafka.tools.models.broker import Broker
 from kafka.tools.models.group import Group
 from kafka.tools.protocol.requests.describe_groups_v0 import DescribeGroupsV0Request
+from kafka.tools.protocol.responses.describe_groups_v0 import DescribeGroupsV0Response
 
 
 class InterfaceGroupsTests(unittest.TestCase):
@@ -102,3 +103,110 @@ class InterfaceGroupsTests(unittest.TestCase):
 
         self.assertRaises(GroupError, self.client.get_group, 'nonexistentgroup')
         self.client._send_group_aware_request.assert_called_once()
+
+    def add_listed_group(self, group_name, broker_id):
+        self.client._add_or_update_group({'group_id': group_name, 'protocol_type': 'consumer'}, broker_id)
+
+    def describe_response(self, *group_errors):
+        return DescribeGroupsV0Response({'groups': [{'group_id': group_name,
+                                                     'error': error,
+                                                     'state': 'Stable' if error == 0 else None,
+                                                     'protocol': 'roundrobin',
+                                                     'protocol_type': 'consumer',
+                                                     'members': []} for group_name, error in group_errors]})
+
+    def test_describe_groups(self):
+        self.add_listed_group('group1', 1)
+        self.add_listed_group('group2', 1)
+        self.add_listed_group('group3', 101)
+        self.client._send_any_broker_pipelined = MagicMock()
+        self.client._send_some_brokers = MagicMock()
+        self.client._send_some_brokers.return_value = {1: self.describe_response(('group1', 0), ('group2', 0)),
+                                                       101: self.describe_response(('group3', 0))}
+
+        groups, errors = self.client.describe_groups(['group1', 'group2', 'group3'])
+        assert errors == {}
+        assert sorted(groups.keys()) == ['group1', 'group2', 'group3']
+        assert all(group.state == 'Stable' for group in groups.values())
+
+        # One request to each coordinator, with no lookups as the coordinators are known from ListGroups
+        self.client._send_any_broker_pipelined.assert_not_called()
+        requests = self.client._send_some_brokers.call_args[0][0]
+        assert sorted(requests[1]['group_ids']) == ['group1', 'group2']
+        assert requests[101]['group_ids'] == ['group3']
+
+    def test_describe_groups_cached(self):
+        self.add_listed_group('group1', 1)
+        self.client.cluster.groups['group1']._last_updated = time.time()
+        self.client._send_some_brokers = MagicMock()
+
+        groups, errors = self.client.describe_groups(['group1'])
+        assert groups == {'group1': self.client.cluster.groups['group1']}
+        self.client._send_some_brokers.assert_not_called()
+
+    def test_describe_groups_lookup(self):
+        self.client._send_any_broker_pipelined = MagicMock()
+        self.client._send_any_broker_pipelined.return_value = [group_coordinator(), group_coordinator_error()]
+        self.client._send_some_brokers = MagicMock()
+        self.client._send_some_brokers.return_value = {1: self.describe_response(('group1', 0))}
+
+        groups, errors = self.client.describe_groups(['group1', 'group2'])
+        assert list(groups.keys()) == ['group1']
+        assert errors == {'group2': 15}
+        requests = self.client._send_some_brokers.call_args[0][0]
+        assert list(requests.keys()) == [1]
+        assert requests[1]['group_ids'] == ['group1']
+
+    def test_describe_groups_moved(self):
+        self.add_listed_group('group1', 101)
+        self.add_listed_group('group2', 101)
+        self.client._send_any_broker_pipelined = MagicMock()
+        self.client._send_any_broker_pipelined.return_value = [group_coordinator()]
+        self.client._send_some_brokers = MagicMock()
+        self.client._send_some_brokers.side_effect = [{101: self.describe_response(('group1', 16), ('group2', 0))},
+                                                      {1: self.describe_response(('group1', 0))}]
+
+        # group1 has moved to broker 1, so it is looked up and described again
+        groups, errors = self.client.describe_groups(['group1', 'group2'])
+        assert errors == {}
+        assert sorted(groups.keys()) == ['group1', 'group2']
+        assert self.client.cluster.groups['group1'].coordinator.id == 1
+        requests = self.client._send_any_broker_pipelined.call_args[0][0]
+        assert [request['group_id'] for request in requests] == ['group1']
+
+    def test_describe_groups_coordinator_failed(self):
+        self.add_listed_group('group1', 1)
+        self.add_listed_group('group2', 101)
+        self.client._send_some_brokers = MagicMock()
+        self.client._send_some_brokers.return_value = {1: None, 101: self.describe_response(('group2', 0))}
+
+        groups, errors = self.client.describe_groups(['group1', 'group2'])
+        assert list(groups.keys()) == ['group2']
+        assert errors == {'group1': -1}
+        assert self.client.cluster.groups['group1']._coordinator_updated == 0.0
+        self.client._send_some_brokers.assert_called_once()
+
+    def test_describe_groups_update_once(self):
+        self.add_listed_group('group1', 1)
+        self.add_listed_group('group2', 101)
+        self.client._send_some_brokers = MagicMock()
+        self.client._send_some_brokers.return_value = {1: self.describe_response(('group1', 0)),
+                                                       101: self.describe_response(('group2', 0))}
+        self.client._update_groups_from_describe = MagicMock()
+
+        self.client.describe_groups(['group1', 'group2'])
+        self.client._update_groups_from_describe.assert_called_once()
+        described = self.client._update_groups_from_describe.call_args[0][0]['groups']
+        assert sorted(group_info['group_id'] for group_info in described) == ['group1', 'group2']
+
+    def test_describe_all_groups(self):
+        self.client._send_all_brokers = MagicMock()
+        self.client._send_all_brokers.return_value = {1: list_groups(), 101: None}
+        self.client._send_some_brokers = MagicMock()
+        self.client._send_some_brokers.return_value = {1: self.describe_response(('group1', 0))}
+
+        groups, errors, error_counter = self.client.describe_all_groups()
+        assert list(groups.keys()) == ['group1']
+        assert errors == {}
+        assert error_counter == 1
+        assert list(self.client._send_some_brokers.call_args[0][0].keys()) == [1]
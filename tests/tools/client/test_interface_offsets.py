@@ -1,13 +1,20 @@
+import io
+import time
 import unittest
+from threading import Thread
 from mock import MagicMock
 
-from tests.tools.client.fixtures import topic_metadata, offset_fetch
+from tests.tools.client.fixtures import (topic_metadata, offset_fetch, offset_fetch_error, describe_groups, describe_groups_error, list_offset,
+                                         offset_commit_response)
 
 from kafka.tools.client import Client
-from kafka.tools.exceptions import GroupError
+from kafka.tools.exceptions import GroupError, OffsetError, TopicError
 from kafka.tools.models.group import Group
 from kafka.tools.models.topic import TopicOffsets
 from kafka.tools.protocol.requests.offset_fetch_v1 import OffsetFetchV1Request
+from kafka.tools.protocol.requests.offset_fetch_v2 import OffsetFetchV2Request
+from kafka.tools.protocol.responses.offset_commit_v2 import OffsetCommitV2Response
+from kafka.tools.protocol.responses.offset_fetch_v2 import OffsetFetchV2Response
 
 
 class InterfaceOffsetsTests(unittest.TestCase):
@@ -44,6 +51,44 @@ class InterfaceOffsetsTests(unittest.TestCase):
 
         assert val == {'topic1': 'responseobj'}
 
+    def call_in_batch(self, fn, *args):
+        # Call the function in the background, and wait until it has started a batch for other calls to join
+        results = []
+        thread = Thread(target=lambda: results.append(fn(*args)))
+        thread.daemon = True
+        thread.start()
+        for i in range(500):
+            if len(self.client._batches) > 0:
+                break
+            time.sleep(0.01)
+        return thread, results
+
+    def test_get_offsets_for_topics_batched(self):
+        self.client.configuration.offset_batch_window = 0.5
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client._send_some_brokers = MagicMock()
+        self.client._send_some_brokers.return_value = {1: list_offset()}
+
+        thread, results = self.call_in_batch(self.client.get_offsets_for_topics, ['topic1'])
+        val = self.client.get_offsets_for_topics(['topic1'])
+        thread.join(5)
+
+        # Both calls are answered from one set of requests, and each gets its own TopicOffsets
+        self.client._send_some_brokers.assert_called_once()
+        requests = self.client._send_some_brokers.call_args[0][0]
+        assert len(requests) == 2
+        assert all(len(requests[broker_id]['topics']) == 1 for broker_id in requests)
+        assert val['topic1'].partitions == [4829, 8904]
+        assert results[0]['topic1'].partitions == [4829, 8904]
+        assert results[0]['topic1'] is not val['topic1']
+
+    def test_get_offsets_for_topics_batched_missing_topic(self):
+        self.client.configuration.offset_batch_window = 0.01
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client._send_some_brokers = MagicMock()
+        self.assertRaises(TopicError, self.client.get_offsets_for_topics, ['nosuchtopic'])
+        self.client._send_some_brokers.assert_not_called()
+
     def test_get_offsets_for_topic(self):
         self.client.get_offsets_for_topics = MagicMock()
         self.client.get_offsets_for_topics.return_value = {'topic1': 'thingitreturns'}
@@ -103,6 +148,201 @@ class InterfaceOffsetsTests(unittest.TestCase):
         assert isinstance(val['topic1'], TopicOffsets)
         assert val['topic1'].partitions == [4829, 8904]
 
+    def test_get_offsets_for_group_batched(self):
+        self.client.configuration.offset_batch_window = 0.5
+        self.client.get_group = MagicMock()
+        self.client.get_group.return_value = self.group
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client._send_group_aware_requests = MagicMock()
+        self.client._send_group_aware_requests.return_value = {'group1': self.offset_fetch, 'group2': offset_fetch()}
+
+        thread, results = self.call_in_batch(self.client.get_offsets_for_group, 'group1', 'topic1')
+        val = self.client.get_offsets_for_group('group2', 'topic1')
+        thread.join(5)
+
+        # One OffsetFetch request for each group, sent together
+        self.client._send_group_aware_requests.assert_called_once()
+        requests = self.client._send_group_aware_requests.call_args[0][0]
+        assert sorted(requests.keys()) == ['group1', 'group2']
+        assert requests['group1']['group_id'] == 'group1'
+        assert requests['group2']['topics'][0]['topic'] == 'topic1'
+        assert val['topic1'].partitions == [4829, 8904]
+        assert results[0]['topic1'].partitions == [4829, 8904]
+
+    def test_get_offsets_for_group_batched_lookup_error(self):
+        self.client.configuration.offset_batch_window = 0.5
+        self.client.get_group = MagicMock()
+        self.client.get_group.return_value = self.group
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+
+        def send_requests(requests, errors):
+            errors['group1'] = 15
+            return {'group2': offset_fetch()}
+        self.client._send_group_aware_requests = MagicMock(side_effect=send_requests)
+
+        # Only the caller that asked for the group whose coordinator lookup failed gets the error
+        errors = []
+        thread, results = self.call_in_batch(self.catch_group_error, errors, 'group1')
+        val = self.client.get_offsets_for_group('group2', 'topic1')
+        thread.join(5)
+
+        self.client._send_group_aware_requests.assert_called_once()
+        assert val['topic1'].partitions == [4829, 8904]
+        assert len(errors) == 1
+        assert isinstance(errors[0], GroupError)
+
+    def catch_group_error(self, errors, group_name):
+        try:
+            self.client.get_offsets_for_group(group_name, 'topic1')
+        except GroupError as e:
+            errors.append(e)
+
+    def test_get_offsets_for_group_request_error(self):
+        # Newer OffsetFetch responses have an error for the whole request
+        self.client.get_group = MagicMock()
+        self.client.get_group.return_value = self.group
+        self.client._get_topics_for_group = MagicMock()
+        self.client._get_topics_for_group.return_value = ['topic1']
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client._send_group_aware_request = MagicMock()
+        self.client._send_group_aware_request.return_value = OffsetFetchV2Response({'responses': [], 'error': 15})
+
+        self.assertRaises(OffsetError, self.client.get_offsets_for_group, 'testgroup')
+
+    def test_get_offsets_for_groups(self):
+        self.client._get_groups = MagicMock()
+        self.client._get_groups.return_value = {'group1': self.group, 'group2': self.group}
+        self.client._get_topics_for_group = MagicMock()
+        self.client._get_topics_for_group.return_value = ['topic1']
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client._send_group_aware_requests = MagicMock()
+        self.client._send_group_aware_requests.return_value = {'group1': self.offset_fetch, 'group2': offset_fetch()}
+
+        val = self.client.get_offsets_for_groups(['group1', 'group2'])
+
+        self.client._get_groups.assert_called_once_with(['group1', 'group2'])
+        self.client._maybe_update_metadata_for_topics.assert_called_once_with(['topic1'])
+        self.client._send_group_aware_requests.assert_called_once()
+        requests = self.client._send_group_aware_requests.call_args[0][0]
+        assert set(requests.keys()) == set(['group1', 'group2'])
+        for group_name in requests:
+            assert isinstance(requests[group_name], OffsetFetchV1Request)
+            assert requests[group_name]['group_id'] == group_name
+
+        assert set(val.keys()) == set(['group1', 'group2'])
+        assert val['group2']['topic1'].partitions == [4829, 8904]
+
+    def setup_lag(self):
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client.get_offsets_for_topics = MagicMock()
+        self.client.get_offsets_for_topics.return_value = {'topic1': TopicOffsets(self.client.cluster.topics['topic1'])}
+        self.client.get_offsets_for_topics.return_value['topic1'].partitions = [5000, 9000]
+        self.client._send_group_aware_requests = MagicMock()
+
+    def test_get_lag(self):
+        self.setup_lag()
+        self.client._send_group_aware_requests.return_value = {'group1': offset_fetch(), 'group2': offset_fetch_error()}
+
+        lags, errors = self.client.get_lag(['group1', 'group2'], ['topic1', 'nonexistent'])
+        assert errors == {}
+        assert lags['group1'].partitions == {'topic1': [171, 96]}
+        assert lags['group1'].total == 267
+        assert lags['group2'].partitions == {'topic1': [None, 96]}
+
+        # End offsets are fetched once for all the groups, and topics that do not exist are skipped
+        self.client.get_offsets_for_topics.assert_called_once_with(['topic1'])
+        requests = self.client._send_group_aware_requests.call_args[0][0]
+        assert set(requests.keys()) == set(['group1', 'group2'])
+        assert requests['group1']['group_id'] == 'group1'
+        assert requests['group1']['topics'][0]['topic'] == 'topic1'
+
+    def test_get_lag_group_error(self):
+        self.setup_lag()
+        self.client._send_group_aware_requests.return_value = {'group1': offset_fetch(),
+                                                               'group2': OffsetFetchV2Response({'responses': [], 'error': 16})}
+
+        lags, errors = self.client.get_lag(['group1', 'group2'], ['topic1'])
+        assert list(lags.keys()) == ['group1']
+        assert errors == {'group2': 16}
+
+    def test_get_lag_subscribed_topics(self):
+        self.setup_lag()
+        self.client._send_group_aware_requests.return_value = {'testgroup': offset_fetch()}
+        self.client.list_groups = MagicMock()
+        self.client.list_groups.return_value = (['testgroup', 'emptygroup'], 0)
+        self.client.describe_groups = MagicMock()
+        self.client.describe_groups.return_value = ({'testgroup': self.group}, {'emptygroup': 15})
+        self.group.subscribed_topics = MagicMock()
+        self.group.subscribed_topics.return_value = ['topic1']
+
+        lags, errors = self.client.get_lag()
+        self.client.describe_groups.assert_called_once_with(['testgroup', 'emptygroup'])
+        self.client._maybe_update_metadata_for_topics.assert_called_once_with(['topic1'])
+        assert list(self.client._send_group_aware_requests.call_args[0][0].keys()) == ['testgroup']
+        assert lags['testgroup'].topics == {'topic1': 267}
+        assert errors == {'emptygroup': 15}
+
+    def test_get_lag_reuses_coordinators(self):
+        self.setup_lag()
+        self.client._send_group_aware_requests.return_value = {'testgroup': offset_fetch()}
+        self.group.coordinator = self.client.cluster.brokers[1]
+        self.group.subscribed_topics = MagicMock()
+        self.group.subscribed_topics.return_value = ['topic1']
+        self.client.describe_groups = MagicMock()
+        self.client.describe_groups.return_value = ({'testgroup': self.group}, {})
+
+        self.client.get_lag(['testgroup'])
+        assert self.client._send_group_aware_requests.call_args[0][2] == {'testgroup': self.client.cluster.brokers[1]}
+
+    def test_get_lag_lookup_error(self):
+        self.setup_lag()
+
+        def send_requests(requests, errors, coordinators):
+            errors['group2'] = 15
+            return {'group1': offset_fetch()}
+        self.client._send_group_aware_requests.side_effect = send_requests
+
+        lags, errors = self.client.get_lag(['group1', 'group2'], ['topic1'])
+        assert list(lags.keys()) == ['group1']
+        assert errors == {'group2': 15}
+
+    def test_get_lag_partitions_not_in_metadata(self):
+        self.setup_lag()
+        response = offset_fetch()
+        response['responses'][0]['partition_responses'].append({'partition': 2, 'metadata': None, 'error': 0, 'offset': 10})
+        response['responses'].append({'topic': 'topic2', 'partition_responses': [{'partition': 0, 'metadata': None, 'error': 0, 'offset': 10}]})
+        self.client._send_group_aware_requests.return_value = {'group1': response}
+
+        # The topic grew, or another topic was returned, since the metadata and end offsets were fetched
+        lags, errors = self.client.get_lag(['group1'], ['topic1'])
+        assert lags['group1'].partitions == {'topic1': [171, 96, None], 'topic2': [None]}
+
+    def test_get_lag_no_topics(self):
+        self.setup_lag()
+        lags, errors = self.client.get_lag(['group1'], ['nonexistent'])
+        assert lags == {}
+        assert errors == {}
+        self.client.get_offsets_for_topics.assert_not_called()
+        self.client._send_group_aware_requests.assert_not_called()
+
+    def test_get_groups(self):
+        self.client._send_group_aware_requests = MagicMock()
+        self.client._send_group_aware_requests.return_value = {'testgroup': describe_groups()}
+
+        val = self.client._get_groups(['testgroup'])
+        assert val['testgroup'].state == 'Stable'
+        requests = self.client._send_group_aware_requests.call_args[0][0]
+        assert requests['testgroup']['group_ids'] == ['testgroup']
+
+        # Now the group is cached, so there is no request
+        self.client._get_groups(['testgroup'])
+        self.client._send_group_aware_requests.assert_called_once()
+
+    def test_get_groups_error(self):
+        self.client._send_group_aware_requests = MagicMock()
+        self.client._send_group_aware_requests.return_value = {'testgroup': describe_groups_error()}
+        self.assertRaises(GroupError, self.client._get_groups, ['testgroup'])
+
     def test_set_offsets_for_group_bad_offsets(self):
         self.assertRaises(TypeError, self.client.set_offsets_for_group, 'testgroup', 'notalist')
 
@@ -135,3 +375,207 @@ class InterfaceOffsetsTests(unittest.TestCase):
         self.client.get_group.assert_called_once_with('testgroup')
         self.client._send_set_offset_request.assert_called_once_with('testgroup', [offsets])
         self.client._parse_set_offset_response.assert_called_once_with('sendresponse')
+
+    def topic_offsets(self, *partitions):
+        offsets = TopicOffsets(self.client.cluster.topics['topic1'])
+        offsets.partitions = list(partitions)
+        return offsets
+
+    def setup_set_offsets_for_groups(self, *states):
+        described = {}
+        for i, state in enumerate(states):
+            group = Group('group{0}'.format(i + 1))
+            group.state = state
+            described[group.name] = group
+        self.client.describe_groups = MagicMock()
+        self.client.describe_groups.return_value = (described, {})
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client.get_offsets_for_topics = MagicMock()
+        self.client._send_group_aware_requests = MagicMock()
+        self.client._send_group_aware_requests.side_effect = lambda requests, *args: dict((group_name, offset_commit_response())
+                                                                                          for group_name in requests)
+
+    def test_set_offsets_for_groups(self):
+        self.setup_set_offsets_for_groups('Empty', 'Dead', 'Stable')
+        self.client.get_offsets_for_topics.return_value = {'topic1': self.topic_offsets(10, 20)}
+        offsets = self.topic_offsets(2342, 8793)
+
+        results, errors = self.client.set_offsets_for_groups({'group1': [offsets],
+                                                              'group2': Client.OFFSET_EARLIEST,
+                                                              'group3': Client.OFFSET_EARLIEST}, ['topic1'])
+
+        # The group states are always fetched, and the target is resolved once
+        self.client.describe_groups.assert_called_once()
+        assert self.client.describe_groups.call_args[1] == {'cache': False}
+        self.client.get_offsets_for_topics.assert_called_once_with(['topic1'], Client.OFFSET_EARLIEST)
+        self.client._maybe_update_metadata_for_topics.assert_called_once_with(['topic1'])
+
+        requests = self.client._send_group_aware_requests.call_args[0][0]
+        assert set(requests.keys()) == set(['group1', 'group2'])
+        assert [p['offset'] for p in requests['group1']['topics'][0]['partitions']] == [2342, 8793]
+        assert [p['offset'] for p in requests['group2']['topics'][0]['partitions']] == [10, 20]
+
+        assert results == {'group1': {'topic1': [0, 16]}, 'group2': {'topic1': [0, 16]}}
+        assert errors == {'group3': 25}
+
+    def test_set_offsets_for_groups_describe_error(self):
+        self.setup_set_offsets_for_groups('Empty')
+        self.client.describe_groups.return_value = ({'group1': self.group}, {'group2': 15})
+
+        results, errors = self.client.set_offsets_for_groups({'group1': [self.topic_offsets(1, 2)], 'group2': [self.topic_offsets(1, 2)]})
+        assert list(results.keys()) == ['group1']
+        assert errors == {'group2': 15}
+
+    def test_set_offsets_for_groups_coordinators(self):
+        self.setup_set_offsets_for_groups('Empty', 'Empty')
+        group1 = self.client.describe_groups.return_value[0]['group1']
+        group1.coordinator = self.client.cluster.brokers[1]
+
+        def send_requests(requests, errors, coordinators):
+            errors['group2'] = 15
+            return {'group1': offset_commit_response()}
+        self.client._send_group_aware_requests.side_effect = send_requests
+
+        # The coordinator from describe_groups is reused, and a failed lookup only affects its own group
+        results, errors = self.client.set_offsets_for_groups({'group1': [self.topic_offsets(1, 2)], 'group2': [self.topic_offsets(1, 2)]})
+        assert self.client._send_group_aware_requests.call_args[0][2] == {'group1': self.client.cluster.brokers[1]}
+        assert list(results.keys()) == ['group1']
+        assert errors == {'group2': 15}
+
+    def test_set_offsets_for_groups_unresolved(self):
+        self.setup_set_offsets_for_groups('Empty')
+        target = self.topic_offsets(-1, 20)
+        target.errors[0] = 6
+        self.client.get_offsets_for_topics.return_value = {'topic1': target}
+
+        results, errors = self.client.set_offsets_for_groups({'group1': Client.OFFSET_LATEST}, ['topic1'])
+        assert results == {}
+        assert errors == {'group1': 6}
+        self.client._send_group_aware_requests.assert_not_called()
+
+    def test_set_offsets_for_groups_past_end(self):
+        self.setup_set_offsets_for_groups('Empty')
+        self.client.get_offsets_for_topics.side_effect = [{'topic1': self.topic_offsets(-1, 20)}, {'topic1': self.topic_offsets(15, 25)}]
+
+        self.client.set_offsets_for_groups({'group1': 1500000000000}, ['topic1'])
+        assert self.client.get_offsets_for_topics.call_count == 2
+        assert self.client.get_offsets_for_topics.call_args[0] == (['topic1'], )
+        requests = self.client._send_group_aware_requests.call_args[0][0]
+        assert [p['offset'] for p in requests['group1']['topics'][0]['partitions']] == [15, 20]
+
+    def test_set_offsets_for_groups_bad_offsets(self):
+        self.assertRaises(TypeError, self.client.set_offsets_for_groups, {'group1': 'notalist'})
+
+    def test_set_offsets_for_groups_target_no_topics(self):
+        self.assertRaises(TypeError, self.client.set_offsets_for_groups, {'group1': Client.OFFSET_EARLIEST})
+        self.assertRaises(TypeError, self.client.set_offsets_for_groups, {'group1': Client.OFFSET_EARLIEST}, 'topic1')
+
+    def offset_fetch_all(self):
+        return OffsetFetchV2Response({'responses': [{'topic': 'topic1',
+                                                     'partition_responses': [{'partition': 0, 'metadata': None, 'error': 0, 'offset': 4829},
+                                                                             {'partition': 1, 'metadata': None, 'error': 0, 'offset': -1}]},
+                                                    {'topic': 'topic2',
+                                                     'partition_responses': [{'partition': 0, 'metadata': None, 'error': 0, 'offset': -1}]}],
+                                      'error': 0})
+
+    def test_export_offsets(self):
+        self.client.list_groups = MagicMock()
+        self.client.list_groups.return_value = (['group1', 'group2', 'group3'], 0)
+        self.client._send_group_aware_requests = MagicMock()
+        self.client._send_group_aware_requests.side_effect = [{'group1': self.offset_fetch_all(), 'group2': self.offset_fetch_all()},
+                                                              {'group3': OffsetFetchV2Response({'responses': [], 'error': 16})}]
+
+        fileobj = io.StringIO()
+        exported, errors = self.client.export_offsets(fileobj, batch_size=2)
+        assert exported == 2
+        assert errors == {'group3': 16}
+
+        # Each batch is a separate set of requests, for all the topics of each group
+        assert self.client._send_group_aware_requests.call_count == 2
+        requests = self.client._send_group_aware_requests.call_args_list[0][0][0]
+        assert set(requests.keys()) == set(['group1', 'group2'])
+        assert isinstance(requests['group1'], OffsetFetchV2Request)
+        assert requests['group1']['topics'] is None
+
+        # Topics with no committed offsets are not written
+        assert fileobj.getvalue() == ('{"group":"group1","offsets":[4829,-1],"topic":"topic1"}\n'
+                                      '{"group":"group2","offsets":[4829,-1],"topic":"topic1"}\n')
+
+    def test_export_offsets_lookup_error(self):
+        def send_requests(requests, errors):
+            errors['group1'] = 15
+            return {'group2': self.offset_fetch_all()}
+        self.client._send_group_aware_requests = MagicMock(side_effect=send_requests)
+
+        # A group whose coordinator cannot be found is reported, and the other groups are still exported
+        fileobj = io.StringIO()
+        exported, errors = self.client.export_offsets(fileobj, groups=['group1', 'group2'])
+        assert exported == 1
+        assert errors == {'group1': 15}
+        assert fileobj.getvalue() == '{"group":"group2","offsets":[4829,-1],"topic":"topic1"}\n'
+
+    def setup_import_offsets(self, *states):
+        described = {}
+        for group_name, state in states:
+            described[group_name] = Group(group_name)
+            described[group_name].state = state
+        self.client.describe_groups = MagicMock()
+        self.client.describe_groups.return_value = (described, {})
+        self.client._send_group_aware_requests = MagicMock()
+        self.client._send_group_aware_requests.side_effect = lambda requests, *args: dict(
+            (group_name, OffsetCommitV2Response({'responses': [{'topic': topic['topic'],
+                                                                'partition_responses': [{'partition': p['partition'], 'error': 0}
+                                                                                        for p in topic['partitions']]}
+                                                               for topic in request['topics']]}))
+            for group_name, request in requests.items())
+
+    def test_import_offsets(self):
+        self.setup_import_offsets(('group1', 'Empty'), ('group2', 'Stable'))
+        fileobj = io.StringIO(u'{"group":"group1","offsets":[-1,4829],"topic":"topic1"}\n'
+                              u'\n'
+                              u'{"group":"group1","offsets":[15],"topic":"topic2"}\n'
+                              u'{"group":"group2","offsets":[1,2],"topic":"topic1"}\n')
+
+        results, errors = self.client.import_offsets(fileobj)
+        assert results == {'group1': {'topic1': [-1, 0], 'topic2': [0]}}
+        assert errors == {'group2': 25}
+        assert self.client.describe_groups.call_args[1] == {'cache': False}
+
+        requests = self.client._send_group_aware_requests.call_args[0][0]
+        assert list(requests.keys()) == ['group1']
+        topics = dict((topic['topic'], topic['partitions']) for topic in requests['group1']['topics'])
+        assert [(p['partition'], p['offset']) for p in topics['topic1']] == [(1, 4829)]
+        assert [(p['partition'], p['offset']) for p in topics['topic2']] == [(0, 15)]
+
+    def test_import_offsets_batches(self):
+        self.setup_import_offsets(('group1', 'Empty'), ('group2', 'Empty'), ('group3', 'Empty'))
+        fileobj = io.StringIO(u'{"group":"group1","offsets":[1],"topic":"topic1"}\n'
+                              u'{"group":"group2","offsets":[2],"topic":"topic1"}\n'
+                              u'{"group":"group3","offsets":[3],"topic":"topic1"}\n')
+
+        results, errors = self.client.import_offsets(fileobj, groups=['group1', 'group3'], batch_size=1)
+        assert set(results.keys()) == set(['group1', 'group3'])
+        assert self.client._send_group_aware_requests.call_count == 2
+
+    def test_import_offsets_lookup_error(self):
+        self.setup_import_offsets(('group1', 'Empty'), ('group2', 'Empty'))
+        self.client.describe_groups.return_value[0]['group2'].coordinator = self.client.cluster.brokers[1]
+        default_send = self.client._send_group_aware_requests.side_effect
+
+        def send_requests(requests, errors, coordinators):
+            errors['group1'] = 15
+            return default_send(dict((group_name, request) for group_name, request in requests.items() if group_name != 'group1'))
+        self.client._send_group_aware_requests.side_effect = send_requests
+
+        fileobj = io.StringIO(u'{"group":"group1","offsets":[1],"topic":"topic1"}\n'
+                              u'{"group":"group2","offsets":[2],"topic":"topic1"}\n')
+        results, errors = self.client.import_offsets(fileobj)
+        assert results == {'group2': {'topic1': [0]}}
+        assert errors == {'group1': 15}
+        assert self.client._send_group_aware_requests.call_args[0][2] == {'group2': self.client.cluster.brokers[1]}
+
+    def test_import_offsets_bad_line(self):
+        self.setup_import_offsets(('group1', 'Empty'))
+        for line in (u'notjson\n', u'{"group":"group1","topic":"topic1"}\n', u'{"group":"group1","offsets":["a"],"topic":"topic1"}\n'):
+            self.assertRaises(ValueError, self.client.import_offsets, io.StringIO(line))
+        self.client._send_group_aware_requests.assert_not_called()
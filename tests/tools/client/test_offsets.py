@@ -4,7 +4,7 @@ from mock import MagicMock
 from tests.tools.client.fixtures import list_offset, list_offset_error, topic_metadata, offset_commit_response
 
 from kafka.tools.client import Client
-from kafka.tools.exceptions import ConnectionError, OffsetError
+from kafka.tools.exceptions import ConnectionError
 from kafka.tools.models.topic import TopicOffsets
 from kafka.tools.protocol.requests.offset_commit_v2 import OffsetCommitV2Request
 
@@ -60,10 +60,60 @@ class OffsetTests(unittest.TestCase):
         self.client.cluster.brokers[1].send.side_effect = ConnectionError
         self.assertRaises(ConnectionError, self.client._send_list_offsets_to_brokers, self.list_offset_request)
 
-    def test_send_list_offsets_to_brokers_offsets_error(self):
+    def test_send_list_offsets_to_brokers_retry(self):
+        # NOT_LEADER_FOR_PARTITION on one partition refreshes the metadata for the topic and resends only that partition
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client.cluster.brokers[1].send = MagicMock()
+        self.client.cluster.brokers[1].send.side_effect = [(1, self.list_offset_error), (2, self.list_offset)]
+
+        val = self.client._send_list_offsets_to_brokers(self.list_offset_request)
+        assert val['topic1'].partitions == [4829, 8904]
+        assert val['topic1'].errors == {}
+
+        self.client._maybe_update_metadata_for_topics.assert_called_once_with(['topic1'])
+        assert self.client.cluster.topics['topic1']._last_updated == 0
+        req = self.client.cluster.brokers[1].send.call_args[0][0]
+        assert req['topics'] == [{'topic': 'topic1', 'partitions': [{'partition': 0, 'timestamp': Client.OFFSET_LATEST}]}]
+
+    def test_send_list_offsets_to_brokers_retries_exhausted(self):
+        self.client._maybe_update_metadata_for_topics = MagicMock()
         self.client.cluster.brokers[1].send = MagicMock()
         self.client.cluster.brokers[1].send.return_value = (1, self.list_offset_error)
-        self.assertRaises(OffsetError, self.client._send_list_offsets_to_brokers, self.list_offset_request)
+
+        # The error is reported in the result instead of being raised
+        val = self.client._send_list_offsets_to_brokers(self.list_offset_request)
+        assert val['topic1'].partitions == [-1, 8904]
+        assert val['topic1'].errors == {0: 6}
+        assert self.client.cluster.brokers[1].send.call_count == 1 + self.client.configuration.num_retries
+
+    def test_send_list_offsets_to_brokers_not_retriable(self):
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client.cluster.brokers[1].send = MagicMock()
+        self.client.cluster.brokers[1].send.return_value = (1, list_offset_error(29))
+
+        val = self.client._send_list_offsets_to_brokers(self.list_offset_request)
+        assert val['topic1'].errors == {0: 29}
+        self.client.cluster.brokers[1].send.assert_called_once()
+        self.client._maybe_update_metadata_for_topics.assert_not_called()
+
+    def test_retry_list_offsets_backoff(self):
+        # Errors that don't need new metadata wait for the backoff instead
+        self.client.configuration.retry_backoff = 0.01
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client.cluster.brokers[1].send = MagicMock()
+        self.client.cluster.brokers[1].send.return_value = (1, self.list_offset)
+
+        offsets = self.client._parse_list_offsets_responses({1: list_offset_error(7)})
+        val = self.client._retry_list_offsets(offsets, lambda topic_name, partition: Client.OFFSET_EARLIEST)
+        assert val['topic1'].partitions == [4829, 8904]
+        self.client._maybe_update_metadata_for_topics.assert_not_called()
+        req = self.client.cluster.brokers[1].send.call_args[0][0]
+        assert req['topics'][0]['partitions'] == [{'partition': 0, 'timestamp': Client.OFFSET_EARLIEST}]
+
+    def test_parse_list_offsets_responses_topic_list(self):
+        assert self.client._parse_list_offsets_responses({1: self.list_offset}, ['othertopic']) == {}
+        val = self.client._parse_list_offsets_responses({1: self.list_offset}, ['topic1'])
+        assert val['topic1'].partitions == [4829, 8904]
 
     def test_send_set_offset_request_bad_offsets(self):
         self.assertRaises(TypeError, self.client._send_set_offset_request, 'testgroup', ['notatopicoffsets'])
@@ -1,11 +1,24 @@
+import time
 import unittest
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Event
 from mock import patch, MagicMock
 
-from tests.tools.client.fixtures import group_coordinator, group_coordinator_error
+from tests.tools.client.fixtures import group_coordinator, group_coordinator_error, offset_commit_response, offset_fetch, topic_metadata
 
 from kafka.tools.client import Client
 from kafka.tools.exceptions import GroupError, ConnectionError
 from kafka.tools.models.broker import Broker
+from kafka.tools.models.group import Group
+
+
+def resolved_future(response=None, exception=None):
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result((1, response))
+    return future
 
 
 class SendHelperTests(unittest.TestCase):
@@ -53,6 +66,308 @@ class SendHelperTests(unittest.TestCase):
         self.client._send_any_broker.return_value = self.coordinator_error
         self.assertRaises(GroupError, self.client._send_group_aware_request, 'testgroup', 'fakerequest')
 
+    def add_cached_group(self, group_name, coordinator):
+        self.client.configuration.coordinator_cache_ttl = 60
+        group = Group(group_name)
+        group.coordinator = coordinator
+        group._coordinator_updated = time.time()
+        self.client.cluster.add_group(group)
+
+    def test_send_group_aware_request_cached(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send = MagicMock()
+        broker1.send.return_value = (1, 'fakeresponse')
+        self.client.cluster.add_broker(broker1)
+        self.add_cached_group('testgroup', broker1)
+        self.client._send_any_broker = MagicMock()
+
+        self.client.configuration.coordinator_cache_ttl = None
+        assert self.client._cached_coordinator('testgroup') is None
+
+        self.client.configuration.coordinator_cache_ttl = 60
+        self.client._coordinator_moved = MagicMock()
+        self.client._coordinator_moved.return_value = False
+        assert self.client._send_group_aware_request('testgroup', 'fakerequest') == 'fakeresponse'
+        self.client._send_any_broker.assert_not_called()
+        broker1.send.assert_called_once_with('fakerequest')
+
+    def test_send_group_aware_request_cache_expired(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send = MagicMock()
+        broker1.send.return_value = (1, offset_fetch())
+        self.client.cluster.add_broker(broker1)
+        self.add_cached_group('testgroup', broker1)
+        self.client.cluster.groups['testgroup']._coordinator_updated = time.time() - 120
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.group_coordinator
+
+        self.client._send_group_aware_request('testgroup', 'fakerequest')
+        self.client._send_any_broker.assert_called_once()
+        assert self.client._cached_coordinator('testgroup') == broker1
+
+    def test_send_group_aware_request_not_coordinator(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send = MagicMock()
+        broker1.send.side_effect = [(1, offset_commit_response()), (2, offset_fetch())]
+        self.client.cluster.add_broker(broker1)
+        self.add_cached_group('testgroup', broker1)
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.group_coordinator
+
+        # The cached coordinator says it is not the coordinator, so it is looked up and the request is sent again
+        val = self.client._send_group_aware_request('testgroup', 'fakerequest')
+        assert val.error_codes() == set([0])
+        self.client._send_any_broker.assert_called_once()
+        assert broker1.send.call_count == 2
+
+    def test_send_group_aware_request_not_coordinator_after_lookup(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send = MagicMock()
+        broker1.send.return_value = (1, offset_commit_response())
+        self.client.cluster.add_broker(broker1)
+        self.client.configuration.coordinator_cache_ttl = 60
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.group_coordinator
+
+        # The error is returned to the caller, but the coordinator is not cached
+        self.client._send_group_aware_request('testgroup', 'fakerequest')
+        broker1.send.assert_called_once()
+        assert self.client._cached_coordinator('testgroup') is None
+
+    def test_send_group_aware_request_cached_connection_error(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send = MagicMock()
+        broker1.send.side_effect = [ConnectionError, (2, offset_fetch())]
+        self.client.cluster.add_broker(broker1)
+        self.add_cached_group('testgroup', broker1)
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.group_coordinator
+
+        self.client._send_group_aware_request('testgroup', 'fakerequest')
+        self.client._send_any_broker.assert_called_once()
+        assert broker1.send.call_count == 2
+
+    def test_send_group_aware_request_connection_error(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send = MagicMock()
+        broker1.send.side_effect = ConnectionError
+        self.client.cluster.add_broker(broker1)
+        self.client.configuration.coordinator_cache_ttl = 60
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.group_coordinator
+
+        self.assertRaises(ConnectionError, self.client._send_group_aware_request, 'testgroup', 'fakerequest')
+        assert self.client._cached_coordinator('testgroup') is None
+
+    def test_send_pipelined(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send_async = MagicMock()
+        broker1.send_async.side_effect = [resolved_future('response1'), resolved_future('response2')]
+        broker2 = Broker('host2.example.com', id=101, port=8032)
+        broker2.send_async = MagicMock()
+        broker2.send_async.return_value = resolved_future('response3')
+        self.client.cluster.add_broker(broker1)
+        self.client.cluster.add_broker(broker2)
+
+        val = self.client._send_pipelined([(1, 'request1'), (101, 'request3'), (1, 'request2')])
+        assert val == ['response1', 'response3', 'response2']
+        assert broker1.send_async.call_count == 2
+        broker2.send_async.assert_called_once_with('request3')
+
+    def test_send_pipelined_retry(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send_async = MagicMock()
+        broker1.send_async.side_effect = [resolved_future('response1'), resolved_future(exception=ConnectionError())]
+        broker1.send = MagicMock()
+        broker1.send.return_value = (2, 'response2')
+        self.client.cluster.add_broker(broker1)
+
+        val = self.client._send_pipelined([(1, 'request1'), (1, 'request2')])
+        assert val == ['response1', 'response2']
+        broker1.send.assert_called_once_with('request2')
+
+    def test_send_pipelined_brokers_independent(self):
+        # The second request to broker 1 waits for a slot until broker 101 has been sent to, so it must not hold it up
+        sent = Event()
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send_async = MagicMock()
+        broker1.send_async.side_effect = lambda request: resolved_future(request == 'request2' and sent.wait(5))
+        broker2 = Broker('host2.example.com', id=101, port=8032)
+        broker2.send_async = MagicMock()
+        broker2.send_async.side_effect = lambda request: sent.set() or resolved_future('response3')
+        self.client.cluster.add_broker(broker1)
+        self.client.cluster.add_broker(broker2)
+
+        val = self.client._send_pipelined([(1, 'request1'), (1, 'request2'), (101, 'request3')])
+        assert val == [False, True, 'response3']
+
+    def test_send_pipelined_single(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send = MagicMock()
+        broker1.send.return_value = (1, 'response1')
+        broker1.send_async = MagicMock()
+        self.client.cluster.add_broker(broker1)
+
+        assert self.client._send_pipelined([(1, 'request1')]) == ['response1']
+        broker1.send_async.assert_not_called()
+
+    def test_send_group_aware_requests(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send_async = MagicMock()
+        broker1.send_async.side_effect = [resolved_future(self.group_coordinator), resolved_future(self.group_coordinator),
+                                          resolved_future('response1'), resolved_future('response2')]
+        self.client.cluster.add_broker(broker1)
+
+        val = self.client._send_group_aware_requests({'group1': 'request1', 'group2': 'request2'})
+        assert sorted(val.values()) == ['response1', 'response2']
+        assert self.client.cluster.groups['group1'].coordinator == broker1
+        assert self.client.cluster.groups['group2'].coordinator == broker1
+        assert broker1.send_async.call_count == 4
+
+    def test_send_group_aware_requests_cached(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send_async = MagicMock()
+        broker1.send_async.side_effect = [resolved_future(offset_commit_response()), resolved_future(offset_fetch())]
+        broker1.send = MagicMock()
+        broker1.send.side_effect = [(1, self.group_coordinator), (2, offset_fetch())]
+        self.client.cluster.add_broker(broker1)
+        self.add_cached_group('group1', broker1)
+        self.add_cached_group('group2', broker1)
+
+        # Only group1, which went to a coordinator that has moved, is looked up and sent again
+        val = self.client._send_group_aware_requests({'group1': 'request1', 'group2': 'request2'})
+        assert val['group1'].error_codes() == set([0])
+        assert val['group2'].error_codes() == set([0])
+        assert broker1.send.call_count == 2
+        assert broker1.send.call_args_list[0][0][0]['group_id'] == 'group1'
+        broker1.send.assert_called_with('request1')
+
+    def test_send_group_aware_requests_known_coordinators(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send_async = MagicMock()
+        broker1.send_async.side_effect = [resolved_future(offset_commit_response()), resolved_future(offset_fetch())]
+        broker1.send = MagicMock()
+        broker1.send.side_effect = [(1, self.group_coordinator), (2, offset_fetch())]
+        self.client.cluster.add_broker(broker1)
+
+        # The coordinators are used without coordinator_cache_ttl set, and a group whose coordinator moved is looked up
+        val = self.client._send_group_aware_requests({'group1': 'request1', 'group2': 'request2'}, coordinators={'group1': broker1, 'group2': broker1})
+        assert val['group1'].error_codes() == set([0])
+        assert val['group2'].error_codes() == set([0])
+        assert broker1.send.call_count == 2
+        assert broker1.send.call_args_list[0][0][0]['group_id'] == 'group1'
+
+    def test_send_group_aware_requests_cached_connection_error(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        self.client.cluster.add_broker(broker1)
+        self.add_cached_group('group1', broker1)
+        self.add_cached_group('group2', broker1)
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.group_coordinator
+
+        # Both groups are cached. Only the request for group1 fails, so only group1 is looked up again and resent, and
+        # the response for group2 is kept
+        self.client._send_pipelined = MagicMock()
+        response1 = offset_fetch()
+        response2 = offset_fetch()
+        self.client._send_pipelined.side_effect = [[None, response2], [response1]]
+
+        val = self.client._send_group_aware_requests({'group1': 'request1', 'group2': 'request2'})
+        assert val == {'group1': response1, 'group2': response2}
+        self.client._send_any_broker.assert_called_once()
+        assert self.client._send_any_broker.call_args[0][0]['group_id'] == 'group1'
+        assert self.client._send_pipelined.call_args_list[1][0][0] == [(1, 'request1')]
+
+    def test_send_group_aware_requests_connection_error(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        self.client.cluster.add_broker(broker1)
+        self.client.configuration.coordinator_cache_ttl = 60
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.group_coordinator
+        self.client._send_pipelined = MagicMock()
+        self.client._send_pipelined.return_value = [None]
+
+        self.assertRaises(ConnectionError, self.client._send_group_aware_requests, {'group1': 'request1'})
+        assert self.client._cached_coordinator('group1') is None
+
+    def test_send_group_aware_requests_connection_error_errors(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        self.client.cluster.add_broker(broker1)
+        self.client._send_any_broker_pipelined = MagicMock()
+        self.client._send_any_broker_pipelined.return_value = [self.group_coordinator, self.group_coordinator]
+        self.client._send_pipelined = MagicMock()
+        self.client._send_pipelined.return_value = ['response1', None]
+
+        # The coordinator for group2 was just looked up, so the failure is reported instead of looking it up again
+        errors = {}
+        val = self.client._send_group_aware_requests({'group1': 'request1', 'group2': 'request2'}, errors)
+        assert val == {'group1': 'response1'}
+        assert errors == {'group2': -1}
+        self.client._send_pipelined.assert_called_once()
+
+    def test_send_any_broker_pipelined_spread(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker2 = Broker('host2.example.com', id=101, port=8032)
+        self.client.cluster.add_broker(broker1)
+        self.client.cluster.add_broker(broker2)
+        self.client._send_pipelined = MagicMock()
+        self.client._send_pipelined.return_value = ['response1', 'response2', 'response3', 'response4']
+
+        val = self.client._send_any_broker_pipelined(['request1', 'request2', 'request3', 'request4'])
+        assert val == ['response1', 'response2', 'response3', 'response4']
+        requests = self.client._send_pipelined.call_args[0][0]
+        assert [request for broker_id, request in requests] == ['request1', 'request2', 'request3', 'request4']
+        assert sorted(broker_id for broker_id, request in requests) == [1, 1, 101, 101]
+
+    def test_prefetch_coordinators(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        self.client.cluster.add_broker(broker1)
+        self.add_cached_group('group1', broker1)
+        self.client._connected = True
+        self.client._send_any_broker_pipelined = MagicMock()
+        self.client._send_any_broker_pipelined.return_value = [self.group_coordinator, self.coordinator_error]
+
+        val = self.client.prefetch_coordinators(['group1', 'group2', 'group3'])
+        assert val == {'group1': broker1, 'group2': broker1}
+        requests = self.client._send_any_broker_pipelined.call_args[0][0]
+        assert [request['group_id'] for request in requests] == ['group2', 'group3']
+        assert self.client._cached_coordinator('group2') == broker1
+        assert self.client._cached_coordinator('group3') is None
+
+    def test_prefetch_coordinators_all_cached(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        self.add_cached_group('group1', broker1)
+        self.client._connected = True
+        self.client._send_any_broker_pipelined = MagicMock()
+        assert self.client.prefetch_coordinators(['group1']) == {'group1': broker1}
+        self.client._send_any_broker_pipelined.assert_not_called()
+
+    def test_send_group_aware_requests_error(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send_async = MagicMock()
+        broker1.send_async.side_effect = [resolved_future(self.group_coordinator), resolved_future(self.coordinator_error)]
+        self.client.cluster.add_broker(broker1)
+
+        self.assertRaises(GroupError, self.client._send_group_aware_requests, {'group1': 'request1', 'group2': 'request2'})
+
+    def test_send_group_aware_requests_lookup_errors(self):
+        broker1 = Broker('host1.example.com', id=1, port=8031)
+        broker1.send_async = MagicMock()
+        broker1.send_async.side_effect = [resolved_future(self.group_coordinator), resolved_future(self.coordinator_error)]
+        broker1.send = MagicMock()
+        broker1.send.return_value = (1, 'response1')
+        self.client.cluster.add_broker(broker1)
+
+        # The group whose coordinator can't be found is reported, and the other group's request is still sent
+        errors = {}
+        val = self.client._send_group_aware_requests({'group1': 'request1', 'group2': 'request2'}, errors)
+        assert val == {'group1': 'response1'}
+        assert errors == {'group2': 15}
+        broker1.send.assert_called_once_with('request1')
+
+    def test_send_any_broker_pipelined_no_brokers(self):
+        self.assertRaises(ConnectionError, self.client._send_any_broker_pipelined, ['request1', 'request2'])
+
     def test_send_all_brokers(self):
         broker1 = Broker('host1.example.com', id=1, port=8031)
         broker1.rack = 'rack1'
@@ -89,6 +404,57 @@ class SendHelperTests(unittest.TestCase):
         assert val[1] == 'fakeresponse'
         assert val[101] is None
 
+    def test_send_some_brokers_reuses_executor(self):
+        self.client._send_to_broker = MagicMock()
+        self.client._send_to_broker.return_value = 'fakeresponse'
+        self.client._send_some_brokers({1: 'fakerequest'})
+        executor = self.client._executor
+        self.client._send_some_brokers({1: 'fakerequest'})
+        assert self.client._executor is executor
+
+    def test_send_some_brokers_timeout(self):
+        release = Event()
+        self.client._send_to_broker = MagicMock()
+        self.client._send_to_broker.side_effect = lambda broker_id, request: release.wait() if broker_id == 101 else 'fakeresponse'
+
+        val = self.client._send_some_brokers({1: 'fakerequest', 101: 'fakerequest'}, timeout=0.05)
+        assert val == {1: 'fakeresponse', 101: None}
+        self.assertRaises(ConnectionError, self.client._send_some_brokers, {101: 'fakerequest'}, ignore_errors=False, timeout=0.05)
+        release.set()
+
+    @patch('kafka.tools.client.BrokerMultiplexer')
+    def test_send_some_brokers_multiplexed(self, mock_multiplexer):
+        self.client.configuration.multiplex_broker_io = True
+        self.client.cluster.add_broker(Broker('host1.example.com', id=1, port=8031))
+        self.client.cluster.add_broker(Broker('host2.example.com', id=101, port=8032))
+        mock_multiplexer.return_value.send.return_value = {1: ('fakeresponse', None), 101: (None, ConnectionError())}
+        self.client._send_to_broker = MagicMock()
+        self.client._send_to_broker.return_value = 'retriedresponse'
+
+        val = self.client._send_some_brokers({1: 'fakerequest', 101: 'fakerequest'})
+        requests = mock_multiplexer.return_value.send.call_args[0][0]
+        assert requests == {1: (self.client.cluster.brokers[1], 'fakerequest'), 101: (self.client.cluster.brokers[101], 'fakerequest')}
+
+        # Only the broker that failed is sent to again
+        self.client._send_to_broker.assert_called_once_with(101, 'fakerequest')
+        assert val == {1: 'fakeresponse', 101: 'retriedresponse'}
+
+    @patch('kafka.tools.client.BrokerMultiplexer')
+    def test_send_some_brokers_multiplexed_timeout(self, mock_multiplexer):
+        self.client.configuration.multiplex_broker_io = True
+        self.client.cluster.add_broker(Broker('host1.example.com', id=1, port=8031))
+        mock_multiplexer.return_value.send.return_value = {1: (None, FutureTimeoutError())}
+        self.client._send_to_broker = MagicMock()
+
+        assert self.client._send_some_brokers({1: 'fakerequest'}, timeout=1.0) == {1: None}
+        mock_multiplexer.return_value.send.assert_called_once_with({1: (self.client.cluster.brokers[1], 'fakerequest')}, timeout=1.0)
+        self.client._send_to_broker.assert_not_called()
+
+    def test_send_some_brokers_other_error(self):
+        self.client._send_to_broker = MagicMock()
+        self.client._send_to_broker.side_effect = ValueError
+        self.assertRaises(ValueError, self.client._send_some_brokers, {1: 'fakerequest'})
+
     @patch('kafka.tools.client.shuffle', lambda x: sorted(x))
     def test_send_any_broker(self):
         broker1 = Broker('host1.example.com', id=1, port=8031)
@@ -143,3 +509,70 @@ class SendHelperTests(unittest.TestCase):
 
     def test_raise_if_not_connected(self):
         self.assertRaises(ConnectionError, self.client._raise_if_not_connected)
+
+    def setup_send_to_leaders(self, *responses):
+        self.client._connected = True
+        self.client._update_from_metadata(topic_metadata())
+        self.client._maybe_update_metadata_for_topics = MagicMock()
+        self.client._send_some_brokers = MagicMock()
+        self.client._send_some_brokers.side_effect = responses
+        self.client.configuration.retry_backoff = 0.001
+
+    def test_send_to_leaders(self):
+        self.setup_send_to_leaders({1: 'response1', 101: 'response101'})
+        parsed = {'response1': {('topic1', 0): ('result0', 0)}, 'response101': {('topic1', 1): ('result1', 0)}}
+
+        results, errors = self.client.send_to_leaders({('topic1', 0): 10, ('topic1', 1): 20},
+                                                      lambda items: sorted(items.items()),
+                                                      lambda response: parsed[response])
+        assert results == {('topic1', 0): 'result0', ('topic1', 1): 'result1'}
+        assert errors == {}
+
+        # One request is built for each leader, with the items it leads
+        self.client._maybe_update_metadata_for_topics.assert_called_once_with(['topic1'])
+        requests = self.client._send_some_brokers.call_args[0][0]
+        assert requests == {1: [(('topic1', 0), 10)], 101: [(('topic1', 1), 20)]}
+
+    def test_send_to_leaders_leadership_moved(self):
+        self.setup_send_to_leaders({1: 'response1', 101: 'response101'}, {101: 'retry101'})
+        parsed = {'response1': {('topic1', 0): (None, 6)},
+                  'response101': {('topic1', 1): ('result1', 0)},
+                  'retry101': {('topic1', 0): ('result0', 0)}}
+
+        def move_leader(topics):
+            # The leader only moves for the refresh after the error
+            if self.client._maybe_update_metadata_for_topics.call_count == 2:
+                self.client.cluster.topics['topic1'].partitions[0].leader = self.client.cluster.brokers[101]
+        self.client._maybe_update_metadata_for_topics.side_effect = move_leader
+
+        results, errors = self.client.send_to_leaders([('topic1', 0), ('topic1', 1)], lambda items: list(items), lambda response: parsed[response])
+        assert results == {('topic1', 0): 'result0', ('topic1', 1): 'result1'}
+        assert errors == {}
+
+        # Only the failed item is sent again, to the new leader
+        assert self.client._maybe_update_metadata_for_topics.call_args_list[1][0][0] == ['topic1']
+        assert self.client._send_some_brokers.call_args[0][0] == {101: [('topic1', 0)]}
+
+    def test_send_to_leaders_errors(self):
+        self.client.configuration.num_retries = 1
+        self.setup_send_to_leaders({1: None, 101: 'response101'}, {1: None})
+
+        results, errors = self.client.send_to_leaders([('topic1', 0), ('topic1', 1), ('topic1', 2)], lambda items: list(items),
+                                                      lambda response: {('topic1', 1): (None, 29)})
+        assert results == {}
+        assert errors == {('topic1', 0): 13, ('topic1', 1): 29, ('topic1', 2): 3}
+
+        # The unknown partition is retried (with a metadata refresh), and the failed broker after a backoff. The
+        # non-retriable error is not retried
+        assert self.client._send_some_brokers.call_count == 2
+        assert self.client._send_some_brokers.call_args[0][0] == {1: [('topic1', 0)]}
+
+    def test_send_to_leaders_no_leader(self):
+        self.client.configuration.num_retries = 1
+        self.setup_send_to_leaders()
+        self.client.cluster.topics['topic1'].partitions[0].leader = None
+
+        results, errors = self.client.send_to_leaders([('topic1', 0), ('nonexistent', 0), ('topic1', -1)], lambda items: list(items),
+                                                      lambda response: {})
+        assert errors == {('topic1', 0): 5, ('nonexistent', 0): 3, ('topic1', -1): 3}
+        self.client._send_some_brokers.assert_not_called()
@@ -1,11 +1,12 @@
 import time
 import unittest
+from threading import Thread
 from mock import MagicMock
 
-from tests.tools.client.fixtures import topic_metadata
+from tests.tools.client.fixtures import topic_metadata, topic_metadata_error
 
 from kafka.tools.client import Client
-from kafka.tools.exceptions import TopicError
+from kafka.tools.exceptions import ConnectionError, TopicError
 from kafka.tools.models.broker import Broker
 from kafka.tools.models.topic import Topic
 from kafka.tools.protocol.requests.topic_metadata_v1 import TopicMetadataV1Request
@@ -126,13 +127,82 @@ class TopicsTests(unittest.TestCase):
         assert req['topics'][0] == 'topic1'
         assert req['topics'][1] == 'topic2'
 
+    def start_metadata_batch(self, topics, results):
+        # Start a caller in the background, and wait until it is collecting topics for a batch
+        def fetch():
+            try:
+                results.append(self.client._fetch_topic_metadata(topics))
+            except Exception as e:
+                results.append(e)
+        thread = Thread(target=fetch)
+        thread.daemon = True
+        thread.start()
+
+        for i in range(500):
+            if len(self.client._batches) > 0:
+                break
+            time.sleep(0.01)
+        return thread
+
+    def test_fetch_topic_metadata_batched(self):
+        self.client.configuration.metadata_batch_window = 0.5
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.metadata_response
+
+        results = []
+        thread = self.start_metadata_batch(['topic1'], results)
+        val = self.client._fetch_topic_metadata(['topic2', 'topic1'])
+        thread.join(5)
+
+        # Both callers get the same response, from a single request for all the topics
+        self.client._send_any_broker.assert_called_once()
+        assert self.client._send_any_broker.call_args[0][0]['topics'] == ['topic1', 'topic2']
+        assert val is self.metadata_response
+        assert results == [self.metadata_response]
+        assert 'topic1' in self.client.cluster.topics
+        assert self.client._batches == {}
+
+    def test_fetch_topic_metadata_batched_error(self):
+        self.client.configuration.metadata_batch_window = 0.5
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.side_effect = ConnectionError('broken')
+
+        results = []
+        thread = self.start_metadata_batch(['topic1'], results)
+        self.assertRaises(ConnectionError, self.client._fetch_topic_metadata, ['topic2'])
+        thread.join(5)
+
+        self.client._send_any_broker.assert_called_once()
+        assert isinstance(results[0], ConnectionError)
+
+    def test_fetch_topic_metadata_no_window(self):
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = self.metadata_response
+        self.client._fetch_topic_metadata(['topic1'])
+        self.client._fetch_topic_metadata(['topic1'])
+        assert self.client._send_any_broker.call_count == 2
+
+    def test_fetch_topic_metadata_check_errors(self):
+        self.client._send_any_broker = MagicMock()
+        self.client._send_any_broker.return_value = topic_metadata_error()
+
+        # Topics with errors are not added when the caller checks the errors itself
+        self.client._fetch_topic_metadata(['topic1'], check_errors=True)
+        assert 'topic1' not in self.client.cluster.topics
+        assert 1 in self.client.cluster.brokers
+
+    def test_update_topics_from_metadata_exclude(self):
+        self.client._update_brokers_from_metadata(self.metadata_response)
+        self.client._update_topics_from_metadata(self.metadata_response, exclude=set(['topic1']))
+        assert 'topic1' not in self.client.cluster.topics
+
     def test_update_from_metadata(self):
         self.client._update_brokers_from_metadata = MagicMock()
         self.client._update_topics_from_metadata = MagicMock()
 
         self.client._update_from_metadata('fake_metadata')
         self.client._update_brokers_from_metadata.assert_called_once_with('fake_metadata')
-        self.client._update_topics_from_metadata.assert_called_once_with('fake_metadata', delete=False)
+        self.client._update_topics_from_metadata.assert_called_once_with('fake_metadata', delete=False, exclude=())
 
     def test_update_topics_from_metadata_create(self):
         # Don't want to test the broker update code here
@@ -238,3 +308,80 @@ class TopicsTests(unittest.TestCase):
     def test_map_topic_partitions_to_brokers_nonexistent(self):
         self.client._update_from_metadata(self.metadata_response)
         self.assertRaises(TopicError, self.client._map_topic_partitions_to_brokers, ['nosuchtopic'])
+
+    def test_map_topic_partitions_to_brokers_no_leader(self):
+        self.client._update_from_metadata(self.metadata_response)
+        self.client.cluster.topics['topic1'].partitions[1].leader = None
+        self.assertRaises(TopicError, self.client._map_topic_partitions_to_brokers, ['topic1'])
+
+    def test_update_from_metadata_indexes_leaders(self):
+        self.client._update_from_metadata(self.metadata_response)
+        assert self.client.cluster.leader_for('topic1', 0) == self.client.cluster.brokers[1]
+        assert self.client.cluster.partitions_led_by(101) == set([('topic1', 1)])
+        assert self.client.cluster.partitions_replicated_on(1) == set([('topic1', 0), ('topic1', 1)])
+
+    def test_update_topics_from_metadata_deltas(self):
+        self.client._update_brokers_from_metadata(self.metadata_response)
+        deltas = self.client._update_topics_from_metadata(self.metadata_response)
+        assert sorted((delta.topic, delta.partition, delta.old_state) for delta in deltas) == [('topic1', 0, None), ('topic1', 1, None)]
+        assert self.client.cluster.topics['topic1'].partitions[0].metadata_state() == (1, (101, 1), (101, 1))
+        assert [broker.id for broker in self.client.cluster.topics['topic1'].partitions[1].isr] == [1, 101]
+
+        # Nothing changed, so no partitions are touched
+        self.client._update_or_add_partition = MagicMock()
+        assert self.client._update_topics_from_metadata(self.metadata_response) == []
+        self.client._update_or_add_partition.assert_not_called()
+
+    def test_update_topics_from_metadata_deltas_changed(self):
+        self.client._update_from_metadata(self.metadata_response)
+        self.metadata_response['topics'][0]['partitions'][1]['leader'] = 1
+        self.metadata_response['topics'][0]['partitions'][1]['isrs'] = [1]
+
+        deltas = self.client._update_topics_from_metadata(self.metadata_response)
+        assert len(deltas) == 1
+        assert (deltas[0].topic, deltas[0].partition) == ('topic1', 1)
+        assert deltas[0].old_state == (101, (101, 1), (1, 101))
+        assert deltas[0].new_state == (1, (101, 1), (1, ))
+        assert deltas[0].leader_changed and deltas[0].isr_changed and not deltas[0].replicas_changed
+        assert self.client.cluster.leader_for('topic1', 1) == self.client.cluster.brokers[1]
+
+    def test_update_topics_from_metadata_deltas_changed_elsewhere(self):
+        # A partition that is changed outside of a metadata update gets the metadata state applied again
+        self.client._update_from_metadata(self.metadata_response)
+        partition = self.client.cluster.topics['topic1'].partitions[0]
+        partition.remove_replica(self.client.cluster.brokers[1])
+
+        deltas = self.client._update_topics_from_metadata(self.metadata_response)
+        assert len(deltas) == 1
+        assert deltas[0].old_state == (1, (101, ), (101, 1))
+        assert [broker.id for broker in partition.replicas] == [101, 1]
+
+    def test_update_topics_from_metadata_deltas_removed(self):
+        self.client._update_from_metadata(self.metadata_response)
+        self.metadata_response['topics'][0]['partitions'].pop()
+        deltas = self.client._update_topics_from_metadata(self.metadata_response)
+        assert [(delta.partition, delta.new_state) for delta in deltas] == [(1, None)]
+
+        self.metadata_response['topics'].pop()
+        deltas = self.client._update_topics_from_metadata(self.metadata_response, delete=True)
+        assert [(delta.partition, delta.old_state, delta.new_state) for delta in deltas] == [(0, (1, (101, 1), (101, 1)), None)]
+        assert 'topic1' not in self.client.cluster.topics
+
+    def test_update_topics_from_metadata_no_leader(self):
+        self.metadata_response['topics'][0]['partitions'][0]['leader'] = -1
+        self.client._update_from_metadata(self.metadata_response)
+        assert self.client.cluster.topics['topic1'].partitions[0].leader is None
+        assert self.client.cluster.topics['topic1'].partitions[0].metadata_state()[0] == -1
+
+    def test_metadata_listener(self):
+        calls = []
+        self.client.add_metadata_listener(lambda deltas: 1 / 0)
+        self.client.add_metadata_listener(calls.append)
+
+        deltas = self.client._update_from_metadata(self.metadata_response)
+        assert calls == [deltas]
+        assert len(deltas) == 2
+
+        # Listeners are not called when nothing changed
+        self.client._update_from_metadata(self.metadata_response)
+        assert len(calls) == 1
@@ -1,21 +1,69 @@
-import collections
 import unittest
 import socket
+import ssl
+import struct
+from threading import Thread
 from mock import MagicMock, call, patch
 
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+
 from kafka.tools.configuration import ClientConfiguration
-from kafka.tools.exceptions import ConfigurationException, ConnectionError
+from kafka.tools.exceptions import ConfigurationException, ConnectionError, RequestTooLargeError
 from kafka.tools.models.broker import Broker
 from kafka.tools.models.topic import Topic
 from kafka.tools.protocol.requests.api_versions_v0 import ApiVersionsV0Request
+from kafka.tools.protocol.requests.offset_fetch_v1 import OffsetFetchV1Request
+from kafka.tools.protocol.requests.sync_group_v0 import SyncGroupV0Request
+from kafka.tools.protocol.requests.topic_metadata_v1 import TopicMetadataV1Request
 from kafka.tools.protocol.responses.api_versions_v0 import ApiVersionsV0Response
-from kafka.tools.protocol.types.bytebuffer import ByteBuffer
+
+
+def recv_into_chunks(chunks):
+    """Return a side effect for socket.recv_into that returns one chunk of data per call"""
+    chunks = list(chunks)
+
+    def recv_into(view, nbytes):
+        chunk = chunks.pop(0)
+        view[:len(chunk)] = chunk
+        return len(chunk)
+    return recv_into
+
+
+def sendmsg_recorder(sent, max_bytes=None):
+    """Return a side effect for socket.sendmsg that records the data sent, sending at most max_bytes per call"""
+    def sendmsg(segments):
+        data = b''.join(segment.tobytes() for segment in segments)[:max_bytes]
+        sent.append(data)
+        return len(data)
+    return sendmsg
+
+
+def read_request(sock):
+    """Read a single request from the server end of a socket pair, returning the correlation ID"""
+    def recv_exactly(num_bytes):
+        data = b''
+        while len(data) < num_bytes:
+            data += sock.recv(num_bytes - len(data))
+        return data
+
+    data = recv_exactly(struct.unpack('>i', recv_exactly(4))[0])
+    return struct.unpack('>i', data[4:8])[0]
+
+
+def api_versions_response(correlation_id):
+    """Encode an empty ApiVersionsV0 response, including the size"""
+    return struct.pack('>iihi', 10, correlation_id, 0, 0)
 
 
 class BrokerTests(unittest.TestCase):
     def setUp(self):
         self.configuration = ClientConfiguration(num_retries=3, retry_backoff=0.5)
         self.mock_sock = MagicMock()
+        self.sent = []
+        self.mock_sock.sendmsg.side_effect = sendmsg_recorder(self.sent)
         self.broker = Broker('brokerhost1.example.com', id=1, sock=self.mock_sock, configuration=self.configuration)
 
     def add_partitions(self, pos, num):
@@ -140,6 +188,32 @@ class BrokerTests(unittest.TestCase):
         print(sock)
         assert sock == 'fakewrappedsocket'
 
+    @patch('kafka.tools.models.broker.socket.socket')
+    def test_broker_get_socket_resume_session(self, mock_socket):
+        mock_context = MagicMock()
+        mock_socket.return_value = 'fakesocket'
+
+        self.broker._get_socket(mock_context, session='fakesession')
+        mock_context.wrap_socket.assert_called_once_with('fakesocket', server_hostname='brokerhost1.example.com', session='fakesession')
+
+    def test_broker_connect_tls_session(self):
+        ssl_sock = MagicMock(spec=ssl.SSLSocket)
+        ssl_sock.session = 'fakesession'
+        ssl_sock.session_reused = False
+        self.broker._sock = None
+        self.broker._get_socket = MagicMock()
+        self.broker._get_socket.return_value = ssl_sock
+
+        self.broker.connect()
+        assert self.configuration.tls_sessions.get('brokerhost1.example.com', 9092) == 'fakesession'
+        assert self.configuration.tls_sessions.handshakes == 1
+
+        # The session is cached again on close, and used for the next connection
+        ssl_sock.session = 'newsession'
+        self.broker.close()
+        self.broker.connect()
+        self.broker._get_socket.assert_called_with(self.configuration.ssl_context, 'newsession')
+
     def test_broker_connect(self):
         self.broker.connect()
         self.mock_sock.connect.assert_called_once_with(('brokerhost1.example.com', 9092))
@@ -148,6 +222,68 @@ class BrokerTests(unittest.TestCase):
         self.mock_sock.connect.side_effect = socket.error
         self.assertRaises(ConnectionError, self.broker.connect)
 
+    def test_broker_connect_timeout(self):
+        self.configuration.connect_timeout = 2.5
+        self.broker.connect()
+        self.mock_sock.assert_has_calls([call.settimeout(2.5), call.connect(('brokerhost1.example.com', 9092)), call.settimeout(None)])
+
+    def test_broker_connect_error_new_socket(self):
+        self.broker._sock = None
+        self.broker._get_socket = MagicMock()
+        self.broker._get_socket.return_value = self.mock_sock
+        self.mock_sock.connect.side_effect = socket.timeout
+
+        # The failed socket is closed and never becomes the broker's socket
+        self.assertRaises(ConnectionError, self.broker.connect)
+        self.mock_sock.close.assert_called_once_with()
+        assert self.broker._sock is None
+
+    def test_broker_connect_if_needed(self):
+        self.broker.connect = MagicMock()
+        self.broker.connect_if_needed()
+        self.broker.connect.assert_not_called()
+
+        self.broker._sock = None
+        self.broker.connect_if_needed()
+        self.broker.connect.assert_called_once_with()
+
+    def test_broker_connect_negotiate_api_versions(self):
+        # ApiVersions response with OffsetFetch (API key 9) versions 0 to 2
+        self.configuration.api_version_negotiation = True
+        self.mock_sock.recv_into.side_effect = recv_into_chunks([b'\x00\x00\x00\x10\x00\x00\x00\x01',
+                                                                 b'\x00\x00\x00\x00\x00\x01\x00\x09\x00\x00\x00\x02'])
+        self.broker.connect()
+        assert self.broker.api_versions == {9: (0, 2)}
+
+        # The versions are only requested once
+        self.broker.connect()
+        self.mock_sock.sendmsg.assert_called_once()
+
+    def test_broker_connect_negotiate_not_configured(self):
+        self.broker.connect()
+        self.mock_sock.sendmsg.assert_not_called()
+        assert self.broker.api_versions is None
+
+    def test_broker_connect_negotiate_unsupported(self):
+        # Old brokers close the connection on an ApiVersions request, so the client reconnects without it
+        self.configuration.api_version_negotiation = True
+        self.mock_sock.recv_into.return_value = 0
+        new_sock = MagicMock()
+        self.broker._get_socket = MagicMock()
+        self.broker._get_socket.return_value = new_sock
+
+        self.broker.connect()
+        assert self.broker.api_versions == {}
+        self.mock_sock.close.assert_called_once_with()
+        new_sock.connect.assert_called_once_with(('brokerhost1.example.com', 9092))
+        assert self.broker._sock is new_sock
+
+    def test_broker_single_send_upgrades_request(self):
+        self.broker.api_versions = {9: (0, 3)}
+        self.mock_sock.recv_into.side_effect = socket.error
+        self.assertRaises(ConnectionError, self.broker._single_send, OffsetFetchV1Request({'group_id': 'testgroup', 'topics': []}))
+        assert struct.unpack('>hh', self.sent[0][4:8]) == (9, 3)
+
     def test_broker_close(self):
         self.broker.close()
         self.mock_sock.shutdown.assert_called_once()
@@ -159,28 +295,31 @@ class BrokerTests(unittest.TestCase):
         self.broker.close()
         self.mock_sock.close.assert_called_once()
 
-    @patch.object(Broker, '_read_bytes')
-    def test_broker_single_send(self, mock_read_bytes):
-        # recv is called to get the response size (first 4 bytes)
-        self.mock_sock.recv.return_value = b'\x00\x00\x00\x10'
+    def test_broker_close_twice(self):
+        self.broker.close()
+        self.broker.close()
+        self.mock_sock.close.assert_called_once()
+        assert self.broker._sock is None
 
-        # read_bytes returns the response payload, minus the response size
+    def test_broker_single_send(self):
+        # The response size (first 4 bytes), then the response payload
         # correlation_id (4), error (2), array of (api_key (2), min_version (2), max_version (2))
-        mock_read_bytes.return_value = b'\x00\x00\x00\x01\x00\x00\x00\x00\x00\x01\x00\x01\x01\x01\x02\x02'
+        self.mock_sock.recv_into.side_effect = recv_into_chunks([b'\x00\x00\x00\x10\x00\x00\x00\x01',
+                                                                 b'\x00\x00\x00\x00\x00\x01\x00\x01\x01\x01\x02\x02'])
 
         request = ApiVersionsV0Request({})
         (correlation_id, response) = self.broker._single_send(request)
 
         # Check that the request was encoded properly
-        self.mock_sock.sendall.assert_called_once_with(bytearray(b'\x00\x00\x00\x15\x00\x12\x00\x00\x00\x00\x00\x01\x00\x0bkafka-tools'))
-        self.mock_sock.recv.assert_called_once_with(4)
-        mock_read_bytes.assert_called_once_with(16)
+        self.mock_sock.sendmsg.assert_called_once()
+        assert self.sent == [b'\x00\x00\x00\x15\x00\x12\x00\x00\x00\x00\x00\x01\x00\x0bkafka-tools']
+        assert self.mock_sock.recv_into.call_count == 2
 
         # Check that the response is what was expected to be decoded
         assert isinstance(response, ApiVersionsV0Response)
         assert response.correlation_id == 1
         assert response['error'] == 0
-        assert isinstance(response['api_versions'], collections.Sequence)
+        assert isinstance(response['api_versions'], Sequence)
         assert len(response['api_versions']) == 1
         assert len(response['api_versions'][0]) == 3
         assert response['api_versions'][0]['api_key'] == 1
@@ -190,18 +329,90 @@ class BrokerTests(unittest.TestCase):
         # Correlation ID must be incremented after each request
         assert self.broker._correlation_id == 2
 
-    @patch.object(Broker, '_read_bytes')
-    def test_broker_single_send_error(self, mock_read_bytes):
-        self.mock_sock.recv.side_effect = socket.error
-        mock_read_bytes.return_value = b'\x00\x00\x00\x01\x00\x00\x00\x00\x00\x01\x00\x01\x01\x01\x02\x02'
+        # The response has no bytes fields, so the buffer is returned to the pool
+        assert self.broker._receive_pool.free_bytes == 4096
+
+    def test_broker_single_send_keeps_referenced_buffer(self):
+        # A SyncGroup response with a bytes field keeps a view into the receive buffer
+        self.mock_sock.recv_into.side_effect = recv_into_chunks([b'\x00\x00\x00\x0c\x00\x00\x00\x01',
+                                                                 b'\x00\x00\x00\x00\x00\x02\x01\x02'])
+
+        (correlation_id, response) = self.broker._single_send(SyncGroupV0Request({'group_id': 'testgroup',
+                                                                                  'generation_id': 1,
+                                                                                  'member_id': 'testmember',
+                                                                                  'member_assignments': b''}))
+        assert isinstance(response['member_assignment'], memoryview)
+        assert response['member_assignment'] == b'\x01\x02'
+
+        # The response gets its own buffer of exactly the right size, and the pool is untouched
+        assert len(response['member_assignment'].obj) == 8
+        assert self.broker._receive_pool.free_bytes == 0
+
+    def test_broker_single_send_referenced_buffer_not_from_pool(self):
+        large_buf = bytearray(2097152)
+        self.broker._receive_pool.release(large_buf)
+        self.mock_sock.recv_into.side_effect = recv_into_chunks([b'\x00\x00\x00\x0c\x00\x00\x00\x01',
+                                                                 b'\x00\x00\x00\x00\x00\x02\x01\x02'])
+
+        (correlation_id, response) = self.broker._single_send(SyncGroupV0Request({'group_id': 'testgroup',
+                                                                                  'generation_id': 1,
+                                                                                  'member_id': 'testmember',
+                                                                                  'member_assignments': b''}))
+        assert response['member_assignment'].obj is not large_buf
+        assert self.broker._receive_pool.free_bytes == 2097152
+
+    def test_broker_receive_pool_shared(self):
+        other_broker = Broker('brokerhost2.example.com', id=2, configuration=self.configuration)
+        assert other_broker._receive_pool is self.broker._receive_pool
+
+    def test_broker_single_send_reuses_buffer(self):
+        response_chunks = [b'\x00\x00\x00\x0a\x00\x00\x00\x01', b'\x00\x00\x00\x00\x00\x00']
+        self.mock_sock.recv_into.side_effect = recv_into_chunks(response_chunks + response_chunks)
+
+        self.broker._single_send(ApiVersionsV0Request({}))
+        buf = self.broker._receive_pool.acquire(10)
+        self.broker._receive_pool.release(buf)
+        self.broker._single_send(ApiVersionsV0Request({}))
+        assert self.broker._receive_pool.acquire(10) is buf
+
+    def test_broker_send_segments_partial(self):
+        self.mock_sock.sendmsg.side_effect = sendmsg_recorder(self.sent, max_bytes=3)
+        self.broker._send_segments([b'\x01\x02', b'', bytearray(b'\x03\x04\x05\x06')])
+        assert self.sent == [b'\x01\x02\x03', b'\x04\x05\x06']
+
+    def test_broker_send_segments_ssl(self):
+        self.broker._sock = MagicMock(spec=ssl.SSLSocket)
+        self.broker._send_segments([b'\x01\x02', b'\x03\x04'])
+        self.broker._sock.sendmsg.assert_not_called()
+        self.broker._sock.sendall.assert_has_calls([call(b'\x01\x02'), call(b'\x03\x04')])
+
+    def test_broker_encode_request_larger_than_pool(self):
+        self.broker._send_pool.max_bytes = 10
+        correlation_id, header, body_buf, body_size = self.broker._encode_request(TopicMetadataV1Request({'topics': ['a' * 5000]}))
+        assert correlation_id == 1
+        assert body_size == 5006
+        assert header[:4] == b'\x00\x00\x13\xa3'
+        assert bytes(body_buf[:8]) == b'\x00\x00\x00\x01\x13\x88aa'
+
+    def test_broker_encode_request_too_large(self):
+        self.configuration.max_request_size = 5000
+        self.assertRaises(RequestTooLargeError, self.broker._encode_request, TopicMetadataV1Request({'topics': ['a' * 5000]}))
+        assert self.broker._correlation_id == 1
+
+    def test_broker_send_pool_size(self):
+        self.configuration.send_buffer_pool_size = 1234
+        broker = Broker('brokerhost1.example.com', id=1, sock=self.mock_sock, configuration=self.configuration)
+        assert broker._send_pool.max_bytes == 1234
+
+    def test_broker_single_send_error(self):
+        self.mock_sock.recv_into.side_effect = socket.error
 
         request = ApiVersionsV0Request({})
         self.assertRaises(ConnectionError, self.broker._single_send, request)
 
-    @patch.object(ByteBuffer, 'getInt32')
-    def test_broker_single_send_short(self, mock_getint):
-        self.mock_sock.recv.return_value = b'\x00\x00\x00\x10'
-        mock_getint.side_effect = EOFError
+    def test_broker_single_send_short(self):
+        # A size that is too small to hold the correlation ID must not be used to read the rest of the response
+        self.mock_sock.recv_into.side_effect = recv_into_chunks([b'\x00\x00\x00\x02\x00\x00\x00\x01'])
 
         request = ApiVersionsV0Request({})
         self.assertRaises(ConnectionError, self.broker._single_send, request)
@@ -216,6 +427,21 @@ class BrokerTests(unittest.TestCase):
         mock_close.assert_not_called()
         mock_send.assert_called_once_with('fakerequest')
 
+    @patch.object(Broker, '_single_send')
+    def test_broker_send_holds_lock(self, mock_send):
+        # Other threads can't send on the connection between the request and the response
+        mock_send.side_effect = lambda request: self.broker._send_lock.locked()
+        assert self.broker.send('fakerequest')
+        assert not self.broker._send_lock.locked()
+
+    @patch.object(Broker, 'send_async')
+    @patch.object(Broker, '_single_send')
+    def test_broker_send_reader_running(self, mock_send, mock_send_async):
+        self.broker._reader = 'reader'
+        mock_send_async.return_value.result.return_value = 'fakeresponse'
+        assert self.broker.send('fakerequest') == 'fakeresponse'
+        mock_send.assert_not_called()
+
     @patch.object(Broker, '_single_send')
     @patch.object(Broker, 'connect')
     @patch.object(Broker, 'close')
@@ -244,24 +470,111 @@ class BrokerTests(unittest.TestCase):
         mock_connect.assert_has_calls([call(), call()])
         mock_send.assert_has_calls([call('fakerequest'), call('fakerequest'), call('fakerequest')])
 
-    def test_broker_read_bytes(self):
-        self.mock_sock.recv.return_value = b'\x01\x02\x03\x04'
-        response = self.broker._read_bytes(4)
-
-        self.mock_sock.recv.assert_called_once_with(4)
-        assert response == b'\x01\x02\x03\x04'
-
-    def test_broker_read_bytes_concat(self):
-        self.mock_sock.recv.side_effect = [b'\x01\x02', b'\x03\x04']
-        response = self.broker._read_bytes(4)
-
-        self.mock_sock.recv.assert_has_calls([call(4), call(2)])
-        assert response == b'\x01\x02\x03\x04'
-
-    def test_broker_read_bytes_nodata(self):
-        self.mock_sock.recv.return_value = b''
-        self.assertRaises(socket.error, self.broker._read_bytes, 4)
+    @patch.object(Broker, 'send_async')
+    @patch.object(Broker, '_single_send')
+    def test_broker_send_pipelined(self, mock_send, mock_send_async):
+        self.configuration.max_in_flight = 5
+        mock_send_async.return_value.result.return_value = 'fakeresponse'
+        assert self.broker.send('fakerequest') == 'fakeresponse'
+        mock_send_async.assert_called_once_with('fakerequest')
+        mock_send.assert_not_called()
+
+    def test_broker_send_async_out_of_order(self):
+        client_sock, server_sock = socket.socketpair()
+        self.configuration.max_in_flight = 5
+        broker = Broker('brokerhost1.example.com', id=1, sock=client_sock, configuration=self.configuration)
+
+        futures = [broker.send_async(ApiVersionsV0Request({})) for i in range(3)]
+        correlation_ids = [read_request(server_sock) for i in range(3)]
+        assert correlation_ids == [1, 2, 3]
+
+        # Respond in reverse order, and each response must still go to the right request
+        server_sock.sendall(b''.join(api_versions_response(correlation_id) for correlation_id in reversed(correlation_ids)))
+        for i, future in enumerate(futures):
+            correlation_id, response = future.result(timeout=5)
+            assert correlation_id == i + 1
+            assert response.correlation_id == i + 1
+            assert isinstance(response, ApiVersionsV0Response)
+
+        broker.close()
+        server_sock.close()
+
+    def test_broker_send_async_connection_lost(self):
+        client_sock, server_sock = socket.socketpair()
+        broker = Broker('brokerhost1.example.com', id=1, sock=client_sock, configuration=self.configuration)
+
+        future = broker.send_async(ApiVersionsV0Request({}))
+        read_request(server_sock)
+        server_sock.close()
+        self.assertRaises(ConnectionError, future.result, 5)
+        assert broker._in_flight == {}
+
+    def test_broker_send_async_close(self):
+        client_sock, server_sock = socket.socketpair()
+        broker = Broker('brokerhost1.example.com', id=1, sock=client_sock, configuration=self.configuration)
+
+        future = broker.send_async(ApiVersionsV0Request({}))
+        broker.close()
+        self.assertRaises(ConnectionError, future.result, 5)
+        assert broker._reader is None
+        server_sock.close()
+
+    def test_broker_send_pipelined_connection_lost(self):
+        client_sock, server_sock = socket.socketpair()
+        self.configuration.max_in_flight = 4
+        self.configuration.num_retries = 1
+        broker = Broker('brokerhost1.example.com', id=1, sock=client_sock, configuration=self.configuration)
+
+        def close_after_request():
+            read_request(server_sock)
+            server_sock.close()
+        server = Thread(target=close_after_request)
+        server.start()
+
+        self.assertRaises(ConnectionError, broker.send, ApiVersionsV0Request({}))
+        server.join()
+        assert broker._sock is None
+
+    def test_broker_send_async_encode_error(self):
+        self.configuration.max_in_flight = 2
+        broker = Broker('brokerhost1.example.com', id=1, sock=self.mock_sock, configuration=self.configuration)
+        request = OffsetFetchV1Request({'group_id': 'testgroup', 'topics': [{'topic': 'topic1', 'partitions': [2 ** 40]}]})
+
+        for i in range(3):
+            self.assertRaises(struct.error, broker.send_async(request).result, 5)
+        assert broker._in_flight_slots.acquire(False)
+        assert broker._send_pool.free_bytes == 4096
+        assert broker._correlation_id == 1
 
-    def test_broker_read_bytes_error(self):
-        self.mock_sock.recv.side_effect = socket.error
-        self.assertRaises(socket.error, self.broker._read_bytes, 4)
+    @patch.object(Broker, 'connect')
+    def test_broker_send_async_connect_error(self, mock_connect):
+        self.broker._sock = None
+        mock_connect.side_effect = ConnectionError
+        future = self.broker.send_async(ApiVersionsV0Request({}))
+        self.assertRaises(ConnectionError, future.result, 5)
+        assert self.broker._in_flight == {}
+
+    def test_broker_read_into(self):
+        self.mock_sock.recv_into.side_effect = recv_into_chunks([b'\x01\x02\x03\x04'])
+        buf = bytearray(4)
+        self.broker._read_into(memoryview(buf))
+
+        assert self.mock_sock.recv_into.call_count == 1
+        assert buf == b'\x01\x02\x03\x04'
+
+    def test_broker_read_into_partial(self):
+        self.mock_sock.recv_into.side_effect = recv_into_chunks([b'\x01', b'\x02\x03', b'\x04'])
+        buf = bytearray(4)
+        self.broker._read_into(memoryview(buf))
+
+        assert self.mock_sock.recv_into.call_count == 3
+        assert [c[0][1] for c in self.mock_sock.recv_into.call_args_list] == [4, 3, 1]
+        assert buf == b'\x01\x02\x03\x04'
+
+    def test_broker_read_into_nodata(self):
+        self.mock_sock.recv_into.return_value = 0
+        self.assertRaises(socket.error, self.broker._read_into, memoryview(bytearray(4)))
+
+    def test_broker_read_into_error(self):
+        self.mock_sock.recv_into.side_effect = socket.error
+        self.assertRaises(socket.error, self.broker._read_into, memoryview(bytearray(4)))
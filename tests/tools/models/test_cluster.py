@@ -136,3 +136,77 @@ class SimpleClusterTests(unittest.TestCase):
                 }
             }
         }, sort_keys=True)
+
+    def test_cluster_leader_index(self):
+        self.add_brokers(2)
+        self.add_topics(1)
+        partition = self.cluster.topics['testTopic1'].partitions[0]
+
+        partition.leader = self.cluster.brokers[1]
+        assert self.cluster.leader_for('testTopic1', 0) == self.cluster.brokers[1]
+        assert self.cluster.partitions_led_by(1) == set([('testTopic1', 0)])
+        assert self.cluster.count_led_by(1) == 1
+
+        partition.leader = self.cluster.brokers[2]
+        assert self.cluster.leader_for('testTopic1', 0) == self.cluster.brokers[2]
+        assert self.cluster.partitions_led_by(1) == set()
+        assert self.cluster.partitions_led_by(2) == set([('testTopic1', 0)])
+        assert self.cluster.count_led_by(1) == 0
+        assert self.cluster.count_led_by(2) == 1
+
+        partition.leader = None
+        assert self.cluster.leader_for('testTopic1', 0) is None
+        assert self.cluster.partitions_led_by(2) == set()
+        assert self.cluster.count_led_by(2) == 0
+        assert self.cluster.count_led_by(3) == 0
+
+    def test_cluster_replica_index(self):
+        self.add_brokers(2)
+        self.add_topics(1)
+        partition = self.cluster.topics['testTopic1'].partitions[1]
+
+        partition.add_replica(self.cluster.brokers[1])
+        partition.add_replica(self.cluster.brokers[2])
+        assert self.cluster.partitions_replicated_on(1) == set([('testTopic1', 1)])
+
+        partition.swap_replicas(self.cluster.brokers[1], Broker('brokerhost3.example.com', id=3))
+        assert self.cluster.partitions_replicated_on(1) == set()
+        assert self.cluster.partitions_replicated_on(3) == set([('testTopic1', 1)])
+
+        partition.delete_replicas(0)
+        assert self.cluster.partitions_replicated_on(2) == set()
+
+    def test_cluster_index_add_topic(self):
+        # Topics that are built before they are added to the cluster are indexed when they are added
+        self.add_brokers(2)
+        topic = Topic('testTopic1', 2)
+        topic.partitions[0].leader = self.cluster.brokers[1]
+        topic.partitions[0].add_replica(self.cluster.brokers[2])
+        assert self.cluster.leader_for('testTopic1', 0) is None
+
+        self.cluster.add_topic(topic)
+        assert self.cluster.leader_for('testTopic1', 0) == self.cluster.brokers[1]
+        assert self.cluster.partitions_replicated_on(2) == set([('testTopic1', 0)])
+
+        # Cloning builds the indexes for the new cluster, and changes to the clone do not touch the original
+        newcluster = self.cluster.clone()
+        newcluster.topics['testTopic1'].partitions[0].remove_replica(newcluster.brokers[2])
+        assert newcluster.partitions_replicated_on(2) == set()
+        assert self.cluster.partitions_replicated_on(2) == set([('testTopic1', 0)])
+
+    def test_cluster_index_remove_topic(self):
+        self.add_brokers(1)
+        self.add_topics(1)
+        topic = self.cluster.topics['testTopic1']
+        topic.partitions[0].leader = self.cluster.brokers[1]
+        topic.partitions[1].leader = self.cluster.brokers[1]
+        topic.partitions[1].add_replica(self.cluster.brokers[1])
+
+        topic.assure_has_partitions(1)
+        assert self.cluster.partitions_led_by(1) == set([('testTopic1', 0)])
+        assert self.cluster.partitions_replicated_on(1) == set()
+
+        self.cluster.remove_topic('testTopic1')
+        assert 'testTopic1' not in self.cluster.topics
+        assert self.cluster.partitions_led_by(1) == set()
+        assert self.cluster.leader_for('testTopic1', 0) is None
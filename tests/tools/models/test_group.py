@@ -1,6 +1,6 @@
 import unittest
 
-from kafka.tools.models.group import Group, GroupMember
+from kafka.tools.models.group import Group, GroupLag, GroupMember
 
 
 class GroupTests(unittest.TestCase):
@@ -13,6 +13,15 @@ class GroupTests(unittest.TestCase):
         group._last_updated = 100
         assert group.updated_since(99)
 
+    def test_coordinator_updated_since(self):
+        group = Group('testgroup')
+        group._coordinator_updated = 100
+        assert not group.coordinator_updated_since(99)
+
+        group.coordinator = 'broker'
+        assert group.coordinator_updated_since(99)
+        assert not group.coordinator_updated_since(101)
+
     def test_add_member(self):
         group = Group('testgroup')
         group.add_member('membername', client_id='clientid', client_host='host1', metadata=b'\x00\x32', assignment=b'\x01\x34')
@@ -56,3 +65,22 @@ class GroupTests(unittest.TestCase):
         topics = group.subscribed_topics()
         print(topics)
         assert set(['topic1', 'topic2']) == set(topics)
+
+
+class GroupLagTests(unittest.TestCase):
+    def test_add_topic(self):
+        lag = GroupLag('testgroup')
+        lag.add_topic('topic1', [10, 20, 30], [15, 20, 25])
+        assert lag.partitions == {'topic1': [5, 0, 0]}
+
+    def test_add_topic_unknown(self):
+        lag = GroupLag('testgroup')
+        lag.add_topic('topic1', [-1, 20, 10], [15, -1, 25])
+        assert lag.partitions == {'topic1': [None, None, 15]}
+
+    def test_totals(self):
+        lag = GroupLag('testgroup')
+        lag.add_topic('topic1', [10, -1], [15, 20])
+        lag.add_topic('topic2', [0, 0], [3, 4])
+        assert lag.topics == {'topic1': 5, 'topic2': 7}
+        assert lag.total == 12
@@ -6,7 +6,7 @@ from kafka.tools.exceptions import OffsetError
 from kafka.tools.models.cluster import Cluster
 from kafka.tools.models.broker import Broker
 from kafka.tools.models.topic import Topic, TopicOffsets
-from kafka.tools.models.partition import Partition
+from kafka.tools.models.partition import Partition, PartitionDelta
 
 
 class TopicAndPartitionTests(unittest.TestCase):
@@ -254,6 +254,34 @@ class TopicAndPartitionTests(unittest.TestCase):
         partition.delete_replicas(0)
         assert len(partition.replicas) == 0
 
+    def test_partition_metadata_state(self):
+        broker1 = Broker('brokerhost1.example.com', id=1)
+        broker2 = Broker('brokerhost2.example.com', id=2)
+        partition = self.topic.partitions[0]
+        assert partition.metadata_state() == (-1, (), ())
+
+        partition.leader = broker1
+        partition.add_replica(broker1)
+        partition.add_replica(broker2)
+        partition.isr = [broker2]
+        assert partition.metadata_state() == (1, (1, 2), (2, ))
+
+        # A cached state from metadata is cleared when the partition changes
+        partition._metadata_state = (1, (1, 2), (2, 1))
+        assert partition.metadata_state() == (1, (1, 2), (2, 1))
+        partition.swap_replica_positions(broker1, broker2)
+        assert partition.metadata_state() == (1, (2, 1), (2, ))
+
+    def test_partition_delta(self):
+        delta = PartitionDelta('testTopic', 0, (1, (1, 2), (1, 2)), (1, (1, 2), (1, )))
+        assert not delta.leader_changed
+        assert not delta.replicas_changed
+        assert delta.isr_changed
+
+        delta = PartitionDelta('testTopic', 0, None, (1, (1, 2), (1, )))
+        assert delta.leader_changed and delta.replicas_changed and delta.isr_changed
+        assert repr(delta) == "PartitionDelta(testTopic, 0, None -> (1, (1, 2), (1,)))"
+
     def test_topic_offsets_create(self):
         topic = Topic('topic1', 3)
         offsets = TopicOffsets(topic)
@@ -278,6 +306,19 @@ class TopicAndPartitionTests(unittest.TestCase):
 
         self.assertRaises(OffsetError, offsets.set_offsets_from_list, response['responses'][0]['partition_responses'])
 
+    def test_set_offsets_from_list_record_errors(self):
+        topic = Topic('topic1', 2)
+        offsets = TopicOffsets(topic)
+
+        offsets.set_offsets_from_list(list_offset_error()['responses'][0]['partition_responses'], raise_errors=False)
+        assert offsets.partitions == [-1, 8904]
+        assert offsets.errors == {0: 6}
+
+        # A later success clears the error
+        offsets.set_offsets_from_list(list_offset()['responses'][0]['partition_responses'], raise_errors=False)
+        assert offsets.partitions == [4829, 8904]
+        assert offsets.errors == {}
+
     def test_set_offsets_from_fetch(self):
         topic = Topic('topic1', 2)
         offsets = TopicOffsets(topic)
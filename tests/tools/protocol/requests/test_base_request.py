@@ -2,7 +2,8 @@ import unittest
 from mock import patch
 
 
-from kafka.tools.protocol.requests import _evaluate_plain_value, _evaluate_sequence, _encode_plain_value, _encode_sequence
+from kafka.tools.protocol.requests import _evaluate_plain_value, _evaluate_sequence
+from kafka.tools.protocol.schema import compile_encoder
 from kafka.tools.protocol.types.bytebuffer import ByteBuffer
 
 
@@ -41,60 +42,34 @@ class BaseRequestTests(unittest.TestCase):
         self.assertRaises(KeyError, _evaluate_sequence, {}, [{'name': 'foo', 'type': 'int8'}])
         self.assertRaises(TypeError, _evaluate_sequence, {'foo': 1}, [{'name': 'foo', 'type': 'array', 'item_type': 'int8'}])
 
-    def test_encode_plain_value(self):
-        buf = ByteBuffer(10)
-        _encode_plain_value(1, 'int8', buf)
-        assert buf.get(10, 0) == bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00')
-
-        buf = ByteBuffer(10)
-        _encode_plain_value(1, 'int16', buf)
-        assert buf.get(10, 0) == bytearray(b'\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00')
-
-        buf = ByteBuffer(10)
-        _encode_plain_value(1, 'int32', buf)
-        assert buf.get(10, 0) == bytearray(b'\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00')
-
-        buf = ByteBuffer(10)
-        _encode_plain_value(1, 'int64', buf)
-        assert buf.get(10, 0) == bytearray(b'\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00')
-
-        buf = ByteBuffer(10)
-        _encode_plain_value(True, 'boolean', buf)
-        assert buf.get(10, 0) == bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00')
-
+    def encode_value(self, value, value_type):
         buf = ByteBuffer(10)
-        _encode_plain_value('foo', 'string', buf)
-        assert buf.get(10, 0) == bytearray(b'\x00\x03foo\x00\x00\x00\x00\x00')
+        compile_encoder([{'name': 'foo', 'type': value_type}])({'foo': value}, buf)
+        return buf.get(10, 0)
 
-        buf = ByteBuffer(10)
-        _encode_plain_value(None, 'string', buf)
-        assert buf.get(10, 0) == bytearray(b'\xff\xff\x00\x00\x00\x00\x00\x00\x00\x00')
-
-        buf = ByteBuffer(10)
-        _encode_plain_value(b'\x78\x23', 'bytes', buf)
-        assert buf.get(10, 0) == bytearray(b'\x00\x00\x00\x02\x78\x23\x00\x00\x00\x00')
-
-        buf = ByteBuffer(10)
-        _encode_plain_value(None, 'bytes', buf)
-        assert buf.get(10, 0) == bytearray(b'\xff\xff\xff\xff\x00\x00\x00\x00\x00\x00')
+    def test_encode_plain_value(self):
+        assert self.encode_value(1, 'int8') == bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+        assert self.encode_value(1, 'int16') == bytearray(b'\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00')
+        assert self.encode_value(1, 'int32') == bytearray(b'\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00')
+        assert self.encode_value(1, 'int64') == bytearray(b'\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00')
+        assert self.encode_value(True, 'boolean') == bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+        assert self.encode_value('foo', 'string') == bytearray(b'\x00\x03foo\x00\x00\x00\x00\x00')
+        assert self.encode_value(None, 'string') == bytearray(b'\xff\xff\x00\x00\x00\x00\x00\x00\x00\x00')
+        assert self.encode_value(b'\x78\x23', 'bytes') == bytearray(b'\x00\x00\x00\x02\x78\x23\x00\x00\x00\x00')
+        assert self.encode_value(None, 'bytes') == bytearray(b'\xff\xff\xff\xff\x00\x00\x00\x00\x00\x00')
 
     def test_encode_plain_value_errors(self):
-        buf = ByteBuffer(10)
-        self.assertRaises(NotImplementedError, _encode_plain_value, {'foo': 1}, {'name': 'foo', 'type': 'unknowntype'}, buf)
+        self.assertRaises(NotImplementedError, compile_encoder, [{'name': 'foo', 'type': 'unknowntype'}])
 
     def test_encode_sequence(self):
         buf = ByteBuffer(10)
-        _encode_sequence({'foo': 1}, [{'name': 'foo', 'type': 'int8'}], buf)
-        assert buf.get(10, 0) == bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00')
-
-        buf = ByteBuffer(10)
-        _encode_sequence({'foo': None}, [{'name': 'foo', 'type': 'array', 'item_type': 'int8'}], buf)
+        compile_encoder([{'name': 'foo', 'type': 'array', 'item_type': 'int8'}])({'foo': None}, buf)
         assert buf.get(10, 0) == bytearray(b'\xff\xff\xff\xff\x00\x00\x00\x00\x00\x00')
 
         buf = ByteBuffer(10)
-        _encode_sequence({'foo': [1]}, [{'name': 'foo', 'type': 'array', 'item_type': 'int8'}], buf)
+        compile_encoder([{'name': 'foo', 'type': 'array', 'item_type': 'int8'}])({'foo': [1]}, buf)
         assert buf.get(10, 0) == bytearray(b'\x00\x00\x00\x01\x01\x00\x00\x00\x00\x00')
 
         buf = ByteBuffer(10)
-        _encode_sequence({'foo': [{'bar': 1}]}, [{'name': 'foo', 'type': 'array', 'item_type': [{'name': 'bar', 'type': 'int8'}]}], buf)
+        compile_encoder([{'name': 'foo', 'type': 'array', 'item_type': [{'name': 'bar', 'type': 'int8'}]}])({'foo': [{'bar': 1}]}, buf)
         assert buf.get(10, 0) == bytearray(b'\x00\x00\x00\x01\x01\x00\x00\x00\x00\x00')
@@ -1,32 +1,52 @@
 import unittest
 
-from kafka.tools.protocol.responses import _decode_plain_type, _decode_sequence, _decode_array
+from kafka.tools.protocol.responses.member_assignment_v0 import MemberAssignmentV0
+from kafka.tools.protocol.responses.offset_commit_v2 import OffsetCommitV2Response
+from kafka.tools.protocol.schema import compile_decoder
 from kafka.tools.protocol.types.bytebuffer import ByteBuffer
 
 
 class BaseResponseTests(unittest.TestCase):
-    def test_decode_plain_value(self):
-        assert _decode_plain_type('int8', ByteBuffer(bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00'))) == 1
-        assert _decode_plain_type('int16', ByteBuffer(bytearray(b'\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00'))) == 1
-        assert _decode_plain_type('int32', ByteBuffer(bytearray(b'\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00'))) == 1
-        assert _decode_plain_type('int64', ByteBuffer(bytearray(b'\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00'))) == 1
-        assert _decode_plain_type('boolean', ByteBuffer(bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00'))) is True
-        assert _decode_plain_type('string', ByteBuffer(bytearray(b'\x00\x03foo\x00\x00\x00\x00\x00'))) == 'foo'
-        assert _decode_plain_type('string', ByteBuffer(bytearray(b'\xff\xff\x00\x00\x00\x00\x00\x00\x00\x00'))) is None
-        assert _decode_plain_type('bytes', ByteBuffer(bytearray(b'\x00\x00\x00\x02\x78\x23\x00\x00\x00\x00'))) == b'\x78\x23'
-        assert _decode_plain_type('bytes', ByteBuffer(bytearray(b'\xff\xff\xff\xff\x00\x00\x00\x00\x00\x00'))) is None
+    def decode_value(self, value_type, data):
+        return compile_decoder([{'name': 'bar', 'type': value_type}])(ByteBuffer(bytearray(data)))['bar']
 
-    def test_decode_plain_value_errors(self):
-        self.assertRaises(NotImplementedError, _decode_plain_type, 'unknowntype', ByteBuffer(10))
+    def test_decode_plain_value(self):
+        assert self.decode_value('int8', b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00') == 1
+        assert self.decode_value('int16', b'\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00') == 1
+        assert self.decode_value('int32', b'\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00') == 1
+        assert self.decode_value('int64', b'\x00\x00\x00\x00\x00\x00\x00\x01\x00\x00') == 1
+        assert self.decode_value('boolean', b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00') is True
+        assert self.decode_value('string', b'\x00\x03foo\x00\x00\x00\x00\x00') == 'foo'
+        assert self.decode_value('string', b'\xff\xff\x00\x00\x00\x00\x00\x00\x00\x00') is None
+        assert self.decode_value('bytes', b'\x00\x00\x00\x02\x78\x23\x00\x00\x00\x00') == b'\x78\x23'
+        assert self.decode_value('bytes', b'\xff\xff\xff\xff\x00\x00\x00\x00\x00\x00') is None
 
     def test_decode_array(self):
-        assert _decode_array('int8', ByteBuffer(bytearray(b'\x00\x00\x00\x01\x01\x00\x00\x00\x00\x00'))) == [1]
-        assert _decode_array('int8', ByteBuffer(bytearray(b'\xff\xff\xff\xff\x00\x00\x00\x00\x00\x00'))) is None
-        assert _decode_array([{'name': 'bar', 'type': 'int8'}], ByteBuffer(bytearray(b'\x00\x00\x00\x01\x01\x00\x00\x00\x00\x00'))) == [{'bar': 1}]
+        decode = compile_decoder([{'name': 'bar', 'type': 'array', 'item_type': 'int8'}])
+        assert decode(ByteBuffer(bytearray(b'\x00\x00\x00\x01\x01\x00\x00\x00\x00\x00'))) == {'bar': [1]}
+        assert decode(ByteBuffer(bytearray(b'\xff\xff\xff\xff\x00\x00\x00\x00\x00\x00'))) == {'bar': None}
+
+        decode = compile_decoder([{'name': 'foo', 'type': 'array', 'item_type': [{'name': 'bar', 'type': 'int8'}]}])
+        assert decode(ByteBuffer(bytearray(b'\x00\x00\x00\x01\x01\x00\x00\x00\x00\x00'))) == {'foo': [{'bar': 1}]}
+
+    def test_decode_plain_value_errors(self):
+        self.assertRaises(NotImplementedError, compile_decoder, [{'name': 'bar', 'type': 'unknowntype'}])
 
     def test_decode_sequence(self):
-        schema = [{'name': 'bar', 'type': 'int8'}]
-        assert _decode_sequence(schema, ByteBuffer(bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00'))) == {'bar': 1}
+        decode = compile_decoder([{'name': 'bar', 'type': 'int8'}])
+        assert decode(ByteBuffer(bytearray(b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00'))) == {'bar': 1}
+
+        decode = compile_decoder([{'name': 'bar', 'type': 'array', 'item_type': 'int8'}])
+        assert decode(ByteBuffer(bytearray(b'\x00\x00\x00\x01\x01\x00\x00\x00\x00\x00'))) == {'bar': [1]}
+
+    def test_str_zero_copy(self):
+        response = MemberAssignmentV0({'version': 0, 'partitions': [], 'user_data': memoryview(b'\x01\x02')})
+        assert 'memory' not in str(response)
+        assert repr(b'\x01\x02') in str(response)
 
-        schema = [{'name': 'bar', 'type': 'array', 'item_type': 'int8'}]
-        assert _decode_sequence(schema, ByteBuffer(bytearray(b'\x00\x00\x00\x01\x01\x00\x00\x00\x00\x00'))) == {'bar': [1]}
+    def test_error_codes(self):
+        response = OffsetCommitV2Response({'responses': [{'topic': 'topic1',
+                                                          'partition_responses': [{'partition': 0, 'error': 0},
+                                                                                  {'partition': 1, 'error': 16}]}]})
+        assert response.error_codes() == set([0, 16])
+        assert MemberAssignmentV0({'version': 0, 'partitions': [], 'user_data': None}).error_codes() == set()
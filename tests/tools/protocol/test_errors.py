@@ -1,7 +1,8 @@
 import six
 import unittest
 
-from kafka.tools.protocol.errors import error_short, error_long
+from kafka.tools.protocol.errors import error_short, error_long, error_retriable, error_invalidates_coordinator, error_invalidates_metadata
+from kafka.tools.protocol.errors import errors, metadata_errors, retriable_errors
 
 
 class ErrorTests(unittest.TestCase):
@@ -16,3 +17,21 @@ class ErrorTests(unittest.TestCase):
 
     def test_error_long_unknown(self):
         assert isinstance(error_long(99), six.string_types)
+
+    def test_error_retriable(self):
+        assert error_retriable(6)
+        assert not error_retriable(29)
+        assert not error_retriable(0)
+
+    def test_error_invalidates_metadata(self):
+        assert error_invalidates_metadata(6)
+        assert not error_invalidates_metadata(7)
+
+    def test_metadata_errors_retriable(self):
+        assert metadata_errors.issubset(retriable_errors)
+        assert all(err_num in errors for err_num in retriable_errors)
+
+    def test_error_invalidates_coordinator(self):
+        assert error_invalidates_coordinator(15)
+        assert error_invalidates_coordinator(16)
+        assert not error_invalidates_coordinator(14)
@@ -0,0 +1,138 @@
+import unittest
+from mock import patch
+
+from tests.tools.protocol.utilities import encode_sequence, decode_sequence
+
+from kafka.tools.protocol.requests.offset_commit_v2 import OffsetCommitV2Request
+from kafka.tools.protocol.requests.topic_metadata_v1 import TopicMetadataV1Request
+from kafka.tools.protocol.requests.topic_metadata_v2 import TopicMetadataV2Request
+from kafka.tools.protocol.responses.metadata_v5 import MetadataV5Response
+from kafka.tools.protocol.responses.describe_groups_v0 import DescribeGroupsV0Response
+from kafka.tools.protocol.schema import (compile_encoder, compile_decoder, compile_sizer, encoder_for, decoder_for, references_buffer, references_buffer_for,
+                                         _array_struct, _group_entries)
+from kafka.tools.protocol.types.bytebuffer import ByteBuffer
+
+# throttle_time_ms, 1 broker, cluster_id, controller_id, 1 topic with 1 partition
+metadata_v5_bytes = (b'\x00\x00\x00\x05' +
+                     b'\x00\x00\x00\x01' + b'\x00\x00\x00\x01\x00\x04host\x00\x00\x23\x84\x00\x05rack1' +
+                     b'\x00\x07cluster' + b'\x00\x00\x00\x01' +
+                     b'\x00\x00\x00\x01' + b'\x00\x00\x00\x06topic1\x01' +
+                     b'\x00\x00\x00\x01' + b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01' +
+                     b'\x00\x00\x00\x02\x00\x00\x00\x01\x00\x00\x00\x02' +
+                     b'\x00\x00\x00\x01\x00\x00\x00\x01' +
+                     b'\xff\xff\xff\xff')
+
+
+class SchemaCompilerTests(unittest.TestCase):
+    def test_group_entries(self):
+        schema = [{'name': 'a', 'type': 'int32'},
+                  {'name': 'b', 'type': 'int16'},
+                  {'name': 'c', 'type': 'string'},
+                  {'name': 'd', 'type': 'boolean'}]
+        steps = _group_entries(schema)
+        assert len(steps) == 3
+        assert steps[0] == (['a', 'b'], ['int32', 'int16'])
+        assert steps[1] is schema[2]
+        assert steps[2] == (['d'], ['boolean'])
+
+    def test_encode_fixed_group(self):
+        buf = ByteBuffer(10)
+        compile_encoder([{'name': 'a', 'type': 'int8'}, {'name': 'b', 'type': 'boolean'}, {'name': 'c', 'type': 'int64'}])({'a': 1, 'b': 5, 'c': 2}, buf)
+        assert buf.get(10, 0) == bytearray(b'\x01\x01\x00\x00\x00\x00\x00\x00\x00\x02')
+        assert buf.position == 10
+
+    def test_encode_matches_interpreted(self):
+        value = {'group_id': 'testgroup',
+                 'group_generation_id': -1,
+                 'member_id': '',
+                 'retention_time': -1,
+                 'topics': [{'topic': 'topic1', 'partitions': [{'partition': 0, 'offset': 4829, 'metadata': None},
+                                                               {'partition': 1, 'offset': 8904, 'metadata': 'foo'}]}]}
+        expected = ByteBuffer(100)
+        encode_sequence(value, OffsetCommitV2Request.schema, expected)
+
+        buf = ByteBuffer(100)
+        request = OffsetCommitV2Request(value)
+        request.encode(buf)
+        assert buf.position == expected.position
+        assert request.encoded_size() == expected.position
+        assert buf.get(100, 0) == expected.get(100, 0)
+
+    def test_encode_arrays(self):
+        schema = [{'name': 'a', 'type': 'array', 'item_type': 'int16'},
+                  {'name': 'b', 'type': 'array', 'item_type': 'string'},
+                  {'name': 'c', 'type': 'array', 'item_type': 'int32'}]
+        buf = ByteBuffer(21)
+        compile_encoder(schema)({'a': [1, 2], 'b': ['foo'], 'c': None}, buf)
+        assert buf.get(21, 0) == bytearray(b'\x00\x00\x00\x02\x00\x01\x00\x02\x00\x00\x00\x01\x00\x03foo\xff\xff\xff\xff')
+
+    @patch('kafka.tools.protocol.schema._array_struct', wraps=_array_struct)
+    def test_encode_fixed_array_caches_structs(self, mock_array_struct):
+        encode = compile_encoder([{'name': 'a', 'type': 'array', 'item_type': 'int32'}])
+        for items in ([1, 2], [3, 4], [5]):
+            buf = ByteBuffer(12)
+            encode({'a': items}, buf)
+        assert buf.get(8, 0) == bytearray(b'\x00\x00\x00\x01\x00\x00\x00\x05')
+        assert mock_array_struct.call_count == 2
+
+    def test_sizer(self):
+        schema = [{'name': 'a', 'type': 'array', 'item_type': 'int16'},
+                  {'name': 'b', 'type': 'array', 'item_type': [{'name': 'c', 'type': 'string'}, {'name': 'd', 'type': 'bytes'}]},
+                  {'name': 'e', 'type': 'int64'},
+                  {'name': 'f', 'type': 'string'}]
+        assert compile_sizer(schema)({'a': [1, 2], 'b': [{'c': u'\u00e9', 'd': None}], 'e': 1, 'f': None}) == 8 + 4 + 4 + 4 + 8 + 2
+        assert compile_sizer(schema)({'a': None, 'b': [], 'e': 1, 'f': 'foo'}) == 4 + 4 + 8 + 5
+
+    def test_encode_unknown_type(self):
+        self.assertRaises(NotImplementedError, compile_encoder, [{'name': 'a', 'type': 'unknowntype'}])
+
+    def test_decode_matches_interpreted(self):
+        expected = decode_sequence(MetadataV5Response.schema, ByteBuffer(metadata_v5_bytes))
+        buf = ByteBuffer(metadata_v5_bytes)
+        response = MetadataV5Response.from_bytebuffer(3, buf)
+        assert buf.remaining == 0
+        assert response.correlation_id == 3
+        assert response._response == expected
+        assert response['topics'][0]['internal'] is True
+        assert response['topics'][0]['partitions'][0]['replicas'] == [1, 2]
+        assert response['topics'][0]['partitions'][0]['offline_replicas'] is None
+
+    def test_decode_plain_types(self):
+        schema = [{'name': 'a', 'type': 'string'},
+                  {'name': 'b', 'type': 'bytes'},
+                  {'name': 'c', 'type': 'bytes'},
+                  {'name': 'd', 'type': 'array', 'item_type': 'boolean'}]
+        val = compile_decoder(schema)(ByteBuffer(b'\xff\xff\x00\x00\x00\x02\x78\x23\xff\xff\xff\xff\x00\x00\x00\x02\x01\x00'))
+        assert val == {'a': None, 'b': b'\x78\x23', 'c': None, 'd': [True, False]}
+
+    def test_decode_short_buffer(self):
+        self.assertRaises(EOFError, compile_decoder([{'name': 'a', 'type': 'array', 'item_type': 'int32'}]), ByteBuffer(b'\x00\x00\x00\x02\x00'))
+
+    def test_decode_unknown_type(self):
+        self.assertRaises(NotImplementedError, compile_decoder, [{'name': 'a', 'type': 'unknowntype'}])
+
+    def test_cached_per_class(self):
+        assert encoder_for(TopicMetadataV2Request) is encoder_for(TopicMetadataV2Request)
+        assert encoder_for(TopicMetadataV2Request) is not encoder_for(TopicMetadataV1Request)
+        assert decoder_for(MetadataV5Response) is decoder_for(MetadataV5Response)
+
+    def test_decode_zero_copy(self):
+        schema = [{'name': 'a', 'type': 'string'}, {'name': 'b', 'type': 'bytes'}]
+        data = bytearray(b'\x00\x03foo\x00\x00\x00\x02\x78\x23')
+        val = compile_decoder(schema)(ByteBuffer(data, zero_copy=True))
+        assert val['a'] == 'foo'
+        assert isinstance(val['b'], memoryview)
+        assert val['b'] == b'\x78\x23'
+        assert val['b'].obj is data
+
+    def test_decode_zero_copy_matches_interpreted(self):
+        expected = decode_sequence(MetadataV5Response.schema, ByteBuffer(metadata_v5_bytes, zero_copy=True))
+        assert MetadataV5Response.from_bytebuffer(3, ByteBuffer(metadata_v5_bytes, zero_copy=True))._response == expected
+        assert expected['cluster_id'] == 'cluster'
+
+    def test_references_buffer(self):
+        assert not references_buffer(MetadataV5Response.schema)
+        assert references_buffer([{'name': 'a', 'type': 'array', 'item_type': [{'name': 'b', 'type': 'bytes'}]}])
+        assert references_buffer([{'name': 'a', 'type': 'array', 'item_type': 'bytes'}])
+        assert references_buffer_for(DescribeGroupsV0Response)
+        assert not references_buffer_for(MetadataV5Response)
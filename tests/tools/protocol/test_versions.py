@@ -0,0 +1,55 @@
+import unittest
+
+from kafka.tools.protocol.requests.api_versions_v0 import ApiVersionsV0Request
+from kafka.tools.protocol.requests.find_coordinator_v1 import FindCoordinatorV1Request
+from kafka.tools.protocol.requests.group_coordinator_v0 import GroupCoordinatorV0Request
+from kafka.tools.protocol.requests.list_offset_v1 import ListOffsetV1Request
+from kafka.tools.protocol.requests.list_offset_v2 import ListOffsetV2Request
+from kafka.tools.protocol.requests.topic_metadata_v2 import TopicMetadataV2Request
+from kafka.tools.protocol.requests.topic_metadata_v3 import TopicMetadataV3Request
+from kafka.tools.protocol.requests.topic_metadata_v5 import TopicMetadataV5Request
+from kafka.tools.protocol.versions import REQUEST_UPGRADES, upgrade_request
+
+
+class VersionsTests(unittest.TestCase):
+    def test_upgrades_same_api(self):
+        for request_class, upgrades in REQUEST_UPGRADES.items():
+            for upgrade_class, convert in upgrades:
+                assert upgrade_class.api_key == request_class.api_key
+                assert upgrade_class.api_version > request_class.api_version
+
+    def test_upgrade_no_versions(self):
+        request = TopicMetadataV2Request({'topics': None})
+        assert upgrade_request(request, None) is request
+        assert upgrade_request(request, {}) is request
+
+    def test_upgrade_not_in_table(self):
+        request = ApiVersionsV0Request({})
+        assert upgrade_request(request, {18: (0, 1)}) is request
+
+    def test_upgrade_newest(self):
+        request = upgrade_request(TopicMetadataV2Request({'topics': ['topic1']}), {3: (0, 7)})
+        assert isinstance(request, TopicMetadataV5Request)
+        assert request['topics'] == ['topic1']
+        assert request['allow_auto_topic_creation'] is False
+
+    def test_upgrade_within_range(self):
+        request = upgrade_request(TopicMetadataV2Request({'topics': None}), {3: (0, 3)})
+        assert isinstance(request, TopicMetadataV3Request)
+        assert request['topics'] is None
+
+    def test_upgrade_unsupported(self):
+        request = TopicMetadataV2Request({'topics': None})
+        assert upgrade_request(request, {3: (0, 2)}) is request
+
+    def test_upgrade_list_offset(self):
+        request = upgrade_request(ListOffsetV1Request({'replica_id': -1, 'topics': []}), {2: (0, 2)})
+        assert isinstance(request, ListOffsetV2Request)
+        assert request['isolation_level'] == 0
+        assert request.encoded_size() == 9
+
+    def test_upgrade_group_coordinator(self):
+        request = upgrade_request(GroupCoordinatorV0Request({'group_id': 'testgroup'}), {10: (0, 1)})
+        assert isinstance(request, FindCoordinatorV1Request)
+        assert request['coordinator_key'] == 'testgroup'
+        assert request['coordinator_type'] == 0
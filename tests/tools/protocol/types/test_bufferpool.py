@@ -0,0 +1,38 @@
+import unittest
+
+from kafka.tools.protocol.types.bufferpool import BufferPool
+
+
+class BufferPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = BufferPool(16384)
+
+    def test_acquire_new(self):
+        buf = self.pool.acquire(10)
+        assert isinstance(buf, bytearray)
+        assert len(buf) == 4096
+
+    def test_acquire_rounds_up(self):
+        assert len(self.pool.acquire(4097)) == 8192
+
+    def test_acquire_reuses_smallest(self):
+        small = self.pool.acquire(10)
+        large = self.pool.acquire(5000)
+        self.pool.release(large)
+        self.pool.release(small)
+        assert self.pool.free_bytes == 12288
+
+        assert self.pool.acquire(100) is small
+        assert self.pool.acquire(100) is large
+        assert self.pool.free_bytes == 0
+
+    def test_acquire_too_small(self):
+        small = self.pool.acquire(10)
+        self.pool.release(small)
+        assert self.pool.acquire(5000) is not small
+        assert self.pool.free_bytes == 4096
+
+    def test_release_full(self):
+        self.pool.release(self.pool.acquire(10000))
+        self.pool.release(self.pool.acquire(10000))
+        assert self.pool.free_bytes == 16384
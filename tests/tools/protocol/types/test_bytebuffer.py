@@ -1,3 +1,4 @@
+import struct
 import unittest
 
 from kafka.tools.protocol.types.bytebuffer import ByteBuffer
@@ -175,3 +176,71 @@ class ByteBufferTests(unittest.TestCase):
         val = self.test_bb.slice()
         val.rewind()
         assert val.position == 4
+
+    def test_create_memoryview(self):
+        val = ByteBuffer(memoryview(bytearray(b'\x03\x05\x07\x09')))
+        assert val.zero_copy
+        assert val.capacity == 4
+        assert not self.test_bb.zero_copy
+
+    def test_create_zero_copy_bytestring(self):
+        data = b'\x03\x05\x07\x09'
+        val = ByteBuffer(data, zero_copy=True)
+        assert val.zero_copy
+        assert val._buffer.obj is data
+
+    def test_create_zero_copy_allocate(self):
+        val = ByteBuffer(4, zero_copy=True)
+        assert val.zero_copy
+        assert val.capacity == 4
+
+    def test_get_zero_copy(self):
+        ba = bytearray(b'\x03\x05\x07\x09')
+        val = ByteBuffer(ba, zero_copy=True)
+        view = val.get(2, 2)
+        assert isinstance(view, memoryview)
+        assert view == b'\x07\x09'
+
+        # Views share memory with the original buffer
+        ba[2] = 0x08
+        assert view == b'\x08\x09'
+
+    def test_slice_zero_copy(self):
+        val = ByteBuffer(b'\x03\x05\x07\x09', zero_copy=True)
+        val.position = 2
+        sliced = val.slice()
+        assert sliced.zero_copy
+        assert sliced._buffer is val._buffer
+        assert isinstance(sliced.get(2), memoryview)
+
+    def test_duplicate_zero_copy(self):
+        val = ByteBuffer(b'\x03\x05\x07\x09', zero_copy=True)
+        dup = val.duplicate()
+        assert dup.zero_copy
+        assert dup._buffer is val._buffer
+
+    def test_put_zero_copy(self):
+        val = ByteBuffer(4, zero_copy=True)
+        val.put(memoryview(b'\x21\x23'))
+        val.putInt16(2342)
+        assert val.get(4, 0) == b'\x21\x23\t&'
+
+    def test_get_struct(self):
+        packer = struct.Struct('>bh')
+        assert self.test_bb.getStruct(packer) == (3, 1287)
+        assert self.test_bb.position == 3
+
+    def test_put_struct(self):
+        self.test_bb.putStruct(struct.Struct('>bh'), (8, 2342), 2)
+        assert self.test_bb.get(10, 0) == bytearray(b'\x03\x05\x08\t&\x13\x15\x17\x19\x21')
+
+    def test_raw_and_skip(self):
+        self.test_bb.position = 2
+        data, position, end = self.test_bb.raw()
+        assert data is self.test_bb._buffer
+        assert position == 2
+        assert end == 10
+
+        self.test_bb.skip(8)
+        assert self.test_bb.remaining == 0
+        self.assertRaises(EOFError, self.test_bb.skip, 1)
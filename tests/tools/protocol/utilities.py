@@ -1,12 +1,18 @@
-import collections
+import codecs
 import six
+import struct
+
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
 
 
 def _validate_schema_entry_type(entry_type):
     if isinstance(entry_type, six.string_types):
         if entry_type.lower() not in ('int8', 'int16', 'int32', 'int64', 'string', 'bytes', 'boolean', 'array'):
             raise TypeError('Unknown schema data type: {0}'.format(entry_type))
-    elif isinstance(entry_type, collections.Sequence):
+    elif isinstance(entry_type, Sequence):
         validate_schema(entry_type)
     else:
         raise TypeError('Schema type must be a string type or a list, not {0}'.format(type(entry_type)))
@@ -31,3 +37,90 @@ def validate_schema(schema):
             _validate_schema_entry_type(entry['item_type'])
         else:
             _validate_schema_entry_type(entry['type'])
+
+
+# Straightforward, interpreted implementations of the protocol encoding and decoding. These are used in tests as a
+# reference to check the compiled codecs in kafka.tools.protocol.schema against
+def _encode_plain_value(value, value_type, buf):
+    if value_type == 'int8':
+        buf.putInt8(value)
+    elif value_type == 'int16':
+        buf.putInt16(value)
+    elif value_type == 'int32':
+        buf.putInt32(value)
+    elif value_type == 'int64':
+        buf.putInt64(value)
+    elif value_type == 'string':
+        if value is None:
+            buf.putInt16(-1)
+        else:
+            buf.putInt16(len(value))
+            buf.put(struct.pack('{0}s'.format(len(value)), value.encode("utf-8")))
+    elif value_type == 'bytes':
+        if value is None:
+            buf.putInt32(-1)
+        else:
+            buf.putInt32(len(value))
+            buf.put(value)
+    elif value_type == 'boolean':
+        buf.putInt8(1 if value else 0)
+    elif isinstance(value_type, Sequence):
+        encode_sequence(value, value_type, buf)
+    else:
+        raise NotImplementedError("Reference to non-implemented type in schema: {0}".format(value_type))
+
+
+def encode_sequence(value, schema, buf):
+    for entry in schema:
+        entry_schema = entry['type']
+        if isinstance(entry_schema, six.string_types) and entry_schema.lower() == 'array':
+            if value[entry['name']] is None:
+                buf.putInt32(-1)
+            else:
+                buf.putInt32(len(value[entry['name']]))
+                for item in value[entry['name']]:
+                    _encode_plain_value(item, entry['item_type'], buf)
+        else:
+            _encode_plain_value(value[entry['name']], entry_schema, buf)
+
+
+def _decode_plain_type(value_type, buf):
+    if value_type == 'int8':
+        return buf.getInt8()
+    elif value_type == 'int16':
+        return buf.getInt16()
+    elif value_type == 'int32':
+        return buf.getInt32()
+    elif value_type == 'int64':
+        return buf.getInt64()
+    elif value_type == 'string':
+        val_len = buf.getInt16()
+        return None if val_len == -1 else codecs.utf_8_decode(buf.get(val_len))[0]
+    elif value_type == 'bytes':
+        val_len = buf.getInt32()
+        return None if val_len == -1 else buf.get(val_len)
+    elif value_type == 'boolean':
+        return buf.getInt8() == 1
+    else:
+        raise NotImplementedError("Reference to non-implemented type in schema: {0}".format(value_type))
+
+
+def _decode_array(array_schema, buf):
+    array_len = buf.getInt32()
+    if array_len == -1:
+        return None
+
+    if isinstance(array_schema, six.string_types):
+        return [_decode_plain_type(array_schema, buf) for i in range(array_len)]
+    else:
+        return [decode_sequence(array_schema, buf) for i in range(array_len)]
+
+
+def decode_sequence(sequence_schema, buf):
+    val = {}
+    for entry in sequence_schema:
+        if entry['type'].lower() == 'array':
+            val[entry['name']] = _decode_array(entry['item_type'], buf)
+        else:
+            val[entry['name']] = _decode_plain_type(entry['type'].lower(), buf)
+    return val
@@ -0,0 +1,44 @@
+import unittest
+from concurrent.futures import TimeoutError
+from threading import Event
+
+from kafka.tools.executor import BoundedExecutor
+
+
+class BoundedExecutorTests(unittest.TestCase):
+    def setUp(self):
+        self.executor = BoundedExecutor(1, 1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_submit(self):
+        future = self.executor.submit(lambda x, y=0: x + y, 1, y=2)
+        assert future.result() == 3
+
+    def test_submit_blocks_when_full(self):
+        release = Event()
+        self.executor.submit(release.wait)
+        self.executor.submit(release.wait)
+
+        # Both slots are taken, so the semaphore cannot be acquired without blocking
+        assert not self.executor._slots.acquire(False)
+        release.set()
+        self.executor.shutdown()
+        assert self.executor._slots.acquire(False)
+
+    def test_results(self):
+        def fail():
+            raise ValueError("broken")
+        futures = {1: self.executor.submit(lambda: 'ok'), 2: self.executor.submit(fail)}
+        results = self.executor.results(futures)
+        assert results[1] == ('ok', None)
+        assert results[2][0] is None
+        assert isinstance(results[2][1], ValueError)
+
+    def test_results_timeout(self):
+        release = Event()
+        futures = {1: self.executor.submit(release.wait)}
+        results = self.executor.results(futures, timeout=0.01)
+        release.set()
+        assert isinstance(results[1][1], TimeoutError)
@@ -0,0 +1,117 @@
+import socket
+import time
+import unittest
+from concurrent.futures import TimeoutError
+from threading import Event, Thread
+from mock import MagicMock
+
+from tests.tools.models.test_broker import api_versions_response, read_request
+
+from kafka.tools.configuration import ClientConfiguration
+from kafka.tools.exceptions import ConnectionError
+from kafka.tools.models.broker import Broker
+from kafka.tools.multiplexer import BrokerMultiplexer
+from kafka.tools.protocol.requests.api_versions_v0 import ApiVersionsV0Request
+
+
+def serve(sock, respond):
+    """Read one request from the server end of a socket pair in a thread, and pass the correlation ID to respond"""
+    def run():
+        respond(sock, read_request(sock))
+    thread = Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+class BrokerMultiplexerTests(unittest.TestCase):
+    def setUp(self):
+        self.configuration = ClientConfiguration()
+        self.sockets = []
+        self.brokers = {}
+        for broker_id in (1, 2, 3):
+            client_sock, server_sock = socket.socketpair()
+            self.sockets.extend([client_sock, server_sock])
+            self.brokers[broker_id] = (Broker('host{0}.example.com'.format(broker_id), id=broker_id, sock=client_sock,
+                                              configuration=self.configuration),
+                                       server_sock)
+        self.multiplexer = BrokerMultiplexer()
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def requests(self, broker_ids):
+        return dict((broker_id, (self.brokers[broker_id][0], ApiVersionsV0Request({}))) for broker_id in broker_ids)
+
+    def test_send_all(self):
+        for broker_id in self.brokers:
+            serve(self.brokers[broker_id][1], lambda sock, correlation_id: sock.sendall(api_versions_response(correlation_id)))
+
+        results = self.multiplexer.send(self.requests(self.brokers.keys()))
+        assert sorted(results.keys()) == [1, 2, 3]
+        for broker_id in results:
+            response, error = results[broker_id]
+            assert error is None
+            assert response['error'] == 0
+
+            # The socket is put back the way it was
+            assert self.brokers[broker_id][0]._sock.gettimeout() is None
+            assert not self.brokers[broker_id][0]._send_lock.locked()
+
+    def test_send_partial_reads(self):
+        def respond_slowly(sock, correlation_id):
+            data = api_versions_response(correlation_id)
+            for i in range(len(data)):
+                sock.sendall(data[i:i + 1])
+                time.sleep(0.001)
+        serve(self.brokers[1][1], respond_slowly)
+
+        response, error = self.multiplexer.send(self.requests([1]))[1]
+        assert error is None
+        assert response['api_versions'] == []
+
+    def test_send_connection_closed(self):
+        serve(self.brokers[1][1], lambda sock, correlation_id: sock.shutdown(socket.SHUT_RDWR))
+        response, error = self.multiplexer.send(self.requests([1]))[1]
+        assert response is None
+        assert isinstance(error, ConnectionError)
+        assert self.brokers[1][0]._sock is None
+
+    def test_send_wrong_correlation_id(self):
+        serve(self.brokers[1][1], lambda sock, correlation_id: sock.sendall(api_versions_response(correlation_id + 1)))
+        response, error = self.multiplexer.send(self.requests([1]))[1]
+        assert isinstance(error, ConnectionError)
+
+    def test_send_timeout(self):
+        answered = Event()
+        serve(self.brokers[1][1], lambda sock, correlation_id: answered.wait(1))
+        serve(self.brokers[2][1], lambda sock, correlation_id: sock.sendall(api_versions_response(correlation_id)))
+
+        results = self.multiplexer.send(self.requests([1, 2]), timeout=0.1)
+        answered.set()
+        assert isinstance(results[1][1], TimeoutError)
+        assert self.brokers[1][0]._sock is None
+        assert results[2][1] is None
+
+    def test_send_busy(self):
+        broker = self.brokers[1][0]
+        broker._send_lock.acquire()
+        try:
+            response, error = self.multiplexer.send(self.requests([1]))[1]
+        finally:
+            broker._send_lock.release()
+        assert isinstance(error, ConnectionError)
+        assert broker._sock is not None
+
+    def test_send_not_connected(self):
+        serve(self.brokers[2][1], lambda sock, correlation_id: sock.sendall(api_versions_response(correlation_id)))
+        broker = self.brokers[1][0]
+        broker._sock = None
+        broker.connect = MagicMock()
+
+        results = self.multiplexer.send(self.requests([1, 2]))
+        assert isinstance(results[1][1], ConnectionError)
+        broker.connect.assert_not_called()
+        assert not broker._send_lock.locked()
+        assert results[2][1] is None
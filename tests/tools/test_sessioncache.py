@@ -0,0 +1,37 @@
+import unittest
+from mock import MagicMock
+
+from kafka.tools.sessioncache import TLSSessionCache
+
+
+class TLSSessionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = TLSSessionCache()
+
+    def test_get_empty(self):
+        assert self.cache.get('host1.example.com', 9093) is None
+
+    def test_put(self):
+        self.cache.put('host1.example.com', 9093, 'session1')
+        self.cache.put('host2.example.com', 9093, None)
+        assert self.cache.get('host1.example.com', 9093) == 'session1'
+        assert self.cache.get('host1.example.com', 9094) is None
+        assert self.cache.get('host2.example.com', 9093) is None
+
+    def test_record_connect(self):
+        sock = MagicMock()
+        sock.session = 'session1'
+        sock.session_reused = False
+        self.cache.record_connect('host1.example.com', 9093, sock)
+
+        sock.session = 'session2'
+        sock.session_reused = True
+        self.cache.record_connect('host1.example.com', 9093, sock)
+
+        assert self.cache.get('host1.example.com', 9093) == 'session2'
+        assert self.cache.stats() == {'handshakes': 1, 'resumptions': 1, 'sessions': 1}
+
+    def test_record_connect_no_session_support(self):
+        self.cache.record_connect('host1.example.com', 9093, object())
+        assert self.cache.handshakes == 1
+        assert self.cache.get('host1.example.com', 9093) is None
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from kafka.tools.models.broker import Broker
+from kafka.tools.models.cluster import Cluster
+from kafka.tools.models.group import Group
+from kafka.tools.models.topic import Topic
+from kafka.tools.snapshot import encode_snapshot, load_snapshot, save_snapshot, write_snapshot
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cluster.snapshot')
+
+        self.cluster = Cluster()
+        self.cluster.add_broker(Broker('host1.example.com', id=1, port=8031))
+        self.cluster.add_broker(Broker('host2.example.com', id=101, port=8032))
+        self.cluster.add_broker(Broker(None, id=2))
+        self.cluster.brokers[1].rack = 'rack1'
+
+        topic = Topic('topic1', 2)
+        self.cluster.add_topic(topic)
+        topic.partitions[0].leader = self.cluster.brokers[1]
+        topic.partitions[0].add_replica(self.cluster.brokers[1])
+        topic.partitions[0].add_replica(self.cluster.brokers[2])
+        topic.partitions[1].leader = self.cluster.brokers[101]
+        topic.partitions[1].add_replica(self.cluster.brokers[101])
+
+        group = Group('group1')
+        group.coordinator = self.cluster.brokers[101]
+        group.protocol_type = 'consumer'
+        self.cluster.add_group(group)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        save_snapshot(self.filename, self.cluster, controller_id=1, bootstrap='host1:9092', created=1500000000.5,
+                      groups_listed=1500000001.0)
+        snapshot = load_snapshot(self.filename, bootstrap='host1:9092')
+
+        assert snapshot['created'] == 1500000000.5
+        assert snapshot['groups_listed'] == 1500000001.0
+        metadata = snapshot['metadata']
+        assert metadata['controller_id'] == 1
+
+        # The placeholder broker is not saved
+        assert sorted(metadata.broker_ids()) == [1, 101]
+        brokers = dict((b['node_id'], b) for b in metadata['brokers'])
+        assert brokers[1]['host'] == 'host1.example.com'
+        assert brokers[1]['port'] == 8031
+        assert brokers[1]['rack'] == 'rack1'
+
+        assert metadata.topic_names() == ['topic1']
+        partitions = metadata['topics'][0]['partitions']
+        assert [(p['id'], p['leader'], p['replicas']) for p in partitions] == [(0, 1, [1, 2]), (1, 101, [101])]
+        assert snapshot['groups'] == [{'group_id': 'group1', 'protocol_type': 'consumer', 'coordinator': 101}]
+
+        # Nothing is left behind in the directory
+        assert os.listdir(self.tmpdir) == ['cluster.snapshot']
+
+    def test_encode_then_write(self):
+        write_snapshot(self.filename, encode_snapshot(self.cluster, controller_id=1, bootstrap='host1:9092'))
+        snapshot = load_snapshot(self.filename, bootstrap='host1:9092')
+        assert snapshot['metadata']['controller_id'] == 1
+        assert snapshot['metadata'].topic_names() == ['topic1']
+
+    def test_load_missing(self):
+        assert load_snapshot(self.filename) is None
+
+    def test_load_other_cluster(self):
+        save_snapshot(self.filename, self.cluster, bootstrap='host1:9092')
+        assert load_snapshot(self.filename, bootstrap='host2:9092') is None
+
+    def test_load_too_old(self):
+        save_snapshot(self.filename, self.cluster, created=time.time() - 120)
+        assert load_snapshot(self.filename, max_age=60) is None
+        assert load_snapshot(self.filename, max_age=600) is not None
+
+    def test_load_not_snapshot(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'not a snapshot file')
+        assert load_snapshot(self.filename) is None
+
+    def test_load_truncated(self):
+        save_snapshot(self.filename, self.cluster)
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        with open(self.filename, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        assert load_snapshot(self.filename) is None
+
+    def test_save_error(self):
+        self.assertRaises(OSError, save_snapshot, os.path.join(self.tmpdir, 'missing', 'cluster.snapshot'), self.cluster)